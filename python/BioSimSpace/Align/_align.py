@@ -402,7 +402,7 @@ def rmsdAlign(molecule0, molecule1, mapping=None, property_map0={}, property_map
     return _Molecule(mol0)
 
 def merge(molecule0, molecule1, mapping=None, allow_ring_breaking=False,
-        property_map0={}, property_map1={}):
+        property_map0={}, property_map1={}, roi=None):
     """Create a merged molecule from 'molecule0' and 'molecule1' based on the
        atom index 'mapping'. The merged molecule can be used in single- and
        dual-toplogy free energy calculations.
@@ -434,6 +434,13 @@ def merge(molecule0, molecule1, mapping=None, allow_ring_breaking=False,
            A dictionary that maps "properties" in molecule1 to their user
            defined values.
 
+       roi : [int], str
+           The indices of the residues in molecule0 that are perturbed, or
+           "auto" to detect them from the mapping. When set, a residue-local
+           merge is performed, e.g. for a protein mutation. The residues of
+           molecule0 are preserved, and properties outside of the region of
+           interest are taken from molecule0 at both end states.
+
        Returns
        -------
 
@@ -455,6 +462,12 @@ def merge(molecule0, molecule1, mapping=None, allow_ring_breaking=False,
 
        >>> import BioSimSpace as BSS
        >>> molecule0 = BSS.Align.merge(molecule0, molecule1)
+
+       Mutate a single residue of a protein, with the perturbed residues
+       detected from the mapping.
+
+       >>> import BioSimSpace as BSS
+       >>> merged = BSS.Align.merge(protein0, protein1, mapping, roi="auto")
     """
 
     if type(molecule0) is not _Molecule:
@@ -492,7 +505,7 @@ def merge(molecule0, molecule1, mapping=None, allow_ring_breaking=False,
 
     # Create and return the merged molecule.
     return molecule0._merge(molecule1, mapping, allow_ring_breaking=allow_ring_breaking,
-            property_map0=property_map0, property_map1=property_map1)
+            property_map0=property_map0, property_map1=property_map1, roi=roi)
 
 def _score_rmsd(molecule0, molecule1, mappings, is_align=False):
     """Internal function to score atom mappings based on the root mean squared
@@ -133,9 +133,25 @@ class FreeEnergy():
         # Set the engine.
         self._engine = engine
 
-    def run(self):
-        """Run the simulation."""
-        self._runner.startAll()
+    def run(self, max_concurrent=1, executor=None):
+        """Run the simulation.
+
+           Parameters
+           ----------
+
+           max_concurrent : int
+               The maximum number of lambda windows to run at once. If None,
+               then as many as the available hardware resources allow.
+
+           executor : :class:`Executor <BioSimSpace.Process.Executor>`
+               The executor used to launch the lambda windows, e.g. a
+               :class:`ClusterExecutor <BioSimSpace.Process.ClusterExecutor>`
+               to spread them across multiple hosts. If None, then the
+               executor of each process is used.
+        """
+        if executor is not None:
+            self._runner.setExecutor(executor)
+        self._runner.startAll(max_concurrent=max_concurrent)
 
     def _analyse_gromacs(self):
         """Analyse the GROMACS free energy data.
@@ -462,6 +478,8 @@ class FreeEnergy():
             # doesn't work properly at present.
             system0.removeWaterMolecules()
             system1.removeWaterMolecules()
+            system0._detach()
+            system1._detach()
             for wat in waters0:
                 system0._sire_system.add(wat, _SireMol.MGName("all"))
             for wat in waters1:
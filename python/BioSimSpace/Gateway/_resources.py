@@ -24,6 +24,9 @@ Functionality for finding and managing hardware resources.
 """
 
 import argparse as _argparse
+import os as _os
+import shutil as _shutil
+import subprocess as _subprocess
 
 __author__ = "Lester Hedges"
 __email_ = "lester.hedges@gmail.com"
@@ -41,6 +44,9 @@ class ResourceManager():
         self._cores = None
         self._gpus = None
 
+        # Resources detected on this machine, found on first use.
+        self._detected = None
+
         # Create the argument parser.
         self._parser = _argparse.ArgumentParser(description="Command-line parser for hardware resources",
                                                 add_help=False, allow_abbrev=False)
@@ -68,6 +74,23 @@ class ResourceManager():
                 if value is not None:
                     self._gpus = int(value)
 
+    def _detect(self):
+        """Detect the hardware resources available on this machine.
+
+           Returns
+           -------
+
+           resources : dict
+               A dictionary containing the number of cores and the IDs of the
+               GPU devices.
+        """
+
+        if self._detected is None:
+            self._detected = { "cores" : _detect_cores(),
+                               "gpus" : _detect_gpus() }
+
+        return self._detected
+
     def getNodes(self):
         """Return the number of nodes.
 
@@ -98,7 +121,8 @@ class ResourceManager():
         self._nodes = nodes
 
     def getCores(self):
-        """Return the number of cores.
+        """Return the number of cores. Unless set by the user, this is the
+           number of cores available to this process.
 
            Returns
            -------
@@ -106,6 +130,8 @@ class ResourceManager():
            cores : int
                The number of cores.
         """
+        if self._cores is None:
+            return self._detect()["cores"]
         return self._cores
 
     def setCores(self, cores):
@@ -127,7 +153,8 @@ class ResourceManager():
         self._cores = cores
 
     def getGPUs(self):
-        """Return the number of GPUs.
+        """Return the number of GPUs. Unless set by the user, this is the
+           number of GPUs available to this process.
 
            Returns
            -------
@@ -135,8 +162,32 @@ class ResourceManager():
            gpus : int
                The number of GPUs.
         """
+        if self._gpus is None:
+            return len(self._detect()["gpus"])
         return self._gpus
 
+    def getGPUDevices(self):
+        """Return the IDs of the available GPU devices, as used by the
+           CUDA_VISIBLE_DEVICES environment variable.
+
+           Returns
+           -------
+
+           devices : [str]
+               The IDs of the GPU devices.
+        """
+
+        devices = self._detect()["gpus"]
+
+        if self._gpus is None:
+            return list(devices)
+
+        # Use the detected devices, if there are enough.
+        if self._gpus <= len(devices):
+            return devices[:self._gpus]
+        else:
+            return [str(x) for x in range(0, self._gpus)]
+
     def setGPUs(self, gpus):
         """Set the number of GPUs.
 
@@ -154,3 +205,48 @@ class ResourceManager():
             raise ValueError("'gpus' cannot be negative!")
 
         self._gpus = gpus
+
+def _detect_cores():
+    """Internal function to detect the number of cores available to this
+       process.
+
+       Returns
+       -------
+
+       cores : int
+           The number of cores.
+    """
+
+    # Respect any CPU affinity set for the process, e.g. by a batch system.
+    try:
+        return len(_os.sched_getaffinity(0))
+    except AttributeError:
+        return _os.cpu_count() or 1
+
+def _detect_gpus():
+    """Internal function to detect the GPU devices available to this process.
+
+       Returns
+       -------
+
+       devices : [str]
+           The IDs of the GPU devices.
+    """
+
+    # The devices have been restricted, e.g. by a batch system.
+    if "CUDA_VISIBLE_DEVICES" in _os.environ:
+        return [x.strip() for x in _os.environ["CUDA_VISIBLE_DEVICES"].split(",")
+                if x.strip() not in ["", "-1", "NoDevFiles"]]
+
+    # Query the NVIDIA driver.
+    if _shutil.which("nvidia-smi") is not None:
+        try:
+            proc = _subprocess.run(["nvidia-smi", "-L"], stdout=_subprocess.PIPE,
+                stderr=_subprocess.PIPE, universal_newlines=True, timeout=10)
+            if proc.returncode == 0:
+                num_gpus = len([x for x in proc.stdout.splitlines() if x.startswith("GPU")])
+                return [str(x) for x in range(0, num_gpus)]
+        except (OSError, _subprocess.SubprocessError):
+            pass
+
+    return []
@@ -52,6 +52,8 @@ from BioSimSpace import _gromacs_path
 from .._SireWrappers import Molecule as _Molecule
 from .._SireWrappers import System as _System
 
+import BioSimSpace._Utils as _Utils
+
 __author__ = "Lester Hedges"
 __email_ = "lester.hedges@gmail.com"
 
@@ -436,34 +438,26 @@ def saveMolecules(filebase, system, fileformat, property_map={}):
         if not _os.path.isdir(dirname):
             _os.makedirs(dirname, exist_ok=True)
 
-    # Store the current working directory.
-    dir = _os.getcwd()
-
     # Change to the working directory for the process.
     # This avoid problems with relative paths.
-    if dirname != "":
-        _os.chdir(dirname)
+    if dirname == "":
+        dirname = "."
 
     # A list of the files that have been written.
     files = []
 
-    # Save the system using each file format.
-    for format in formats:
-        # Add the file format to the property map.
-        _property_map["fileformat"] = _SireBase.wrap(format)
-
-        # Write the file.
-        try:
-            file = _SireIO.MoleculeParser.save(system._getSireSystem(), filebase, _property_map)
-            files += file
-        except:
-            if dirname != "":
-                _os.chdir(dir)
-            raise IOError("Failed to save system to format: '%s'" % format) from None
-
-    # Change back to the original directory.
-    if dirname != "":
-        _os.chdir(dir)
+    with _Utils.cd(dirname):
+        # Save the system using each file format.
+        for format in formats:
+            # Add the file format to the property map.
+            _property_map["fileformat"] = _SireBase.wrap(format)
+
+            # Write the file.
+            try:
+                file = _SireIO.MoleculeParser.save(system._getSireSystem(), filebase, _property_map)
+                files += file
+            except:
+                raise IOError("Failed to save system to format: '%s'" % format) from None
 
     # Return the list of files.
     return files
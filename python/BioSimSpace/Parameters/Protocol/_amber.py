@@ -244,7 +244,7 @@ class GAFF(_protocol.Protocol):
         prefix = work_dir + "/"
 
         # Create a new molecule using a deep copy of the internal Sire Molecule.
-        new_mol = _Molecule(molecule._getSireMolecule().__deepcopy__())
+        new_mol = _Molecule(molecule._getSireMolecule())
 
         # The user will likely have passed a bare PDB or Mol2 file.
         # Antechamber expects the molecule to be uncharged, or integer
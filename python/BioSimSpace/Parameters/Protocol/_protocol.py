@@ -153,7 +153,7 @@ class Protocol():
         prefix = work_dir + "/"
 
         # Create a new molecule using a deep copy of the internal Sire Molecule.
-        new_mol = _Molecule(molecule._getSireMolecule().__deepcopy__())
+        new_mol = _Molecule(molecule._getSireMolecule())
 
         # Choose the program to run with depending on the force field compatibility.
         # If tLEaP and pdb2gmx are supported, default to tLEaP, then use pdb2gmx if
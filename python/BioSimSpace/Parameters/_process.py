@@ -38,19 +38,20 @@ Author: Lester Hedges <lester.hedges@gmail.com>
 # the run method requires the return type of the method to be  picklable, which
 # isn't the case for our Molecule object.
 
-import glob as _glob
 import os as _os
 import queue as _queue
 import sys as _sys
 import tempfile as _tempfile
 import threading as _threading
-import zipfile as _zipfile
 
 from BioSimSpace import _is_notebook
 
 from . import Protocol as _Protocol
 from .._Exceptions import ParameterisationError as _ParameterisationError
 from .._SireWrappers import Molecule as _Molecule
+from ..Process._monitor import _Notifier
+
+import BioSimSpace._Utils as _Utils
 
 if _is_notebook():
     from IPython.display import FileLink as _FileLink
@@ -81,8 +82,9 @@ def _wrap_protocol(protocol_function, process):
         if process._queue is not None:
             process._queue.put(None)
 
-        # Return to the user directory.
-        _os.chdir(process._dir)
+    # Notify anything waiting for the process.
+    finally:
+        process._notifier.set()
 
 class Process():
     """A class for running parameterisation protocols as a background process."""
@@ -155,6 +157,9 @@ class Process():
         self._queue = None
         self._thread = None
 
+        # Create a flag used to notify anything waiting for the process.
+        self._notifier = _Notifier()
+
         # Start the process.
         if autostart:
             self.start()
@@ -190,7 +195,7 @@ class Process():
 
         # Start the process, if it's not already started.
         if not self._is_started:
-            self._start()
+            self.start()
 
         # Block the thread until it finishes.
         if not self._is_finished:
@@ -212,6 +217,26 @@ class Process():
 
         return self._new_molecule
 
+    async def molecule(self):
+        """Asynchronously get the parameterised molecule. This doesn't block
+           the event loop, so many parameterisations can be awaited concurrently.
+
+           Returns
+           -------
+
+           molecule : BioSimSpace._SireWrappers.Molecule
+               The parameterised molecule.
+        """
+
+        # Start the process, if it's not already started.
+        if not self._is_started:
+            self.start()
+
+        # Wait for the process to notify us that it has finished.
+        await self._notifier.waitAsync()
+
+        return self.getMolecule()
+
     def isRunning(self):
         """Return whether the parameterising protocol is still running."""
         return not self._is_finished
@@ -227,7 +252,8 @@ class Process():
         """
         return self._is_error
 
-    def getOutput(self, filename=None, file_link=False):
+    def getOutput(self, filename=None, file_link=False, include=None, exclude=None,
+            compression="stored", level=None, workers=None, incremental=True):
         """Return a zip file containing the output from the parameterisation process.
 
            Parameters
@@ -239,6 +265,28 @@ class Process():
            file_link : bool
                Whether to return a FileLink when working in Jupyter.
 
+           include : [str]
+               A list of glob patterns. Only matching files are archived. By
+               default, all files are archived.
+
+           exclude : [str]
+               A list of glob patterns for files to exclude from the archive,
+               e.g. ["*.nc", "*.dcd"] to skip trajectories.
+
+           compression : str
+               The compression codec: "stored", "deflated", "bzip2", or "lzma".
+
+           level : int
+               The compression level. Use None for the codec's default.
+
+           workers : int
+               The number of threads used to compress files in parallel. By
+               default, one thread is used per CPU.
+
+           incremental : bool
+               Whether to only compress files that have changed since the
+               archive was last written.
+
            Returns
            -------
 
@@ -259,25 +307,26 @@ class Process():
             else:
                 zipname = "%s.zip" % self._hash
 
-            # Append the files to the archive.
-            with _zipfile.ZipFile(zipname, "w") as zip:
-                # Loop over all of the output files.
-                for file in _glob.glob("%s/*" % self._work_dir):
-                    zip.write(file, arcname=_os.path.basename(file))
+            # Archive the output files.
+            _Utils.archive(self._work_dir, zipname, include=include, exclude=exclude,
+                compression=compression, level=level, workers=workers, incremental=incremental)
 
             # Store the location of the zip file. Only do so if the
             # parameterisation has finished.
-            if not self._is_finished:
+            if self._is_finished:
                 self._zipfile = zipname
 
+        else:
+            zipname = self._zipfile
+
         # Return a link to the archive.
         if _is_notebook():
             if file_link:
-                return _FileLink(self._zipfile)
+                return _FileLink(zipname)
             else:
-                return self._zipfile
+                return zipname
         else:
-            return self._zipfile
+            return zipname
 
     def getHash(self):
         """Get the object hash."""
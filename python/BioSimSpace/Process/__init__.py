@@ -50,6 +50,28 @@ Multi process simulation tools
 
     ProcessRunner
 
+Executors
+=========
+
+.. autosummary::
+    :toctree: generated/
+
+    Executor
+    LocalExecutor
+    PoolExecutor
+    QueueExecutor
+    ClusterExecutor
+    getDefaultExecutor
+    setDefaultExecutor
+
+Stopping policies
+=================
+
+.. autosummary::
+    :toctree: generated/
+
+    ConvergencePolicy
+
 Examples
 ========
 
@@ -89,6 +111,9 @@ get the minimised molecular system.
 """
 
 from ._amber import *
+from ._cluster import *
+from ._convergence import *
+from ._executor import *
 from ._gromacs import *
 from ._namd import *
 from ._process_runner import *
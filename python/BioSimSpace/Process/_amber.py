@@ -23,22 +23,20 @@
 Functionality for running simulations using AMBER.
 """
 
-from watchdog.events import PatternMatchingEventHandler as _PatternMatchingEventHandler
-from watchdog.observers import Observer as _Observer
-
 import math as _math
 import os as _os
 import re as _re
-import time as _time
+import shutil as _shutil
+import threading as _threading
 import timeit as _timeit
 import warnings as _warnings
 
-import Sire.Base as _SireBase
 import Sire.IO as _SireIO
 import Sire.Mol as _SireMol
 
 from BioSimSpace import _amber_home
 from . import _process
+from ._monitor import getMonitor as _getMonitor
 from .._Exceptions import IncompatibleError as _IncompatibleError
 from .._Exceptions import MissingSoftwareError as _MissingSoftwareError
 from .._SireWrappers import System as _System
@@ -54,84 +52,342 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["Amber"]
 
-class _Watcher:
-    """A class to watch for changes to the AMBER energy info file. An event handler
-       is used trigger updates to the energy dictionary each time the file is modified.
+# Regular expression used to split energy info lines into records and values.
+_nrg_regex = _re.compile(r"(\d*\-*\d*\s*[A-Z]+\(*[A-Z]*\)*)\s*=\s*(\-*\d+\.?\d*)")
+
+class _NrgParser:
+    """A stateful parser for the AMBER energy info file. The parser remembers
+       the byte offset of the last complete line that was read, so that only
+       data appended since the previous update is processed. Records are only
+       returned once they are complete, i.e. when the next record starts, or
+       when a separator line is reached.
     """
-    def __init__(self, proc):
+
+    # The number of bytes at the start of the file used to detect rewrites.
+    _head_size = 256
+
+    def __init__(self, file, is_minimisation=False):
         """Constructor.
 
            Parameters
            ----------
 
-           proc : :class:`Process.Amber <BioSimSpace.Process.Amber>`
-               The Amber Process object.
+           file : str
+               The path to the energy info file.
+
+           is_minimisation : bool
+               Whether the file was written by a minimisation protocol.
         """
 
-        self._process = proc
-        self._observer = _Observer()
+        self._file = file
+        self._is_minimisation = is_minimisation
+        self._lock = _threading.Lock()
+        self.reset()
 
-    def start(self):
-        """Start the file watcher."""
+    def reset(self):
+        """Reset the parser so that the file is read from the beginning."""
 
-        # Setup the event handler and observer.
-        event_handler = _Handler(self._process)
-        self._observer.schedule(event_handler, self._process._work_dir)
-        self._observer.daemon = True
-        self._observer.start()
+        # The byte offset of the first unread line.
+        self._offset = 0
 
-class _Handler(_PatternMatchingEventHandler):
-    """An event handler to trigger updates to the energy dictionary each time
-       the log file is changed.
-    """
+        # Any partially written line at the end of the file.
+        self._buffer = b""
 
-    # Overwrite defaults.
-    case_sensitive = False
-    ignore_directories = True
-    ignore_patterns = []
-    patterns = "*.nrg"
+        # The modification time and size of the file at the last update.
+        self._stat = None
 
-    def __init__(self, proc):
-        """Constructor.
+        # The first bytes of the file, used to detect when it is rewritten.
+        self._head = b""
+
+        # The record that is currently being parsed.
+        self._record = []
+        self._is_header = False
+
+        # The keys and step of the last complete record.
+        self._keys = None
+        self._step = None
+
+    def update(self, flush=False):
+        """Parse any data that has been appended to the file since the last
+           update.
 
            Parameters
            ----------
 
-           proc : :class:`Process.Amber <BioSimSpace.Process.Amber>`
-               The Amber Process object.
+           flush : bool
+               Whether to return the final record, even if no terminating
+               line has been written. This should only be used once the
+               process has finished. A record is only flushed if it contains
+               the same entries as the previous record, i.e. a record that
+               was truncated part way through is discarded.
+
+           Returns
+           -------
+
+           records : [[(str, str)]]
+               A list of new records. Each record is a list of (key, value)
+               pairs.
         """
-        self._process = proc
 
-    def on_any_event(self, event):
-        """Update the dictionary when the file is modified.
+        with self._lock:
+            try:
+                stat = _os.stat(self._file)
+            except FileNotFoundError:
+                return []
+
+            records = []
+
+            # Only read the file if it has changed since the last update.
+            if self._stat != (stat.st_mtime_ns, stat.st_size):
+                self._stat = (stat.st_mtime_ns, stat.st_size)
+
+                with open(self._file, "rb") as file:
+                    # AMBER can rewrite, rather than append to, the energy info
+                    # file. If the file has shrunk, or the start of the file has
+                    # changed, then start reading from the beginning again.
+                    head = file.read(self._head_size)
+                    if stat.st_size < self._offset or head[:len(self._head)] != self._head:
+                        self._offset = 0
+                        self._buffer = b""
+                        self._record = []
+                        self._is_header = False
+                    self._head = head
+
+                    # Read the new data.
+                    file.seek(self._offset)
+                    data = file.read()
+
+                self._offset += len(data)
+                data = self._buffer + data
+
+                # Hold back any partial line until the rest has been written.
+                index = data.rfind(b"\n") + 1
+                self._buffer = data[index:]
+
+                for line in data[:index].decode("utf-8", "replace").splitlines():
+                    self._parse_line(line, records)
+
+            # Flush the final record.
+            if flush and len(self._record) > 0:
+                if self._keys is None or [key for key, _ in self._record] == self._keys:
+                    self._end_record(records)
+                else:
+                    self._record = []
+
+            return records
+
+    def _parse_line(self, line, records):
+        """Parse a single line of the energy info file.
 
            Parameters
            ----------
 
-           event : str
-               The file system event.
+           line : str
+               The line to parse.
+
+           records : [[(str, str)]]
+               The list of complete records.
         """
 
-        # N.B.
-        #
-        # Since the watchdog package is cross-platform it doesn't support
-        # detection of "close-write" operations, so multiple "modified" events
-        # can be triggered while the log file is being written. As such, we
-        # check whether the file has been updated by seeing if the NSTEP record
-        # is different to the most recent entry in the dictionary.
-        # So far, no issues have been found with processing partially written
-        # files, i.e. duplicate or missing records.
-
-        if event.event_type == "modified":
-            # If this is the first time the file has been modified since the
-            # process started, then wipe the dictionary and flag that the file
-            # is now being watched.
-            if not self._process._is_watching:
-                self._process._stdout_dict = _process._MultiDict()
-                self._process._is_watching = True
+        # Skip empty lines.
+        if len(line.strip()) == 0:
+            return
 
-            # Now update the dictionary with any new records.
-            self._process._update_energy_dict()
+        # Summary reports and separators mark the end of a record.
+        if line[0] == "|" or line.strip()[0] == "-":
+            self._end_record(records)
+            return
+
+        # The output format is different for minimisation protocols.
+        if self._is_minimisation and "=" not in line:
+
+            # Split the line using whitespace.
+            data = line.upper().split()
+
+            # A header marks the start of a new record.
+            if data[0] == "NSTEP":
+                self._end_record(records)
+                self._is_header = True
+                return
+
+            # Add the timestep and energy records.
+            if self._is_header and len(data) > 1:
+                self._record = [("NSTEP", data[0]), ("ENERGY", data[1])]
+                self._is_header = False
+
+            return
+
+        # All other lines are formatted as RECORD = VALUE.
+        for key, value in _nrg_regex.findall(line.upper()):
+
+            # Strip whitespace from the record key.
+            key = key.strip()
+
+            # A timestep record marks the start of a new record.
+            if key == "NSTEP":
+                self._end_record(records)
+
+            self._record.append((key, value))
+
+    def _end_record(self, records):
+        """Complete the current record.
+
+           Parameters
+           ----------
+
+           records : [[(str, str)]]
+               The list of complete records.
+        """
+
+        record = self._record
+        self._record = []
+
+        # Find the timestep of the record.
+        step = None
+        for key, value in record:
+            if key == "NSTEP":
+                try:
+                    step = int(value)
+                except ValueError:
+                    pass
+                break
+
+        # Discard incomplete records and those that have already been parsed.
+        if step is None or (self._step is not None and step <= self._step):
+            return
+
+        self._step = step
+        self._keys = [key for key, _ in record]
+        records.append(record)
+
+def _read_restart(file, has_velocities=False):
+    """Internal function to read the number of atoms and the time from an
+       AMBER ASCII restart file, checking that the coordinates, and
+       optionally the velocities, were written in full.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the restart file.
+
+       has_velocities : bool
+           Whether the file must contain velocities.
+
+       Returns
+       -------
+
+       num_atoms : int
+           The number of atoms.
+
+       time : float
+           The simulation time in picoseconds.
+    """
+
+    with open(file, "r") as f:
+        lines = f.read().splitlines()
+
+    data = lines[1].split()
+    num_atoms = int(data[0])
+    time = float(data[1]) if len(data) > 1 else 0.0
+
+    # Values are written six per line, in columns twelve characters wide.
+    num_values = 3 * num_atoms
+    num_lines = _math.ceil(num_values / 6)
+    if has_velocities:
+        num_lines *= 2
+
+    # Make sure that the final line is complete.
+    last = lines[1 + num_lines]
+    num_last = num_values - 6 * (_math.ceil(num_values / 6) - 1)
+    if len(last.rstrip()) < 12 * num_last:
+        raise ValueError("Incomplete restart file: '%s'" % file)
+    for x in range(0, num_last):
+        float(last[12*x:12*(x+1)])
+
+    return num_atoms, time
+
+def _resume_config(config, step, steps):
+    """Internal function to modify an AMBER dynamics configuration so that it
+       continues from a restart file written after 'step' of 'steps'
+       integration steps.
+
+       Parameters
+       ----------
+
+       config : [str]
+           The configuration.
+
+       step : int
+           The number of completed steps.
+
+       steps : int
+           The total number of steps.
+
+       Returns
+       -------
+
+       config : [str]
+           The configuration for the remaining steps.
+    """
+
+    new_config = []
+
+    for line in config:
+        key = line.strip().split("=")[0]
+
+        # Read coordinates and velocities, and continue the simulation time.
+        if key == "ntx":
+            line = "  ntx=5,"
+        elif key == "irest":
+            line = "  irest=1,"
+
+        # Only run the remaining steps.
+        elif key == "nstlim":
+            line = "  nstlim=%d," % (steps - step)
+
+        # The velocities are read from the restart file.
+        elif key == "tempi":
+            continue
+
+        # Continue heating or cooling from the temperature at the checkpoint.
+        elif line.startswith("&wt TYPE='TEMP0'"):
+            value1 = float(_re.search(r"value1=([\d\.\-]+)", line).group(1))
+            value2 = float(_re.search(r"value2=([\d\.\-]+)", line).group(1))
+            value1 += (value2 - value1) * step / steps
+            line = "&wt TYPE='TEMP0', istep1=0, istep2=%d, value1=%.2f, value2=%.2f /" \
+                % (steps - step, value1, value2)
+
+        new_config.append(line)
+
+    return new_config
+
+def _replace_args(args, replacements):
+    """Internal function to replace the values of command-line arguments.
+
+       Parameters
+       ----------
+
+       args : [str]
+           The list of command-line argument strings.
+
+       replacements : dict
+           A dictionary mapping argument names to their new values.
+
+       Returns
+       -------
+
+       args : [str]
+           The updated list of arguments.
+    """
+
+    new_args = list(args)
+
+    for x in range(1, len(new_args)):
+        if new_args[x-1] in replacements:
+            new_args[x] = replacements[new_args[x-1]]
+
+    return new_args
 
 class Amber(_process.Process):
     """A class for running simulations using AMBER."""
@@ -198,16 +454,25 @@ class Amber(_process.Process):
                 raise IOError("AMBER executable doesn't exist: '%s'" % exe)
 
         # Initialise the energy dictionary and header.
-        self._stdout_dict = _process._MultiDict()
+        self._stdout_dict = _process._RecordStore(int_keys=["NSTEP"])
 
         # Create the name of the energy output file and wipe the
         # contents of any existing file.
         self._nrg_file = "%s/%s.nrg" % (self._work_dir, name)
         open(self._nrg_file, "w").close()
 
-        # Initialise the energy watcher.
+        # Initialise the energy watcher and parser. The energy info file can
+        # be read from the monitor thread and from threads waiting on the
+        # process, so updates are serialised with a lock.
         self._watcher = None
         self._is_watching = False
+        self._is_finished = False
+        self._nrg_parser = None
+        self._nrg_lock = _threading.RLock()
+
+        # The number of steps completed before the checkpoint that the process
+        # was last resumed from. AMBER counts steps from zero when resuming.
+        self._step_offset = 0
 
         # The names of the input files.
         self._rst_file = "%s/%s.rst7" % (self._work_dir, name)
@@ -265,6 +530,7 @@ class Amber(_process.Process):
                 # TODO: This is a hack since the "update" method of Sire.System
                 # doesn't work properly at present.
                 system.removeWaterMolecules()
+                system._detach()
                 for wat in waters:
                     system._sire_system.add(wat, _SireMol.MGName("all"))
 
@@ -519,20 +785,55 @@ class Amber(_process.Process):
             if self._process.isRunning():
                 return
 
+        # Resume from a checkpoint, if one was found when the process failed.
+        checkpoint = self._checkpoint
+        self._checkpoint = None
+
         # Reset the watcher.
         self._is_watching = False
+        self._is_finished = False
+
+        # Create a new parser for the energy info file.
+        self._nrg_parser = _NrgParser(self._nrg_file,
+            type(self._protocol) is _Protocol.Minimisation)
+
+        if checkpoint is None:
+            self._step_offset = 0
+        else:
+            self._step_offset = checkpoint["step"]
+
+            # Write the trajectory to a separate file, which is joined to the
+            # existing trajectory once the process has finished.
+            self._setTrajectorySegment("%s/%s.resume.nc" % (self._work_dir, self._name),
+                time=checkpoint["time"])
 
         # Run the process in the working directory.
         with _Utils.cd(self._work_dir):
 
             # Create the arguments string list.
             args = self.getArgStringList()
+            arg_string = self.getArgString()
+
+            if checkpoint is not None:
+                # Continue from a copy of the restart file, since the original
+                # is overwritten as the simulation runs.
+                _shutil.copyfile(checkpoint["file"], "%s.resume.rst7" % self._name)
+
+                # Only run the remaining steps.
+                with open("%s.resume.cfg" % self._name, "w") as file:
+                    for line in _resume_config(self._config, checkpoint["step"], checkpoint["steps"]):
+                        file.write("%s\n" % line)
+
+                args = _replace_args(args, { "-i" : "%s.resume.cfg" % self._name,
+                                             "-c" : "%s.resume.rst7" % self._name,
+                                             "-x" : "%s.resume.nc" % self._name })
+                arg_string = " ".join(args)
 
             # Write the command-line process to a README.txt file.
             with open("README.txt", "w") as file:
 
                 # Set the command-line string.
-                self._command = "%s " % self._exe + self.getArgString()
+                self._command = "%s " % self._exe + arg_string
 
                 # Write the command to file.
                 file.write("# AMBER was run with the following command:\n")
@@ -542,15 +843,79 @@ class Amber(_process.Process):
             self._timer = _timeit.default_timer()
 
             # Start the simulation.
-            self._process = _SireBase.Process.run(self._exe, args,
-                "%s.out"  % self._name, "%s.err"  % self._name)
+            self._process = self._submit(args, "%s.out"  % self._name, "%s.err"  % self._name)
 
-	# Watch the energy info file for changes.
-        self._watcher = _Watcher(self)
-        self._watcher.start()
+        # Watch the energy info file for changes, and clean up once the
+        # process has finished.
+        self._watcher = _getMonitor().watchFile(self._work_dir,
+            _os.path.basename(self._nrg_file), self._nrg_modified)
+        _getMonitor().watchProcess(self, self._finished)
+
+        # Stop the process early once it has converged.
+        self._watch_convergence()
 
         return self
 
+    def _findCheckpoint(self):
+        """Find the latest valid checkpoint in the working directory. AMBER
+           periodically writes the coordinates and velocities to a restart
+           file during dynamics.
+
+           Returns
+           -------
+
+           checkpoint : dict
+               The restart file, the time of the checkpoint, and the number
+               of completed and total integration steps, or None if there
+               isn't a valid checkpoint.
+        """
+
+        # Only dynamics protocols write restart files during the simulation.
+        if type(self._protocol) not in [_Protocol.Equilibration, _Protocol.Production]:
+            return None
+
+        restart = "%s/%s.crd" % (self._work_dir, self._name)
+
+        try:
+            num_atoms, time = _read_restart(restart, has_velocities=True)
+            num_input_atoms, input_time = _read_restart(self._rst_file)
+        except (OSError, IndexError, ValueError):
+            return None
+
+        if num_atoms != num_input_atoms:
+            return None
+
+        # The simulation time starts from zero, unless the simulation continues
+        # from the time in the input file.
+        if type(self._protocol) is _Protocol.Production and self._protocol.isRestart():
+            start_time = input_time
+        else:
+            start_time = 0
+
+        timestep = self._protocol.getTimeStep().picoseconds().magnitude()
+        steps = _math.ceil(self._protocol.getRunTime() / self._protocol.getTimeStep())
+        step = round((time - start_time) / timestep)
+
+        # Nothing to resume, or nothing left to run.
+        if step <= 0 or step >= steps:
+            return None
+
+        return { "file" : restart, "time" : time, "step" : step, "steps" : steps }
+
+    def _checkpointPattern(self):
+        """Return a glob pattern matching the checkpoint files written by the
+           process while it is running.
+
+           Returns
+           -------
+
+           pattern : str
+               The pattern, or None if the process doesn't write checkpoints.
+        """
+        if type(self._protocol) not in [_Protocol.Equilibration, _Protocol.Production]:
+            return None
+        return "%s.crd" % self._name
+
     def getSystem(self, block="AUTO"):
         """Get the latest molecular system.
 
@@ -694,8 +1059,8 @@ class Amber(_process.Process):
            Returns
            -------
 
-           records : :class:`MultiDict <BioSimSpace.Process._process._MultiDict>`
-              The dictionary of time-series records.
+           records : dict
+              A dictionary mapping each record key to a NumPy array of values.
         """
 
         # Wait for the process to finish.
@@ -712,10 +1077,10 @@ class Amber(_process.Process):
            Returns
            -------
 
-           records : :class:`MultiDict <BioSimSpace.Process._process._MultiDict>`
-              The dictionary of time-series records.
+           records : dict
+              A dictionary mapping each record key to a NumPy array of values.
         """
-        return getRecords(block=False)
+        return self.getRecords(block=False)
 
     def getTime(self, time_series=False, block="AUTO"):
         """Get the time (in nanoseconds).
@@ -741,14 +1106,14 @@ class Amber(_process.Process):
             return None
 
         # Get the list of time steps.
-        time_steps = self.getRecord("TIME(PS)", time_series, None, block)
+        time_steps = self.getRecord("TIME(PS)", time_series, _Units.Time.picosecond, block)
 
         # Convert from picoseconds to nanoseconds.
         if time_steps is not None:
             if time_series:
-                return [(x * _Units.Time.picosecond).nanoseconds() for x in time_steps]
+                return time_steps.convert(_Units.Time.nanosecond)
             else:
-                return (time_steps * _Units.Time.picosecond).nanoseconds()
+                return time_steps.nanoseconds()
 
     def getCurrentTime(self, time_series=False):
         """Get the current time (in nanoseconds).
@@ -1309,7 +1674,7 @@ class Amber(_process.Process):
            virial : float
               The virial.
         """
-        return self.getRecord("VIRIAL", time_series, block)
+        return self.getRecord("VIRIAL", time_series, None, block)
 
     def getCurrentVirial(self, time_series=False):
         """Get the current virial.
@@ -1457,7 +1822,7 @@ class Amber(_process.Process):
            density : float
               The density.
         """
-        return self.getRecord("DENSITY", time_series, block)
+        return self.getRecord("DENSITY", time_series, None, block)
 
     def getCurrentDensity(self, time_series=False):
         """Get the current density.
@@ -1476,81 +1841,88 @@ class Amber(_process.Process):
         """
         return self.getDensity(time_series, block=False)
 
-    def _update_energy_dict(self):
-        """Read the energy info file and update the dictionary."""
-
-        # Flag that this isn't a header line.
-        is_header = False
-
-        # Open the file for reading.
-        with open(self._nrg_file, "r") as file:
-
-            # Loop over all of the lines.
-            for line in file:
-
-                # Skip empty lines and summary reports.
-                if len(line) > 0 and line[0] is not "|":
-
-                    # The output format is different for minimisation protocols.
-                    if type(self._protocol) is _Protocol.Minimisation:
-
-                        # No equals sign in the line.
-                        if "=" not in line:
-
-                            # Split the line using whitespace.
-                            data = line.upper().split()
+    def _nrg_modified(self, file):
+        """Callback used to update the dictionary when the energy info file
+           is modified.
 
-                            # If we find a header, jump to the top of the loop.
-                            if len(data) > 0:
-                                if data[0] == "NSTEP":
-                                    is_header = True
-                                    continue
-
-                        # Process the header record.
-                        if is_header:
+           Parameters
+           ----------
 
-                            # Split the line using whitespace.
-                            data = line.upper().split()
+           file : str
+               The path to the modified file.
+        """
 
-                            # The file hasn't been updated.
-                            if "NSTEP" in self._stdout_dict and data[0] == self._stdout_dict["NSTEP"][-1]:
-                                return
+        # N.B.
+        #
+        # Multiple events can be triggered while the file is being written.
+        # The parser only processes complete records that have been appended
+        # since the last update, so this is safe.
+
+        # If this is the first time the file has been modified since the
+        # process started, then wipe the dictionary and flag that the file
+        # is now being watched.
+        with self._nrg_lock:
+            if not self._is_watching:
+                # Keep the records up to the checkpoint that the process resumed from.
+                if self._step_offset > 0:
+                    self._stdout_dict.truncate("NSTEP", self._step_offset)
+                else:
+                    self._stdout_dict = _process._RecordStore(int_keys=["NSTEP"])
+                self._is_watching = True
 
-                            else:
-                                # Add the timestep and energy records to the dictionary.
-                                self._stdout_dict["NSTEP"] = data[0]
-                                self._stdout_dict["ENERGY"] = data[1]
+            # Now update the dictionary with any new records.
+            self._update_energy_dict()
+
+    def _stop_watching(self):
+        """Stop watching the energy info file."""
+        watcher = self._watcher
+        if watcher is not None:
+            self._watcher = None
+            _getMonitor().unwatch(watcher)
+
+    def _finished(self):
+        """Callback used to stop watching the energy info file and read any
+           remaining records once the process has finished. This is called
+           by both the monitor and by threads waiting on the process, but
+           only runs once per start of the process.
+        """
+        with self._nrg_lock:
+            if self._is_finished:
+                return
+            self._is_finished = True
 
-                                # Turn off the header flag now that the data has been recorded.
-                                is_header = False
+            self._stop_watching()
+            self._update_energy_dict(flush=True)
 
-                    # All other protocols have output that is formatted as RECORD = VALUE.
+    def _update_energy_dict(self, flush=False):
+        """Read any new records from the energy info file and update the
+           dictionary.
 
-                    # Use a regex search to split the line into record names and values.
-                    records = _re.findall(r"(\d*\-*\d*\s*[A-Z]+\(*[A-Z]*\)*)\s*=\s*(\-*\d+\.?\d*)", line.upper())
+           Parameters
+           ----------
 
-                    # Append each record to the dictionary.
-                    for key, value in records:
+           flush : bool
+               Whether to flush the final record. This should only be used
+               once the process has finished.
+        """
 
-                        # Strip whitespace from the record key.
-                        key = key.strip()
+        with self._nrg_lock:
+            if self._nrg_parser is None:
+                return
 
-                        # The file hasn't been updated.
-                        if key == "NSTEP":
-                            if "NSTEP" in self._stdout_dict and value == self._stdout_dict["NSTEP"][-1]:
-                                return
-                            else:
-                                self._stdout_dict[key] = value
-                        else:
-                            self._stdout_dict[key] = value
+            # Append each new record to the dictionary, counting time steps
+            # from the start of the simulation.
+            for record in self._nrg_parser.update(flush):
+                for key, value in record:
+                    if key == "NSTEP" and self._step_offset > 0:
+                        value = int(value) + self._step_offset
+                    self._stdout_dict[key] = value
 
     def kill(self):
         """Kill the running process."""
 
-        # Stop and join the watchdog observer.
-        if self._watcher is not None:
-            self._watcher._observer.stop()
-            self._watcher._observer.join()
+        # Stop watching the energy info file.
+        self._stop_watching()
 
         # Kill the process.
         if not self._process is None and self._process.isRunning():
@@ -1568,41 +1940,77 @@ class Amber(_process.Process):
 
         # The process isn't running.
         if not self.isRunning():
+            self._finished()
             return
 
-        if max_time is not None:
-            # Convert int to float.
-            if type(max_time) is int:
-                max_time = float(max_time)
+        # Block until the monitor notifies us that the process has finished.
+        # If the maximum run time is exceeded, kill the job.
+        if not _getMonitor().wait(self, self._get_timeout(max_time)):
+            self.kill()
+            return
 
-            # BioSimSpace.Types.Time
-            if isinstance(max_time, _Type.Type):
-                max_time = max_time.minutes().magnitude()
+        # Stop watching the energy info file and read any remaining records.
+        self._finished()
 
-            # Float.
-            elif type(max_time) is float:
-                if max_time <= 0:
-                    raise ValueError("'max_time' cannot be negative!")
+    async def wait_async(self, max_time=None):
+        """Asynchronously wait for the process to finish. This doesn't block
+           the event loop, so many processes can be awaited concurrently.
 
-            else:
-                raise TypeError("'max_time' must be of type 'BioSimSpace.Types.Time' or 'float'.")
+           Parameters
+           ----------
+
+           max_time: :class:`Time <BioSimSpace.Types.Time>`, int, float
+               The maximimum time to wait (in minutes).
+        """
+
+        # The process isn't running.
+        if not self.isRunning():
+            self._finished()
+            return
+
+        # If the maximum run time is exceeded, kill the job.
+        if not await _getMonitor().waitAsync(self, self._get_timeout(max_time)):
+            self.kill()
+            return
+
+        # Stop watching the energy info file and read any remaining records.
+        self._finished()
+
+    def _get_timeout(self, max_time):
+        """Helper function to work out how much longer to wait for the
+           process, given the maximum run time.
 
-        # Loop until the process is finished.
-        # For some reason we can't use Sire.Base.Process.wait() since it
-        # doesn't work properly with the background threads used for the
-        # watchdog observer.
-        while self._process.isRunning():
-            _time.sleep(1)
+           Parameters
+           ----------
 
-            # The maximum run time has been exceeded, kill the job.
-            if max_time is not None:
-                if self.runTime().magnitude() > max_time:
-                    self.kill()
-                    return
+           max_time: :class:`Time <BioSimSpace.Types.Time>`, int, float
+               The maximimum run time (in minutes).
 
-        # Stop and join the watchdog observer.
-        self._watcher._observer.stop()
-        self._watcher._observer.join()
+           Returns
+           -------
+
+           timeout : float
+               The remaining time (in seconds).
+        """
+
+        max_time = self._max_time_to_seconds(max_time)
+
+        if max_time is None:
+            return None
+        else:
+            return max(0, max_time - 60 * self.runTime().magnitude())
+
+    def _update_records(self):
+        """Read any new thermodynamic records.
+
+           Returns
+           -------
+
+           records : :class:`_RecordStore <BioSimSpace.Process._process._RecordStore>`
+               The record store for the process.
+        """
+        self._update_energy_dict()
+        return self._stdout_dict
 
     def _get_stdout_record(self, key, time_series=False, unit=None):
         """Helper function to get a stdout record from the dictionary.
@@ -1627,7 +2035,7 @@ class Amber(_process.Process):
         """
 
         # No data!
-        if len(self._stdout_dict) is 0:
+        if len(self._stdout_dict) == 0:
             return None
 
         if type(time_series) is not bool:
@@ -1639,30 +2047,14 @@ class Amber(_process.Process):
             if not isinstance(unit, _Type.Type):
                 raise TypeError("'unit' must be of type 'BioSimSpace.Types'")
 
-        # Return the list of dictionary values.
-        if time_series:
-            try:
-                if key is "NSTEP":
-                    return [int(x) for x in self._stdout_dict[key]]
-                else:
-                    if unit is None:
-                        return [float(x) for x in self._stdout_dict[key]]
-                    else:
-                        return [float(x) * unit for x in self._stdout_dict[key]]
-
-            except KeyError:
-                return None
+        try:
+            # Return a view of the time series.
+            if time_series:
+                return self._stdout_dict.timeSeries(key, unit)
 
-        # Return the most recent dictionary value.
-        else:
-            try:
-                if key is "NSTEP":
-                    return int(self._stdout_dict[key][-1])
-                else:
-                    if unit is None:
-                        return float(self._stdout_dict[key][-1])
-                    else:
-                        return float(self._stdout_dict[key][-1]) * unit
+            # Return the most recent value.
+            else:
+                return self._stdout_dict.last(key, unit)
 
-            except KeyError:
-                return None
+        except KeyError:
+            return None
@@ -0,0 +1,825 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+An executor for running processes on worker daemons spread across
+multiple hosts.
+"""
+
+import base64 as _base64
+import hashlib as _hashlib
+import hmac as _hmac
+import ipaddress as _ipaddress
+import json as _json
+import multiprocessing as _multiprocessing
+import os as _os
+import socket as _socket
+import socketserver as _socketserver
+import subprocess as _subprocess
+import sys as _sys
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import uuid as _uuid
+
+from ._executor import Executor as _Executor
+from ._executor import _job_record, _launch
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["ClusterExecutor"]
+
+class ClusterExecutor(_Executor):
+    """An executor that distributes jobs to worker daemons running on any
+       number of hosts. The executor acts as a coordinator, listening for
+       connections from workers, which can be started locally using
+       "startWorkers", or on a remote host by running:
+
+           python -m BioSimSpace.Process._cluster HOST PORT
+
+       Workers pull jobs from the coordinator. Each job is sent along with
+       the contents of its working directory, and is run in a scratch
+       directory on the worker. While the job runs, the worker streams any
+       new or modified files back to the coordinator, so that the local
+       working directory mirrors the remote one and the process can be
+       monitored as usual. Executables must be available on each worker
+       host, and files must be referred to relative to the working
+       directory.
+
+       Messages are JSON objects, one per line, with file contents encoded
+       in base64.
+
+       Workers run any command that the coordinator sends them, and the
+       coordinator sends the contents of its working directories to any
+       worker that connects. By default, the coordinator only listens on
+       the loopback interface. To accept workers from other hosts, a shared
+       'token' must be passed to the constructor, and the same token set in
+       the BSS_CLUSTER_TOKEN environment variable on each remote worker.
+       Workers that don't present the token are disconnected. The token is
+       sent, along with all other traffic, unencrypted, so the coordinator
+       should only be exposed on a trusted network.
+    """
+
+    # Jobs don't use the hardware resources of the local host.
+    _is_local = False
+
+    def __init__(self, host="127.0.0.1", port=0, interval=0.5, token=None):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           host : str
+               The interface to listen on. Use "0.0.0.0" to accept workers
+               from other hosts.
+
+           port : int
+               The port to listen on. If zero, then a free port is chosen.
+
+           interval : float
+               The time in seconds between status updates from the workers.
+
+           token : str
+               A secret shared with the workers, which they must present when
+               they connect. This is required when listening on an interface
+               other than loopback.
+        """
+
+        super().__init__()
+
+        if type(host) is not str:
+            raise TypeError("'host' must be of type 'str'")
+
+        if type(port) is not int:
+            raise TypeError("'port' must be of type 'int'")
+
+        if type(interval) is int:
+            interval = float(interval)
+
+        if type(interval) is not float:
+            raise TypeError("'interval' must be of type 'float'")
+
+        if interval <= 0:
+            raise ValueError("'interval' must be greater than zero!")
+
+        if token is not None:
+            if type(token) is not str:
+                raise TypeError("'token' must be of type 'str'")
+            if len(token) == 0:
+                raise ValueError("'token' must not be empty!")
+
+        # Workers run whatever they are sent, so don't accept connections from
+        # other hosts unless they are authenticated.
+        elif not _is_loopback(host):
+            raise ValueError("A 'token' is required to accept workers from other hosts.")
+
+        self._interval = interval
+        self._token = token
+
+        # The jobs that are waiting for a worker, in order of submission.
+        self._lock = _threading.Lock()
+        self._queue = []
+
+        # The number of connected workers, and the workers started locally.
+        self._num_connected = 0
+        self._workers = []
+        self._is_shutdown = False
+
+        # Listen for workers in a background thread.
+        self._server = _Server((host, port), _Handler)
+        self._server.executor = self
+        self._thread = _threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.Process.ClusterExecutor: address='%s:%d', nWorkers=%d>" \
+            % (*self.address(), self.nWorkers())
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "BioSimSpace.Process.ClusterExecutor('%s', %d)" % self.address()
+
+    def submit(self, exe, args, stdout, stderr, work_dir, environment={}):
+        """Submit a job.
+
+           Parameters
+           ----------
+
+           exe : str
+               The executable.
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to, relative to the
+               working directory.
+
+           stderr : str
+               The name of the file to redirect stderr to, relative to the
+               working directory.
+
+           work_dir : str
+               The working directory.
+
+           environment : dict
+               Additional environment variables.
+
+           Returns
+           -------
+
+           job : :class:`_ClusterJob <BioSimSpace.Process._cluster._ClusterJob>`
+               A handle to the job.
+        """
+
+        if self._is_shutdown:
+            raise ValueError("The executor has been shut down!")
+
+        job = _ClusterJob(self, _job_record(exe, args, stdout, stderr, work_dir, environment))
+
+        with self._lock:
+            self._queue.append(job)
+
+        return job
+
+    def address(self):
+        """Return the address that workers connect to.
+
+           Returns
+           -------
+
+           address : (str, int)
+               The host and port.
+        """
+        return self._server.server_address[:2]
+
+    def nQueued(self):
+        """Return the number of queued jobs.
+
+           Returns
+           -------
+
+           n_queued : int
+               The number of jobs waiting for a worker.
+        """
+        with self._lock:
+            return len(self._queue)
+
+    def nWorkers(self):
+        """Return the number of connected workers.
+
+           Returns
+           -------
+
+           n_workers : int
+               The number of workers connected to the coordinator.
+        """
+        with self._lock:
+            return self._num_connected
+
+    def startWorkers(self, num_workers=1, scratch_dir=None):
+        """Start worker daemons on the local host.
+
+           Parameters
+           ----------
+
+           num_workers : int
+               The number of workers to start.
+
+           scratch_dir : str
+               The directory in which the workers run jobs. If None, then
+               the system temporary directory is used.
+        """
+
+        if type(num_workers) is not int:
+            raise TypeError("'num_workers' must be of type 'int'")
+
+        if num_workers < 1:
+            raise ValueError("'num_workers' must be greater than zero!")
+
+        if scratch_dir is not None and type(scratch_dir) is not str:
+            raise TypeError("'scratch_dir' must be of type 'str'")
+
+        host, port = self.address()
+
+        # Connect via the loopback interface when listening on all interfaces.
+        if host == "0.0.0.0":
+            host = "127.0.0.1"
+
+        for x in range(0, num_workers):
+            worker = _multiprocessing.Process(target=_run_worker,
+                args=(host, port, scratch_dir, self._interval, self._token), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def shutdown(self, timeout=None):
+        """Stop accepting jobs and ask all workers to exit. Each worker exits
+           once it has finished its current job.
+
+           Parameters
+           ----------
+
+           timeout : float
+               The maximum time to wait for the workers to exit, in seconds.
+        """
+
+        self._is_shutdown = True
+
+        if timeout is not None:
+            deadline = _time.time() + timeout
+
+        # Workers are told to exit the next time that they ask for a job.
+        while self.nWorkers() > 0:
+            if timeout is not None and _time.time() > deadline:
+                break
+            _time.sleep(0.1)
+
+        for worker in self._workers:
+            worker.join(None if timeout is None else max(0, deadline - _time.time()))
+
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+
+        # Stop listening once all of the workers have disconnected.
+        if self.nWorkers() == 0:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _nextJob(self):
+        """Return the next queued job, or None if the queue is empty."""
+        with self._lock:
+            if len(self._queue) == 0:
+                return None
+            job = self._queue.pop(0)
+            job._is_queued = False
+            return job
+
+    def _cancel(self, job):
+        """Remove a job from the queue, returning whether it was queued."""
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+                job._is_queued = False
+                return True
+            return False
+
+class _ClusterJob():
+    """A handle to a job submitted to a ClusterExecutor."""
+
+    def __init__(self, executor, record):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           executor : :class:`ClusterExecutor <BioSimSpace.Process.ClusterExecutor>`
+               The executor that the job was submitted to.
+
+           record : dict
+               The job record.
+        """
+        self._executor = executor
+        self._record = record
+        self._job_id = _uuid.uuid4().hex
+        self._is_queued = True
+        self._is_cancelled = False
+        self._return_code = None
+
+    def jobId(self):
+        """Return the job identifier.
+
+           Returns
+           -------
+
+           job_id : str
+               The job identifier.
+        """
+        return self._job_id
+
+    def isQueued(self):
+        """Return whether the job is waiting for a worker.
+
+           Returns
+           -------
+
+           is_queued : bool
+               Whether the job is queued.
+        """
+        return self._is_queued
+
+    def isRunning(self):
+        """Return whether the job is queued or running.
+
+           Returns
+           -------
+
+           is_running : bool
+               Whether the job hasn't finished.
+        """
+        return self._return_code is None
+
+    def isError(self):
+        """Return whether the job failed, or was cancelled.
+
+           Returns
+           -------
+
+           is_error : bool
+               Whether the job failed.
+        """
+        return self._return_code not in [None, 0]
+
+    def kill(self):
+        """Cancel the job. A queued job is removed from the queue, otherwise
+           the worker running the job is asked to kill it.
+        """
+        self._is_cancelled = True
+        if self._executor._cancel(self):
+            self._return_code = -1
+
+    def _message(self):
+        """Create the message that sends the job to a worker.
+
+           Returns
+           -------
+
+           message : dict
+               The message.
+        """
+        record = dict(self._record)
+        work_dir = record.pop("work_dir")
+
+        return { "type" : "job",
+                 "job_id" : self._job_id,
+                 "work_dir" : work_dir,
+                 "record" : record,
+                 "files" : _FileTracker(work_dir).changes() }
+
+class _FileTracker():
+    """Tracks the files in a directory, so that only new or modified data is
+       transferred.
+    """
+
+    def __init__(self, directory):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           directory : str
+               The directory to track.
+        """
+        self._directory = directory
+
+        # The size, modification time, and digest of each file when it was
+        # last sent.
+        self._sent = {}
+
+    def mark(self):
+        """Mark the current contents of the directory as sent."""
+        for path, stat in self._scan():
+            try:
+                with open(_os.path.join(self._directory, path), "rb") as file:
+                    self._sent[path] = (stat.st_size, stat.st_mtime_ns, _digest(file, stat.st_size))
+            except OSError:
+                pass
+
+    def changes(self):
+        """Return the data that has changed since the last call.
+
+           Returns
+           -------
+
+           files : dict
+               A mapping of relative file paths to an offset and the base64
+               encoded data to write from that offset.
+        """
+
+        files = {}
+
+        for path, stat in self._scan():
+            sent = self._sent.get(path)
+
+            if sent is not None and (stat.st_size, stat.st_mtime_ns) == sent[:2]:
+                continue
+
+            try:
+                with open(_os.path.join(self._directory, path), "rb") as file:
+                    # Only send the new data if the file has been appended to,
+                    # i.e. the data that was already sent is unchanged.
+                    # Otherwise, e.g. when a file is rewritten in place, the
+                    # whole file is sent.
+                    offset = 0
+                    if sent is not None and stat.st_size > sent[0] and \
+                        _digest(file, sent[0]) == sent[2]:
+                        offset = sent[0]
+
+                    file.seek(offset)
+                    data = file.read(stat.st_size - offset)
+                    size = offset + len(data)
+                    digest = _digest(file, size)
+            except OSError:
+                continue
+
+            files[path] = [offset, _base64.b64encode(data).decode("ascii")]
+            self._sent[path] = (size, stat.st_mtime_ns, digest)
+
+        return files
+
+    def _scan(self):
+        """Return the relative path and status of each file in the directory."""
+        files = []
+        for root, dirs, names in _os.walk(self._directory):
+            for name in names:
+                path = _os.path.join(root, name)
+                try:
+                    files.append((_os.path.relpath(path, self._directory), _os.stat(path)))
+                except OSError:
+                    pass
+        return files
+
+def _digest(file, size, block_size=65536):
+    """Internal function to compute a digest of the start of a file. This
+       covers the first and last block of data, which is enough to detect
+       when a file has been rewritten rather than appended to, without
+       reading the whole of a large file.
+
+       Parameters
+       ----------
+
+       file : file
+           The file, opened in binary mode.
+
+       size : int
+           The number of bytes at the start of the file to cover.
+
+       block_size : int
+           The size of each block.
+
+       Returns
+       -------
+
+       digest : str
+           The digest.
+    """
+
+    digest = _hashlib.sha1()
+
+    file.seek(0)
+    digest.update(file.read(min(size, block_size)))
+
+    if size > block_size:
+        start = max(block_size, size - block_size)
+        file.seek(start)
+        digest.update(file.read(size - start))
+
+    return digest.hexdigest()
+
+def _is_loopback(host):
+    """Internal function to check whether a host name refers to the
+       loopback interface.
+
+       Parameters
+       ----------
+
+       host : str
+           The host name or address.
+
+       Returns
+       -------
+
+       is_loopback : bool
+           Whether the host is a loopback address.
+    """
+    try:
+        return _ipaddress.ip_address(_socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def _apply_changes(directory, files):
+    """Internal function to write the data sent by a file tracker to a
+       directory.
+
+       Parameters
+       ----------
+
+       directory : str
+           The directory.
+
+       files : dict
+           A mapping of relative file paths to an offset and the base64
+           encoded data to write from that offset.
+    """
+
+    directory = _os.path.abspath(directory)
+
+    for path, (offset, data) in files.items():
+        full_path = _os.path.abspath(_os.path.join(directory, path))
+
+        # Don't allow files to be written outside of the directory.
+        if _os.path.commonpath([directory, full_path]) != directory:
+            raise ValueError("Invalid file path: '%s'" % path)
+
+        _os.makedirs(_os.path.dirname(full_path), exist_ok=True)
+
+        data = _base64.b64decode(data)
+
+        if offset == 0 or not _os.path.isfile(full_path):
+            with open(full_path, "wb") as file:
+                file.write(data)
+        else:
+            with open(full_path, "r+b") as file:
+                file.seek(offset)
+                file.write(data)
+                file.truncate()
+
+def _send(stream, message):
+    """Internal function to send a message.
+
+       Parameters
+       ----------
+
+       stream : file
+           The stream to write to.
+
+       message : dict
+           The message.
+    """
+    stream.write(_json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+def _recv(stream):
+    """Internal function to receive a message.
+
+       Parameters
+       ----------
+
+       stream : file
+           The stream to read from.
+
+       Returns
+       -------
+
+       message : dict
+           The message, or None if the connection was closed.
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return _json.loads(line.decode("utf-8"))
+
+class _Server(_socketserver.ThreadingTCPServer):
+    """The server that workers connect to."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+class _Handler(_socketserver.StreamRequestHandler):
+    """Handles the messages from a single worker."""
+
+    def handle(self):
+        """Serve jobs to the worker until it disconnects."""
+
+        executor = self.server.executor
+
+        # The worker must first present the shared token, if there is one.
+        try:
+            message = _recv(self.rfile)
+        except (OSError, ValueError):
+            return
+
+        if message is None or message.get("type") != "hello":
+            return
+
+        if executor._token is not None:
+            token = message.get("token")
+            if type(token) is not str or \
+                not _hmac.compare_digest(token.encode("utf-8"), executor._token.encode("utf-8")):
+                return
+
+        with executor._lock:
+            executor._num_connected += 1
+
+        job = None
+
+        try:
+            while True:
+                message = _recv(self.rfile)
+
+                if message is None:
+                    break
+
+                # The worker is waiting for a job.
+                if message["type"] == "ready":
+                    if executor._is_shutdown:
+                        _send(self.wfile, { "type" : "shutdown" })
+                        break
+
+                    job = executor._nextJob()
+
+                    if job is None:
+                        _send(self.wfile, { "type" : "wait" })
+                    else:
+                        _send(self.wfile, job._message())
+
+                # The worker has sent an update for the running job.
+                elif message["type"] in ["status", "finished"] and job is not None:
+                    _apply_changes(job._record["work_dir"], message["files"])
+
+                    if message["type"] == "finished":
+                        job._return_code = message["return_code"]
+                        job = None
+                        _send(self.wfile, { "type" : "ok" })
+                    elif job._is_cancelled:
+                        _send(self.wfile, { "type" : "cancel" })
+                    else:
+                        _send(self.wfile, { "type" : "ok" })
+
+        # The connection to the worker was lost.
+        except (OSError, ValueError):
+            pass
+
+        finally:
+            with executor._lock:
+                executor._num_connected -= 1
+
+            # The job can't finish without the worker.
+            if job is not None and job._return_code is None:
+                job._return_code = -1
+
+def _run_worker(host, port, scratch_dir=None, interval=0.5, token=None):
+    """Internal function to run a worker daemon, which pulls jobs from a
+       coordinator and runs them until a shutdown is requested.
+
+       Parameters
+       ----------
+
+       host : str
+           The host of the coordinator.
+
+       port : int
+           The port of the coordinator.
+
+       scratch_dir : str
+           The directory in which to run jobs. If None, then the system
+           temporary directory is used.
+
+       interval : float
+           The time in seconds between status updates.
+
+       token : str
+           The token shared with the coordinator. If None, then the value of
+           the BSS_CLUSTER_TOKEN environment variable is used, if set.
+    """
+
+    if token is None:
+        token = _os.environ.get("BSS_CLUSTER_TOKEN")
+
+    with _socket.create_connection((host, port)) as connection:
+        stream = connection.makefile("rwb")
+
+        _send(stream, { "type" : "hello", "token" : token })
+
+        while True:
+            _send(stream, { "type" : "ready" })
+            message = _recv(stream)
+
+            if message is None or message["type"] == "shutdown":
+                break
+
+            if message["type"] == "wait":
+                _time.sleep(interval)
+                continue
+
+            with _tempfile.TemporaryDirectory(dir=scratch_dir) as work_dir:
+                if not _run_job(stream, message, work_dir, interval):
+                    break
+
+def _run_job(stream, message, work_dir, interval):
+    """Internal function to run a job on a worker.
+
+       Parameters
+       ----------
+
+       stream : file
+           The stream connected to the coordinator.
+
+       message : dict
+           The message containing the job.
+
+       work_dir : str
+           The directory in which to run the job.
+
+       interval : float
+           The time in seconds between status updates.
+
+       Returns
+       -------
+
+       is_connected : bool
+           Whether the worker is still connected to the coordinator.
+    """
+
+    _apply_changes(work_dir, message["files"])
+
+    # Only send back files that the job creates or modifies.
+    tracker = _FileTracker(work_dir)
+    tracker.mark()
+
+    record = message["record"]
+    record["work_dir"] = work_dir
+
+    # Redirect any paths to the original working directory.
+    record["command"] = [arg.replace(message["work_dir"], work_dir)
+                         for arg in record["command"]]
+
+    try:
+        popen = _launch(record)
+    except Exception:
+        popen = None
+        return_code = -1
+
+    # Wait for the job to finish, streaming its output back to the
+    # coordinator, and killing it if cancelled.
+    while popen is not None:
+        try:
+            return_code = popen.wait(interval)
+            break
+        except _subprocess.TimeoutExpired:
+            _send(stream, { "type" : "status", "files" : tracker.changes() })
+            reply = _recv(stream)
+
+            if reply is None:
+                popen.kill()
+                popen.wait()
+                return False
+
+            if reply["type"] == "cancel":
+                popen.kill()
+
+    _send(stream, { "type" : "finished", "return_code" : return_code,
+                    "files" : tracker.changes() })
+
+    return _recv(stream) is not None
+
+if __name__ == "__main__":
+    _run_worker(_sys.argv[1], int(_sys.argv[2]))
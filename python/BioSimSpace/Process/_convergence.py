@@ -0,0 +1,279 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+Convergence-based stopping policies for simulation processes.
+"""
+
+import math as _math
+import numpy as _np
+
+from ..Types._type import Type as _Type
+from ._statistics import _detect_equilibration
+from ._statistics import _statistical_inefficiency
+
+import BioSimSpace.Types as _Types
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["ConvergencePolicy"]
+
+class ConvergencePolicy():
+    """A policy used to stop a process once a set of records has converged.
+       For each record, the end of the equilibration region is detected
+       automatically. The remaining samples must be stationary, i.e. the
+       means of the first and second halves must agree to within their
+       statistical uncertainty, and the standard error of the mean must be
+       below the requested tolerance. The standard errors account for the
+       correlation between samples.
+    """
+
+    def __init__(self, records, min_samples=50, z_score=2.0,
+            interval=_Types.Time(30, "seconds")):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           records : dict
+               A dictionary mapping the name of each record to monitor to
+               the maximum standard error of its mean. Record names match
+               the getter methods of the process, e.g. "Density" for
+               'getCurrentDensity', or "Gradient" for SOMD free energy
+               gradients. Tolerances can be given as a type with the same
+               dimensions as the record, or as a float, which is interpreted
+               in the units in which the record is returned. A tolerance of
+               None only requires that the record is stationary.
+
+           min_samples : int
+               The minimum number of samples required after equilibration.
+
+           z_score : float
+               The number of standard errors by which the means of the two
+               halves of the production region can differ.
+
+           interval : :class:`Time <BioSimSpace.Types.Time>`
+               The minimum wall-clock time between convergence checks.
+        """
+
+        if type(records) is not dict:
+            raise TypeError("'records' must be of type 'dict'")
+
+        if len(records) == 0:
+            raise ValueError("'records' cannot be empty!")
+
+        for record, tolerance in records.items():
+            if type(record) is not str:
+                raise TypeError("'records' keys must be of type 'str'")
+
+            if type(tolerance) is int:
+                tolerance = float(tolerance)
+
+            if tolerance is not None and type(tolerance) is not float \
+                and not isinstance(tolerance, _Type):
+                raise TypeError("Tolerance for record '%s' must be of type 'float', "
+                                "'BioSimSpace.Types._type.Type', or 'None'" % record)
+
+        if type(min_samples) is not int:
+            raise TypeError("'min_samples' must be of type 'int'")
+
+        if min_samples < 4:
+            raise ValueError("'min_samples' must be at least four!")
+
+        if type(z_score) is int:
+            z_score = float(z_score)
+
+        if type(z_score) is not float:
+            raise TypeError("'z_score' must be of type 'float'")
+
+        if z_score <= 0:
+            raise ValueError("'z_score' must be positive!")
+
+        if not isinstance(interval, _Types.Time):
+            raise TypeError("'interval' must be of type 'BioSimSpace.Types.Time'")
+
+        self._records = records.copy()
+        self._min_samples = min_samples
+        self._z_score = z_score
+        self._interval = interval.seconds().magnitude()
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.Process.ConvergencePolicy: records=%s, min_samples=%d, z_score=%s>" \
+            % (list(self._records), self._min_samples, self._z_score)
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "BioSimSpace.Process.ConvergencePolicy(%s, min_samples=%d, z_score=%s)" \
+            % (self._records, self._min_samples, self._z_score)
+
+    def records(self):
+        """Return the names of the monitored records.
+
+           Returns
+           -------
+
+           records : [str]
+               The record names.
+        """
+        return list(self._records)
+
+    def interval(self):
+        """Return the minimum wall-clock time between convergence checks.
+
+           Returns
+           -------
+
+           interval : :class:`Time <BioSimSpace.Types.Time>`
+               The interval between checks.
+        """
+        return _Types.Time(self._interval, "seconds")
+
+    def validate(self, process):
+        """Check that a process can generate the monitored records.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process.
+        """
+        for record in self._records:
+            if not callable(getattr(process, "getCurrent%s" % record, None)):
+                raise ValueError("BioSimSpace.Process.%s doesn't generate '%s' records!"
+                    % (process.__class__.__name__, record))
+
+    def isConverged(self, process):
+        """Return whether all of the monitored records have converged.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process.
+
+           Returns
+           -------
+
+           is_converged : bool
+               Whether the records have converged.
+        """
+        return all(status["converged"] for status in self.getStatus(process).values())
+
+    def getStatus(self, process):
+        """Return the convergence status of each monitored record.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process.
+
+           Returns
+           -------
+
+           status : dict
+               A dictionary mapping each record to a dictionary containing
+               the number of samples, the index of the first sample after
+               equilibration, the mean and standard error of the production
+               region, and whether the record has converged.
+        """
+
+        status = {}
+
+        for record, tolerance in self._records.items():
+            values = getattr(process, "getCurrent%s" % record)(time_series=True)
+            status[record] = self._test(values, tolerance)
+
+        return status
+
+    def _test(self, values, tolerance):
+        """Test whether a single time series has converged.
+
+           Parameters
+           ----------
+
+           values : numpy.ndarray, :class:`_TimeSeries <BioSimSpace.Process._process._TimeSeries>`
+               The time series.
+
+           tolerance : float, :class:`Type <BioSimSpace.Types._type.Type>`
+               The maximum standard error of the mean.
+
+           Returns
+           -------
+
+           status : dict
+               The convergence status of the record.
+        """
+
+        status = { "samples" : 0,
+                   "start" : None,
+                   "mean" : None,
+                   "error" : None,
+                   "converged" : False }
+
+        if values is None:
+            return status
+
+        # Extract the magnitudes, converting the tolerance to the same unit.
+        if hasattr(values, "magnitudes"):
+            if isinstance(tolerance, _Type):
+                tolerance = tolerance / values.unit()
+            values = values.magnitudes()
+        elif isinstance(tolerance, _Type):
+            tolerance = tolerance.magnitude()
+
+        values = _np.asarray(values, dtype=_np.float64)
+        status["samples"] = len(values)
+
+        if len(values) < self._min_samples:
+            return status
+
+        # Discard the equilibration region.
+        start, g, _ = _detect_equilibration(values)
+        production = values[start:]
+        num_samples = len(production)
+
+        status["start"] = start
+        status["mean"] = float(production.mean())
+        status["error"] = _math.sqrt(production.var(ddof=1) * g / num_samples)
+
+        if num_samples < self._min_samples:
+            return status
+
+        # Check that the production region is stationary by comparing the
+        # means of its two halves.
+        half = num_samples // 2
+        errors = []
+        means = []
+        for samples in [production[:half], production[half:]]:
+            means.append(samples.mean())
+            errors.append(samples.var(ddof=1) * _statistical_inefficiency(samples) / len(samples))
+
+        is_stationary = abs(means[0] - means[1]) <= self._z_score * _math.sqrt(sum(errors))
+
+        # Check the precision of the mean.
+        is_precise = tolerance is None or status["error"] <= tolerance
+
+        status["converged"] = bool(is_stationary and is_precise)
+
+        return status
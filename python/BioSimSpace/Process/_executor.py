@@ -0,0 +1,860 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+Executors for launching process executables.
+"""
+
+import concurrent.futures as _futures
+import json as _json
+import multiprocessing as _multiprocessing
+import os as _os
+import subprocess as _subprocess
+import sys as _sys
+import threading as _threading
+import time as _time
+import uuid as _uuid
+
+import Sire.Base as _SireBase
+
+import BioSimSpace._Utils as _Utils
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["Executor", "LocalExecutor", "PoolExecutor", "QueueExecutor",
+           "getDefaultExecutor", "setDefaultExecutor"]
+
+class Executor():
+    """Base class for executors, which launch the executables of simulation
+       processes. Processes delegate to an executor when they are started,
+       so the same workflow can be run locally, or via a queue.
+
+       The object returned by "submit" is a handle to the job, which must
+       provide "isQueued", "isRunning", "isError", and "kill" methods. A job
+       is considered to be running until it has finished, i.e. this includes
+       the time that it spends in a queue.
+    """
+
+    # Whether jobs run on the local host, using its hardware resources.
+    _is_local = True
+
+    def __init__(self):
+        """Constructor."""
+
+	# Don't allow user to create an instance of this base class.
+        if type(self) is Executor:
+            raise Exception("<Executor> must be subclassed.")
+
+    def submit(self, exe, args, stdout, stderr, work_dir, environment={}):
+        """Submit a job.
+
+           Parameters
+           ----------
+
+           exe : str
+               The executable.
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to, relative to the
+               working directory.
+
+           stderr : str
+               The name of the file to redirect stderr to, relative to the
+               working directory.
+
+           work_dir : str
+               The working directory.
+
+           environment : dict
+               Additional environment variables.
+
+           Returns
+           -------
+
+           job : object
+               A handle to the job.
+        """
+        raise NotImplementedError("Derived method 'BioSimSpace.Process.%s.submit()' is not implemented!"
+            % self.__class__.__name__)
+
+class LocalExecutor(Executor):
+    """An executor that runs jobs immediately on the local host."""
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.Process.LocalExecutor>"
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "BioSimSpace.Process.LocalExecutor()"
+
+    def submit(self, exe, args, stdout, stderr, work_dir, environment={}):
+        """Submit a job.
+
+           Parameters
+           ----------
+
+           exe : str
+               The executable.
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to, relative to the
+               working directory.
+
+           stderr : str
+               The name of the file to redirect stderr to, relative to the
+               working directory.
+
+           work_dir : str
+               The working directory.
+
+           environment : dict
+               Additional environment variables.
+
+           Returns
+           -------
+
+           job : Sire.Base.Process
+               A handle to the job.
+        """
+        with _Utils.cd(work_dir), _Utils.environ(environment):
+            return _SireBase.Process.run(exe, args, stdout, stderr)
+
+class PoolExecutor(Executor):
+    """An executor that runs jobs on the local host using a fixed number of
+       workers. Jobs are queued until a worker is free.
+    """
+
+    def __init__(self, max_workers=None):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           max_workers : int
+               The maximum number of jobs to run at once. If None, then the
+               number of cores is used.
+        """
+
+        super().__init__()
+
+        if max_workers is None:
+            from ..Gateway import ResourceManager
+            max_workers = ResourceManager.getCores()
+
+        if type(max_workers) is not int:
+            raise TypeError("'max_workers' must be of type 'int'")
+
+        if max_workers < 1:
+            raise ValueError("'max_workers' must be greater than zero!")
+
+        self._max_workers = max_workers
+        self._pool = _futures.ThreadPoolExecutor(max_workers=max_workers,
+            thread_name_prefix="BioSimSpace.PoolExecutor")
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.Process.PoolExecutor: max_workers=%d>" % self._max_workers
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "BioSimSpace.Process.PoolExecutor(max_workers=%d)" % self._max_workers
+
+    def submit(self, exe, args, stdout, stderr, work_dir, environment={}):
+        """Submit a job.
+
+           Parameters
+           ----------
+
+           exe : str
+               The executable.
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to, relative to the
+               working directory.
+
+           stderr : str
+               The name of the file to redirect stderr to, relative to the
+               working directory.
+
+           work_dir : str
+               The working directory.
+
+           environment : dict
+               Additional environment variables.
+
+           Returns
+           -------
+
+           job : :class:`_PoolJob <BioSimSpace.Process._executor._PoolJob>`
+               A handle to the job.
+        """
+        job = _PoolJob(_job_record(exe, args, stdout, stderr, work_dir, environment))
+        self._pool.submit(job._run)
+        return job
+
+    def maxWorkers(self):
+        """Return the maximum number of jobs that run at once.
+
+           Returns
+           -------
+
+           max_workers : int
+               The maximum number of jobs.
+        """
+        return self._max_workers
+
+class _PoolJob():
+    """A handle to a job run by a PoolExecutor."""
+
+    def __init__(self, record):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           record : dict
+               The job record.
+        """
+        self._record = record
+        self._lock = _threading.Lock()
+        self._popen = None
+        self._is_cancelled = False
+        self._return_code = None
+
+    def _run(self):
+        """Run the job. This is called by a worker thread."""
+
+        with self._lock:
+            if self._is_cancelled:
+                return
+            try:
+                self._popen = _launch(self._record)
+            except Exception:
+                self._return_code = -1
+                return
+
+        self._return_code = self._popen.wait()
+
+    def isQueued(self):
+        """Return whether the job is waiting for a worker.
+
+           Returns
+           -------
+
+           is_queued : bool
+               Whether the job is queued.
+        """
+        return self._popen is None and self._return_code is None and not self._is_cancelled
+
+    def isRunning(self):
+        """Return whether the job is queued or running.
+
+           Returns
+           -------
+
+           is_running : bool
+               Whether the job hasn't finished.
+        """
+        # The job was cancelled before it started.
+        if self._is_cancelled and self._popen is None:
+            return False
+        return self._return_code is None
+
+    def isError(self):
+        """Return whether the job failed, or was cancelled.
+
+           Returns
+           -------
+
+           is_error : bool
+               Whether the job failed.
+        """
+        return self._is_cancelled or self._return_code not in [None, 0]
+
+    def kill(self):
+        """Cancel the job, killing it if it is running."""
+        with self._lock:
+            self._is_cancelled = True
+            if self._popen is not None and self._popen.poll() is None:
+                self._popen.kill()
+
+    def terminate(self):
+        """Cancel the job, sending SIGTERM if it is running so that it can
+           exit cleanly.
+        """
+        with self._lock:
+            if self._popen is None:
+                self._is_cancelled = True
+            elif self._popen.poll() is None:
+                self._popen.terminate()
+
+class QueueExecutor(Executor):
+    """An executor that mimics a cluster batch queue. Jobs are submitted by
+       writing them to a spool directory, from which they are claimed and
+       run by worker daemons. Workers can be started locally using
+       "startWorkers", or on any host that shares the spool directory by
+       running:
+
+           python -m BioSimSpace.Process._executor SPOOL_DIR
+
+       The spool directory contains a sub-directory for each job state:
+       "queued", "running", and "finished". Jobs are claimed by atomically
+       moving them from "queued" to "running", so each is only run once.
+    """
+
+    # Workers may run on any host that shares the spool directory.
+    _is_local = False
+
+    def __init__(self, spool_dir, interval=0.5):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           spool_dir : str
+               The spool directory.
+
+           interval : float
+               The time in seconds between checks for new jobs, or for
+               requests to cancel a running job.
+        """
+
+        super().__init__()
+
+        if type(spool_dir) is not str:
+            raise TypeError("'spool_dir' must be of type 'str'")
+
+        if type(interval) is int:
+            interval = float(interval)
+
+        if type(interval) is not float:
+            raise TypeError("'interval' must be of type 'float'")
+
+        if interval <= 0:
+            raise ValueError("'interval' must be greater than zero!")
+
+        self._spool_dir = _os.path.abspath(spool_dir)
+        self._interval = interval
+        self._workers = []
+
+        _create_spool(self._spool_dir)
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.Process.QueueExecutor: spool_dir='%s', nWorkers=%d>" \
+            % (self._spool_dir, self.nWorkers())
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "BioSimSpace.Process.QueueExecutor('%s')" % self._spool_dir
+
+    def submit(self, exe, args, stdout, stderr, work_dir, environment={}):
+        """Submit a job.
+
+           Parameters
+           ----------
+
+           exe : str
+               The executable.
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to, relative to the
+               working directory.
+
+           stderr : str
+               The name of the file to redirect stderr to, relative to the
+               working directory.
+
+           work_dir : str
+               The working directory.
+
+           environment : dict
+               Additional environment variables.
+
+           Returns
+           -------
+
+           job : :class:`_QueueJob <BioSimSpace.Process._executor._QueueJob>`
+               A handle to the job.
+        """
+
+        # Job identifiers sort in order of submission.
+        job_id = "%020d-%s" % (_time.time_ns(), _uuid.uuid4().hex)
+
+        _write_record(self._spool_dir, "queued", job_id,
+            _job_record(exe, args, stdout, stderr, work_dir, environment))
+
+        return _QueueJob(self._spool_dir, job_id)
+
+    def spoolDir(self):
+        """Return the spool directory.
+
+           Returns
+           -------
+
+           spool_dir : str
+               The spool directory.
+        """
+        return self._spool_dir
+
+    def nQueued(self):
+        """Return the number of queued jobs.
+
+           Returns
+           -------
+
+           n_queued : int
+               The number of jobs waiting for a worker.
+        """
+        return len(_list_jobs(self._spool_dir, "queued"))
+
+    def nRunning(self):
+        """Return the number of running jobs.
+
+           Returns
+           -------
+
+           n_running : int
+               The number of jobs that have been claimed by a worker.
+        """
+        return len(_list_jobs(self._spool_dir, "running"))
+
+    def startWorkers(self, num_workers=1):
+        """Start worker daemons on the local host.
+
+           Parameters
+           ----------
+
+           num_workers : int
+               The number of workers to start.
+        """
+
+        if type(num_workers) is not int:
+            raise TypeError("'num_workers' must be of type 'int'")
+
+        if num_workers < 1:
+            raise ValueError("'num_workers' must be greater than zero!")
+
+        # Remove any previous shutdown request.
+        try:
+            _os.remove(_os.path.join(self._spool_dir, "shutdown"))
+        except FileNotFoundError:
+            pass
+
+        for x in range(0, num_workers):
+            worker = _multiprocessing.Process(target=_run_worker,
+                args=(self._spool_dir, self._interval), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stopWorkers(self, timeout=None):
+        """Ask all workers using the spool directory to exit. Each worker
+           exits once it has finished its current job.
+
+           Parameters
+           ----------
+
+           timeout : float
+               The maximum time to wait for the local workers to exit, in
+               seconds.
+        """
+
+        with open(_os.path.join(self._spool_dir, "shutdown"), "w"):
+            pass
+
+        for worker in self._workers:
+            worker.join(timeout)
+
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+
+    def nWorkers(self):
+        """Return the number of local workers.
+
+           Returns
+           -------
+
+           n_workers : int
+               The number of workers started by this executor that are running.
+        """
+        return len([worker for worker in self._workers if worker.is_alive()])
+
+class _QueueJob():
+    """A handle to a job submitted to a QueueExecutor."""
+
+    def __init__(self, spool_dir, job_id):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           spool_dir : str
+               The spool directory.
+
+           job_id : str
+               The job identifier.
+        """
+        self._spool_dir = spool_dir
+        self._job_id = job_id
+        self._result = None
+
+    def _path(self, state):
+        """Return the path of the job record for a given state."""
+        return _os.path.join(self._spool_dir, state, "%s.json" % self._job_id)
+
+    def _getResult(self):
+        """Return the result of the job, or None if it hasn't finished."""
+        if self._result is None:
+            try:
+                with open(self._path("finished"), "r") as file:
+                    self._result = _json.load(file)
+            except FileNotFoundError:
+                pass
+        return self._result
+
+    def jobId(self):
+        """Return the job identifier.
+
+           Returns
+           -------
+
+           job_id : str
+               The job identifier.
+        """
+        return self._job_id
+
+    def isQueued(self):
+        """Return whether the job is waiting for a worker.
+
+           Returns
+           -------
+
+           is_queued : bool
+               Whether the job is queued.
+        """
+        return _os.path.isfile(self._path("queued"))
+
+    def isRunning(self):
+        """Return whether the job is queued or running.
+
+           Returns
+           -------
+
+           is_running : bool
+               Whether the job hasn't finished.
+        """
+        return self._getResult() is None
+
+    def isError(self):
+        """Return whether the job failed, or was cancelled.
+
+           Returns
+           -------
+
+           is_error : bool
+               Whether the job failed.
+        """
+        result = self._getResult()
+        return result is not None and result["return_code"] != 0
+
+    def kill(self):
+        """Cancel the job. A queued job is removed from the queue, otherwise
+           the worker running the job is asked to kill it.
+        """
+
+        if self._getResult() is not None:
+            return
+
+        # Ask the worker to kill the job. This is done first, so that a worker
+        # that claims the job from now on won't launch it.
+        with open(self._path("cancel"), "w"):
+            pass
+
+        # Remove the job from the queue. This fails if a worker has already
+        # claimed it.
+        try:
+            _os.rename(self._path("queued"), self._path("cancelled"))
+            _write_record(self._spool_dir, "finished", self._job_id, { "return_code" : -1 })
+            _os.remove(self._path("cancelled"))
+        except FileNotFoundError:
+            pass
+
+        # The worker removes the request once the job has finished, but it
+        # may have finished before the request was made.
+        if self._getResult() is not None:
+            _remove_file(self._path("cancel"))
+
+def _job_record(exe, args, stdout, stderr, work_dir, environment):
+    """Internal function to create a job record.
+
+       Returns
+       -------
+
+       record : dict
+           The job record.
+    """
+
+    if type(args) is str:
+        args = [args]
+
+    return { "command" : [exe] + list(args),
+             "stdout" : stdout,
+             "stderr" : stderr,
+             "work_dir" : _os.path.abspath(work_dir),
+             "environment" : { k : str(v) for k, v in environment.items() } }
+
+def _launch(record):
+    """Internal function to launch the command in a job record.
+
+       Parameters
+       ----------
+
+       record : dict
+           The job record.
+
+       Returns
+       -------
+
+       popen : subprocess.Popen
+           The running command.
+    """
+
+    environment = dict(_os.environ)
+    environment.update(record["environment"])
+
+    work_dir = record["work_dir"]
+    stdout = open(_os.path.join(work_dir, record["stdout"]), "w")
+
+    # Redirect both streams to the same file.
+    if record["stderr"] == record["stdout"]:
+        stderr = _subprocess.STDOUT
+    else:
+        stderr = open(_os.path.join(work_dir, record["stderr"]), "w")
+
+    try:
+        return _subprocess.Popen(record["command"], cwd=work_dir, env=environment,
+            stdout=stdout, stderr=stderr)
+    finally:
+        stdout.close()
+        if stderr is not _subprocess.STDOUT:
+            stderr.close()
+
+def _create_spool(spool_dir):
+    """Internal function to create the directory structure for a spool.
+
+       Parameters
+       ----------
+
+       spool_dir : str
+           The spool directory.
+    """
+    for state in ["tmp", "queued", "running", "finished", "cancelled", "cancel"]:
+        _os.makedirs(_os.path.join(spool_dir, state), exist_ok=True)
+
+def _write_record(spool_dir, state, job_id, record):
+    """Internal function to atomically write a job record to the spool.
+
+       Parameters
+       ----------
+
+       spool_dir : str
+           The spool directory.
+
+       state : str
+           The state of the job.
+
+       job_id : str
+           The job identifier.
+
+       record : dict
+           The job record.
+    """
+
+    tmp_file = _os.path.join(spool_dir, "tmp", "%s.%s.json" % (job_id, state))
+
+    with open(tmp_file, "w") as file:
+        _json.dump(record, file)
+
+    _os.replace(tmp_file, _os.path.join(spool_dir, state, "%s.json" % job_id))
+
+def _remove_file(file):
+    """Internal function to remove a file, if it exists.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the file.
+    """
+    try:
+        _os.remove(file)
+    except FileNotFoundError:
+        pass
+
+def _remove_stale_cancels(spool_dir):
+    """Internal function to remove requests to cancel jobs that have already
+       finished.
+
+       Parameters
+       ----------
+
+       spool_dir : str
+           The spool directory.
+    """
+    for job_id in _list_jobs(spool_dir, "cancel"):
+        if _os.path.isfile(_os.path.join(spool_dir, "finished", "%s.json" % job_id)):
+            _remove_file(_os.path.join(spool_dir, "cancel", "%s.json" % job_id))
+
+def _list_jobs(spool_dir, state):
+    """Internal function to list the jobs in a given state, in order of
+       submission.
+
+       Parameters
+       ----------
+
+       spool_dir : str
+           The spool directory.
+
+       state : str
+           The state of the jobs.
+
+       Returns
+       -------
+
+       job_ids : [str]
+           The job identifiers.
+    """
+    return sorted(file[:-5] for file in _os.listdir(_os.path.join(spool_dir, state))
+                  if file.endswith(".json"))
+
+def _run_worker(spool_dir, interval=0.5):
+    """Internal function to run a worker daemon, which claims and runs jobs
+       from a spool directory until a shutdown is requested.
+
+       Parameters
+       ----------
+
+       spool_dir : str
+           The spool directory.
+
+       interval : float
+           The time in seconds between checks for new jobs, or for requests
+           to cancel the running job.
+    """
+
+    _create_spool(spool_dir)
+
+    while not _os.path.isfile(_os.path.join(spool_dir, "shutdown")):
+        job_id = None
+
+        # Claim the oldest job that no other worker has claimed.
+        for queued_id in _list_jobs(spool_dir, "queued"):
+            try:
+                _os.rename(_os.path.join(spool_dir, "queued", "%s.json" % queued_id),
+                           _os.path.join(spool_dir, "running", "%s.json" % queued_id))
+                job_id = queued_id
+                break
+            except FileNotFoundError:
+                pass
+
+        if job_id is None:
+            _remove_stale_cancels(spool_dir)
+            _time.sleep(interval)
+            continue
+
+        running_file = _os.path.join(spool_dir, "running", "%s.json" % job_id)
+        cancel_file = _os.path.join(spool_dir, "cancel", "%s.json" % job_id)
+
+        try:
+            # The job was cancelled before it was launched.
+            if _os.path.isfile(cancel_file):
+                raise RuntimeError("The job was cancelled.")
+
+            with open(running_file, "r") as file:
+                popen = _launch(_json.load(file))
+
+            # Wait for the job to finish, killing it if cancelled.
+            while True:
+                try:
+                    return_code = popen.wait(interval)
+                    break
+                except _subprocess.TimeoutExpired:
+                    if _os.path.isfile(cancel_file):
+                        popen.kill()
+
+        # The job couldn't be launched.
+        except Exception:
+            return_code = -1
+
+        _write_record(spool_dir, "finished", job_id, { "return_code" : return_code })
+
+        for file in [running_file, cancel_file]:
+            _remove_file(file)
+
+def getDefaultExecutor():
+    """Return the executor used by processes that haven't been assigned one.
+
+       Returns
+       -------
+
+       executor : :class:`Executor <BioSimSpace.Process.Executor>`
+           The default executor.
+    """
+    return _default_executor
+
+def setDefaultExecutor(executor):
+    """Set the executor used by processes that haven't been assigned one.
+
+       Parameters
+       ----------
+
+       executor : :class:`Executor <BioSimSpace.Process.Executor>`
+           The default executor.
+    """
+    global _default_executor
+
+    if not isinstance(executor, Executor):
+        raise TypeError("'executor' must be of type 'BioSimSpace.Process.Executor'")
+
+    _default_executor = executor
+
+# Jobs are run immediately on the local host by default.
+_default_executor = LocalExecutor()
+
+if __name__ == "__main__":
+    _run_worker(_os.path.abspath(_sys.argv[1]))
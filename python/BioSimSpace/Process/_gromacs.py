@@ -26,6 +26,7 @@ Functionality for running simulations with GROMACS.
 import math as _math
 import os as _os
 import pygtail as _pygtail
+import struct as _struct
 import subprocess as _subprocess
 import timeit as _timeit
 import warnings as _warnings
@@ -38,6 +39,7 @@ from . import _process
 from .._Exceptions import MissingSoftwareError as _MissingSoftwareError
 from .._SireWrappers import System as _System
 from ..Trajectory import Trajectory as _Trajectory
+from ..Trajectory._trajectory import _getFrame
 
 import BioSimSpace.Protocol as _Protocol
 import BioSimSpace.Types._type as _Type
@@ -49,11 +51,391 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["Gromacs"]
 
+# Magic numbers at the start and end of a complete GROMACS checkpoint file.
+_cpt_magic = _struct.pack(">i", 171817)
+_cpt_footer_magic = _struct.pack(">i", 171819)
+
+def _is_checkpoint(file):
+    """Internal function to check whether a GROMACS checkpoint file is
+       complete, i.e. that it wasn't truncated when the process was killed.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the checkpoint file.
+
+       Returns
+       -------
+
+       is_checkpoint : bool
+           Whether the file is a complete checkpoint.
+    """
+    try:
+        with open(file, "rb") as f:
+            header = f.read(4)
+            f.seek(-4, _os.SEEK_END)
+            footer = f.read(4)
+    except OSError:
+        return False
+
+    return header == _cpt_magic and footer == _cpt_footer_magic
+
+# Whether each GROMACS executable uses thread-MPI, found on first use.
+_thread_mpi = {}
+
+def _is_thread_mpi(exe):
+    """Internal function to check whether a GROMACS executable was built with
+       its own thread-MPI library, rather than an external MPI library, e.g.
+       "gmx" rather than "gmx_mpi". Only thread-MPI builds accept the "-nt"
+       option.
+
+       Parameters
+       ----------
+
+       exe : str
+           The path to the GROMACS executable.
+
+       Returns
+       -------
+
+       is_thread_mpi : bool
+           Whether the executable uses thread-MPI.
+    """
+
+    if exe not in _thread_mpi:
+        # Fall back to the naming convention for external MPI builds.
+        is_thread_mpi = not _os.path.basename(exe).startswith(("gmx_mpi", "mdrun_mpi"))
+
+        # The version information lists the MPI library, e.g.
+        # "MPI library:        thread_mpi".
+        try:
+            proc = _subprocess.run([exe, "-version"], stdout=_subprocess.PIPE,
+                stderr=_subprocess.STDOUT, universal_newlines=True, timeout=60)
+            for line in proc.stdout.splitlines():
+                if line.strip().startswith("MPI library:"):
+                    is_thread_mpi = "thread_mpi" in line
+                    break
+        except (OSError, _subprocess.SubprocessError):
+            pass
+
+        _thread_mpi[exe] = is_thread_mpi
+
+    return _thread_mpi[exe]
+
+def _normalise_key(key):
+    """Normalise the name of a thermodynamic record so that the formatting
+       is consistent, e.g. "Pres. DC (bar)" becomes "PRESDC".
+
+       Parameters
+       ----------
+
+       key : str
+           The name of the record.
+
+       Returns
+       -------
+
+       key : str
+           The normalised record key.
+    """
+
+    # Convert to upper case and strip whitespace and newlines from beginning and end.
+    key = key.upper().strip()
+
+    # Remove whitespace, periods, hyphens, and parentheses.
+    for char in " .-()":
+        key = key.replace(char, "")
+
+    # Remove instances of BAR.
+    key = key.replace("BAR", "")
+
+    return key
+
+class _EdrReader():
+    """An incremental reader for GROMACS binary energy (.edr) files, as written
+       by GROMACS 4.5, or later. The reader remembers the byte offset of the
+       end of the last complete frame, so each update only decodes frames that
+       have been appended since the previous read. Partially written frames
+       are left until the next update.
+    """
+
+    # Magic numbers used in the file and frame headers.
+    _header_magic = -55555
+    _frame_magic = -7777777
+
+    # The value used by GROMACS to check the floating point precision.
+    _check_real = -2e10
+
+    # The size, in bytes, of each sub-block data type: int, float, double,
+    # int64, and char. (Characters are padded to four bytes.)
+    _type_sizes = { 0 : 4, 1 : 4, 2 : 8, 3 : 8, 4 : 4 }
+
+    def __init__(self, file):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           file : str
+               The path to the energy file.
+        """
+        self._file = file
+        self.reset()
+
+    def reset(self):
+        """Reset the reader so that the file is read from the beginning."""
+        self._offset = 0
+        self._inode = None
+        self._names = None
+        self._real = None
+
+    def names(self):
+        """Return the names of the energy terms.
+
+           Returns
+           -------
+
+           names : [str]
+               The names of the energy terms, or None if the file header
+               hasn't been read.
+        """
+        return self._names
+
+    def update(self):
+        """Decode any frames that have been appended to the file since the
+           last update.
+
+           Returns
+           -------
+
+           frames : [(int, float, [float])]
+               A list of (step, time, energies) tuples for each new frame.
+               The time is in picoseconds and the energies are in the same
+               order as the names of the energy terms.
+        """
+
+        try:
+            stat = _os.stat(self._file)
+        except FileNotFoundError:
+            return []
+
+        # The file has been replaced, or truncated. Start again.
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self.reset()
+            self._inode = stat.st_ino
+
+        # Nothing new has been written.
+        if stat.st_size == self._offset:
+            return []
+
+        # Read the new data.
+        with open(self._file, "rb") as file:
+            file.seek(self._offset)
+            data = file.read()
+
+        frames = []
+        pos = 0
+
+        try:
+            # Read the file header.
+            if self._names is None:
+                pos = self._read_header(data, pos)
+
+            # Read each complete frame.
+            while pos < len(data):
+                step, time, energies, pos = self._read_frame(data, pos)
+
+                # Only store frames containing the full set of energies.
+                if len(energies) == len(self._names):
+                    frames.append((step, time, energies))
+
+        # The final frame is incomplete.
+        except _struct.error:
+            pass
+
+        self._offset += pos
+
+        return frames
+
+    def _read_header(self, data, pos):
+        """Read the names of the energy terms from the file header.
+
+           Parameters
+           ----------
+
+           data : bytes
+               The file data.
+
+           pos : int
+               The current position in the data.
+
+           Returns
+           -------
+
+           pos : int
+               The position of the end of the header.
+        """
+
+        magic, = _struct.unpack_from(">i", data, pos)
+        pos += 4
+
+        if magic != self._header_magic:
+            raise IOError("Unsupported GROMACS energy file: '%s'" % self._file)
+
+        version, num_terms = _struct.unpack_from(">ii", data, pos)
+        pos += 8
+
+        names = []
+        for x in range(0, num_terms):
+            name, pos = self._read_string(data, pos)
+            names.append(name)
+
+            # Skip the unit.
+            if version >= 2:
+                _, pos = self._read_string(data, pos)
+
+        self._names = names
+
+        return pos
+
+    def _read_frame(self, data, pos):
+        """Read a single energy frame.
+
+           Parameters
+           ----------
+
+           data : bytes
+               The file data.
+
+           pos : int
+               The current position in the data.
+
+           Returns
+           -------
+
+           step : int
+               The integration step.
+
+           time : float
+               The simulation time in picoseconds.
+
+           energies : [float]
+               The energies for the frame.
+
+           pos : int
+               The position of the end of the frame.
+        """
+
+        # Work out the precision of real values from the first frame.
+        if self._real is None:
+            if _struct.unpack_from(">f", data, pos)[0] < 0.5*self._check_real:
+                self._real = "f"
+            elif _struct.unpack_from(">d", data, pos)[0] < 0.5*self._check_real:
+                self._real = "d"
+            else:
+                raise IOError("Unsupported GROMACS energy file: '%s'" % self._file)
+
+        real_size = _struct.calcsize(self._real)
+        pos += real_size
+
+        magic, version, time, step, num_sum = _struct.unpack_from(">iidqi", data, pos)
+        pos += 28
+
+        if magic != self._frame_magic or version < 4:
+            raise IOError("Unsupported GROMACS energy file: '%s'" % self._file)
+
+        # Skip the number of steps.
+        pos += 8
+
+        # Skip the time step.
+        if version >= 5:
+            pos += 8
+
+        num_terms, _, num_blocks = _struct.unpack_from(">iii", data, pos)
+        pos += 12
+
+        # Read the sub-block types and sizes.
+        sub_blocks = []
+        for x in range(0, num_blocks):
+            _, num_sub = _struct.unpack_from(">ii", data, pos)
+            pos += 8
+            for y in range(0, num_sub):
+                sub_blocks.append(_struct.unpack_from(">ii", data, pos))
+                pos += 8
+
+        # Skip the energy size and two reserved values.
+        pos += 12
+
+        # Read the energies, skipping averages and sums.
+        if num_sum > 0:
+            values = _struct.unpack_from(">%d%s" % (3*num_terms, self._real), data, pos)
+            energies = list(values[0::3])
+            pos += 3*num_terms*real_size
+        else:
+            energies = list(_struct.unpack_from(">%d%s" % (num_terms, self._real), data, pos))
+            pos += num_terms*real_size
+
+        # Skip the sub-block data.
+        for data_type, num_values in sub_blocks:
+            if data_type in self._type_sizes:
+                pos += num_values * self._type_sizes[data_type]
+
+            # Strings.
+            elif data_type == 5:
+                for x in range(0, num_values):
+                    pos += 4
+                    _, pos = self._read_string(data, pos)
+
+            else:
+                raise IOError("Unsupported GROMACS energy file: '%s'" % self._file)
+
+        # Make sure that the entire frame has been written.
+        if pos > len(data):
+            raise _struct.error("Incomplete frame.")
+
+        return step, time, energies, pos
+
+    def _read_string(self, data, pos):
+        """Read an XDR string.
+
+           Parameters
+           ----------
+
+           data : bytes
+               The file data.
+
+           pos : int
+               The current position in the data.
+
+           Returns
+           -------
+
+           string : str
+               The string.
+
+           pos : int
+               The position of the end of the string.
+        """
+
+        length, = _struct.unpack_from(">I", data, pos)
+        pos += 4
+
+        if pos + length > len(data):
+            raise _struct.error("Incomplete string.")
+
+        string = data[pos:pos+length].decode("utf-8", "replace")
+
+        # Strings are padded to a multiple of four bytes.
+        pos += 4 * ((length + 3) // 4)
+
+        return string, pos
+
 class Gromacs(_process.Process):
     """A class for running simulations using GROMACS."""
 
     def __init__(self, system, protocol, exe=None, name="gromacs",
-            work_dir=None, seed=None, property_map={}):
+            work_dir=None, seed=None, property_map={}, use_edr=False):
         """Constructor.
 
            Parameters
@@ -81,6 +463,11 @@ class Gromacs(_process.Process):
                A dictionary that maps system "properties" to their user defined
                values. This allows the user to refer to properties with their
                own naming scheme, e.g. { "charge" : "my-charge" }
+
+           use_edr : bool
+               Whether to read thermodynamic records directly from the binary
+               energy file, rather than the log file. This gives full precision
+               records for every energy output step.
         """
 
         # Call the base class constructor.
@@ -106,11 +493,20 @@ class Gromacs(_process.Process):
                                             "Please install GROMACS (http://www.gromacs.org).")
 
         # Initialise the stdout dictionary and title header.
-        self._stdout_dict = _process._MultiDict()
+        self._stdout_dict = _process._RecordStore(int_keys=["STEP"])
 
         # Store the name of the GROMACS log file.
         self._log_file = "%s/%s.log" % (self._work_dir, name)
 
+        # Store the name of the GROMACS energy file.
+        self._edr_file = "%s/%s.edr" % (self._work_dir, name)
+
+        # Whether to read records from the energy file.
+        if type(use_edr) is not bool:
+            raise TypeError("'use_edr' must be of type 'bool'")
+        self._use_edr = use_edr
+        self._edr_reader = None
+
         # The names of the input files.
         self._gro_file = "%s/%s.gro" % (self._work_dir, name)
         self._top_file = "%s/%s.top" % (self._work_dir, name)
@@ -536,6 +932,35 @@ class Gromacs(_process.Process):
         self.setArg("-v", True)             # Verbose output.
         self.setArg("-deffnm", self._name)  # Output file prefix.
 
+    def _setResources(self, num_threads=None, gpu_devices=None):
+        """Set the hardware resources that the process can use. These are
+           applied when the process is next started.
+
+           Parameters
+           ----------
+
+           num_threads : int
+               The number of CPU threads.
+
+           gpu_devices : [str]
+               The IDs of the GPU devices.
+        """
+
+        super()._setResources(num_threads, gpu_devices)
+
+        # Run a single rank using the assigned number of OpenMP threads. The
+        # total number of threads can only be set for thread-MPI builds. With
+        # an external MPI library the number of ranks is set by the launcher.
+        if num_threads is None:
+            self.deleteArg("-nt")
+            self.deleteArg("-ntomp")
+        else:
+            if _is_thread_mpi(self._exe):
+                self.setArg("-nt", num_threads)
+            else:
+                self.deleteArg("-nt")
+            self.setArg("-ntomp", num_threads)
+
     def _generate_binary_run_file(self):
         """Use grommp to generate the binary run input file."""
 
@@ -616,20 +1041,39 @@ class Gromacs(_process.Process):
             if self._process.isRunning():
                 return
 
+        # Resume from a checkpoint, if one was found when the process failed.
+        checkpoint = self._checkpoint
+        self._checkpoint = None
+
         # Clear any existing output.
         self._clear_output()
 
+        # The output files are read from the start, so reset the records. When
+        # resuming, GROMACS truncates the output files at the checkpoint and
+        # appends to them, so the records remain continuous.
+        self._stdout_dict = _process._RecordStore(int_keys=["STEP"])
+
+        # Create a new reader for the energy file.
+        if self._use_edr:
+            self._edr_reader = _EdrReader(self._edr_file)
+
         # Run the process in the working directory.
         with _Utils.cd(self._work_dir):
 
             # Create the arguments string list.
             args = self.getArgStringList()
+            arg_string = self.getArgString()
+
+            # Continue from the checkpoint, appending to the existing output.
+            if checkpoint is not None:
+                args += ["-cpi", checkpoint["file"], "-append"]
+                arg_string += " -cpi %s -append" % checkpoint["file"]
 
             # Write the command-line process to a README.txt file.
             with open("README.txt", "w") as f:
 
                 # Set the command-line string.
-                self._command = "%s " % self._exe + self.getArgString()
+                self._command = "%s " % self._exe + arg_string
 
                 # Write the command to file.
                 f.write("# GROMACS was run with the following command:\n")
@@ -639,8 +1083,7 @@ class Gromacs(_process.Process):
             self._timer = _timeit.default_timer()
 
             # Start the simulation.
-            self._process = _SireBase.Process.run(self._exe, args,
-                "%s.out" % self._name, "%s.out" % self._name)
+            self._process = self._submit(args, "%s.out" % self._name, "%s.out" % self._name)
 
             # For historical reasons (console message aggregation with MPI), Gromacs
             # writes the majority of its output to stderr. For user convenience, we
@@ -649,8 +1092,71 @@ class Gromacs(_process.Process):
             with open(self._stderr_file, "w") as f:
                 f.write("All output has been redirected to the stdout stream!\n")
 
+        # Stop the process early once it has converged.
+        self._watch_convergence()
+
         return self
 
+    def _findCheckpoint(self):
+        """Find the latest valid checkpoint in the working directory. GROMACS
+           writes a checkpoint file periodically, keeping the previous one
+           as a backup.
+
+           Returns
+           -------
+
+           checkpoint : dict
+               The name of the checkpoint file, or None if there isn't a
+               valid checkpoint.
+        """
+
+        # Energy minimisation doesn't write checkpoints.
+        if type(self._protocol) is _Protocol.Minimisation:
+            return None
+
+        for file in ["%s.cpt" % self._name, "%s_prev.cpt" % self._name]:
+            if _is_checkpoint("%s/%s" % (self._work_dir, file)):
+                return { "file" : file }
+
+        return None
+
+    def _checkpointPattern(self):
+        """Return a glob pattern matching the checkpoint files written by the
+           process while it is running.
+
+           Returns
+           -------
+
+           pattern : str
+               The pattern, or None if the process doesn't write checkpoints.
+        """
+        if type(self._protocol) is _Protocol.Minimisation:
+            return None
+        return "%s*.cpt" % self._name
+
+    def _stop(self):
+        """Stop the process cleanly once it has converged. GROMACS stops at
+           the next neighbour search step when it receives SIGTERM, writing
+           a checkpoint and the final configuration.
+        """
+        try:
+            self._process.terminate()
+        # The executor can't signal the job, so wait for the next checkpoint.
+        except AttributeError:
+            super()._stop()
+
+    def _update_records(self):
+        """Read any new thermodynamic records.
+
+           Returns
+           -------
+
+           records : :class:`_RecordStore <BioSimSpace.Process._process._RecordStore>`
+               The record store for the process.
+        """
+        self._update_stdout_dict()
+        return self._stdout_dict
+
     def getSystem(self, block="AUTO"):
         """Get the latest molecular system.
 
@@ -696,7 +1202,7 @@ class Gromacs(_process.Process):
         else:
             # Grab the last frame from the current trajectory file.
             try:
-                new_system = self.getTrajectory().getFrames()[-1]
+                new_system = self._getFinalFrame()
 
                 # If the system contains perturbable molecules, then
                 # copy the new coordinates back into the original system.
@@ -706,11 +1212,35 @@ class Gromacs(_process.Process):
                     return old_system
                 else:
                     # Preserve the original fileformat property.
+                    new_system._detach()
                     new_system._sire_system.setProperty("fileformat", _SireBase.wrap("GroTop,Gro87"))
                     return new_system
             except:
                 return None
 
+    def _getFinalFrame(self):
+        """Helper function to get the final frame of the simulation without
+           loading the entire trajectory.
+
+           Returns
+           -------
+
+           system : :class:`System <BioSimSpace._SireWrappers.System>`
+               The final frame of the simulation.
+        """
+
+        # When the process finishes, mdrun writes the final configuration to
+        # the GRO file, replacing the input configuration. If it is newer than
+        # the run input file, then use it directly.
+        if not self.isRunning() and _os.path.isfile(self._gro_file) and \
+            _os.path.getmtime(self._gro_file) > _os.path.getmtime(self._tpr_file):
+            return _System(_SireIO.MoleculeParser.read([self._gro_file, self._top_file], self._property_map))
+
+        # Otherwise, only read the last frame of the trajectory. The GRO file
+        # is used as the topology for MDTraj.
+        with _Utils.cd(self._work_dir):
+            return _getFrame(self._traj_file, self._top_file, -1, coordinates=self._gro_file)
+
     def getCurrentSystem(self):
         """Get the latest molecular system.
 
@@ -820,8 +1350,8 @@ class Gromacs(_process.Process):
            Returns
            -------
 
-           records : :class:`MultiDict <BioSimSpace.Process._process._MultiDict>`
-              The dictionary of time-series records.
+           records : dict
+              A dictionary mapping each record key to a NumPy array of values.
         """
         # Wait for the process to finish.
         if block is True:
@@ -843,10 +1373,10 @@ class Gromacs(_process.Process):
            Returns
            -------
 
-           records : :class:`MultiDict <BioSimSpace.Process._process._MultiDict>`
-              The dictionary of time-series records.
+           records : dict
+              A dictionary mapping each record key to a NumPy array of values.
         """
-        return getRecords(block=False)
+        return self.getRecords(block=False)
 
     def getTime(self, time_series=False, block="AUTO"):
         """Get the time (in nanoseconds).
@@ -1596,6 +2126,80 @@ class Gromacs(_process.Process):
         """
         return self.getPressureDC(time_series, block=False)
 
+    def getVolume(self, time_series=False, block="AUTO"):
+        """Get the volume.
+
+           Parameters
+           ----------
+
+           time_series : bool
+               Whether to return a list of time series records.
+
+           block : bool
+               Whether to block until the process has finished running.
+
+           Returns
+           -------
+
+           volume : :class:`Volume <BioSimSpace.Types.Volume>`
+               The volume.
+        """
+        return self.getRecord("VOLUME", time_series, _Units.Volume.nanometer3, block)
+
+    def getCurrentVolume(self, time_series=False):
+        """Get the current volume.
+
+           Parameters
+           ----------
+
+           time_series : bool
+               Whether to return a list of time series records.
+
+           Returns
+           -------
+
+           volume : :class:`Volume <BioSimSpace.Types.Volume>`
+               The current volume.
+        """
+        return self.getVolume(time_series, block=False)
+
+    def getDensity(self, time_series=False, block="AUTO"):
+        """Get the density (in kg per cubic meter).
+
+           Parameters
+           ----------
+
+           time_series : bool
+               Whether to return a list of time series records.
+
+           block : bool
+               Whether to block until the process has finished running.
+
+           Returns
+           -------
+
+           density : float
+              The density.
+        """
+        return self.getRecord("DENSITY", time_series, None, block)
+
+    def getCurrentDensity(self, time_series=False):
+        """Get the current density (in kg per cubic meter).
+
+           Parameters
+           ----------
+
+           time_series : bool
+               Whether to return a list of time series records.
+
+           Returns
+           -------
+
+           density : float
+              The current density.
+        """
+        return self.getDensity(time_series, block=False)
+
     def getConstraintRMSD(self, time_series=False, block="AUTO"):
         """Get the RMSD of the constrained atoms.
 
@@ -1634,7 +2238,7 @@ class Gromacs(_process.Process):
         return self.getConstraintRMSD(time_series, block=False)
 
     def stdout(self, n=10):
-        """Print the last n lines of the stdout buffer.
+        """Print the last n lines of stdout.
 
            Parameters
            ----------
@@ -1650,154 +2254,136 @@ class Gromacs(_process.Process):
         if n < 0:
             raise ValueError("The number of lines must be positive!")
 
-        # Append any new lines to the stdout list.
-        for line in _pygtail.Pygtail(self._stdout_file):
-            self._stdout.append(line.rstrip())
-
-        # Get the current number of lines.
-        num_lines = len(self._stdout)
-
-        # Set the line from which to start printing.
-        if num_lines < n:
-            start = 0
-        else:
-            start = num_lines - n
-
-        # Print the lines.
-        for x in range(start, num_lines):
-            print(self._stdout[x])
+        # Read the lines backwards from the end of the file.
+        for line in _process._tail(self._stdout_file, n):
+            print(line)
 
     def _update_stdout_dict(self):
         """Update the dictonary of thermodynamic records."""
 
-        # Exit if log file hasn't been created.
-        if not _os.path.isfile(self._log_file):
-            return
-
-        # A list of the new record lines.
-        lines = []
-
-        # Append any new lines.
-        for line in _pygtail.Pygtail(self._log_file):
-            lines.append(line)
-
-        # Store the number of lines.
-        num_lines = len(lines)
-
-        # Line index counter.
-        x = 0
+        with self._records_lock:
+            # Read any new frames from the energy file.
+            if self._edr_reader is not None:
+                try:
+                    frames = self._edr_reader.update()
+                except IOError as e:
+                    # The energy file can't be read, so fall back to parsing the
+                    # log file. The records are re-read from the start of the log,
+                    # so discard any that were already read from the energy file.
+                    _warnings.warn("%s. Falling back to parsing the log file." % e)
+                    self._edr_reader = None
+                    self._stdout_dict = _process._RecordStore(int_keys=["STEP"])
+                else:
+                    for step, time, energies in frames:
+                        self._stdout_dict["STEP"] = step
+                        self._stdout_dict["TIME"] = time
+                        for key, value in zip(self._edr_reader.names(), energies):
+                            self._stdout_dict[_normalise_key(key)] = value
+                    return
+
+            # Exit if log file hasn't been created.
+            if not _os.path.isfile(self._log_file):
+                return
 
-        # Append any new records to the stdout dictionary.
-        while x < num_lines:
+            # A list of the new record lines.
+            lines = []
 
-            # We've hit any energy record section.
-            if lines[x].strip() == "Energies (kJ/mol)":
+            # Append any new lines.
+            for line in _pygtail.Pygtail(self._log_file):
+                lines.append(line)
 
-                # Initialise lists to hold all of the key/value pairs.
-                keys = []
-                values = []
+            # Store the number of lines.
+            num_lines = len(lines)
 
-                # Loop until we reach a blank line, or the end of the lines.
-                while True:
+            # Line index counter.
+            x = 0
 
-                    # End of file.
-                    if x + 2 >= num_lines:
-                        break
+            # Append any new records to the stdout dictionary.
+            while x < num_lines:
 
-                    # Extract the lines with the keys and values.
-                    k_line = lines[x+1]
-                    v_line = lines[x+2]
+                # We've hit any energy record section.
+                if lines[x].strip() == "Energies (kJ/mol)":
 
-                    # Empty line:
-                    if len(k_line.strip()) == 0 or len(v_line.strip()) == 0:
-                        break
+                    # Initialise lists to hold all of the key/value pairs.
+                    keys = []
+                    values = []
 
-                    # Add whitespace at the end so that the splitting algorithm
-                    # below works properly.
-                    k_line = k_line + " "
-                    v_line = v_line + " "
+                    # Loop until we reach a blank line, or the end of the lines.
+                    while True:
 
-                    # Set the starting index of a record.
-                    start_idx = 0
+                        # End of file.
+                        if x + 2 >= num_lines:
+                            break
 
-                    # Create lists to hold the keys and values.
-                    k = []
-                    v = []
+                        # Extract the lines with the keys and values.
+                        k_line = lines[x+1]
+                        v_line = lines[x+2]
 
-                    # Split the lines into the record headings and corresponding
-                    # values.
-                    for idx, val in enumerate(v_line):
-                        # We've hit the end of the line.
-                        if idx + 1 == len(v_line):
+                        # Empty line:
+                        if len(k_line.strip()) == 0 or len(v_line.strip()) == 0:
                             break
 
-                        # This is the end of a record, i.e. we've gone from a
-                        # character to whitespace. Record the key and value and
-                        # update the start index for the next record.
-                        if val != " " and v_line[idx+1] == " ":
-                            k.append(k_line[start_idx:idx+1])
-                            v.append(v_line[start_idx:idx+1])
-                            start_idx=idx+1
-
-                    # Update the keys and values, making sure the number of
-                    # values matches the number of keys.
-                    keys.extend(k)
-                    values.extend(v[:len(k)])
+                        # Add whitespace at the end so that the splitting algorithm
+                        # below works properly.
+                        k_line = k_line + " "
+                        v_line = v_line + " "
+
+                        # Set the starting index of a record.
+                        start_idx = 0
+
+                        # Create lists to hold the keys and values.
+                        k = []
+                        v = []
+
+                        # Split the lines into the record headings and corresponding
+                        # values.
+                        for idx, val in enumerate(v_line):
+                            # We've hit the end of the line.
+                            if idx + 1 == len(v_line):
+                                break
+
+                            # This is the end of a record, i.e. we've gone from a
+                            # character to whitespace. Record the key and value and
+                            # update the start index for the next record.
+                            if val != " " and v_line[idx+1] == " ":
+                                k.append(k_line[start_idx:idx+1])
+                                v.append(v_line[start_idx:idx+1])
+                                start_idx=idx+1
+
+                        # Update the keys and values, making sure the number of
+                        # values matches the number of keys.
+                        keys.extend(k)
+                        values.extend(v[:len(k)])
+
+                        # Update the line index.
+                        x = x + 2
+
+                    # Add the records to the dictionary.
+                    if (len(keys) == len(values)):
+                        for key, value in zip(keys, values):
+                            # Add the record, making the formatting of the key consistent.
+                            self._stdout_dict[_normalise_key(key)] = value.strip()
+
+                # This is a time record.
+                elif "Step" in lines[x].strip():
+                    if x + 1 < num_lines:
+                        records = lines[x+1].split()
+
+                        # There should be two records, 'Step' and 'Time'.
+                        if len(records) == 2:
+                            self._stdout_dict["STEP"] = records[0].strip()
+                            self._stdout_dict["TIME"] = records[1].strip()
 
                     # Update the line index.
-                    x = x + 2
-
-                # Add the records to the dictionary.
-                if (len(keys) == len(values)):
-                    for key, value in zip(keys, values):
-                        # Replace certain characters in the key in order to make
-                        # the formatting consistent.
-
-                        # Convert to upper case.
-                        key = key.upper()
-
-                        # Strip whitespace and newlines from beginning and end.
-                        key = key.strip()
-
-                        # Remove whitespace.
-                        key = key.replace(" ", "")
-
-                        # Remove periods.
-                        key = key.replace(".", "")
-
-                        # Remove hyphens.
-                        key = key.replace("-", "")
-
-                        # Remove parentheses.
-                        key = key.replace("(", "")
-                        key = key.replace(")", "")
+                    x += 2
 
-                        # Remove instances of BAR.
-                        key = key.replace("BAR", "")
+                # We've reached an averages section, abort.
+                elif " A V E R A G E S" in lines[x]:
+                    break
 
-                        # Add the record.
-                        self._stdout_dict[key] = value.strip()
-
-            # This is a time record.
-            elif "Step" in lines[x].strip():
-                if x + 1 < num_lines:
-                    records = lines[x+1].split()
-
-                    # There should be two records, 'Step' and 'Time'.
-                    if len(records) == 2:
-                        self._stdout_dict["STEP"] = records[0].strip()
-                        self._stdout_dict["TIME"] = records[1].strip()
-
-                # Update the line index.
-                x += 2
-
-            # We've reached an averages section, abort.
-            elif " A V E R A G E S" in lines[x]:
-                break
-
-            # No match, move to the next line.
-            else:
-                x += 1
+                # No match, move to the next line.
+                else:
+                    x += 1
 
     def _get_stdout_record(self, key, time_series=False, unit=None):
         """Helper function to get a stdout record from the dictionary.
@@ -1822,7 +2408,7 @@ class Gromacs(_process.Process):
         """
 
         # No data!
-        if len(self._stdout_dict) is 0:
+        if len(self._stdout_dict) == 0:
             return None
 
         if type(time_series) is not bool:
@@ -1834,34 +2420,24 @@ class Gromacs(_process.Process):
             if not isinstance(unit, _Type.Type):
                 raise TypeError("'unit' must be of type 'BioSimSpace.Types'")
 
-        # Return the list of dictionary values.
-        if time_series:
-            try:
-                if key is "STEP":
-                    return [int(x) for x in self._stdout_dict[key]]
-                elif key is "TIME":
-                    return [(float(x) * unit).nanoseconds() for x in self._stdout_dict[key]]
-                else:
-                    if unit is None:
-                        return [float(x) for x in self._stdout_dict[key]]
-                    else:
-                        return [float(x) * unit for x in self._stdout_dict[key]]
+        # Time records are converted to nanoseconds.
+        if key == "TIME" and unit is None:
+            unit = _Units.Time.picosecond
 
-            except KeyError:
-                return None
+        try:
+            # Return a view of the time series.
+            if time_series:
+                if key == "TIME":
+                    return self._stdout_dict.timeSeries(key, unit).convert(_Units.Time.nanosecond)
+                else:
+                    return self._stdout_dict.timeSeries(key, unit)
 
-        # Return the most recent dictionary value.
-        else:
-            try:
-                if key is "STEP":
-                    return int(self._stdout_dict[key][-1])
-                elif key is "TIME":
-                    return (float(self._stdout_dict[key][-1]) * unit).nanoseconds()
+            # Return the most recent value.
+            else:
+                if key == "TIME":
+                    return self._stdout_dict.last(key, unit).nanoseconds()
                 else:
-                    if unit is None:
-                        return float(self._stdout_dict[key][-1])
-                    else:
-                        return float(self._stdout_dict[key][-1]) * unit
+                    return self._stdout_dict.last(key, unit)
 
-            except KeyError:
-                return None
+        except KeyError:
+            return None
@@ -0,0 +1,586 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+A shared service for monitoring output files and running processes.
+"""
+
+import asyncio as _asyncio
+import ctypes as _ctypes
+import ctypes.util as _ctypes_util
+import fnmatch as _fnmatch
+import glob as _glob
+import itertools as _itertools
+import os as _os
+import select as _select
+import struct as _struct
+import sys as _sys
+import threading as _threading
+import time as _time
+import warnings as _warnings
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["getMonitor"]
+
+class _Notifier():
+    """A thread-safe flag that can be waited on from a thread, or awaited
+       from any number of asyncio event loops.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._lock = _threading.Lock()
+        self._event = _threading.Event()
+        self._futures = []
+
+    def set(self):
+        """Set the flag, waking any waiting threads and coroutines."""
+
+        with self._lock:
+            self._event.set()
+            futures = self._futures
+            self._futures = []
+
+        for loop, future in futures:
+            try:
+                loop.call_soon_threadsafe(_set_future, future)
+            # The event loop has been closed.
+            except RuntimeError:
+                pass
+
+    def clear(self):
+        """Clear the flag."""
+        with self._lock:
+            self._event.clear()
+
+    def isSet(self):
+        """Return whether the flag is set.
+
+           Returns
+           -------
+
+           is_set : bool
+               Whether the flag is set.
+        """
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the flag is set.
+
+           Parameters
+           ----------
+
+           timeout : float
+               The maximum time to wait, in seconds.
+
+           Returns
+           -------
+
+           is_set : bool
+               Whether the flag was set before the timeout.
+        """
+        return self._event.wait(timeout)
+
+    async def waitAsync(self, timeout=None):
+        """Asynchronously wait until the flag is set, without blocking the
+           event loop.
+
+           Parameters
+           ----------
+
+           timeout : float
+               The maximum time to wait, in seconds.
+
+           Returns
+           -------
+
+           is_set : bool
+               Whether the flag was set before the timeout.
+        """
+
+        loop = _asyncio.get_running_loop()
+
+        with self._lock:
+            if self._event.is_set():
+                return True
+            future = loop.create_future()
+            self._futures.append((loop, future))
+
+        try:
+            await _asyncio.wait_for(future, timeout)
+            return True
+        except _asyncio.TimeoutError:
+            return False
+
+def _set_future(future):
+    """Helper function to complete a future, if it hasn't been cancelled."""
+    if not future.done():
+        future.set_result(True)
+
+class _Inotify():
+    """A minimal wrapper around the Linux inotify API."""
+
+    # Event masks.
+    _IN_MODIFY = 0x00000002
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+
+    # Flags for inotify_init1.
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+
+    # The size of the fixed part of an inotify event.
+    _event_size = _struct.calcsize("iIII")
+
+    def __init__(self):
+        """Constructor."""
+
+        if not _sys.platform.startswith("linux"):
+            raise OSError("inotify is only supported on Linux.")
+
+        self._libc = _ctypes.CDLL(_ctypes_util.find_library("c"), use_errno=True)
+
+        self._fd = self._libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(_ctypes.get_errno(), "Failed to initialise inotify.")
+
+        # Mappings between watch descriptors and directories.
+        self._directories = {}
+        self._descriptors = {}
+
+    def fileno(self):
+        """Return the inotify file descriptor."""
+        return self._fd
+
+    def addWatch(self, directory):
+        """Watch a directory for changes to the files that it contains.
+
+           Parameters
+           ----------
+
+           directory : str
+               The path to the directory.
+        """
+
+        if directory in self._descriptors:
+            return
+
+        mask = self._IN_MODIFY | self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, _os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(_ctypes.get_errno(), "Failed to watch directory: '%s'" % directory)
+
+        self._directories[wd] = directory
+        self._descriptors[directory] = wd
+
+    def removeWatch(self, directory):
+        """Stop watching a directory.
+
+           Parameters
+           ----------
+
+           directory : str
+               The path to the directory.
+        """
+
+        wd = self._descriptors.pop(directory, None)
+        if wd is not None:
+            self._directories.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def read(self):
+        """Read all pending events.
+
+           Returns
+           -------
+
+           events : set((str, str))
+               The (directory, file name) pairs of the modified files.
+        """
+
+        events = set()
+
+        try:
+            data = _os.read(self._fd, 65536)
+        except BlockingIOError:
+            return events
+
+        pos = 0
+        while pos + self._event_size <= len(data):
+            wd, _, _, length = _struct.unpack_from("iIII", data, pos)
+            pos += self._event_size
+            name = data[pos:pos+length].rstrip(b"\0")
+            pos += length
+
+            if wd in self._directories and len(name) > 0:
+                events.add((self._directories[wd], _os.fsdecode(name)))
+
+        return events
+
+class _Monitor():
+    """A process-wide service that monitors output files and running
+       processes using a single background thread. File changes are detected
+       using inotify, where available, falling back to polling the file
+       modification times. Processes are checked once per polling interval,
+       regardless of how many are registered, and threads waiting for a
+       process to finish block on a condition until they are notified.
+    """
+
+    def __init__(self, interval=0.5):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           interval : float
+               The polling interval in seconds.
+        """
+
+        self._interval = interval
+        self._lock = _threading.RLock()
+        self._condition = _threading.Condition(self._lock)
+        self._thread = None
+        self._counter = _itertools.count()
+
+        # The registered file watches: handle -> (directory, pattern, callback)
+        self._watches = {}
+
+        # The registered processes: handle -> (process, callback)
+        self._processes = {}
+
+        # The modification times of files when polling.
+        self._stat = {}
+
+        # Try to use inotify.
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError):
+            self._inotify = None
+
+    def watchFile(self, directory, pattern, callback):
+        """Call a function whenever a matching file in a directory changes.
+
+           Parameters
+           ----------
+
+           directory : str
+               The directory containing the file.
+
+           pattern : str
+               A glob pattern used to match the file name.
+
+           callback : function
+               The function to call. This is passed the full path to the
+               modified file.
+
+           Returns
+           -------
+
+           handle : int
+               A handle that can be used to remove the watch.
+        """
+
+        directory = _os.path.abspath(directory)
+
+        with self._lock:
+            handle = next(self._counter)
+            self._watches[handle] = (directory, pattern, callback)
+
+            if self._inotify is not None:
+                try:
+                    self._inotify.addWatch(directory)
+                except OSError:
+                    _warnings.warn("Unable to use inotify. Falling back to polling.")
+                    self._inotify = None
+
+            self._start()
+
+        return handle
+
+    def watchProcess(self, process, callback=None):
+        """Monitor a running process, notifying any waiting threads once it
+           has finished.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process to monitor.
+
+           callback : function
+               An optional function to call, with no arguments, once the
+               process has finished.
+
+           Returns
+           -------
+
+           handle : int
+               A handle that can be used to stop monitoring the process.
+        """
+
+        with self._lock:
+            handle = next(self._counter)
+            self._processes[handle] = (process, callback)
+            self._start()
+
+        return handle
+
+    def unwatch(self, handle):
+        """Remove a file or process watch.
+
+           Parameters
+           ----------
+
+           handle : int
+               The handle of the watch.
+        """
+
+        with self._lock:
+            self._processes.pop(handle, None)
+            watch = self._watches.pop(handle, None)
+
+            if watch is None:
+                return
+
+            # Stop watching the directory if no other watches need it.
+            if self._inotify is not None:
+                if not any(w[0] == watch[0] for w in self._watches.values()):
+                    self._inotify.removeWatch(watch[0])
+
+            # Forget the modification times of files that are no longer
+            # matched by any watch.
+            for file in list(self._stat):
+                if self._matches(file, watch) and \
+                   not any(self._matches(file, w) for w in self._watches.values()):
+                    del self._stat[file]
+
+    def wait(self, process, timeout=None):
+        """Block until a process has finished.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process to wait for.
+
+           timeout : float
+               The maximum time to wait, in seconds.
+
+           Returns
+           -------
+
+           is_finished : bool
+               Whether the process finished before the timeout.
+        """
+
+        # Make sure the process is being monitored.
+        handle = self.watchProcess(process)
+
+        try:
+            with self._condition:
+                return self._condition.wait_for(lambda: not process.isRunning(), timeout)
+        finally:
+            self.unwatch(handle)
+
+    async def waitAsync(self, process, timeout=None):
+        """Asynchronously wait for a process to finish, without blocking the
+           event loop.
+
+           Parameters
+           ----------
+
+           process : :class:`Process <BioSimSpace.Process>`
+               The process to wait for.
+
+           timeout : float
+               The maximum time to wait, in seconds.
+
+           Returns
+           -------
+
+           is_finished : bool
+               Whether the process finished before the timeout.
+        """
+
+        notifier = _Notifier()
+        handle = self.watchProcess(process, notifier.set)
+
+        try:
+            if not process.isRunning():
+                return True
+            return await notifier.waitAsync(timeout)
+        finally:
+            self.unwatch(handle)
+
+    def _start(self):
+        """Start the monitoring thread, if it isn't already running."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = _threading.Thread(target=self._run, name="BioSimSpace.Monitor")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        """The main loop of the monitoring thread."""
+
+        while True:
+            # Another thread can fall back to polling at any time, so use the
+            # same inotify instance for the whole iteration.
+            with self._lock:
+                inotify = self._inotify
+
+            # Wait for file events, or until the next polling interval.
+            if inotify is not None:
+                try:
+                    ready, _, _ = _select.select([inotify], [], [], self._interval)
+                except OSError:
+                    ready = []
+                modified = inotify.read() if ready else set()
+            else:
+                _time.sleep(self._interval)
+                modified = None
+
+            with self._lock:
+                watches = list(self._watches.items())
+                processes = list(self._processes.items())
+
+                # Nothing left to monitor, so exit the thread. It will be
+                # restarted when something new is registered.
+                if len(watches) == 0 and len(processes) == 0:
+                    self._thread = None
+                    return
+
+            # Dispatch file events.
+            for handle, (directory, pattern, callback) in watches:
+                if modified is None:
+                    # Poll under the lock so that a watch that has just been
+                    # removed doesn't record the files again.
+                    with self._lock:
+                        if handle not in self._watches:
+                            continue
+                        files = self._poll(directory, pattern)
+                else:
+                    files = [_os.path.join(d, f) for d, f in modified
+                             if d == directory and _fnmatch.fnmatch(f, pattern)]
+
+                for file in files:
+                    try:
+                        callback(file)
+                    except Exception as e:
+                        _warnings.warn("File monitor callback failed: %s" % e)
+
+            # Check for finished processes.
+            finished = []
+            for handle, (process, callback) in processes:
+                if not process.isRunning():
+                    finished.append((handle, callback))
+
+            if len(finished) > 0:
+                with self._lock:
+                    for handle, _ in finished:
+                        self._processes.pop(handle, None)
+                    self._condition.notify_all()
+
+                for _, callback in finished:
+                    if callback is not None:
+                        try:
+                            callback()
+                        except Exception as e:
+                            _warnings.warn("Process monitor callback failed: %s" % e)
+
+    @staticmethod
+    def _matches(file, watch):
+        """Return whether a file is matched by a watch.
+
+           Parameters
+           ----------
+
+           file : str
+               The path to the file.
+
+           watch : (str, str, function)
+               The (directory, pattern, callback) of the watch.
+
+           Returns
+           -------
+
+           is_match : bool
+               Whether the file is matched.
+        """
+        directory, name = _os.path.split(file)
+        return directory == watch[0] and _fnmatch.fnmatch(name, watch[1])
+
+    def _poll(self, directory, pattern):
+        """Find files that have changed since the last poll.
+
+           Parameters
+           ----------
+
+           directory : str
+               The directory containing the files.
+
+           pattern : str
+               A glob pattern used to match the file names.
+
+           Returns
+           -------
+
+           files : [str]
+               A list of modified files.
+        """
+
+        files = []
+
+        for file in _glob.glob(_os.path.join(directory, pattern)):
+            try:
+                stat = _os.stat(file)
+            except FileNotFoundError:
+                continue
+
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self._stat.get(file) != key:
+                self._stat[file] = key
+                files.append(file)
+
+        return files
+
+# The shared monitor.
+_monitor = None
+_monitor_lock = _threading.Lock()
+
+def getMonitor():
+    """Return the process-wide monitoring service.
+
+       Returns
+       -------
+
+       monitor : :class:`_Monitor <BioSimSpace.Process._monitor._Monitor>`
+           The monitoring service.
+    """
+    global _monitor
+
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = _Monitor()
+
+    return _monitor
@@ -48,6 +48,161 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["Namd"]
 
+def _config_value(config, key, default=None):
+    """Internal function to get the value of a keyword in a NAMD
+       configuration.
+
+       Parameters
+       ----------
+
+       config : [str]
+           The configuration.
+
+       key : str
+           The keyword.
+
+       default : str
+           The value to return if the keyword isn't set.
+
+       Returns
+       -------
+
+       value : str
+           The value of the keyword.
+    """
+    for line in config:
+        data = line.split()
+        if len(data) > 1 and data[0].lower() == key.lower():
+            return data[1]
+    return default
+
+def _count_pdb_atoms(file, is_complete=False):
+    """Internal function to count the atoms in a PDB file.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the PDB file.
+
+       is_complete : bool
+           Whether the file must end with an END record, i.e. it was
+           written in full.
+
+       Returns
+       -------
+
+       num_atoms : int
+           The number of atoms.
+    """
+
+    num_atoms = 0
+    is_ended = False
+
+    with open(file, "r") as f:
+        for line in f:
+            if line.startswith("ATOM") or line.startswith("HETATM"):
+                num_atoms += 1
+            elif line.startswith("END"):
+                is_ended = True
+
+    if is_complete and not is_ended:
+        raise ValueError("Incomplete PDB file: '%s'" % file)
+
+    return num_atoms
+
+def _read_xsc_step(file):
+    """Internal function to read the time step from a NAMD extended system
+       file.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the extended system file.
+
+       Returns
+       -------
+
+       step : int
+           The time step.
+    """
+    with open(file, "r") as f:
+        lines = [line for line in f if len(line.strip()) > 0 and line[0] != "#"]
+    return int(lines[-1].split()[0])
+
+def _resume_config(config, name, checkpoint):
+    """Internal function to modify a NAMD dynamics configuration so that it
+       continues from a set of restart files.
+
+       Parameters
+       ----------
+
+       config : [str]
+           The configuration.
+
+       name : str
+           The name of the process.
+
+       checkpoint : dict
+           The checkpoint.
+
+       Returns
+       -------
+
+       config : [str]
+           The configuration for the remaining steps.
+    """
+
+    step = checkpoint["step"]
+    restart = "%s_out.restart" % name
+    suffix = checkpoint["suffix"]
+
+    new_config = []
+
+    for line in config:
+        data = line.split()
+        key = data[0].lower() if len(data) > 0 else ""
+
+        # Read the coordinates, velocities, and box from the restart files.
+        if key == "coordinates":
+            new_config.append("coordinates           %s.coor%s" % (restart, suffix))
+            new_config.append("velocities            %s.vel%s" % (restart, suffix))
+            continue
+        elif key == "velocities":
+            continue
+        elif key == "extendedsystem":
+            line = "extendedSystem        %s.xsc%s" % (restart, suffix)
+
+        # The velocities aren't generated from the temperature.
+        elif key == "temperature":
+            continue
+
+        # Continue heating or cooling from the temperature at the checkpoint.
+        elif key == "reassigntemp":
+            first_step = int(_config_value(config, "firsttimestep", 0))
+            freq = int(_config_value(config, "reassignFreq"))
+            incr = float(_config_value(config, "reassignIncr", 0))
+            temp = float(data[1]) + incr * ((step - first_step) // freq)
+            hold = _config_value(config, "reassignHold")
+            if hold is not None:
+                temp = min(temp, float(hold)) if incr > 0 else max(temp, float(hold))
+            line = "reassignTemp          %.2f" % temp
+
+        # Continue counting time steps from the checkpoint.
+        elif key == "firsttimestep":
+            continue
+
+        # Only run the remaining steps, writing the trajectory to a new file.
+        elif key == "run":
+            new_config.append("firsttimestep         %d" % step)
+            new_config.append("DCDfile               %s_out.resume.dcd" % name)
+            line = "run                   %d" % (checkpoint["end_step"] - step)
+
+        new_config.append(line)
+
+    return new_config
+
 class Namd(_process.Process):
     """A class for running simulations using NAMD."""
 
@@ -107,7 +262,7 @@ class Namd(_process.Process):
                 raise IOError("NAMD executable doesn't exist: '%s'" % exe)
 
         # Initialise the stdout dictionary and title header.
-        self._stdout_dict = _process._MultiDict()
+        self._stdout_dict = _process._RecordStore(int_keys=["TS"])
         self._stdout_title = None
 
         # The names of the input files.
@@ -510,17 +665,52 @@ class Namd(_process.Process):
             if self._process.isRunning():
                 return
 
+        # Resume from a checkpoint, if one was found when the process failed.
+        checkpoint = self._checkpoint
+        self._checkpoint = None
+
         # Clear any existing output.
         self._clear_output()
 
+        # The stdout file is read from the start, so reset the records. When
+        # resuming, keep the records up to the checkpoint. NAMD continues to
+        # count time steps from the checkpoint, so the records are continuous.
+        if checkpoint is None:
+            self._stdout_dict = _process._RecordStore(int_keys=["TS"])
+            config_file = "%s.cfg" % self._name
+        else:
+            self._stdout_dict.truncate("TS", checkpoint["step"])
+            config_file = "%s.resume.cfg" % self._name
+
+            # Write the trajectory to a separate file, which is joined to the
+            # existing trajectory once the process has finished. Frames are
+            # written at multiples of the output frequency.
+            first_step = int(_config_value(self._config, "firsttimestep", 0))
+            frequency = int(_config_value(self._config, "DCDfreq"))
+            self._setTrajectorySegment("%s/%s_out.resume.dcd" % (self._work_dir, self._name),
+                num_frames=checkpoint["step"] // frequency - first_step // frequency)
+
         # Run the process in the working directory.
         with _Utils.cd(self._work_dir):
 
+            # Only run the remaining steps, starting from the restart files.
+            if checkpoint is not None:
+                with open(config_file, "w") as file:
+                    for line in _resume_config(self._config, self._name, checkpoint):
+                        file.write("%s\n" % line)
+
+            # NAMD ignores OMP_NUM_THREADS, so set the number of worker
+            # threads on the command-line.
+            if self._num_threads is None:
+                args = [config_file]
+            else:
+                args = ["+p%d" % self._num_threads, config_file]
+
             # Write the command-line process to a README.txt file.
             with open("README.txt", "w") as file:
 
                 # Set the command-line string.
-                self._command = "%s %s.cfg" % (self._exe, self._name)
+                self._command = "%s %s" % (self._exe, " ".join(args))
 
                 # Write the command to file.
                 file.write("# NAMD was run with the following command:\n")
@@ -530,11 +720,87 @@ class Namd(_process.Process):
             self._timer = _timeit.default_timer()
 
             # Start the simulation.
-            self._process = _SireBase.Process.run(self._exe,
-                "%s.cfg" % self._name, "%s.out" % self._name, "%s.err" % self._name)
+            self._process = self._submit(args, "%s.out" % self._name, "%s.err" % self._name)
+
+        # Stop the process early once it has converged.
+        self._watch_convergence()
 
         return self
 
+    def _findCheckpoint(self):
+        """Find the latest valid checkpoint in the working directory. NAMD
+           periodically writes restart coordinate, velocity, and extended
+           system files, moving the previous set aside as a backup.
+
+           Returns
+           -------
+
+           checkpoint : dict
+               The suffix of the restart files and the time step of the
+               checkpoint, or None if there isn't a valid checkpoint.
+        """
+
+        # Only dynamics protocols are resumed.
+        if type(self._protocol) not in [_Protocol.Equilibration, _Protocol.Production]:
+            return None
+
+        try:
+            num_atoms = _count_pdb_atoms(self._top_file)
+            first_step = int(_config_value(self._config, "firsttimestep", 0))
+            run_steps = int(_config_value(self._config, "run"))
+        except (OSError, TypeError, ValueError):
+            return None
+
+        checkpoint = None
+
+        for suffix in ["", ".old"]:
+            prefix = "%s/%s_out.restart" % (self._work_dir, self._name)
+
+            try:
+                step = _read_xsc_step("%s.xsc%s" % (prefix, suffix))
+                if _count_pdb_atoms("%s.coor%s" % (prefix, suffix), True) != num_atoms or \
+                   _count_pdb_atoms("%s.vel%s" % (prefix, suffix), True) != num_atoms:
+                    continue
+            except (OSError, IndexError, ValueError):
+                continue
+
+            # Nothing to resume, or nothing left to run.
+            if step <= first_step or step >= first_step + run_steps:
+                continue
+
+            if checkpoint is None or step > checkpoint["step"]:
+                checkpoint = { "suffix" : suffix, "step" : step,
+                               "end_step" : first_step + run_steps }
+
+        return checkpoint
+
+    def _checkpointPattern(self):
+        """Return a glob pattern matching the checkpoint files written by the
+           process while it is running.
+
+           Returns
+           -------
+
+           pattern : str
+               The pattern, or None if the process doesn't write checkpoints.
+        """
+        if type(self._protocol) not in [_Protocol.Equilibration, _Protocol.Production]:
+            return None
+        return "%s_out.restart.*" % self._name
+
+    def _update_records(self):
+        """Read any new thermodynamic records.
+
+           Returns
+           -------
+
+           records : :class:`_RecordStore <BioSimSpace.Process._process._RecordStore>`
+               The record store for the process.
+        """
+        # Parse any new stdout lines, without printing them.
+        self.stdout(0)
+        return self._stdout_dict
+
     def getSystem(self, block="AUTO"):
         """Get the latest molecular system.
 
@@ -713,7 +979,7 @@ class Namd(_process.Process):
            -------
 
            records : dict
-               The dictionary of time-series records.
+               A dictionary mapping each record key to a NumPy array of values.
         """
         # Wait for the process to finish.
         if block is True:
@@ -735,10 +1001,10 @@ class Namd(_process.Process):
            Returns
            -------
 
-           records : BioSimSpace.Process._process._MultiDict
-              The dictionary of time-series records.
+           records : dict
+              A dictionary mapping each record key to a NumPy array of values.
         """
-        return getRecords(block=False)
+        return self.getRecords(block=False)
 
     def getTime(self, time_series=False, block="AUTO"):
         """Get the time (in nanoseconds).
@@ -772,7 +1038,7 @@ class Namd(_process.Process):
             # Multiply by the integration time step.
             if time_steps is not None:
                 if time_series:
-                    return [x * timestep for x in time_steps]
+                    return _process._TimeSeries(time_steps, timestep)
                 else:
                     return timestep * time_steps
 
@@ -1583,12 +1849,9 @@ class Namd(_process.Process):
                The estimated remaining time in minutes.
         """
 
-        # Make sure the list of stdout records is up to date.
-        # Print the last zero lines, i.e. no output.
-        self.stdout(0)
-
-        # Now search backwards through the list to find the last TIMING record.
-        for _, record in reversed(list(enumerate(self._stdout))):
+        # Search backwards from the end of stdout to find the last TIMING
+        # record. Only the tail of the file is read.
+        for record in _process._reverse_lines(self._stdout_file):
 
             # Split the record using whitespace.
             data = record.split()
@@ -1600,14 +1863,14 @@ class Namd(_process.Process):
                     # Try to find the "hours" record.
                     # If found, return the entry preceeding it.
                     try:
-                        return (float(data[data.index("hours") - 1]) * 60) * _Units.Time.minutes
+                        return (float(data[data.index("hours") - 1]) * 60) * _Units.Time.minute
 
                     # No record found.
                     except ValueError:
                         return None
 
     def stdout(self, n=10):
-        """Print the last n lines of the stdout buffer.
+        """Print the last n lines of stdout.
 
            Parameters
            ----------
@@ -1620,42 +1883,36 @@ class Namd(_process.Process):
         if n < 0:
             raise ValueError("The number of lines must be positive!")
 
-        # Append any new lines to the stdout list.
-        for line in _pygtail.Pygtail(self._stdout_file):
-            self._stdout.append(line.rstrip())
-
-            # Split the record using whitespace.
-            data = self._stdout[-1].split()
-
-            # Make sure there is at least one record.
-            if len(data) > 0:
+        # Parse any new lines, appending them to the stdout buffer. This is
+        # also done when checking for convergence, so is serialised.
+        with self._records_lock:
+            for line in _pygtail.Pygtail(self._stdout_file):
+                line = line.rstrip()
+                self._stdout.append(line)
 
-                # Store the updated energy title.
-                if data[0] == "ETITLE:":
-                    self._stdout_title = data[1:]
+                # Split the record using whitespace.
+                data = line.split()
 
-                # This is an energy record.
-                elif data[0] == "ENERGY:":
-                    # Extract the data.
-                    stdout_data = data[1:]
+                # Make sure there is at least one record.
+                if len(data) > 0:
 
-                    # Add the records to the dictionary.
-                    if (len(stdout_data) == len(self._stdout_title)):
-                        for title, data in zip(self._stdout_title, stdout_data):
-                            self._stdout_dict[title] = data
+                    # Store the updated energy title.
+                    if data[0] == "ETITLE:":
+                        self._stdout_title = data[1:]
 
-        # Get the current number of lines.
-        num_lines = len(self._stdout)
+                    # This is an energy record.
+                    elif data[0] == "ENERGY:":
+                        # Extract the data.
+                        stdout_data = data[1:]
 
-        # Set the line from which to start printing.
-        if num_lines < n:
-            start = 0
-        else:
-            start = num_lines - n
+                        # Add the records to the dictionary.
+                        if (len(stdout_data) == len(self._stdout_title)):
+                            for title, data in zip(self._stdout_title, stdout_data):
+                                self._stdout_dict[title] = data
 
-        # Print the lines.
-        for x in range(start, num_lines):
-            print(self._stdout[x])
+        # Read the lines backwards from the end of the file.
+        for line in _process._tail(self._stdout_file, n):
+            print(line)
 
     def _get_stdout_record(self, key, time_series=False, unit=None):
         """Helper function to get a stdout record from the dictionary.
@@ -1680,7 +1937,7 @@ class Namd(_process.Process):
         """
 
         # No data!
-        if len(self._stdout_dict) is 0:
+        if len(self._stdout_dict) == 0:
             return None
 
         if type(time_series) is not bool:
@@ -1692,30 +1949,14 @@ class Namd(_process.Process):
             if not isinstance(unit, _Type.Type):
                 raise TypeError("'unit' must be of type 'BioSimSpace.Types'")
 
-        # Return the list of dictionary values.
-        if time_series:
-            try:
-                if key is "TS":
-                    return [int(x) for x in self._stdout_dict[key]]
-                else:
-                    if unit is None:
-                        return [float(x) for x in self._stdout_dict[key]]
-                    else:
-                        return [float(x) * unit for x in self._stdout_dict[key]]
-
-            except KeyError:
-                return None
+        try:
+            # Return a view of the time series.
+            if time_series:
+                return self._stdout_dict.timeSeries(key, unit)
 
-        # Return the most recent dictionary value.
-        else:
-            try:
-                if key is "TS":
-                    return int(self._stdout_dict[key][-1])
-                else:
-                    if unit is None:
-                        return float(self._stdout_dict[key][-1])
-                    else:
-                        return float(self._stdout_dict[key][-1]) * unit
+            # Return the most recent value.
+            else:
+                return self._stdout_dict.last(key, unit)
 
-            except KeyError:
-                return None
+        except KeyError:
+            return None
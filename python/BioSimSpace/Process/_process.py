@@ -23,13 +23,17 @@
 Functionality for running simulation processes.
 """
 
+from collections.abc import Sequence as _Sequence
+
 import collections as _collections
 import glob as _glob
+import numpy as _np
 import os as _os
 import pygtail as _pygtail
 import timeit as _timeit
 import warnings as _warnings
 import tempfile as _tempfile
+import threading as _threading
 import zipfile as _zipfile
 
 import Sire.Mol as _SireMol
@@ -38,9 +42,15 @@ from BioSimSpace import _is_interactive, _is_notebook
 
 from ..Protocol._protocol import Protocol as _Protocol
 from .._SireWrappers import System as _System
+from ._convergence import ConvergencePolicy as _ConvergencePolicy
+from ._executor import Executor as _Executor
+from ._executor import getDefaultExecutor as _getDefaultExecutor
+from ._monitor import _Notifier
+from ._monitor import getMonitor as _getMonitor
 
 import BioSimSpace.Types._type as _Type
 import BioSimSpace.Units as _Units
+import BioSimSpace._Utils as _Utils
 
 if _is_notebook():
     from IPython.display import FileLink as _FileLink
@@ -56,9 +66,433 @@ class _MultiDict(dict):
         """Add the given value to the list of values for this key."""
         self.setdefault(key, []).append(value)
 
+class _RecordStore():
+    """A columnar store for time-series records. Each record key maps to a
+       growable NumPy array. Values are converted to a numeric type once, when
+       they are added to the store, and time series are returned as read-only
+       views of the underlying arrays. Malformed values are stored as NaN in
+       floating point columns, and are masked in integer columns. Records
+       are typically appended by the monitor thread while being read by the
+       main thread, so modifications are serialised with a lock.
+    """
+
+    # The initial capacity of each column.
+    _initial_capacity = 64
+
+    # The sentinel used to store missing values in integer columns. These are
+    # masked when the column is returned. Floating point columns use NaN.
+    _int_missing = _np.iinfo(_np.int64).min
+
+    def __init__(self, int_keys=[]):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           int_keys : [str]
+               The keys of records that hold integer values, e.g. time steps.
+               All other records are stored as floating point values.
+        """
+
+        self._int_keys = set(int_keys)
+        self._columns = {}
+        self._sizes = {}
+        self._lock = _threading.RLock()
+
+    def __setitem__(self, key, value):
+        """Append a value to the column for this key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           value : str, int, float
+               The record value.
+        """
+        self.append(key, value)
+
+    def __getitem__(self, key):
+        """Return a read-only view of the column for this key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           Returns
+           -------
+
+           column : numpy.ndarray, numpy.ma.MaskedArray
+               The column of values. Integer columns are returned as masked
+               arrays, with missing values masked.
+        """
+        with self._lock:
+            view = self._columns[key][:self._sizes[key]]
+        view.flags.writeable = False
+
+        if key in self._int_keys:
+            missing = view == self._int_missing
+            if not missing.any():
+                missing = _np.ma.nomask
+            view = _np.ma.MaskedArray(view, mask=missing, copy=False)
+
+        return view
+
+    def __contains__(self, key):
+        """Return whether there is a column for the given key."""
+        return key in self._columns
+
+    def __len__(self):
+        """Return the number of columns."""
+        return len(self._columns)
+
+    def __iter__(self):
+        """Iterate over the record keys."""
+        return iter(self._columns)
+
+    def keys(self):
+        """Return the record keys."""
+        return self._columns.keys()
+
+    def items(self):
+        """Return (key, column) pairs for all records."""
+        with self._lock:
+            return [(key, self[key]) for key in self._columns]
+
+    def append(self, key, value):
+        """Append a value to the column for this key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           value : str, int, float
+               The record value.
+        """
+
+        # Convert the value. Malformed values are stored as missing, rather
+        # than raising, so that a single bad line in an engine log doesn't
+        # stop the parsing of subsequent records.
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = _np.nan
+
+        if key in self._int_keys:
+            value = int(value) if _np.isfinite(value) else self._int_missing
+            dtype = _np.int64
+        else:
+            dtype = _np.float64
+
+        with self._lock:
+            try:
+                column = self._columns[key]
+                size = self._sizes[key]
+
+                # Double the capacity of the column when it is full.
+                if size == len(column):
+                    new_column = _np.empty(2*size, dtype=dtype)
+                    new_column[:size] = column
+                    column = self._columns[key] = new_column
+
+            except KeyError:
+                column = self._columns[key] = _np.empty(self._initial_capacity, dtype=dtype)
+                size = 0
+
+            column[size] = value
+            self._sizes[key] = size + 1
+
+    def extend(self, key, values):
+        """Append an array of values to the column for this key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           values : numpy.ndarray, [str, int, float]
+               The record values.
+        """
+
+        # Convert the values, marking any that are malformed as missing.
+        values = _np.asarray(values).ravel()
+        try:
+            values = values.astype(_np.float64)
+        except (TypeError, ValueError):
+            values = _np.array([self._to_float(x) for x in values], dtype=_np.float64)
+
+        if key in self._int_keys:
+            dtype = _np.int64
+            missing = ~_np.isfinite(values)
+            values = _np.where(missing, 0, values).astype(dtype)
+            values[missing] = self._int_missing
+        else:
+            dtype = _np.float64
+
+        with self._lock:
+            try:
+                column = self._columns[key]
+                size = self._sizes[key]
+            except KeyError:
+                column = self._columns[key] = _np.empty(self._initial_capacity, dtype=dtype)
+                size = 0
+
+            # Grow the column to the next power of two multiple of its capacity.
+            if size + len(values) > len(column):
+                capacity = len(column)
+                while capacity < size + len(values):
+                    capacity *= 2
+                new_column = _np.empty(capacity, dtype=dtype)
+                new_column[:size] = column[:size]
+                column = self._columns[key] = new_column
+
+            column[size:size+len(values)] = values
+            self._sizes[key] = size + len(values)
+
+    @staticmethod
+    def _to_float(value):
+        """Convert a value to a float, returning NaN if it is malformed."""
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return _np.nan
+
+    def truncate(self, key, value):
+        """Remove all records from the first record whose value for the
+           given key is greater than 'value' onwards, e.g. to discard the
+           records written after the time step of a checkpoint.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           value : int, float
+               The largest value to keep.
+        """
+
+        with self._lock:
+            if key not in self._columns:
+                return
+
+            column = self._columns[key][:self._sizes[key]]
+
+            # Find the first record beyond the value.
+            beyond = _np.flatnonzero(column > value)
+            if len(beyond) == 0:
+                return
+            num_records = beyond[0]
+
+            for key in self._sizes:
+                self._sizes[key] = min(self._sizes[key], num_records)
+
+    def last(self, key, unit=None):
+        """Return the most recent value for the given key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           unit : :class:`Type <BioSimSpace.Types._type.Type>`
+               The unit of the record.
+
+           Returns
+           -------
+
+           value : int, float, :class:`Type <BioSimSpace.Types._type.Type>`
+               The most recent value. Missing integer values are returned
+               as None.
+        """
+
+        with self._lock:
+            value = self._columns[key][self._sizes[key]-1]
+
+        if key in self._int_keys:
+            return None if value == self._int_missing else int(value)
+        elif unit is None:
+            return float(value)
+        else:
+            return float(value) * unit
+
+    def timeSeries(self, key, unit=None):
+        """Return the time series of values for the given key.
+
+           Parameters
+           ----------
+
+           key : str
+               The record key.
+
+           unit : :class:`Type <BioSimSpace.Types._type.Type>`
+               The unit of the record.
+
+           Returns
+           -------
+
+           time_series : numpy.ndarray, :class:`_TimeSeries <BioSimSpace.Process._process._TimeSeries>`
+               A read-only view of the column, or a typed time series if a
+               unit is specified.
+        """
+
+        if unit is None or key in self._int_keys:
+            return self[key]
+        else:
+            return _TimeSeries(self[key], unit)
+
+    def nRecords(self):
+        """Return the number of complete records, i.e. the length of the
+           shortest column. Records are appended one key at a time, so the
+           most recent record may only be partially written while the
+           process is running.
+
+           Returns
+           -------
+
+           num_records : int
+               The number of records.
+        """
+
+        with self._lock:
+            if len(self._sizes) == 0:
+                return 0
+            else:
+                return min(self._sizes.values())
+
+    def record(self, index):
+        """Return all values for a single record.
+
+           Parameters
+           ----------
+
+           index : int
+               The index of the record.
+
+           Returns
+           -------
+
+           record : dict
+               A dictionary mapping each key to its value for the record.
+        """
+
+        record = {}
+
+        with self._lock:
+            for key, column in self._columns.items():
+                if index < self._sizes[key]:
+                    if key in self._int_keys:
+                        value = column[index]
+                        record[key] = None if value == self._int_missing else int(value)
+                    else:
+                        record[key] = float(column[index])
+
+        return record
+
+    def copy(self):
+        """Return a copy of the store.
+
+           Returns
+           -------
+
+           records : dict
+               A dictionary mapping each record key to a copy of its column.
+        """
+        with self._lock:
+            return {key: column.copy() for key, column in self.items()}
+
+class _TimeSeries(_Sequence):
+    """A sequence of records with a common unit. The magnitudes are held in
+       a NumPy array, with typed values only created when they are accessed.
+    """
+
+    def __init__(self, magnitudes, unit):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           magnitudes : numpy.ndarray
+               The magnitudes of the records.
+
+           unit : :class:`Type <BioSimSpace.Types._type.Type>`
+               The unit of the records.
+        """
+        self._magnitudes = magnitudes
+        self._unit = unit
+
+    def __len__(self):
+        """Return the number of records."""
+        return len(self._magnitudes)
+
+    def __getitem__(self, index):
+        """Return the record(s) at the given index, or slice."""
+        if isinstance(index, slice):
+            return _TimeSeries(self._magnitudes[index], self._unit)
+        else:
+            return float(self._magnitudes[index]) * self._unit
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "[%s]" % ", ".join([str(x) for x in self])
+
+    def __repr__(self):
+        """Return a human readable string representation of the object."""
+        return self.__str__()
+
+    def magnitudes(self):
+        """Return the magnitudes of the records.
+
+           Returns
+           -------
+
+           magnitudes : numpy.ndarray
+               A view of the record magnitudes.
+        """
+        return self._magnitudes
+
+    def unit(self):
+        """Return the unit of the records.
+
+           Returns
+           -------
+
+           unit : :class:`Type <BioSimSpace.Types._type.Type>`
+               The unit of the records.
+        """
+        return self._unit
+
+    def convert(self, unit):
+        """Convert the records to a different unit. The conversion factor is
+           computed once and applied to the whole array.
+
+           Parameters
+           ----------
+
+           unit : :class:`Type <BioSimSpace.Types._type.Type>`
+               The unit to convert to. This must be of the same type.
+
+           Returns
+           -------
+
+           time_series : :class:`_TimeSeries <BioSimSpace.Process._process._TimeSeries>`
+               The converted time series.
+        """
+        return _TimeSeries(self._magnitudes * (self._unit / unit), unit)
+
 class Process():
     """Base class for running different biomolecular simulation processes."""
 
+    # The default number of stdout and stderr lines to hold in memory.
+    _default_buffer_size = 10000
+
     def __init__(self, system, protocol, name=None, work_dir=None, seed=None, property_map={}):
         """Constructor.
 
@@ -188,6 +622,36 @@ class Process():
         # Initalise the command-line argument dictionary.
         self._args = _collections.OrderedDict()
 
+        # The maximum number of stdout and stderr lines to hold in memory.
+        self._buffer_size = self._default_buffer_size
+
+        # No stopping policy by default.
+        self._stopping_policy = None
+        self._is_converged = False
+        self._convergence_handles = []
+        self._convergence_timer = None
+        self._convergence_thread = None
+
+        # New records are read from the output files both by the main thread
+        # and when checking for convergence, so reads are serialised.
+        self._records_lock = _threading.RLock()
+
+        # The hardware resources assigned to the process. By default, the
+        # process can use whatever is available.
+        self._num_threads = None
+        self._gpu_devices = None
+
+        # The executor used to launch the process. If None, the default
+        # executor is used.
+        self._executor = None
+
+        # The checkpoint to resume from the next time that the process is
+        # started, and the trajectory segment written since the process was
+        # last resumed, which is yet to be joined to the main trajectory.
+        self._checkpoint = None
+        self._traj_segment = None
+        self._traj_segment_lock = _threading.Lock()
+
         # Clear any existing output in the current working directory
         # and set out stdout/stderr files.
         self._clear_output()
@@ -212,9 +676,10 @@ class Process():
         open(self._stdout_file, "a").close()
         open(self._stderr_file, "a").close()
 
-        # Initialise lists to store the contents of stdout and stderr.
-        self._stdout = []
-        self._stderr = []
+        # Initialise ring buffers to store the most recent lines of stdout
+        # and stderr. The full output is always available from the files.
+        self._stdout = _collections.deque(maxlen=self._buffer_size)
+        self._stderr = _collections.deque(maxlen=self._buffer_size)
 
         # Clean up any existing offset files.
         offset_files = _glob.glob("%s/*.offset" % self._work_dir)
@@ -366,32 +831,328 @@ class Process():
         if not self.isRunning():
             return
 
-        if max_time is not None:
-            # Convert int to float.
-            if type(max_time) is int:
-                max_time = float(max_time)
+        # Block until the monitor notifies us that the process has finished,
+        # or the maximum time has elapsed.
+        _getMonitor().wait(self, self._max_time_to_seconds(max_time))
 
-            # BioSimSpace.Types.Time
-            if isinstance(max_time, _Type.Type):
-                max_time = int(max_time.milliseconds().magnitude())
+    async def wait_async(self, max_time=None):
+        """Asynchronously wait for the process to finish. This doesn't block
+           the event loop, so many processes can be awaited concurrently.
 
-            # Float.
-            elif type(max_time) is float:
-                if max_time <= 0:
-                    raise ValueError("'max_time' cannot be negative!")
+           Parameters
+           ----------
 
-                # Convert the time to milliseconds.
-                max_time = int(max_time * 60 * 1000)
+           max_time: :class:`Time <BioSimSpace.Types.Time>`, int, float
+               The maximimum time to wait (in minutes).
+        """
 
-            else:
-                raise TypeError("'max_time' must be of type 'BioSimSpace.Types.Time' or 'float'.")
+        # The process isn't running.
+        if not self.isRunning():
+            return
+
+        await _getMonitor().waitAsync(self, self._max_time_to_seconds(max_time))
+
+    async def records(self):
+        """Asynchronously iterate over the thermodynamic records generated
+           by the process. New records are yielded as soon as they are written,
+           and iteration stops once the process has finished.
+
+           Returns
+           -------
+
+           records : async iterator
+               An asynchronous iterator over the records. Each record is a
+               dictionary mapping the record keys to their values.
+        """
+
+        # Wake whenever a file in the working directory changes, or the
+        # process finishes.
+        notifier = _Notifier()
+        monitor = _getMonitor()
+        file_handle = monitor.watchFile(self._work_dir, "*", lambda file: notifier.set())
+        process_handle = monitor.watchProcess(self, notifier.set)
+
+        store = None
+        index = 0
+
+        try:
+            while True:
+                notifier.clear()
+
+                # Check whether the process is running before reading the
+                # records so that the final records aren't missed.
+                is_running = self.isRunning()
 
-            # Wait for the desired amount of time.
-            self._process.wait(max_time)
+                # Read any new records. Start again if the store was replaced.
+                new_store = self._update_records()
+                if new_store is not store:
+                    store = new_store
+                    index = 0
+
+                if store is not None:
+                    while index < store.nRecords():
+                        yield store.record(index)
+                        index += 1
+
+                if not is_running:
+                    break
+
+                await notifier.waitAsync()
+
+        finally:
+            monitor.unwatch(file_handle)
+            monitor.unwatch(process_handle)
+
+    def getExecutor(self):
+        """Return the executor used to launch the process.
+
+           Returns
+           -------
+
+           executor : :class:`Executor <BioSimSpace.Process.Executor>`
+               The executor.
+        """
+        if self._executor is None:
+            return _getDefaultExecutor()
+        return self._executor
+
+    def setExecutor(self, executor):
+        """Set the executor used to launch the process, e.g. to run the
+           process via a batch queue.
+
+           Parameters
+           ----------
+
+           executor : :class:`Executor <BioSimSpace.Process.Executor>`
+               The executor, or None to use the default executor.
+        """
+
+        if executor is not None and not isinstance(executor, _Executor):
+            raise TypeError("'executor' must be of type 'BioSimSpace.Process.Executor'")
+
+        self._executor = executor
+
+    def _submit(self, args, stdout, stderr):
+        """Launch the process executable using the executor, restricted to
+           the hardware resources assigned to the process.
+
+           Parameters
+           ----------
+
+           args : [str], str
+               The command-line arguments.
+
+           stdout : str
+               The name of the file to redirect stdout to.
+
+           stderr : str
+               The name of the file to redirect stderr to.
+
+           Returns
+           -------
+
+           job : object
+               A handle to the running job.
+        """
+        job = self.getExecutor().submit(self._exe, args, stdout, stderr,
+            self._work_dir, self._getEnvironment())
+
+        # Join the trajectory segment once the resumed process has finished.
+        if self._traj_segment is not None:
+            _getMonitor().watchProcess(job, self._stitchTrajectory)
+
+        return job
+
+    def _resume(self):
+        """Prepare the process to resume from the latest valid checkpoint in
+           its working directory the next time that it is started, rather
+           than starting from scratch. This is used when restarting a
+           process that failed, or was killed.
+
+           Returns
+           -------
+
+           is_resumable : bool
+               Whether a valid checkpoint was found.
+        """
+        self._checkpoint = self._findCheckpoint()
+        return self._checkpoint is not None
+
+    def _findCheckpoint(self):
+        """Find the latest valid checkpoint in the working directory.
+
+           Returns
+           -------
+
+           checkpoint : dict
+               Information about the checkpoint that is needed to resume
+               the process, or None if there isn't a valid checkpoint, or
+               the process doesn't support resuming.
+        """
+        return None
+
+    def _setTrajectorySegment(self, segment, num_frames=None, time=None):
+        """Set the file that the trajectory is written to after the process
+           is resumed. Once the process finishes, the segment is joined to
+           the trajectory that was written before the checkpoint. This
+           must be called before the process is submitted.
+
+           Parameters
+           ----------
+
+           segment : str
+               The trajectory segment file.
+
+           num_frames : int
+               The number of frames of the original trajectory to keep.
+
+           time : float
+               Alternatively, the time of the checkpoint in picoseconds.
+        """
+
+        # Join any segment from a previous attempt, so that the trajectory
+        # is continuous up to the checkpoint.
+        self._stitchTrajectory()
+
+        if _os.path.isfile(segment):
+            _os.remove(segment)
+
+        with self._traj_segment_lock:
+            self._traj_segment = (segment, num_frames, time)
+
+    def _stitchTrajectory(self):
+        """Join the trajectory segment written since the process was resumed
+           to the main trajectory file.
+        """
+
+        with self._traj_segment_lock:
+            if self._traj_segment is None:
+                return
+
+            # Wait until the process has finished writing the segment.
+            if self._process is not None and self._process.isRunning():
+                return
+
+            segment, num_frames, time = self._traj_segment
+            self._traj_segment = None
+
+            if not _os.path.isfile(segment):
+                return
+
+            if not _os.path.isfile(self._traj_file):
+                _os.replace(segment, self._traj_file)
+                return
+
+            from ..Trajectory._trajectory import _stitch
+
+            try:
+                _stitch(self._traj_file, segment, num_frames=num_frames,
+                    time=time, topology=self._top_file)
+            except Exception as e:
+                _warnings.warn("Failed to join trajectory segment '%s': %s" % (segment, e))
+                return
+
+            _os.remove(segment)
+
+    def _setResources(self, num_threads=None, gpu_devices=None):
+        """Set the hardware resources that the process can use. These are
+           applied when the process is next started.
+
+           Parameters
+           ----------
+
+           num_threads : int
+               The number of CPU threads.
+
+           gpu_devices : [str]
+               The IDs of the GPU devices.
+        """
+
+        if num_threads is not None:
+            if type(num_threads) is not int:
+                raise TypeError("'num_threads' must be of type 'int'")
+            if num_threads < 1:
+                raise ValueError("'num_threads' must be greater than zero!")
+
+        if gpu_devices is not None:
+            if type(gpu_devices) is not list or not all(type(x) is str for x in gpu_devices):
+                raise TypeError("'gpu_devices' must be a list of 'str' types.")
+
+        self._num_threads = num_threads
+        self._gpu_devices = gpu_devices
+
+    def _getEnvironment(self):
+        """Return the environment variables used to apply the hardware
+           resources assigned to the process. This should be overloaded by
+           processes that need additional variables.
+
+           Returns
+           -------
+
+           environment : dict
+               A dictionary mapping environment variable names to values.
+        """
+
+        environment = {}
+
+        if self._num_threads is not None:
+            environment["OMP_NUM_THREADS"] = str(self._num_threads)
+
+        if self._gpu_devices is not None:
+            environment["CUDA_VISIBLE_DEVICES"] = ",".join(self._gpu_devices)
+
+        return environment
+
+    def _update_records(self):
+        """Read any new thermodynamic records. This should be overloaded by
+           processes that generate records.
+
+           Returns
+           -------
+
+           records : :class:`_RecordStore <BioSimSpace.Process._process._RecordStore>`
+               The record store for the process.
+        """
+        return None
+
+    def _max_time_to_seconds(self, max_time):
+        """Helper function to validate a maximum wait time and convert it
+           to seconds.
+
+           Parameters
+           ----------
+
+           max_time: :class:`Time <BioSimSpace.Types.Time>`, int, float
+               The maximimum time to wait (in minutes).
+
+           Returns
+           -------
+
+           max_time : float
+               The maximum time to wait (in seconds).
+        """
+
+        if max_time is None:
+            return None
+
+        # Convert int to float.
+        if type(max_time) is int:
+            max_time = float(max_time)
+
+        # BioSimSpace.Types.Time
+        if isinstance(max_time, _Type.Type):
+            return max_time.seconds().magnitude()
+
+        # Float.
+        elif type(max_time) is float:
+            if max_time <= 0:
+                raise ValueError("'max_time' cannot be negative!")
+
+            # Convert the time to seconds.
+            return max_time * 60
 
         else:
-            # Wait for the process to finish.
-            self._process.wait()
+            raise TypeError("'max_time' must be of type 'BioSimSpace.Types.Time' or 'float'.")
 
     def isQueued(self):
         """Return whether the process is queued.
@@ -402,7 +1163,14 @@ class Process():
            is_queued : bool
                Whether the process is queued.
         """
-        return self._is_queued
+        if self._is_queued:
+            return True
+
+        # The job is waiting in the executor's queue.
+        try:
+            return self._process.isQueued()
+        except AttributeError:
+            return False
 
     def isRunning(self):
         """Return whether the process is running.
@@ -427,18 +1195,194 @@ class Process():
            is_error : bool
                Whether the process errored.
         """
+
+        # The process was stopped by the stopping policy.
+        if self._is_converged:
+            return False
+
         try:
             return self._process.isError()
         except AttributeError:
             return False
 
+    def isConverged(self):
+        """Return whether the process was stopped because the records
+           monitored by its stopping policy converged.
+
+           Returns
+           -------
+
+           is_converged : bool
+               Whether the process converged.
+        """
+        return self._is_converged
+
+    def getStoppingPolicy(self):
+        """Return the stopping policy.
+
+           Returns
+           -------
+
+           policy : :class:`ConvergencePolicy <BioSimSpace.Process.ConvergencePolicy>`
+               The stopping policy, or None if the process only stops once
+               the protocol has finished.
+        """
+        return self._stopping_policy
+
+    def setStoppingPolicy(self, policy):
+        """Set a policy used to stop the process early once the chosen records
+           have converged. The policy takes effect when the process is started.
+
+           Parameters
+           ----------
+
+           policy : :class:`ConvergencePolicy <BioSimSpace.Process.ConvergencePolicy>`
+               The stopping policy. Use None to run for the full protocol.
+        """
+
+        if policy is not None:
+            if not isinstance(policy, _ConvergencePolicy):
+                raise TypeError("'policy' must be of type 'BioSimSpace.Process.ConvergencePolicy'")
+
+            # Make sure the process generates the records.
+            policy.validate(self)
+
+        self._stopping_policy = policy
+
+    def _watch_convergence(self):
+        """Start checking whether the process has converged, if a stopping
+           policy has been set. This should be called once the process has
+           been started.
+        """
+
+        self._is_converged = False
+        self._convergence_timer = None
+
+        if self._stopping_policy is None:
+            return
+
+        # Check for convergence whenever output is written, and stop checking
+        # once the process has finished.
+        monitor = _getMonitor()
+        self._convergence_handles = [
+            monitor.watchFile(self._work_dir, "*", self._check_convergence),
+            monitor.watchProcess(self, self._stop_watching_convergence)]
+
+    def _stop_watching_convergence(self):
+        """Stop checking whether the process has converged."""
+
+        monitor = _getMonitor()
+
+        for handle in self._convergence_handles:
+            monitor.unwatch(handle)
+
+        self._convergence_handles = []
+
+    def _check_convergence(self, file=None):
+        """Check whether the process has converged, stopping it if so. This
+           is called by the monitor, so the records are analysed on a
+           separate thread to avoid delaying other callbacks.
+
+           Parameters
+           ----------
+
+           file : str
+               The output file that changed.
+        """
+
+        policy = self._stopping_policy
+
+        if policy is None or self._is_converged or not self.isRunning():
+            return
+
+        # Limit how often the records are analysed, and only run one analysis
+        # at a time.
+        time = _timeit.default_timer()
+        if self._convergence_timer is not None and \
+            time - self._convergence_timer < policy.interval().seconds().magnitude():
+            return
+        if self._convergence_thread is not None and self._convergence_thread.is_alive():
+            return
+        self._convergence_timer = time
+
+        self._convergence_thread = _threading.Thread(target=self._analyse_convergence,
+            name="BioSimSpace.Convergence")
+        self._convergence_thread.daemon = True
+        self._convergence_thread.start()
+
+    def _analyse_convergence(self):
+        """Analyse the records, stopping the process if they have converged."""
+
+        policy = self._stopping_policy
+
+        if policy is None or not policy.isConverged(self):
+            return
+
+        self._is_converged = True
+
+        # Stop checking for convergence, but keep watching for the process to
+        # finish so that any handles added while stopping are removed.
+        monitor = _getMonitor()
+        if len(self._convergence_handles) > 0:
+            monitor.unwatch(self._convergence_handles[0])
+
+        self._stop()
+
+    def _stop(self):
+        """Stop the process cleanly once it has converged, so that its final
+           output is written, and it can be resumed. The process is killed
+           once the latest checkpoint is complete, i.e. it isn't part way
+           through being written. Engines that write their final output when
+           they are sent a termination signal override this.
+        """
+
+        pattern = self._checkpointPattern()
+
+        # Either the process doesn't write checkpoints, or the latest one is
+        # complete.
+        if pattern is None or self._findCheckpoint() is not None:
+            self.kill()
+            return
+
+        # Wait until the checkpoint has been written.
+        handle = _getMonitor().watchFile(self._work_dir, pattern, self._stop_at_checkpoint)
+        self._convergence_handles.append(handle)
+
+        # The process finished while the watch was being added.
+        if not self.isRunning():
+            self._stop_watching_convergence()
+
+    def _stop_at_checkpoint(self, file=None):
+        """Kill the process once its checkpoint is complete.
+
+           Parameters
+           ----------
+
+           file : str
+               The checkpoint file that changed.
+        """
+        if self.isRunning() and self._findCheckpoint() is not None:
+            self.kill()
+
+    def _checkpointPattern(self):
+        """Return a glob pattern matching the checkpoint files written by the
+           process while it is running.
+
+           Returns
+           -------
+
+           pattern : str
+               The pattern, or None if the process doesn't write checkpoints.
+        """
+        return None
+
     def kill(self):
         """Kill the running process."""
         if not self._process is None and self._process.isRunning():
             self._process.kill()
 
     def stdout(self, n=10):
-        """Print the last n lines of the stdout buffer.
+        """Print the last n lines of stdout.
 
            Parameters
            ----------
@@ -451,25 +1395,12 @@ class Process():
         if n < 0:
             raise ValueError("The number of lines must be positive!")
 
-        # Append any new lines to the stdout list.
-        for line in _pygtail.Pygtail(self._stdout_file):
-            self._stdout.append(line.rstrip())
-
-        # Get the current number of lines.
-        num_lines = len(self._stdout)
-
-        # Set the line from which to start printing.
-        if num_lines < n:
-            start = 0
-        else:
-            start = num_lines - n
-
-        # Print the lines.
-        for x in range(start, num_lines):
-            print(self._stdout[x])
+        # Read the lines backwards from the end of the file.
+        for line in _tail(self._stdout_file, n):
+            print(line)
 
     def stderr(self, n=10):
-        """Print the last n lines of the stderr buffer.
+        """Print the last n lines of stderr.
 
            Parameters
            ----------
@@ -482,22 +1413,9 @@ class Process():
         if n < 0:
             raise ValueError("The number of lines must be positive!")
 
-        # Append any new lines to the stdout list.
-        for line in _pygtail.Pygtail(self._stderr_file):
-            self._stderr.append(line.rstrip())
-
-        # Get the current number of lines.
-        num_lines = len(self._stderr)
-
-        # Set the line from which to start printing.
-        if num_lines < n:
-            start = 0
-        else:
-            start = num_lines - n
-
-        # Print the lines.
-        for x in range(start, num_lines):
-            print(self._stderr[x])
+        # Read the lines backwards from the end of the file.
+        for line in _tail(self._stderr_file, n):
+            print(line)
 
     def exe(self):
         """Return the executable.
@@ -533,7 +1451,9 @@ class Process():
         return self._work_dir
 
     def getStdout(self, block="AUTO"):
-        """Return the entire stdout for the process as a list of strings.
+        """Return the stdout for the process as a list of strings. At most
+           the number of lines set by :meth:`setBufferSize` are returned,
+           i.e. the most recent output.
 
            Parameters
            ----------
@@ -558,10 +1478,12 @@ class Process():
         for line in _pygtail.Pygtail(self._stdout_file):
             self._stdout.append(line.rstrip())
 
-        return self._stdout.copy()
+        return list(self._stdout)
 
     def getStderr(self, block="AUTO"):
-        """Return the entire stderr for the process as a list of strings.
+        """Return the stderr for the process as a list of strings. At most
+           the number of lines set by :meth:`setBufferSize` are returned,
+           i.e. the most recent output.
 
            Parameters
            ----------
@@ -586,7 +1508,42 @@ class Process():
         for line in _pygtail.Pygtail(self._stderr_file):
             self._stderr.append(line.rstrip())
 
-        return self._stderr.copy()
+        return list(self._stderr)
+
+    def getBufferSize(self):
+        """Return the maximum number of lines of stdout and stderr that are
+           held in memory.
+
+           Returns
+           -------
+
+           size : int
+               The buffer size.
+        """
+        return self._buffer_size
+
+    def setBufferSize(self, size):
+        """Set the maximum number of lines of stdout and stderr that are
+           held in memory. Once full, the oldest lines are discarded.
+
+           Parameters
+           ----------
+
+           size : int
+               The buffer size.
+        """
+
+        if type(size) is not int:
+            raise TypeError("'size' must be of type 'int'")
+
+        if size < 1:
+            raise ValueError("'size' must be greater than zero!")
+
+        self._buffer_size = size
+
+        # Resize the buffers, keeping the most recent lines.
+        self._stdout = _collections.deque(self._stdout, maxlen=size)
+        self._stderr = _collections.deque(self._stderr, maxlen=size)
 
     def getInput(self, name=None, file_link=False):
         """Return a link to a zip file containing the input files used by
@@ -632,8 +1589,11 @@ class Process():
         else:
             return zipname
 
-    def getOutput(self, name=None, block="AUTO", file_link=False):
-        """Return a link to a zip file of the working directory.
+    def getOutput(self, name=None, block="AUTO", file_link=False, include=None, exclude=None,
+            compression="stored", level=None, workers=None, incremental=True):
+        """Return a link to a zip file of the working directory. Repeated
+           calls update the existing archive, so only files that have changed
+           are compressed.
 
            Parameters
            ----------
@@ -647,6 +1607,28 @@ class Process():
            file_link : bool
                Whether to return a FileLink when working in Jupyter.
 
+           include : [str]
+               A list of glob patterns. Only matching files are archived. By
+               default, all files are archived.
+
+           exclude : [str]
+               A list of glob patterns for files to exclude from the archive,
+               e.g. ["*.nc", "*.dcd"] to skip trajectories.
+
+           compression : str
+               The compression codec: "stored", "deflated", "bzip2", or "lzma".
+
+           level : int
+               The compression level. Use None for the codec's default.
+
+           workers : int
+               The number of threads used to compress files in parallel. By
+               default, one thread is used per CPU.
+
+           incremental : bool
+               Whether to only compress files that have changed since the
+               archive was last written.
+
            Returns
            -------
 
@@ -669,13 +1651,9 @@ class Process():
         # Generate the zip file name.
         zipname = "%s.zip" % name
 
-        # Glob all of the output files.
-        output = _glob.glob("%s/*" % self._work_dir)
-
-        with _zipfile.ZipFile(zipname, "w") as zip:
-            # Loop over all of the file outputs.
-            for file in output:
-                zip.write(file, arcname=_os.path.basename(file))
+        # Archive the output files.
+        _Utils.archive(self._work_dir, zipname, include=include, exclude=exclude,
+                compression=compression, level=level, workers=workers, incremental=incremental)
 
         # Return a link to the archive.
         if _is_notebook():
@@ -1122,3 +2100,90 @@ def _odict_insert(dct, key, value, index):
             break
         elif i > index:
             dct.move_to_end(item)
+
+def _reverse_lines(file, block_size=8192):
+    """Iterate over the lines of a file in reverse order, seeking backwards
+       from the end of the file one block at a time.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the file.
+
+       block_size : int
+           The number of bytes to read at a time.
+
+       Returns
+       -------
+
+       lines : generator
+           A generator yielding the lines of the file, last line first.
+    """
+
+    try:
+        handle = open(file, "rb")
+    except FileNotFoundError:
+        return
+
+    with handle:
+        handle.seek(0, _os.SEEK_END)
+        end = handle.tell()
+        pos = end
+
+        # Don't treat a trailing newline as an empty final line.
+        if pos > 0:
+            handle.seek(pos - 1)
+            if handle.read(1) == b"\n":
+                pos -= 1
+
+        # Any partial line carried over from the previous block.
+        remainder = b""
+
+        while pos > 0:
+            size = min(block_size, pos)
+            pos -= size
+            handle.seek(pos)
+            lines = (handle.read(size) + remainder).split(b"\n")
+
+            # The first line may be incomplete, so keep it for the next block.
+            remainder = lines[0]
+
+            for line in reversed(lines[1:]):
+                yield line.decode(errors="replace").rstrip()
+
+        if end > 0:
+            yield remainder.decode(errors="replace").rstrip()
+
+def _tail(file, n):
+    """Return the last n lines of a file. Only the end of the file is read,
+       so the cost depends on the number of lines requested, rather than the
+       size of the file.
+
+       Parameters
+       ----------
+
+       file : str
+           The path to the file.
+
+       n : int
+           The number of lines.
+
+       Returns
+       -------
+
+       lines : [str]
+           The last n lines of the file.
+    """
+
+    lines = []
+
+    if n > 0:
+        for line in _reverse_lines(file):
+            lines.append(line)
+            if len(lines) == n:
+                break
+
+    lines.reverse()
+
+    return lines
@@ -25,8 +25,12 @@ Functionality for running multiple processes.
 
 import os as _os
 import tempfile as _tempfile
+import threading as _threading
 
+from ._monitor import _Notifier
+from ._monitor import getMonitor as _getMonitor
 from ._process import Process as _Process
+from ..Gateway import ResourceManager as _ResourceManager
 from .._SireWrappers import System as _System
 
 __author__ = "Lester Hedges"
@@ -101,6 +105,14 @@ class ProcessRunner():
         if nest_dirs:
             self._processes = self._nest_directories(self._processes)
 
+        # The thread used to run processes in the background, the processes
+        # that have finished, a flag used to stop scheduling new processes,
+        # and any error raised on the background thread.
+        self._thread = None
+        self._finished = []
+        self._stop = _threading.Event()
+        self._error = None
+
     def __str__(self):
         """Return a human readable string representation of the object."""
         return "<BioSimSpace.Process.%s: nProcesses=%d, nRunning=%d, nQueued=%d, nError=%d, name='%s', work_dir='%s'>" \
@@ -161,6 +173,20 @@ class ProcessRunner():
         else:
             self._name = name
 
+    def setExecutor(self, executor):
+        """Set the executor used to launch all of the processes, e.g. to
+           distribute them between the hosts of a
+           :class:`ClusterExecutor <BioSimSpace.Process.ClusterExecutor>`.
+
+           Parameters
+           ----------
+
+           executor : :class:`Executor <BioSimSpace.Process.Executor>`
+               The executor, or None to use the default executor.
+        """
+        for process in self._processes:
+            process.setExecutor(executor)
+
     def addProcess(self, process):
         """Add a process to the runner.
 
@@ -405,32 +431,133 @@ class ProcessRunner():
         except IndexError:
             raise("'index' is out of range: [0-%d]" % len(self._processes))
 
-    def startAll(self):
-        """Start all of the processes."""
+    def startAll(self, max_concurrent=1, max_retries=5, block=True):
+        """Start all of the processes. Up to 'max_concurrent' processes are
+           run at once, and a queued process is started whenever a running
+           one finishes. A process that fails is restarted, up to a maximum
+           number of attempts, before it is counted as finished. Where
+           possible, a restarted process resumes from the latest checkpoint
+           written by its engine, rather than starting from scratch.
 
-        for p in self._processes:
-            # Initialise the error state.
-            is_error = True
+           The cores and GPUs reported by the
+           :class:`ResourceManager <BioSimSpace.Gateway.ResourceManager>`
+           are divided between the running processes, and each process is
+           restricted to its share when it is started.
 
-            # Zero the tally of failed processes.
-            num_failed = 0
+           Parameters
+           ----------
 
-            # Retry failed processes up to a maximum of 5 times.
-            while is_error:
-                # Start the process and wait for it to finish.
-                p.start()
-                p.wait()
+           max_concurrent : int
+               The maximum number of processes to run at once. If None, then
+               this is chosen to make use of all of the available resources,
+               i.e. one process per GPU, or one per core if there are no GPUs.
+               No more processes than cores are run at once. Processes that
+               are launched by an executor that runs jobs on other hosts,
+               e.g. a :class:`ClusterExecutor <BioSimSpace.Process.ClusterExecutor>`,
+               aren't limited by the local resources, so if None then all of
+               the processes are submitted at once.
+
+           max_retries : int
+               The maximum number of times to run each process.
+
+           block : bool
+               Whether to block until all of the processes have finished.
+               Otherwise, processes are scheduled from a background thread
+               and progress can be checked using "progress". Use "wait" to
+               wait for them to finish, which raises any error from starting
+               a process. Processes are started in their working directory,
+               which changes the working directory of the whole Python process
+               while they are set up, so other code that runs at the same time
+               should use absolute paths.
+        """
+
+        if max_concurrent is not None:
+            if type(max_concurrent) is not int:
+                raise TypeError("'max_concurrent' must be of type 'int'")
+
+            if max_concurrent < 1:
+                raise ValueError("'max_concurrent' must be greater than zero!")
+
+        if type(max_retries) is not int:
+            raise TypeError("'max_retries' must be of type 'int'")
+
+        if max_retries < 1:
+            raise ValueError("'max_retries' must be greater than zero!")
+
+        if type(block) is not bool:
+            raise TypeError("'block' must be of type 'bool'")
+
+        # Don't start the processes twice.
+        if self._thread is not None and self._thread.is_alive():
+            raise ValueError("The processes have already been started!")
+
+        # Reset the state.
+        self._finished = []
+        self._stop.clear()
+        self._error = None
+
+        # Processes that run elsewhere, e.g. on the hosts of a cluster, aren't
+        # limited by the local resources, so submit as many as are allowed.
+        if len(self._processes) > 0 and \
+           not any(process.getExecutor()._is_local for process in self._processes):
+            if max_concurrent is None:
+                max_concurrent = len(self._processes)
+            slots = [(None, None)] * max(1, min(max_concurrent, len(self._processes)))
+
+        # Divide the available resources between the running processes.
+        else:
+            slots = _allocate(len(self._processes), max_concurrent,
+                _ResourceManager.getCores(), _ResourceManager.getGPUDevices())
+
+        args = (list(self._processes), slots, max_retries, self._finished, self._stop)
+
+        if block:
+            _schedule(*args)
+        else:
+            self._thread = _threading.Thread(target=self._run_schedule, args=args)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait(self):
+        """Wait for all of the processes started by "startAll" to finish.
+           If an error was raised while scheduling the processes in the
+           background, then it is raised here.
+        """
+        if self._thread is not None:
+            self._thread.join()
+
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def nFinished(self):
+        """Return the number of processes that have finished. A process is
+           only counted as finished once it has succeeded, or has failed
+           the maximum number of times.
+
+           Returns
+           -------
+
+           n_finished : int
+               The number of processes that have finished.
+        """
+        return len(self._finished)
+
+    def progress(self):
+        """Return the fraction of processes that have finished.
 
-                # Check the error state.
-                is_error = p.isError()
+           Returns
+           -------
+
+           progress : float
+               The fraction of processes that have finished.
+        """
 
-                # Increment the number of failures.
-                if is_error:
-                    num_failed += 1
+        if len(self._processes) == 0:
+            return 1.0
 
-                    # Maximum retries reached, move to the next process.
-                    if num_failed == 5:
-                        break
+        return len(self._finished) / len(self._processes)
 
     def kill(self, index):
         """Kill a specific process. The same can be achieved using:
@@ -452,14 +579,21 @@ class ProcessRunner():
     def killAll(self):
         """Kill all of the processes."""
 
+        # Stop scheduling new processes.
+        self._stop.set()
+
         for p in self._processes:
             p.kill()
 
     def restartFailed(self):
-        """Restart any jobs that are in an error state."""
+        """Restart any jobs that are in an error state. Each job resumes
+           from the latest valid checkpoint in its working directory, if
+           there is one.
+        """
 
         for p in self._processes:
             if p.isError():
+                p._resume()
                 p.start()
 
     def runTime(self):
@@ -479,6 +613,15 @@ class ProcessRunner():
 
         return run_time
 
+    def _run_schedule(self, *args):
+        """Helper function to schedule the processes from a background
+           thread, storing any error so that it can be raised by "wait".
+        """
+        try:
+            _schedule(*args)
+        except Exception as e:
+            self._error = e
+
     def _nest_directories(self, processes):
         """Helper function to nest processes inside the runner's working
            directory.
@@ -508,8 +651,150 @@ class ProcessRunner():
             if process._package_name == "SOMD":
                 new_processes.append(type(process)(_System(process._system), process._protocol,
                     process._exe, process._name, process._platform, new_dir, process._seed, process._property_map))
+            elif process._package_name == "GROMACS":
+                new_processes.append(type(process)(_System(process._system), process._protocol,
+                    process._exe, process._name, new_dir, process._seed, process._property_map, process._use_edr))
             else:
                 new_processes.append(type(process)(_System(process._system), process._protocol,
                     process._exe, process._name, new_dir, process._seed, process._property_map))
 
+            # Use the same executor.
+            new_processes[-1]._executor = process._executor
+
         return new_processes
+
+def _allocate(num_processes, max_concurrent, cores, gpu_devices):
+    """Internal function to divide hardware resources into slots, each of
+       which runs a single process at a time.
+
+       Parameters
+       ----------
+
+       num_processes : int
+           The number of processes to run.
+
+       max_concurrent : int
+           The maximum number of processes to run at once, or None to use
+           one process per GPU, or per core if there are no GPUs.
+
+       cores : int
+           The number of cores.
+
+       gpu_devices : [str]
+           The IDs of the GPU devices.
+
+       Returns
+       -------
+
+       slots : [(int, [str])]
+           The number of threads and the GPU devices (or None) for each slot.
+    """
+
+    cores = max(1, cores)
+
+    if max_concurrent is None:
+        if len(gpu_devices) > 0:
+            max_concurrent = len(gpu_devices)
+        else:
+            max_concurrent = cores
+
+    # Don't run more processes than cores, since they would compete with
+    # each other for time.
+    num_slots = max(1, min(num_processes, max_concurrent, cores))
+
+    # Share the cores as evenly as possible.
+    num_threads, remainder = divmod(cores, num_slots)
+
+    slots = []
+    for x in range(0, num_slots):
+        if len(gpu_devices) > 0:
+            gpus = [gpu_devices[x % len(gpu_devices)]]
+        else:
+            gpus = None
+        slots.append((num_threads + (1 if x < remainder else 0), gpus))
+
+    return slots
+
+def _schedule(processes, slots, max_retries, finished, stop):
+    """Internal function to run processes, with one process running in each
+       resource slot at a time. A process that fails is restarted straight
+       away, resuming from its latest checkpoint, up to a maximum of
+       'max_retries' attempts.
+
+       Parameters
+       ----------
+
+       processes : [:class:`Process <BioSimSpace.Process>`]
+           The processes to run, in order.
+
+       slots : [(int, [str])]
+           The number of threads and the GPU devices (or None) for each slot.
+
+       max_retries : int
+           The maximum number of times to run each process.
+
+       finished : list
+           A list to which each process is appended once it has finished.
+
+       stop : threading.Event
+           An event that is set to stop new processes from being started.
+    """
+
+    monitor = _getMonitor()
+
+    # Wake whenever a running process finishes.
+    notifier = _Notifier()
+
+    # The queued and running processes, along with their number of failures
+    # and resource slot.
+    queued = [[p, 0, None] for p in processes]
+    running = []
+
+    # The free resource slots.
+    free = list(slots)
+
+    # Monitor handles for the running processes.
+    handles = {}
+
+    try:
+        while len(queued) > 0 or len(running) > 0:
+            notifier.clear()
+
+            # Start queued processes while there are free slots.
+            while len(queued) > 0 and len(free) > 0 and not stop.is_set():
+                job = queued.pop(0)
+                job[2] = free.pop(0)
+                job[0]._setResources(*job[2])
+                job[0].start()
+                running.append(job)
+                handles[id(job)] = monitor.watchProcess(job[0], notifier.set)
+
+            # Nothing is running and nothing more will be started.
+            if len(running) == 0:
+                break
+
+            # Wait for a process to finish.
+            done = [job for job in running if not job[0].isRunning()]
+            if len(done) == 0:
+                notifier.wait()
+                continue
+
+            for job in done:
+                running.remove(job)
+                monitor.unwatch(handles.pop(id(job)))
+                free.append(job[2])
+
+                # Retry failed processes ahead of any that are still queued,
+                # resuming from their latest checkpoint.
+                if job[0].isError() and not stop.is_set():
+                    job[1] += 1
+                    if job[1] < max_retries:
+                        job[0]._resume()
+                        queued.insert(0, job)
+                        continue
+
+                finished.append(job[0])
+
+    finally:
+        for handle in handles.values():
+            monitor.unwatch(handle)
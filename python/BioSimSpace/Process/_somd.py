@@ -24,18 +24,22 @@ Functionality for running simulations with SOMD.
 """
 
 import math as _math
+import numpy as _np
 import os as _os
-import pygtail as _pygtail
+import threading as _threading
 import timeit as _timeit
 import warnings as _warnings
 
 import Sire.Base as _SireBase
 import Sire.IO as _SireIO
+import Sire.Stream as _SireStream
 
 from . import _process
+from ._statistics import _OnlineStatistics
 from .._Exceptions import IncompatibleError as _IncompatibleError
 from .._Exceptions import MissingSoftwareError as _MissingSoftwareError
 from .._SireWrappers import System as _System
+from ..Trajectory import countFrames as _countFrames
 from ..Trajectory import Trajectory as _Trajectory
 
 import BioSimSpace.Protocol as _Protocol
@@ -46,6 +50,63 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["Somd"]
 
+def _config_value(config, key, default=None):
+    """Internal function to get the value of a keyword in a SOMD
+       configuration.
+
+       Parameters
+       ----------
+
+       config : [str]
+           The configuration.
+
+       key : str
+           The keyword.
+
+       default : str
+           The value to return if the keyword isn't set.
+
+       Returns
+       -------
+
+       value : str
+           The value of the keyword.
+    """
+    for line in config:
+        data = line.split("=", 1)
+        if len(data) == 2 and data[0].strip().lower() == key.lower():
+            return data[1].strip()
+    return default
+
+def _resume_config(config, ncycles):
+    """Internal function to create a configuration that continues a SOMD
+       simulation from its restart file. SOMD automatically loads the
+       restart file from the working directory and continues from the
+       last cycle that it completed, so only the number of cycles that
+       remain to be run need to be updated.
+
+       Parameters
+       ----------
+
+       config : [str]
+           The original configuration.
+
+       ncycles : int
+           The number of cycles that remain to be run.
+
+       Returns
+       -------
+
+       config : [str]
+           The configuration for the resumed simulation.
+    """
+    new_config = []
+    for line in config:
+        if line.split("=", 1)[0].strip().lower() == "ncycles":
+            line = "ncycles = %d" % ncycles
+        new_config.append(line)
+    return new_config
+
 class Somd(_process.Process):
     """A class for running simulations using SOMD."""
 
@@ -88,6 +149,10 @@ class Somd(_process.Process):
                own naming scheme, e.g. { "charge" : "my-charge" }
         """
 
+        # Create a lock to protect the gradient records. This is needed
+        # before calling the base class constructor, which clears the output.
+        self._gradient_lock = _threading.Lock()
+
         # Call the base class constructor.
         super().__init__(system, protocol, name, work_dir, seed, property_map)
 
@@ -141,9 +206,8 @@ class Somd(_process.Process):
         # Set the path for the perturbation file.
         self._pert_file = "%s/%s.pert" % (self._work_dir, name)
 
-        # Set the path for the gradient file and create the gradient list.
+        # Set the path for the gradient file.
         self._gradient_file = "%s/gradients.dat" % self._work_dir
-        self._gradients = []
 
         # Create the list of input files.
         self._input_files = [self._config_file, self._rst_file, self._top_file]
@@ -185,6 +249,7 @@ class Somd(_process.Process):
                 self._input_files.append(self._pert_file)
 
                 # Remove the perturbable molecule.
+                system._detach()
                 system._sire_system.remove(pert_mol.number())
 
                 # Recreate the system, putting the perturbable molecule with
@@ -192,6 +257,7 @@ class Somd(_process.Process):
                 updated_system = _System(pert_mol) + _System(system)
 
                 # Copy across all of the properties from the orginal system.
+                updated_system._detach()
                 for prop in system._sire_system.propertyKeys():
                     updated_system._sire_system.setProperty(prop, system._sire_system.property(prop))
 
@@ -452,6 +518,25 @@ class Somd(_process.Process):
         self.setArg("-C", "%s.cfg" % self._name)                        # Config file.
         self.setArg("-p", self._platform)                               # Simulation platform.
 
+    def _getEnvironment(self):
+        """Return the environment variables used to apply the hardware
+           resources assigned to the process.
+
+           Returns
+           -------
+
+           environment : dict
+               A dictionary mapping environment variable names to values.
+        """
+
+        environment = super()._getEnvironment()
+
+        # Limit the number of threads used by the OpenMM CPU platform.
+        if self._num_threads is not None:
+            environment["OPENMM_CPU_THREADS"] = str(self._num_threads)
+
+        return environment
+
     def start(self):
         """Start the SOMD process.
 
@@ -471,8 +556,22 @@ class Somd(_process.Process):
             if self._process.isRunning():
                 return
 
+        # Resume from a checkpoint, if one was found.
+        checkpoint = self._checkpoint
+        self._checkpoint = None
+
         # Clear any existing output.
-        self._clear_output()
+        self._clear_output(is_resuming=checkpoint is not None)
+
+        if checkpoint is not None:
+            # Join the trajectory from the previous attempt, if needed.
+            self._stitchTrajectory()
+
+            # SOMD writes coordinates to a new trajectory file each time
+            # that it is run, named by counting the existing files.
+            num_dcd = len([f for f in _os.listdir(self._work_dir) if f.endswith(".dcd")])
+            self._setTrajectorySegment("%s/traj%09d.dcd" % (self._work_dir, num_dcd + 1),
+                num_frames=checkpoint["cycle"] * checkpoint["frames_per_cycle"])
 
         # Run the process in the working directory.
         with _Utils.cd(self._work_dir):
@@ -480,11 +579,20 @@ class Somd(_process.Process):
             # Create the arguments string list.
             args = self.getArgStringList()
 
+            # Run the remaining cycles using a separate configuration file.
+            if checkpoint is not None:
+                config_file = "%s.resume.cfg" % self._name
+                with open(config_file, "w") as f:
+                    for line in _resume_config(self.getConfig(),
+                            checkpoint["ncycles"] - checkpoint["cycle"]):
+                        f.write("%s\n" % line)
+                args[args.index("-C") + 1] = config_file
+
             # Write the command-line process to a README.txt file.
             with open("README.txt", "w") as f:
 
                 # Set the command-line string.
-                self._command = "%s " % self._exe + self.getArgString()
+                self._command = "%s " % self._exe + " ".join(args)
 
                 # Write the command to file.
                 f.write("# SOMD was run with the following command:\n")
@@ -494,15 +602,29 @@ class Somd(_process.Process):
             self._timer = _timeit.default_timer()
 
             # Start the simulation.
-            self._process = _SireBase.Process.run(self._exe, args,
-                "%s.out"  % self._name, "%s.out"  % self._name)
+            self._process = self._submit(args, "%s.out"  % self._name, "%s.out"  % self._name)
 
             # SOMD uses the stdout stream for all output.
             with open(_os.path.basename(self._stderr_file), "w") as f:
                 f.write("All output has been redirected to the stdout stream!\n")
 
+        # Stop the process early once it has converged.
+        self._watch_convergence()
+
         return self
 
+    def _update_records(self):
+        """Read any new thermodynamic records.
+
+           Returns
+           -------
+
+           records : :class:`_RecordStore <BioSimSpace.Process._process._RecordStore>`
+               The record store for the process.
+        """
+        self.getGradient(block=False)
+        return self._gradients
+
     def getSystem(self, block="AUTO"):
         """Get the latest molecular system.
 
@@ -598,8 +720,18 @@ class Somd(_process.Process):
         if type(self._protocol) is _Protocol.Minimisation:
             return None
 
-        # Get the number of trajectory frames.
-        num_frames = self.getTrajectory(block=block).nFrames()
+        # Wait for the process to finish.
+        if block is True:
+            self.wait()
+        elif block == "AUTO" and self._is_blocked:
+            self.wait()
+
+        # Get the number of trajectory frames. The frames are counted from the
+        # file, rather than loading the trajectory.
+        try:
+            num_frames = _countFrames(self._traj_file)
+        except:
+            return None
 
         if num_frames == 0:
             return None
@@ -647,7 +779,7 @@ class Somd(_process.Process):
            Returns
            -------
 
-           gradient : float
+           gradient : float, numpy.ndarray
                The free energy gradient.
         """
 
@@ -657,23 +789,16 @@ class Somd(_process.Process):
         elif block == "AUTO" and self._is_blocked:
             self.wait()
 
-        # No gradient file.
-        if not _os.path.isfile(self._gradient_file):
-            return None
-
-        # Append any new lines to the gradients list.
-        for line in _pygtail.Pygtail(self._gradient_file):
-            # Ignore comments.
-            if line[0] != "#":
-                self._gradients.append(float(line.rstrip().split()[-1]))
+        # Read any new gradient records.
+        self._update_gradients()
 
         if len(self._gradients) == 0:
             return None
 
         if time_series:
-            return self._gradients
+            return self._gradients.timeSeries("GRADIENT")
         else:
-            return self._gradients[-1]
+            return self._gradients.last("GRADIENT")
 
     def getCurrentGradient(self, time_series=False):
         """Get the current free energy gradient.
@@ -692,12 +817,174 @@ class Somd(_process.Process):
         """
         return self.getGradient(time_series, block=False)
 
-    def _clear_output(self):
-        """Reset stdout and stderr."""
+    def getGradientStatistics(self, block="AUTO"):
+        """Get running statistics for the free energy gradient. These are
+           updated as gradients are read, so the cost of the query doesn't
+           depend on the length of the simulation.
+
+           Parameters
+           ----------
+
+           block : bool
+               Whether to block until the process has finished running.
+
+           Returns
+           -------
+
+           statistics : dict
+               A dictionary containing the number of samples, the mean
+               gradient, its variance, the standard error of the mean
+               (corrected for autocorrelation), the standard error estimated
+               by block averaging, and the statistical inefficiency.
+        """
+
+        # Wait for the process to finish.
+        if block is True:
+            self.wait()
+        elif block == "AUTO" and self._is_blocked:
+            self.wait()
+
+        # Read any new gradient records.
+        self._update_gradients()
+
+        if self._gradient_stats.nSamples() == 0:
+            return None
+
+        return self._gradient_stats.summary()
+
+    def getCurrentGradientStatistics(self):
+        """Get the current running statistics for the free energy gradient.
+
+           Returns
+           -------
+
+           statistics : dict
+               A dictionary containing the number of samples, the mean
+               gradient, its variance, the standard error of the mean
+               (corrected for autocorrelation), the standard error estimated
+               by block averaging, and the statistical inefficiency.
+        """
+        return self.getGradientStatistics(block=False)
+
+    def _update_gradients(self):
+        """Read any gradients that have been appended to the gradient file
+           since the last update, adding them to the gradient records and
+           running statistics.
+        """
+
+        with self._gradient_lock:
+            # No gradient file.
+            if not _os.path.isfile(self._gradient_file):
+                return
+
+            # Read the new data.
+            with open(self._gradient_file, "rb") as file:
+                file.seek(self._gradient_offset)
+                data = file.read()
+
+            self._gradient_offset += len(data)
+            data = self._gradient_buffer + data
+
+            # Hold back any partial line until the rest has been written.
+            index = data.rfind(b"\n") + 1
+            self._gradient_buffer = data[index:]
+
+            # Extract the gradient from the final column of each record,
+            # ignoring comments.
+            gradients = []
+            for line in data[:index].decode("utf-8", "replace").splitlines():
+                if len(line) > 0 and line[0] != "#":
+                    try:
+                        gradients.append(float(line.split()[-1]))
+                    except (IndexError, ValueError):
+                        pass
+
+            if len(gradients) > 0:
+                gradients = _np.array(gradients)
+                self._gradients.extend("GRADIENT", gradients)
+                self._gradient_stats.update(gradients)
+
+    def _findCheckpoint(self):
+        """Find the latest valid checkpoint in the working directory.
+
+           Returns
+           -------
+
+           checkpoint : dict
+               Information about the checkpoint that is needed to resume
+               the process, or None if there isn't a valid checkpoint.
+        """
+
+        # Minimisation is performed in a single cycle.
+        if type(self._protocol) is _Protocol.Minimisation:
+            return None
+
+        file = "%s/sim_restart.s3" % self._work_dir
+        if not _os.path.isfile(file) or _os.path.getsize(file) == 0:
+            return None
+
+        try:
+            nmoves = int(_config_value(self._config, "nmoves"))
+            ncycles = int(_config_value(self._config, "ncycles"))
+
+            # Work out the number of cycles that were completed from the
+            # number of moves stored in the restart file.
+            system, moves = _SireStream.load(file)
+            cycle = moves.nMoves() // nmoves
+        except:
+            return None
+
+        # Nothing to resume from, or nothing left to run.
+        if cycle <= 0 or cycle >= ncycles:
+            return None
+
+        # The number of trajectory frames written per cycle.
+        freq = int(_config_value(self._config, "buffered coordinates frequency", nmoves))
+        frames_per_cycle = max(nmoves // freq, 1) if freq > 0 else 1
+
+        return { "cycle"            : cycle,
+                 "ncycles"          : ncycles,
+                 "frames_per_cycle" : frames_per_cycle }
+
+    def _checkpointPattern(self):
+        """Return a glob pattern matching the checkpoint files written by the
+           process while it is running.
+
+           Returns
+           -------
+
+           pattern : str
+               The pattern, or None if the process doesn't write checkpoints.
+        """
+        if type(self._protocol) is _Protocol.Minimisation:
+            return None
+        return "sim_restart.s3"
+
+    def _clear_output(self, is_resuming=False):
+        """Reset stdout and stderr.
+
+           Parameters
+           ----------
+
+           is_resuming : bool
+               Whether the process is being resumed from its restart file,
+               in which case the restart, trajectory, and data files are
+               kept so that SOMD can continue and append to them.
+        """
 
         # Call the base class method.
         super()._clear_output()
 
+        # Reset the gradient records and running statistics. When resuming,
+        # the records are re-read from the start of the gradient file.
+        self._gradients = _process._RecordStore()
+        self._gradient_stats = _OnlineStatistics()
+        self._gradient_offset = 0
+        self._gradient_buffer = b""
+
+        if is_resuming:
+            return
+
         # Delete any restart and trajectory files in the working directory.
 
         file = "%s/sim_restart.s3" % self._work_dir
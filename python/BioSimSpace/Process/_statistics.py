@@ -0,0 +1,435 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+Online statistics for time-series records.
+"""
+
+import math as _math
+import numpy as _np
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = []
+
+class _OnlineStatistics():
+    """Running statistics for a correlated time series. Samples are added in
+       chunks as they are read, and each chunk is processed once, so the cost
+       of querying the statistics doesn't depend on the length of the series.
+
+       The mean and variance are accumulated exactly. The standard error of
+       the mean is estimated in two ways: by blocking, where samples are
+       repeatedly averaged in pairs and the standard error is computed at
+       each block size, and from the statistical inefficiency, which is
+       found by integrating the autocorrelation function. Sums of lagged
+       products are accumulated for lags up to 'max_lag', so that the
+       autocorrelation function can be evaluated without revisiting old
+       samples.
+    """
+
+    def __init__(self, max_lag=200, min_blocks=16):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           max_lag : int
+               The maximum lag at which the autocorrelation function is
+               evaluated.
+
+           min_blocks : int
+               The minimum number of blocks needed to estimate the standard
+               error at a given block size.
+        """
+
+        if type(max_lag) is not int:
+            raise TypeError("'max_lag' must be of type 'int'")
+
+        if max_lag < 1:
+            raise ValueError("'max_lag' must be greater than zero!")
+
+        if type(min_blocks) is not int:
+            raise TypeError("'min_blocks' must be of type 'int'")
+
+        if min_blocks < 2:
+            raise ValueError("'min_blocks' must be at least two!")
+
+        self._max_lag = max_lag
+        self._min_blocks = min_blocks
+
+        # The number of samples, and the mean and sum of squared deviations of
+        # the shifted samples.
+        self._num_samples = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+        # Samples are shifted by the first value to avoid a loss of precision
+        # when summing products of samples with a large mean.
+        self._shift = None
+
+        # The sum of the shifted samples, the first and most recent samples,
+        # and the sums of lagged products.
+        self._sum = 0.0
+        self._head = _np.empty(0)
+        self._tail = _np.empty(0)
+        self._lag_sums = _np.zeros(max_lag)
+
+        # The count, mean, and sum of squared deviations for each blocking
+        # level, along with any unpaired block average.
+        self._block_counts = []
+        self._block_means = []
+        self._block_m2 = []
+        self._block_pending = []
+
+        # Cached results, which are cleared when samples are added.
+        self._cache = {}
+
+    def update(self, values):
+        """Add new samples.
+
+           Parameters
+           ----------
+
+           values : numpy.ndarray, [float]
+               The new samples, in order.
+        """
+
+        values = _np.asarray(values, dtype=_np.float64).ravel()
+
+        if len(values) == 0:
+            return
+
+        if self._shift is None:
+            self._shift = values[0]
+
+        values = values - self._shift
+
+        # Update the lagged product sums. Only products involving at least
+        # one new sample need to be added.
+        start = len(self._tail)
+        series = _np.concatenate((self._tail, values))
+        for lag in range(1, min(self._max_lag, len(series) - 1) + 1):
+            first = max(start, lag)
+            if first < len(series):
+                self._lag_sums[lag-1] += _np.dot(series[first:], series[first-lag:len(series)-lag])
+
+        # Store the first and most recent samples.
+        if len(self._head) < self._max_lag:
+            self._head = _np.concatenate((self._head, values[:self._max_lag - len(self._head)]))
+        self._tail = series[-self._max_lag:].copy()
+
+        # Update the moments.
+        self._num_samples, self._mean, self._m2 = _merge(
+            self._num_samples, self._mean, self._m2, values)
+        self._sum += values.sum()
+
+        # Update the blocking levels, averaging pairs of values to create the
+        # samples for the next level.
+        level = 0
+        while len(values) > 0:
+            if level == len(self._block_counts):
+                self._block_counts.append(0)
+                self._block_means.append(0.0)
+                self._block_m2.append(0.0)
+                self._block_pending.append(_np.empty(0))
+
+            self._block_counts[level], self._block_means[level], self._block_m2[level] = _merge(
+                self._block_counts[level], self._block_means[level], self._block_m2[level], values)
+
+            values = _np.concatenate((self._block_pending[level], values))
+            num_pairs = len(values) // 2
+            self._block_pending[level] = values[2*num_pairs:]
+            values = values[:2*num_pairs].reshape(-1, 2).mean(axis=1)
+
+            level += 1
+
+        self._cache = {}
+
+    def nSamples(self):
+        """Return the number of samples.
+
+           Returns
+           -------
+
+           num_samples : int
+               The number of samples.
+        """
+        return self._num_samples
+
+    def mean(self):
+        """Return the mean of the samples.
+
+           Returns
+           -------
+
+           mean : float
+               The mean, or None if there are no samples.
+        """
+        if self._num_samples == 0:
+            return None
+        return float(self._mean + self._shift)
+
+    def variance(self):
+        """Return the sample variance.
+
+           Returns
+           -------
+
+           variance : float
+               The variance, or None if there are fewer than two samples.
+        """
+        if self._num_samples < 2:
+            return None
+        return self._m2 / (self._num_samples - 1)
+
+    def blockStandardError(self):
+        """Return the standard error of the mean estimated by blocking. The
+           largest estimate over all block sizes with enough blocks is
+           returned, since the estimate grows with the block size until the
+           blocks are uncorrelated.
+
+           Returns
+           -------
+
+           error : float
+               The standard error, or None if there are too few samples.
+        """
+
+        if "block_error" not in self._cache:
+            errors = [_math.sqrt(m2 / (count * (count - 1)))
+                      for count, m2 in zip(self._block_counts, self._block_m2)
+                      if count >= self._min_blocks]
+
+            self._cache["block_error"] = max(errors) if len(errors) > 0 else None
+
+        return self._cache["block_error"]
+
+    def statisticalInefficiency(self):
+        """Return the statistical inefficiency, i.e. the number of samples
+           needed to obtain an uncorrelated sample. The autocorrelation
+           function is integrated up to the first lag at which it is no longer
+           positive, or up to the maximum lag.
+
+           Returns
+           -------
+
+           g : float
+               The statistical inefficiency, or None if there are fewer than
+               two samples.
+        """
+
+        if self._num_samples < 2:
+            return None
+
+        if "g" not in self._cache:
+            n = self._num_samples
+            variance = self._m2 / n
+
+            if variance == 0:
+                self._cache["g"] = 1.0
+                return 1.0
+
+            lags = _np.arange(1, min(self._max_lag, n - 1) + 1)
+            num_pairs = n - lags
+
+            # The sum of the samples excluding the last and first 'lag' samples.
+            tail_sums = _np.cumsum(self._tail[::-1])[lags-1]
+            head_sums = _np.cumsum(self._head)[lags-1]
+            first = self._sum - tail_sums
+            second = self._sum - head_sums
+
+            # The normalised autocorrelation function.
+            mean = self._mean
+            covariance = (self._lag_sums[lags-1] - mean*(first + second)
+                       + num_pairs*mean*mean) / num_pairs
+            correlation = covariance / variance
+
+            # Truncate at the first lag that isn't positively correlated.
+            negative = _np.nonzero(correlation <= 0)[0]
+            if len(negative) > 0:
+                lags = lags[:negative[0]]
+                correlation = correlation[:negative[0]]
+
+            g = 1.0 + 2.0*_np.sum(correlation * (1.0 - lags / n))
+
+            self._cache["g"] = max(1.0, float(g))
+
+        return self._cache["g"]
+
+    def standardError(self):
+        """Return the standard error of the mean, corrected for correlation
+           using the statistical inefficiency.
+
+           Returns
+           -------
+
+           error : float
+               The standard error, or None if there are fewer than two samples.
+        """
+
+        if self._num_samples < 2:
+            return None
+
+        return _math.sqrt(self.variance() * self.statisticalInefficiency() / self._num_samples)
+
+    def summary(self):
+        """Return all of the statistics.
+
+           Returns
+           -------
+
+           statistics : dict
+               A dictionary containing the number of samples, the mean,
+               variance, standard error, block standard error, and
+               statistical inefficiency.
+        """
+        return { "samples" : self.nSamples(),
+                 "mean" : self.mean(),
+                 "variance" : self.variance(),
+                 "error" : self.standardError(),
+                 "block_error" : self.blockStandardError(),
+                 "statistical_inefficiency" : self.statisticalInefficiency() }
+
+def _merge(count, mean, m2, values):
+    """Merge a chunk of samples into running moments.
+
+       Parameters
+       ----------
+
+       count : int
+           The current number of samples.
+
+       mean : float
+           The current mean.
+
+       m2 : float
+           The current sum of squared deviations from the mean.
+
+       values : numpy.ndarray
+           The new samples.
+
+       Returns
+       -------
+
+       (count, mean, m2) : (int, float, float)
+           The updated moments.
+    """
+
+    num_values = len(values)
+
+    if num_values == 0:
+        return count, mean, m2
+
+    values_mean = values.mean()
+    values_m2 = _np.sum((values - values_mean)**2)
+
+    total = count + num_values
+    delta = values_mean - mean
+
+    mean += delta * num_values / total
+    m2 += values_m2 + delta*delta * count * num_values / total
+
+    return total, float(mean), float(m2)
+
+def _statistical_inefficiency(values):
+    """Compute the statistical inefficiency of a time series. The
+       autocorrelation function is computed using a fast Fourier transform
+       and integrated up to the first lag at which it is no longer positive.
+
+       Parameters
+       ----------
+
+       values : numpy.ndarray
+           The time series.
+
+       Returns
+       -------
+
+       g : float
+           The statistical inefficiency.
+    """
+
+    values = _np.asarray(values, dtype=_np.float64)
+    n = len(values)
+
+    if n < 2:
+        return 1.0
+
+    deviations = values - values.mean()
+    variance = _np.dot(deviations, deviations) / n
+
+    if variance == 0:
+        return 1.0
+
+    # Compute the autocovariance using a zero-padded transform.
+    size = 2**int(_math.ceil(_math.log2(2*n)))
+    transform = _np.fft.rfft(deviations, size)
+    autocovariance = _np.fft.irfft(transform * _np.conjugate(transform), size)[1:n]
+
+    lags = _np.arange(1, n)
+    correlation = autocovariance / ((n - lags) * variance)
+
+    # Truncate at the first lag that isn't positively correlated.
+    negative = _np.nonzero(correlation <= 0)[0]
+    if len(negative) > 0:
+        lags = lags[:negative[0]]
+        correlation = correlation[:negative[0]]
+
+    g = 1.0 + 2.0*_np.sum(correlation * (1.0 - lags / n))
+
+    return max(1.0, float(g))
+
+def _detect_equilibration(values, num_points=20):
+    """Detect the end of the equilibration region of a time series. The
+       start of the production region is chosen to maximise the number of
+       uncorrelated samples that remain.
+
+       Parameters
+       ----------
+
+       values : numpy.ndarray
+           The time series.
+
+       num_points : int
+           The number of candidate starting points, spread evenly over the
+           first half of the time series.
+
+       Returns
+       -------
+
+       (start, g, num_effective) : (int, float, float)
+           The index of the first sample in the production region, its
+           statistical inefficiency, and the number of uncorrelated samples.
+    """
+
+    values = _np.asarray(values, dtype=_np.float64)
+    n = len(values)
+
+    best = None
+
+    for start in _np.unique(_np.linspace(0, n // 2, num_points, dtype=int)):
+        g = _statistical_inefficiency(values[start:])
+        num_effective = (n - start) / g
+        if best is None or num_effective > best[2]:
+            best = (int(start), g, num_effective)
+
+    return best
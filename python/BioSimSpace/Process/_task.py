@@ -23,14 +23,16 @@
 Functionality for running background tasks.
 """
 
-import glob as _glob
 import os as _os
 import tempfile as _tempfile
 import threading as _threading
-import zipfile as _zipfile
 
 from BioSimSpace import _is_notebook
 
+from ._monitor import _Notifier
+
+import BioSimSpace._Utils as _Utils
+
 __author__ = "Lester Hedges"
 __email_ = "lester.hedges@gmail.com"
 
@@ -54,6 +56,10 @@ def _wrap_task(task):
     except Exception as e:
         task._result = e
 
+    # Notify anything waiting for the task.
+    finally:
+        task._notifier.set()
+
 class Task():
     """Base class for running a background task."""
 
@@ -96,6 +102,9 @@ class Task():
         # Initialise the result of the task.
         self._result = None
 
+        # Create a flag used to notify anything waiting for the task.
+        self._notifier = _Notifier()
+
         # Initialise the error message.
         self._error_message = None
 
@@ -143,6 +152,9 @@ class Task():
         # Reset the error message.
         self._error_message = None
 
+        # Reset the notification flag.
+        self._notifier.clear()
+
         # Create the thread.
         self._thread = _threading.Thread(target=_wrap_task, args=[self])
 
@@ -179,6 +191,18 @@ class Task():
 
         return self._result
 
+    async def result(self):
+        """Asynchronously get the result of the task. This doesn't block the
+           event loop, so many tasks can be awaited concurrently."""
+
+        if not self._is_started:
+            return None
+
+        # Wait for the task to notify us that it has finished.
+        await self._notifier.waitAsync()
+
+        return self.getResult()
+
     def isStarted(self):
         """Return whether the task has been started.
 
@@ -240,7 +264,8 @@ class Task():
         else:
             return None
 
-    def getOutput(self, filename=None, file_link=False):
+    def getOutput(self, filename=None, file_link=False, include=None, exclude=None,
+            compression="stored", level=None, workers=None, incremental=True):
         """Return a zip file containing the output of the task.
 
            Parameters
@@ -252,6 +277,28 @@ class Task():
            file_link : bool
                Whether to return a FileLink when working in Jupyter.
 
+           include : [str]
+               A list of glob patterns. Only matching files are archived. By
+               default, all files are archived.
+
+           exclude : [str]
+               A list of glob patterns for files to exclude from the archive,
+               e.g. ["*.nc", "*.dcd"] to skip trajectories.
+
+           compression : str
+               The compression codec: "stored", "deflated", "bzip2", or "lzma".
+
+           level : int
+               The compression level. Use None for the codec's default.
+
+           workers : int
+               The number of threads used to compress files in parallel. By
+               default, one thread is used per CPU.
+
+           incremental : bool
+               Whether to only compress files that have changed since the
+               archive was last written.
+
            Returns
            -------
 
@@ -286,17 +333,18 @@ class Task():
                 if not _os.path.isdir(dirname):
                     _os.makedirs(dirname, exist_ok=True)
 
-            # Append the files to the archive.
-            with _zipfile.ZipFile(zipname, "w") as zip:
-                # Loop over all of the output files.
-                for file in _glob.glob("%s/*" % self._work_dir):
-                    zip.write(file, arcname=_os.path.basename(file))
+            # Archive the output files.
+            _Utils.archive(self._work_dir, zipname, include=include, exclude=exclude,
+                compression=compression, level=level, workers=workers, incremental=incremental)
 
             # Store the location of the zip file. Only do so if the
             # task has finished.
-            if not self._is_finished:
+            if self._is_finished:
                 self._zipfile = zipname
 
+        else:
+            zipname = self._zipfile
+
         # Return a link to the archive.
         if _is_notebook():
             if file_link:
@@ -38,6 +38,7 @@ from BioSimSpace import _gmx_exe, _gromacs_path
 
 from .._Exceptions import MissingSoftwareError as _MissingSoftwareError
 from .._SireWrappers import System as _System
+from .._SireWrappers import SystemBuilder as _SystemBuilder
 from .._SireWrappers import Molecule as _Molecule
 from ..Types import Length as _Length
 
@@ -561,6 +562,7 @@ def _solvate(molecule, box, shell, model, num_point,
             # TODO: This is a hack since the "update" method of Sire.System
             # doesn't work properly at present.
             molecule.removeWaterMolecules()
+            molecule._detach()
             for wat in waters:
                 molecule._sire_system.add(wat, _SireMol.MGName("all"))
 
@@ -680,12 +682,17 @@ def _solvate(molecule, box, shell, model, num_point,
 
                 # Create a system by adding these to the water molecules from
                 # gmx solvate, which will include the original waters.
-                system = _System(non_waters + water.getMolecules())
+                builder = _SystemBuilder(non_waters)
 
             else:
-                system = molecule + water.getMolecules()
+                builder = _SystemBuilder(molecule)
+
+            # Add the water molecules in a single pass.
+            builder.add(water)
+            system = builder.commit()
 
             # Add all of the water box properties to the new system.
+            system._detach()
             for prop in water._sire_system.propertyKeys():
                 prop = property_map.get(prop, prop)
 
@@ -868,11 +875,16 @@ def _solvate(molecule, box, shell, model, num_point,
                             # Create a system by adding these to the water and ion
                             # molecules from gmx solvate, which will include the
                             # original waters.
-                            system = _System(non_waters + water_ions.getMolecules())
+                            builder = _SystemBuilder(non_waters)
                         else:
-                            system = molecule + water_ions.getMolecules()
+                            builder = _SystemBuilder(molecule)
+
+                        # Add the water and ion molecules in a single pass.
+                        builder.add(water_ions)
+                        system = builder.commit()
 
                         # Add all of the water molecules' properties to the new system.
+                        system._detach()
                         for prop in water_ions._sire_system.propertyKeys():
                             prop = property_map.get(prop, prop)
 
@@ -882,6 +894,7 @@ def _solvate(molecule, box, shell, model, num_point,
                         system = water_ions
 
         # Store the name of the water model as a system property.
+        system._detach()
         system._sire_system.setProperty("water_model", _SireBase.wrap(model))
 
     return system
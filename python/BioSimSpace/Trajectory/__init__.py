@@ -22,6 +22,15 @@
 """
 .. currentmodule:: BioSimSpace.Trajectory
 
+Functions
+=========
+
+.. autosummary::
+    :toctree: generated/
+
+    countFrames
+    getFrame
+
 Classes
 =======
 
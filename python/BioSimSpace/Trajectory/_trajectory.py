@@ -27,6 +27,8 @@ import MDAnalysis as _mdanalysis
 import mdtraj as _mdtraj
 import os as _os
 import shutil as _shutil
+import struct as _struct
+import threading as _threading
 import warnings as _warnings
 
 import Sire.IO as _SireIO
@@ -43,12 +45,17 @@ import BioSimSpace.IO as _IO
 __author__ = "Lester Hedges"
 __email_ = "lester.hedges@gmail.com"
 
-__all__ = ["getFrame", "Trajectory"]
+__all__ = ["countFrames", "getFrame", "Trajectory"]
 
 # A dictionary mapping the Sire file format extension to those expected by MDTraj.
 _extensions = { "Gro87" : "gro",
                 "PRM7"   : "parm7" }
 
+# Magic numbers identifying GROMACS XTC and TRR frames.
+_xtc_magic = _struct.pack(">i", 1995)
+_xtc_magic_2023 = _struct.pack(">i", 2023)
+_trr_magic = _struct.pack(">i", 1993)
+
 def getFrame(trajectory, topology, index):
     """Extract a single frame from a trajectory file.
 
@@ -80,14 +87,56 @@ def getFrame(trajectory, topology, index):
     if type(index) is not int:
         raise TypeError("'index' must be of type 'int'")
 
+    return _getFrame(trajectory, topology, index)
+
+def _getFrame(trajectory, topology, index, coordinates=None):
+    """Internal helper function to extract a single frame from a trajectory
+       file. Negative indices count back from the final frame.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A trajectory file.
+
+       topology : str
+           A topology file.
+
+       index : int
+          The index of the frame.
+
+       coordinates : str
+           A coordinate file that can be used as the topology when reading
+           the frame with MDTraj, e.g. a GRO file. If None, then the topology
+           file is used.
+
+       Returns
+       -------
+
+       frame : :class:`System <BioSimSpace._SireWrappers.System>`
+           The System object of the corresponding frame.
+    """
+
+    if coordinates is None:
+        coordinates = topology
+
+    # Convert a negative index to the equivalent positive index.
+    if index < 0:
+        num_frames = countFrames(trajectory)
+
+        if index < -num_frames:
+            raise ValueError("Frame index (%d) of of range (-1 to -%d)." % (index, num_frames))
+
+        index += num_frames
+
     # Try to load the frame.
     try:
-        frame = _mdtraj.load_frame(trajectory, index, top=topology)
+        frame = _mdtraj.load_frame(trajectory, index, top=coordinates)
     except:
         # Get the file format of the topology file.
         try:
             # Load the topology file to determine the file format.
-            file_format = _IO.readMolecules(topology).fileFormat()
+            file_format = _IO.readMolecules(coordinates).fileFormat()
 
             # Set the extension.
             extension = _extensions.get(file_format, file_format.lower())
@@ -96,12 +145,12 @@ def getFrame(trajectory, topology, index):
             top_file = _os.getcwd() + "/.topology." + extension
 
             # Copy the topology to a file with the correct extension.
-            _shutil.copyfile(topology, top_file)
+            _shutil.copyfile(coordinates, top_file)
 
             frame = _mdtraj.load_frame(trajectory, index, top=top_file)
         except:
             _os.remove(top_file)
-            raise IOError("MDTraj failed to read frame %d from: traj=%s, top=%s" % (index, trajectory, topology))
+            raise IOError("MDTraj failed to read frame %d from: traj=%s, top=%s" % (index, trajectory, coordinates))
 
         # Remove the temporary topology file.
         _os.remove(top_file)
@@ -125,6 +174,499 @@ def getFrame(trajectory, topology, index):
     # Return the system.
     return system
 
+def countFrames(trajectory):
+    """Count the number of frames in a trajectory file without reading the
+       coordinates. For DCD and AMBER NetCDF files the number of frames is
+       determined from the file header. For XTC and TRR files the frame
+       headers are scanned to build an index of frame offsets, which is
+       cached and extended as the file grows, so repeatedly counting the
+       frames of a running simulation only reads the new frames. Incomplete
+       frames at the end of the file are not counted. MDTraj is used for
+       any other format.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A trajectory file.
+
+       Returns
+       -------
+
+       num_frames : int
+           The number of frames in the trajectory.
+    """
+
+    if type(trajectory) is not str:
+        raise TypeError("'trajectory' must be of type 'str'")
+
+    if not _os.path.isfile(trajectory):
+        raise IOError("Trajectory file doesn't exist: '%s'" % trajectory)
+
+    with open(trajectory, "rb") as file:
+        magic = file.read(12)
+
+    # Nothing has been written yet.
+    if len(magic) == 0:
+        return 0
+
+    try:
+        # AMBER NetCDF.
+        if magic[:3] == b"CDF":
+            num_frames = _count_netcdf_frames(trajectory, magic)
+
+        # DCD, written using either byte order.
+        elif magic[4:8] == b"CORD":
+            num_frames = _count_dcd_frames(trajectory)
+
+        # GROMACS XTC and TRR.
+        elif magic[:4] in [_xtc_magic, _xtc_magic_2023, _trr_magic]:
+            num_frames = _getFrameIndex(trajectory).update()
+
+        else:
+            num_frames = None
+
+    except _struct.error:
+        num_frames = None
+
+    # Fall back to MDTraj.
+    if num_frames is None:
+        try:
+            with _mdtraj.open(trajectory) as file:
+                num_frames = len(file)
+        except:
+            raise IOError("MDTraj failed to read frames from: traj=%s" % trajectory) from None
+
+    return num_frames
+
+def _count_netcdf_frames(trajectory, header):
+    """Internal helper function to read the number of frames from the header
+       of an AMBER NetCDF file. The frame dimension is the unlimited record
+       dimension, so the frame count is the number of records.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A NetCDF trajectory file.
+
+       header : bytes
+           The first bytes of the file.
+
+       Returns
+       -------
+
+       num_frames : int
+           The number of frames, or None if the count isn't stored in the
+           header, e.g. for NetCDF4 files.
+    """
+
+    # Classic and 64-bit offset formats store a 32-bit record count.
+    if header[3] in [1, 2]:
+        num_records = _struct.unpack(">I", header[4:8])[0]
+        streaming = 0xFFFFFFFF
+
+    # The 64-bit data format (CDF-5) stores a 64-bit record count.
+    elif header[3] == 5:
+        num_records = _struct.unpack(">Q", header[4:12])[0]
+        streaming = 0xFFFFFFFFFFFFFFFF
+
+    else:
+        return None
+
+    # The record count isn't known while the file is being streamed.
+    if num_records == streaming:
+        return None
+
+    return num_records
+
+def _count_dcd_frames(trajectory):
+    """Internal helper function to count the frames in a DCD file from the
+       file size and the size of each frame, which is determined by the header.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A DCD trajectory file.
+
+       Returns
+       -------
+
+       num_frames : int
+           The number of frames, or None if the file couldn't be parsed.
+    """
+
+    header = _read_dcd_header(trajectory)
+
+    if header is None:
+        return None
+
+    endian, offset, frame_size, num_sets, num_fixed = header
+
+    # When atoms are fixed the first frame is larger than the others, so
+    # trust the count in the header.
+    if num_fixed > 0:
+        return num_sets
+
+    return max(_os.path.getsize(trajectory) - offset, 0) // frame_size
+
+def _read_dcd_header(trajectory):
+    """Internal helper function to read the header of a DCD file.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A DCD trajectory file.
+
+       Returns
+       -------
+
+       header : (str, int, int, int, int)
+           The byte order, the size of the header, the size of each frame,
+           the number of frames recorded in the header, and the number of
+           fixed atoms, or None if the file couldn't be parsed.
+    """
+
+    with open(trajectory, "rb") as file:
+        header = file.read(92)
+
+        # Work out the byte order from the length of the first block.
+        for endian in ["<", ">"]:
+            if _struct.unpack(endian + "i", header[:4])[0] == 84:
+                break
+        else:
+            return None
+
+        # The control block.
+        control = _struct.unpack(endian + "20i", header[8:88])
+        num_sets = control[0]
+        num_fixed = control[8]
+        is_charmm = control[19] != 0
+        has_unit_cell = is_charmm and control[10] != 0
+        has_fourth_dim = is_charmm and control[11] != 0
+
+        # Skip the title block.
+        length = _struct.unpack(endian + "i", file.read(4))[0]
+        file.seek(length + 4, _os.SEEK_CUR)
+
+        # Read the number of atoms.
+        num_atoms = _struct.unpack(endian + "3i", file.read(12))[1]
+
+        # The end of the header.
+        offset = file.tell()
+
+    # Each frame contains an optional unit cell block, followed by a block
+    # for each Cartesian dimension. Each block is enclosed by its length.
+    frame_size = 56 * has_unit_cell + (3 + has_fourth_dim) * (4 * num_atoms + 8)
+
+    return endian, offset, frame_size, num_sets, num_fixed
+
+def _stitch(trajectory, segment, num_frames=None, time=None, topology=None):
+    """Internal helper function to append a trajectory segment, written by a
+       process that was resumed from a checkpoint, to the trajectory written
+       before the checkpoint. Frames in the original trajectory beyond the
+       checkpoint are discarded, since they are repeated in the segment.
+       DCD files are joined in place, other formats are joined using MDTraj.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           The original trajectory file, which is updated.
+
+       segment : str
+           The trajectory file written since the checkpoint.
+
+       num_frames : int
+           The number of frames of the original trajectory to keep.
+
+       time : float
+           Alternatively, the time of the checkpoint in picoseconds. Frames
+           written after this time are discarded.
+
+       topology : str
+           A topology file, which is required for formats other than DCD.
+    """
+
+    if (num_frames is None) == (time is None):
+        raise ValueError("Exactly one of 'num_frames' and 'time' must be specified!")
+
+    # Join DCD files directly. Files with fixed atoms are joined using MDTraj,
+    # since the first frame of each file differs in size.
+    if num_frames is not None:
+        try:
+            header = _read_dcd_header(trajectory)
+            seg_header = _read_dcd_header(segment)
+        except (OSError, _struct.error):
+            header = None
+            seg_header = None
+
+        if header is not None and seg_header is not None and header[4] == 0 \
+            and seg_header[4] == 0 and header[2] == seg_header[2]:
+            endian, offset, frame_size, _, _ = header
+
+            # Only complete frames are kept.
+            num_frames = min(num_frames, _count_dcd_frames(trajectory))
+            num_seg_frames = _count_dcd_frames(segment)
+
+            with open(trajectory, "r+b") as file:
+                file.truncate(offset + num_frames * frame_size)
+                file.seek(0, _os.SEEK_END)
+
+                with open(segment, "rb") as seg_file:
+                    seg_file.seek(seg_header[1])
+                    file.write(seg_file.read(num_seg_frames * frame_size))
+
+                # Update the number of frames in the header.
+                file.seek(8)
+                file.write(_struct.pack(endian + "i", num_frames + num_seg_frames))
+
+            return
+
+    if topology is None:
+        raise ValueError("A topology is required to join trajectory files: '%s'" % trajectory)
+
+    # MDTraj doesn't recognise the extension of AMBER topology files written
+    # by BioSimSpace.
+    if topology.endswith(".prm7"):
+        topology = _mdtraj.load_prmtop(topology)
+
+    traj = _mdtraj.load(trajectory, top=topology)
+
+    if time is not None:
+        num_frames = int((traj.time <= time + 1e-6).sum())
+
+    traj = traj[:num_frames].join(_mdtraj.load(segment, top=topology), check_topology=False)
+    traj.save(trajectory, force_overwrite=True)
+
+class _FrameIndex():
+    """An index of the frame offsets in a GROMACS XTC or TRR file. Frames in
+       these formats don't have a fixed size, so the index is built by
+       reading the header of each frame, which gives the size of the frame
+       data. The index remembers where the last complete frame ended, so
+       only frames appended since the previous update are read.
+    """
+
+    # The number of bytes at the start of the file used to detect rewrites.
+    _head_size = 96
+
+    def __init__(self, file):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           file : str
+               The path to the trajectory file.
+        """
+
+        self._file = file
+        self._lock = _threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset the index so that the file is read from the beginning."""
+
+        # The byte offset of the start of each complete frame.
+        self._offsets = []
+
+        # The byte offset of the end of the last complete frame.
+        self._end = 0
+
+        # The first bytes of the file, used to detect when it is rewritten.
+        self._head = b""
+
+        # The size of each frame, if all frames in the file are the same size.
+        self._stride = None
+
+    def offsets(self):
+        """Return the byte offsets of the frames that have been indexed.
+
+           Returns
+           -------
+
+           offsets : [int]
+               The offset of each frame.
+        """
+        with self._lock:
+            return self._offsets.copy()
+
+    def update(self):
+        """Index any frames that have been appended to the file since the
+           last update.
+
+           Returns
+           -------
+
+           num_frames : int
+               The number of complete frames in the file.
+        """
+
+        with self._lock:
+            size = _os.path.getsize(self._file)
+
+            with open(self._file, "rb") as file:
+                # If the file has shrunk, or the start of the file has changed,
+                # then start reading from the beginning again.
+                head = file.read(self._head_size)
+                if size < self._end or head[:len(self._head)] != self._head:
+                    self.reset()
+                self._head = head
+
+                # TRR frames usually have a fixed size, in which case the
+                # remaining frames can be indexed using the stride, provided
+                # the frame at the end of the file has the same size.
+                is_trr = head[:4] == _trr_magic
+
+                # Index the new frames.
+                while True:
+                    if is_trr and self._stride is not None:
+                        is_trr = False
+                        num_frames = (size - self._end) // self._stride
+                        last = self._end + (num_frames - 1) * self._stride
+                        try:
+                            is_fixed = num_frames > 1 and self._frame_size(file, last) == self._stride
+                        except IOError:
+                            is_fixed = False
+                        if is_fixed:
+                            self._offsets.extend(range(self._end, last + 1, self._stride))
+                            self._end = last + self._stride
+
+                    frame_size = self._frame_size(file, self._end)
+
+                    if frame_size is None or self._end + frame_size > size:
+                        break
+
+                    # Record whether all of the frames have the same size.
+                    if len(self._offsets) == 0:
+                        self._stride = frame_size
+                    elif frame_size != self._stride:
+                        self._stride = None
+
+                    self._offsets.append(self._end)
+                    self._end += frame_size
+
+            return len(self._offsets)
+
+    def _frame_size(self, file, offset):
+        """Get the size of a frame from its header.
+
+           Parameters
+           ----------
+
+           file : file
+               The open trajectory file.
+
+           offset : int
+               The byte offset of the start of the frame.
+
+           Returns
+           -------
+
+           frame_size : int
+               The size of the frame in bytes, or None if the header hasn't
+               been fully written.
+        """
+
+        file.seek(offset)
+        header = file.read(96)
+
+        if len(header) < 8:
+            return None
+
+        magic = header[:4]
+
+        # XTC frame: magic, natoms, step, time, box, natoms.
+        if magic in [_xtc_magic, _xtc_magic_2023]:
+            num_atoms = _struct.unpack(">i", header[4:8])[0]
+
+            # Small systems are stored uncompressed.
+            if num_atoms <= 9:
+                return 56 + 12 * num_atoms
+
+            # Otherwise, the header is followed by the precision, the integer
+            # bounds and the smallest index, then the size of the compressed
+            # coordinates, which are padded to a multiple of four bytes. From
+            # GROMACS 2023, large frames use a 64-bit size.
+            if magic == _xtc_magic:
+                if len(header) < 92:
+                    return None
+                num_bytes = _struct.unpack(">i", header[88:92])[0]
+                return 92 + 4 * ((num_bytes + 3) // 4)
+            else:
+                if len(header) < 96:
+                    return None
+                num_bytes = _struct.unpack(">q", header[88:96])[0]
+                return 96 + 4 * ((num_bytes + 3) // 4)
+
+        # TRR frame: magic, version string, block sizes, natoms, step, nre,
+        # followed by the time and lambda values.
+        elif magic == _trr_magic:
+            if len(header) < 76:
+                return None
+
+            # Skip the version string, which is padded to four bytes.
+            length = _struct.unpack(">i", header[8:12])[0]
+            start = 12 + 4 * ((length + 3) // 4)
+
+            if len(header) < start + 52:
+                return None
+
+            sizes = _struct.unpack(">13i", header[start:start+52])
+            num_atoms = sizes[10]
+
+            # Work out the precision from the size of the data blocks.
+            box_size, vir_size, pres_size = sizes[2:5]
+            x_size, v_size, f_size = sizes[7:10]
+            if box_size > 0:
+                real_size = box_size // 9
+            elif vir_size > 0:
+                real_size = vir_size // 9
+            elif pres_size > 0:
+                real_size = pres_size // 9
+            elif num_atoms > 0 and x_size + v_size + f_size > 0:
+                real_size = max(x_size, v_size, f_size) // (3 * num_atoms)
+            else:
+                real_size = 4
+
+            return start + 52 + 2 * real_size + sum(sizes[:10])
+
+        # This isn't the start of a frame.
+        else:
+            raise IOError("Invalid frame header at byte %d of trajectory file: '%s'"
+                % (offset, self._file))
+
+# A cache of frame indices for XTC and TRR files.
+_frame_indices = {}
+_frame_indices_lock = _threading.Lock()
+
+def _getFrameIndex(trajectory):
+    """Internal helper function to get the cached frame index for a trajectory
+       file, creating it if required.
+
+       Parameters
+       ----------
+
+       trajectory : str
+           A GROMACS XTC or TRR trajectory file.
+
+       Returns
+       -------
+
+       index : :class:`_FrameIndex <BioSimSpace.Trajectory._trajectory._FrameIndex>`
+           The frame index.
+    """
+
+    trajectory = _os.path.abspath(trajectory)
+
+    with _frame_indices_lock:
+        if trajectory not in _frame_indices:
+            _frame_indices[trajectory] = _FrameIndex(trajectory)
+
+        return _frame_indices[trajectory]
+
 class Trajectory():
     """A class for reading a manipulating biomolecular trajectories."""
 
@@ -222,6 +764,8 @@ class Trajectory():
 
         # Set the location of the trajectory and topology files.
         if self._process is not None:
+            # Join any trajectory segment written since the process was resumed.
+            self._process._stitchTrajectory()
             traj_file = self._process._traj_file
 
             # Weirdly, the GRO file is used as the topology.
@@ -398,15 +942,28 @@ class Trajectory():
                The number of trajectory frames.
         """
 
-        # First get the current MDTraj object.
-        if self._process is not None and self._process.isRunning():
-            self._trajectory = self.getTrajectory()
-
-        # There is no trajectory.
-        if self._trajectory is None:
-            return 0
+        # Get the location of the trajectory file.
+        if self._process is not None:
+            # Join any trajectory segment written since the process was resumed.
+            self._process._stitchTrajectory()
+            traj_file = self._process._traj_file
         else:
-            return self._trajectory.n_frames
+            traj_file = self._traj_file
+
+        # Count the frames without loading the trajectory.
+        try:
+            return countFrames(traj_file)
+
+        except:
+            # Fall back to the current MDTraj object.
+            if self._process is not None and self._process.isRunning():
+                self._trajectory = self.getTrajectory()
+
+            # There is no trajectory.
+            if self._trajectory is None:
+                return 0
+            else:
+                return self._trajectory.n_frames
 
     def rmsd(self, frame=None, atoms=None, molecule=None):
         """Compute the root mean squared displacement.
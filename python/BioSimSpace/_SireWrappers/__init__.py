@@ -30,7 +30,9 @@ Classes
 
     Molecule
     System
+    SystemBuilder
 """
 
 from ._molecule import *
 from ._system import *
+from ._system_builder import *
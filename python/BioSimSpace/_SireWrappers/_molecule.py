@@ -26,9 +26,14 @@ not be directly exposed to the user.
 
 from pytest import approx as _approx
 
+import bisect as _bisect
+import collections as _collections
+import itertools as _itertools
+import numpy as _np
 import os.path as _path
 import random as _random
 import string as _string
+import threading as _threading
 
 import Sire.Base as _SireBase
 import Sire.CAS as _SireCAS
@@ -48,6 +53,13 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["Molecule"]
 
+# The type of each small molecule, keyed by its number and version, so that
+# an unchanged molecule only needs to be classified once. The least recently
+# used entries are discarded once the cache is full.
+_molecule_types = _collections.OrderedDict()
+_molecule_types_lock = _threading.Lock()
+_max_molecule_types = 100000
+
 class Molecule():
     """A container class for storing a molecule."""
 
@@ -72,17 +84,19 @@ class Molecule():
         self._molecule0 = None
         self._molecule1 = None
 
-        # Check that the molecule is valid.
+        # Check that the molecule is valid. Sire molecules are only modified
+        # through editors, which return a new molecule when committed, so the
+        # underlying Sire object can be shared rather than copied.
 
         # A Sire Molecule object.
         if type(molecule) is _SireMol.Molecule:
-            self._sire_molecule = molecule.__deepcopy__()
+            self._sire_molecule = molecule
             if self._sire_molecule.hasProperty("is_perturbable"):
                 self._convertFromMergedMolecule()
 
         # Another BioSimSpace Molecule object.
         elif type(molecule) is Molecule:
-            self._sire_molecule = molecule._sire_molecule.__deepcopy__()
+            self._sire_molecule = molecule._sire_molecule
             if molecule._molecule0 is not None:
                 self._molecule0 = Molecule(molecule._molecule0)
             if molecule._molecule1 is not None:
@@ -223,49 +237,7 @@ class Molecule():
            is_water : bool
                Whether this is a water molecule.
         """
-        # Water models have 5 or less atoms.
-        if self.nAtoms() > 5:
-            return False
-
-        # Tally counters for the number of H and O atoms.
-        num_hydrogen = 0
-        num_oxygen = 0
-
-        # Loop over all atoms in the molecule.
-        for atom in self._sire_molecule.atoms():
-
-            # First try using the "element" property of the atom.
-            try:
-                # Hydrogen.
-                if atom.property("element") == _SireMol.Element("H"):
-                    num_hydrogen += 1
-                # Oxygen.
-                elif atom.property("element") == _SireMol.Element("O"):
-                    num_oxygen += 1
-
-            # Otherwise, try to infer the element from the atom name.
-            except:
-                # Strip all digits from the name.
-                name = "".join([x for x in atom.name().value() if not x.isdigit()])
-
-                # Remove any whitespace.
-                name = name.replace(" ", "")
-
-                # Try to infer the element.
-                element = _SireMol.Element.biologicalElement(name)
-
-                # Hydrogen.
-                if element == _SireMol.Element("H"):
-                    num_hydrogen += 1
-                # Oxygen.
-                elif element == _SireMol.Element("O"):
-                    num_oxygen += 1
-
-        # A water molecule has two Hydrogens and one Oxygen.
-        if num_hydrogen == 2 and num_oxygen == 1:
-            return True
-        else:
-            return False
+        return _molecule_type(self._sire_molecule) == "water"
 
     def charge(self, property_map={}, is_lambda1=False):
         """Return the total molecular charge.
@@ -361,6 +333,74 @@ class Molecule():
         except UserWarning:
             raise UserWarning("Molecule has no 'coordinates' property.") from None
 
+    def getCoordinates(self, property_map={}, is_lambda1=False):
+        """Return the coordinates of the atoms in the molecule.
+
+           Parameters
+           ----------
+
+           property_map : dict
+               A dictionary that maps system "properties" to their user defined
+               values. This allows the user to refer to properties with their
+               own naming scheme, e.g. { "charge" : "my-charge" }
+
+           is_lambda1 : bool
+              Whether to use the coordinates at lambda = 1 if the molecule is
+              merged.
+
+           Returns
+           -------
+
+           coordinates : numpy.ndarray
+               An array of shape (nAtoms, 3) containing the coordinates of
+               each atom, in Angstrom.
+        """
+
+        if type(property_map) is not dict:
+            raise TypeError("'property_map' must be of type 'dict'")
+
+        if type(is_lambda1) is not bool:
+            raise TypeError("'is_lambda1' must be of type 'bool'")
+
+        prop = _coordinates_property(self._sire_molecule, property_map, is_lambda1)
+
+        try:
+            return _get_coordinates(self._sire_molecule, prop)
+        except UserWarning:
+            raise UserWarning("Molecule has no '%s' property." % prop) from None
+
+    def setCoordinates(self, coordinates, property_map={}, is_lambda1=False):
+        """Set the coordinates of the atoms in the molecule.
+
+           Parameters
+           ----------
+
+           coordinates : numpy.ndarray
+               An array of shape (nAtoms, 3) containing the coordinates of
+               each atom, in Angstrom.
+
+           property_map : dict
+               A dictionary that maps system "properties" to their user defined
+               values. This allows the user to refer to properties with their
+               own naming scheme, e.g. { "charge" : "my-charge" }
+
+           is_lambda1 : bool
+              Whether to set the coordinates at lambda = 1 if the molecule is
+              merged.
+        """
+
+        if type(property_map) is not dict:
+            raise TypeError("'property_map' must be of type 'dict'")
+
+        if type(is_lambda1) is not bool:
+            raise TypeError("'is_lambda1' must be of type 'bool'")
+
+        coordinates = _validate_coordinates(coordinates, self.nAtoms())
+
+        prop = _coordinates_property(self._sire_molecule, property_map, is_lambda1)
+
+        self._sire_molecule = _set_coordinates(self._sire_molecule, prop, coordinates)
+
     def toSystem(self):
         """Convert a single Molecule to a System.
 
@@ -521,23 +561,44 @@ class Molecule():
             if verbose:
                 print("\nSetting atom properties...")
 
+            # Atom properties are stored in cut-group order. Work out the
+            # position in mol1 of the value for each atom in mol0, so that
+            # each property can be permuted in a single pass.
+            pos1 = { idx : x for x, idx in enumerate(
+                     idx for group in _cut_group_atoms(mol1) for idx in group) }
+            perm = [pos1[matches[_SireMol.AtomIdx(idx)].value()]
+                    for group in _cut_group_atoms(mol0) for idx in group]
+
             # Loop over all of the keys in the new molecule.
             for prop in props1:
                 # This is a new property, or we are allowed to overwrite.
                 if (not mol0.hasProperty(_property_map[prop])) or overwrite:
-                    # Loop over all of the atom mapping pairs and set the property.
+                    propty = mol1.property(prop)
+
+                    # Skip non atom-based properties.
+                    if not isinstance(propty, _SireMol.AtomProp):
+                        continue
+
+                    seen_prop[prop] = True
+
+                    if verbose:
+                        print("  %s" % _property_map[prop])
+
+                    # Copy the whole property in one go.
+                    try:
+                        edit_mol = edit_mol.setProperty(_property_map[prop],
+                            _permute_atom_property(propty, mol0, perm))
+                        continue
+                    except:
+                        pass
+
+                    # Fall back to copying the property atom by atom.
                     for idx0, idx1 in matches.items():
-                        # Does the atom have this property?
-                        # If so, add it to the matching atom in this molecule.
-                        if mol1.atom(idx1).hasProperty(prop):
-                            if verbose:
-                                print("  %-20s %s --> %s" % (_property_map[prop], idx1, idx0))
-                            try:
-                                edit_mol = edit_mol.atom(idx0).setProperty(_property_map[prop], mol1.atom(idx1).property(prop)).molecule()
-                                seen_prop[prop] = True
-                            except:
-                                raise _IncompatibleError("Failed to copy property '%s' from %s to %s."
-                                    % (_property_map[prop], idx1, idx0)) from None
+                        try:
+                            edit_mol = edit_mol.atom(idx0).setProperty(_property_map[prop], mol1.atom(idx1).property(prop)).molecule()
+                        except:
+                            raise _IncompatibleError("Failed to copy property '%s' from %s to %s."
+                                % (_property_map[prop], idx1, idx0)) from None
 
             # Now deal with all unseen properties. These will be non atom-based
             # properties, such as TwoAtomFunctions, StringProperty, etc.
@@ -715,8 +776,8 @@ class Molecule():
         if type(property_map) is not dict:
             raise TypeError("'property_map' must be of type 'dict'")
 
-        # Extract and copy the Sire molecule.
-        mol = self._sire_molecule.__deepcopy__()
+        # Extract the Sire molecule.
+        mol = self._sire_molecule
 
         # First work out the indices of atoms that are perturbed.
         pert_idxs = []
@@ -1080,65 +1141,20 @@ class Molecule():
             dihedrals0 = mol.property("dihedral0").potentials()
             dihedrals1 = mol.property("dihedral1").potentials()
 
-            # Dictionaries to store the DihedralIDs at lambda = 0 and 1.
-            dihedrals0_idx = {}
-            dihedrals1_idx = {}
-
-            # Loop over all dihedrals at lambda = 0.
-            for idx, dihedral in enumerate(dihedrals0):
-                # Get the AtomIdx for the atoms in the dihedral.
-                idx0 = info.atomIdx(dihedral.atom0())
-                idx1 = info.atomIdx(dihedral.atom1())
-                idx2 = info.atomIdx(dihedral.atom2())
-                idx3 = info.atomIdx(dihedral.atom3())
-
-                # Create the DihedralID.
-                dihedral_id = _SireMol.DihedralID(idx0, idx1, idx2, idx3)
-
-                # Add to the list of ids.
-                dihedrals0_idx[dihedral_id] = idx
-
-            # Loop over all dihedrals at lambda = 1.
-            for idx, dihedral in enumerate(dihedrals1):
-                # Get the AtomIdx for the atoms in the dihedral.
-                idx0 = info.atomIdx(dihedral.atom0())
-                idx1 = info.atomIdx(dihedral.atom1())
-                idx2 = info.atomIdx(dihedral.atom2())
-                idx3 = info.atomIdx(dihedral.atom3())
-
-                # Create the DihedralID.
-                dihedral_id = _SireMol.DihedralID(idx0, idx1, idx2, idx3)
-
-                # Add to the list of ids.
-                if dihedral_id.mirror() in dihedrals0_idx:
-                    dihedrals1_idx[dihedral_id.mirror()] = idx
-                else:
-                    dihedrals1_idx[dihedral_id] = idx
+            # Dictionaries grouping the dihedrals at lambda = 0 and 1 by their
+            # canonical key. A dihedral and its mirror image share the same key.
+            dihedrals0_idx = _bonded_term_keys(info, dihedrals0, _dihedral_key)
+            dihedrals1_idx = _bonded_term_keys(info, dihedrals1, _dihedral_key)
 
-            # Now work out the DihedralIDs that are unique at lambda = 0 and 1
+            # Now work out the dihedrals that are unique at lambda = 0 and 1
             # as well as those that are shared.
-            dihedrals0_unique_idx = {}
-            dihedrals1_unique_idx = {}
-            dihedrals_shared_idx = {}
-
-            # lambda = 0.
-            for idx in dihedrals0_idx.keys():
-                if idx not in dihedrals1_idx.keys():
-                    dihedrals0_unique_idx[idx] = dihedrals0_idx[idx]
-                else:
-                    dihedrals_shared_idx[idx] = (dihedrals0_idx[idx], dihedrals1_idx[idx])
-
-            # lambda = 1.
-            for idx in dihedrals1_idx.keys():
-                if idx not in dihedrals0_idx.keys():
-                    dihedrals1_unique_idx[idx] = dihedrals1_idx[idx]
-                elif idx not in dihedrals_shared_idx.keys():
-                    dihedrals_shared_idx[idx] = (dihedrals0_idx[idx], dihedrals1_idx[idx])
+            dihedrals0_unique_idx, dihedrals1_unique_idx, dihedrals_shared_idx = \
+                _match_bonded_terms(dihedrals0_idx, dihedrals1_idx)
 
             # First create records for the dihedrals that are unique to lambda = 0 and 1.
 
             # lambda = 0.
-            for idx in dihedrals0_unique_idx.values():
+            for idx in dihedrals0_unique_idx:
                 # Get the dihedral potential.
                 dihedral = dihedrals0[idx]
 
@@ -1172,7 +1188,7 @@ class Molecule():
                 file.write("    enddihedral\n")
 
             # lambda = 1.
-            for idx in dihedrals1_unique_idx.values():
+            for idx in dihedrals1_unique_idx:
                 # Get the dihedral potential.
                 dihedral = dihedrals1[idx]
 
@@ -1206,7 +1222,7 @@ class Molecule():
                 file.write("    enddihedral\n")
 
             # Now add records for the shared dihedrals.
-            for idx0, idx1 in dihedrals_shared_idx.values():
+            for idx0, idx1 in dihedrals_shared_idx:
                 # Get the dihedral potentials.
                 dihedral0 = dihedrals0[idx0]
                 dihedral1 = dihedrals1[idx1]
@@ -1298,74 +1314,22 @@ class Molecule():
             impropers0 = mol.property("improper0").potentials()
             impropers1 = mol.property("improper1").potentials()
 
-            # Dictionaries to store the ImproperIDs at lambda = 0 and 1.
-            impropers0_idx = {}
-            impropers1_idx = {}
-
-            # Loop over all impropers at lambda = 0.
-            for idx, improper in enumerate(impropers0):
-                # Get the AtomIdx for the atoms in the improper.
-                idx0 = info.atomIdx(improper.atom0())
-                idx1 = info.atomIdx(improper.atom1())
-                idx2 = info.atomIdx(improper.atom2())
-                idx3 = info.atomIdx(improper.atom3())
-
-                # Create the ImproperID.
-                improper_id = _SireMol.ImproperID(idx0, idx1, idx2, idx3)
+            # Dictionaries grouping the impropers at lambda = 0 and 1 by their
+            # canonical key. Note that the ordering of impropers is inconsistent
+            # between molecular topology formats, so the key is independent of
+            # the order of the atoms.
+            impropers0_idx = _bonded_term_keys(info, impropers0, _improper_key)
+            impropers1_idx = _bonded_term_keys(info, impropers1, _improper_key)
 
-                # Add to the list of ids.
-                impropers0_idx[improper_id] = idx
-
-            # Loop over all impropers at lambda = 1.
-            for idx, improper in enumerate(impropers1):
-                # Get the AtomIdx for the atoms in the improper.
-                idx0 = info.atomIdx(improper.atom0())
-                idx1 = info.atomIdx(improper.atom1())
-                idx2 = info.atomIdx(improper.atom2())
-                idx3 = info.atomIdx(improper.atom3())
-
-                # Create the ImproperID.
-                improper_id = _SireMol.ImproperID(idx0, idx1, idx2, idx3)
-
-                # Add to the list of ids.
-                # You cannot mirror an improper!
-                impropers1_idx[improper_id] = idx
-
-            # Now work out the ImproperIDs that are unique at lambda = 0 and 1
-            # as well as those that are shared. Note that the ordering of
-            # impropers is inconsistent between molecular topology formats so
-            # we test all permutations of atom ordering to find matches. This
-            # is achieved using the ImproperID.equivalent() method.
-            impropers0_unique_idx = {}
-            impropers1_unique_idx = {}
-            impropers_shared_idx = {}
-
-            # lambda = 0.
-            for idx0 in impropers0_idx.keys():
-                is_shared = False
-                for idx1 in impropers1_idx.keys():
-                    if idx0.equivalent(idx1):
-                        impropers_shared_idx[idx0] = (impropers0_idx[idx0], impropers1_idx[idx1])
-                        is_shared = True
-                        break
-                if not is_shared:
-                    impropers0_unique_idx[idx0] = impropers0_idx[idx0]
-
-            # lambda = 1.
-            for idx1 in impropers1_idx.keys():
-                is_shared = False
-                for idx0 in impropers0_idx.keys():
-                    if idx1.equivalent(idx0):
-                        impropers_shared_idx[idx1] = (impropers0_idx[idx0], impropers1_idx[idx1])
-                        is_shared = True
-                        break
-                if not is_shared:
-                    impropers1_unique_idx[idx1] = impropers1_idx[idx1]
+            # Now work out the impropers that are unique at lambda = 0 and 1
+            # as well as those that are shared.
+            impropers0_unique_idx, impropers1_unique_idx, impropers_shared_idx = \
+                _match_bonded_terms(impropers0_idx, impropers1_idx)
 
             # First create records for the impropers that are unique to lambda = 0 and 1.
 
             # lambda = 0.
-            for idx in impropers0_unique_idx.values():
+            for idx in impropers0_unique_idx:
                 # Get the improper potential.
                 improper = impropers0[idx]
 
@@ -1399,7 +1363,7 @@ class Molecule():
                 file.write("    endimproper\n")
 
             # lambda = 1.
-            for idx in impropers1_unique_idx.values():
+            for idx in impropers1_unique_idx:
                 # Get the improper potential.
                 improper = impropers1[idx]
 
@@ -1433,7 +1397,7 @@ class Molecule():
                 file.write("    endimproper\n")
 
             # Now add records for the shared impropers.
-            for idx0, idx1 in impropers_shared_idx.values():
+            for idx0, idx1 in impropers_shared_idx:
                 # Get the improper potentials.
                 improper0 = impropers0[idx0]
                 improper1 = impropers1[idx1]
@@ -1630,8 +1594,8 @@ class Molecule():
         if not self._is_merged:
             return Molecule(self._sire_molecule)
 
-        # Extract and copy the Sire molecule.
-        mol = self._sire_molecule.__deepcopy__()
+        # Extract the Sire molecule.
+        mol = self._sire_molecule
 
         # Make the molecule editable.
         mol = mol.edit()
@@ -1657,7 +1621,8 @@ class Molecule():
         # Return the updated molecule.
         return Molecule(mol.commit())
 
-    def _merge(self, other, mapping, allow_ring_breaking=False, property_map0={}, property_map1={}):
+    def _merge(self, other, mapping, allow_ring_breaking=False, property_map0={},
+            property_map1={}, roi=None):
         """Merge this molecule with 'other'.
 
            Parameters
@@ -1681,6 +1646,14 @@ class Molecule():
                A dictionary that maps "properties" in ther other molecule to
                their user defined values.
 
+           roi : [int], str
+               The indices of the residues in this molecule that are perturbed,
+               or "auto" to detect them from the mapping. When set, a residue-
+               local merge is performed: the residues of this molecule are
+               preserved and atoms outside of the region of interest take
+               their properties and bonded terms from this molecule at both
+               end states.
+
            Returns
            -------
 
@@ -1713,6 +1686,14 @@ class Molecule():
                 if type(idx0) is not _SireMol.AtomIdx or type(idx1) is not _SireMol.AtomIdx:
                     raise TypeError("key:value pairs in 'mapping' must be of type 'Sire.Mol.AtomIdx'")
 
+        if roi is not None and roi != "auto":
+            if type(roi) is not list or not all(type(x) is int for x in roi):
+                raise TypeError("'roi' must be a list of 'int' types, or 'auto'.")
+            for x in roi:
+                if x < 0 or x >= self.nResidues():
+                    raise ValueError("'roi' residue index %d is out of range! "
+                                     "The molecule contains %d residues." % (x, self.nResidues()))
+
         # Create a copy of this molecule.
         mol = Molecule(self)
 
@@ -1748,27 +1729,6 @@ class Molecule():
         if not molecule0.property(ff0).isCompatibleWith(molecule1.property(ff1)):
             raise _IncompatibleError("Cannot merge molecules with incompatible force fields!")
 
-        # Create lists to store the atoms that are unique to each molecule,
-        # along with their indices.
-        atoms0 = []
-        atoms1 = []
-        atoms0_idx = []
-        atoms1_idx = []
-
-        # Loop over each molecule to find the unique atom indices.
-
-        # molecule0
-        for atom in molecule0.atoms():
-            if atom.index() not in idx0:
-                atoms0.append(atom)
-                atoms0_idx.append(atom.index())
-
-        # molecule1
-        for atom in molecule1.atoms():
-            if atom.index() not in idx1:
-                atoms1.append(atom)
-                atoms1_idx.append(atom.index())
-
         # Create lists of the actual property names in the molecules.
         props0 = []
         props1 = []
@@ -1791,6 +1751,36 @@ class Molecule():
         del props0
         del props1
 
+        # Perform a residue-local merge.
+        if roi is not None:
+            mol._sire_molecule = _merge_local(molecule0, molecule1, mapping, roi, shared_props,
+                inv_property_map0, inv_property_map1, allow_ring_breaking)
+            mol._is_merged = True
+            mol._molecule0 = Molecule(molecule0)
+            mol._molecule1 = Molecule(molecule1)
+            return mol
+
+        # Create lists to store the atoms that are unique to each molecule,
+        # along with their indices.
+        atoms0 = []
+        atoms1 = []
+        atoms0_idx = []
+        atoms1_idx = []
+
+        # Loop over each molecule to find the unique atom indices.
+
+        # molecule0
+        for atom in molecule0.atoms():
+            if atom.index() not in idx0:
+                atoms0.append(atom)
+                atoms0_idx.append(atom.index())
+
+        # molecule1
+        for atom in molecule1.atoms():
+            if atom.index() not in idx1:
+                atoms1.append(atom)
+                atoms1_idx.append(atom.index())
+
         # Create a new molecule to hold the merged molecule.
         molecule = _SireMol.Molecule("Merged_Molecule")
 
@@ -2375,71 +2365,12 @@ class Molecule():
         # Check that the merge hasn't modified the connectivity.
 
         # molecule0
-        for x in range(0, molecule0.nAtoms()):
-            # Convert to an AtomIdx.
-            idx = _SireMol.AtomIdx(x)
-
-            for y in range(x+1, molecule0.nAtoms()):
-                # Convert to an AtomIdx.
-                idy = _SireMol.AtomIdx(y)
-
-                # The connectivity has changed.
-                if c0.connectionType(idx, idy) != conn.connectionType(idx, idy):
-                    # Ring opening/closing is allowed.
-                    if allow_ring_breaking:
-                        if not _is_ring_broken(c0, conn, idx, idy, idx, idy):
-                            raise _IncompatibleError("The merge has changed the molecular connectivity! "
-                                                     "Check your atom mapping.")
-                    else:
-                        raise _IncompatibleError("The merge has changed the molecular connectivity! "
-                                                 "If you want to open/close a ring, then set the "
-                                                 "'allow_ring_breaking' option to 'True'.")
-
-                # Check that a ring hasn't been opened/closed.
-                else:
-                    if not allow_ring_breaking:
-                        # We require that both atoms are in a ring before and aren't after, or vice-versa.
-                        if _is_ring_broken(c0, conn, idx, idy, idx, idy):
-                            raise _IncompatibleError("The merge has changed opened/closed a ring! "
-                                                    "If you want to allow this perturbation, then set the "
-                                                    "'allow_ring_breaking' option to 'True'.")
+        _validate_connectivity(c0, conn, [_SireMol.AtomIdx(x) for x in range(0, molecule0.nAtoms())],
+                               allow_ring_breaking)
 
         # molecule1
-        for x in range(0, molecule1.nAtoms()):
-            # Convert to an AtomIdx.
-            idx = _SireMol.AtomIdx(x)
-
-            # Map the index to its position in the merged molecule.
-            idx_map = inv_mapping[idx]
-
-            for y in range(x+1, molecule1.nAtoms()):
-                # Convert to an AtomIdx.
-                idy = _SireMol.AtomIdx(y)
-
-                # Map the index to its position in the merged molecule.
-                idy_map = inv_mapping[idy]
-
-                # The connectivity has changed.
-                if c1.connectionType(idx, idy) != conn.connectionType(idx_map, idy_map):
-                    # Ring opening/closing is forbidden.
-                    if allow_ring_breaking:
-                        # We require that both atoms are in a ring before and aren't after, or vice-versa.
-                        if not _is_ring_broken(c1, conn, idx, idy, idx_map, idy_map):
-                            raise _IncompatibleError("The merge has changed the molecular connectivity! "
-                                                     "Check your atom mapping.")
-                    else:
-                        raise _IncompatibleError("The merge has changed the molecular connectivity! "
-                                                 "If you want to open/close a ring, then set the "
-                                                 "'allow_ring_breaking' option to 'True'.")
-
-                # Check that a ring hasn't been opened/closed.
-                else:
-                    if not allow_ring_breaking:
-                        # We require that both atoms are in a ring before and aren't after, or vice-versa.
-                        if _is_ring_broken(c1, conn, idx, idy, idx_map, idy_map):
-                            raise _IncompatibleError("The merge has changed opened/closed a ring! "
-                                                    "If you want to allow this perturbation, then set the "
-                                                    "'allow_ring_breaking' option to 'True'.")
+        _validate_connectivity(c1, conn, [inv_mapping[_SireMol.AtomIdx(x)] for x in range(0, molecule1.nAtoms())],
+                               allow_ring_breaking)
 
         # Set the "connectivity" property.
         edit_mol.setProperty("connectivity", conn)
@@ -2592,108 +2523,433 @@ class Molecule():
                The axis-aligned bounding box for the molecule.
         """
 
-        # Initialise the coordinates vector.
-        coord = []
+        # Return the AABox for the coordinates.
+        return _aabox(self.getCoordinates(property_map))
 
-        # Extract the atomic coordinates and append them to the vector.
-        try:
-            if "coordinates" in property_map:
-                prop = property_map["coordinates"]
-            else:
-                if self._is_merged:
-                    prop = "coordinates0"
-                else:
-                    prop = "coordinates"
-            coord.extend(self._sire_molecule.property(prop).toVector())
+def _coordinates_property(molecule, property_map={}, is_lambda1=False):
+    """Internal function to return the name of the coordinates property of a
+       molecule. Merged molecules use the coordinates of the chosen end state,
+       i.e. the "coordinates0" or "coordinates1" property.
 
-        except UserWarning:
-            raise UserWarning("Molecule has no 'coordinates' property.") from None
+       Parameters
+       ----------
 
-        # Return the AABox for the coordinates.
-        return _SireVol.AABox(coord)
+       molecule : Sire.Mol.Molecule
+           The molecule.
 
-def _has_pert_atom(idxs, pert_idxs):
-    """Internal function to check whether a potential contains perturbed atoms.
+       property_map : dict
+           A dictionary that maps system "properties" to their user defined
+           values.
+
+       is_lambda1 : bool
+           Whether to use the coordinates at lambda = 1 if the molecule is
+           merged.
+
+       Returns
+       -------
+
+       prop : str
+           The name of the coordinates property.
+    """
+    if molecule.hasProperty("is_perturbable"):
+        if is_lambda1:
+            return property_map.get("coordinates1", "coordinates1")
+        else:
+            return property_map.get("coordinates0", "coordinates0")
+    else:
+        return property_map.get("coordinates", "coordinates")
+
+def _permute_atom_property(propty, molecule, perm):
+    """Internal function to copy an atom property to a molecule with a
+       different atom order.
 
        Parameters
        ----------
 
-       idxs : [AtomIdx]
-           A list of atom indices involved in the potential.
+       propty : Sire.Mol.AtomProp
+           The atom property.
 
-       pert_idxs : [AtomIdx]
-           A list of atom indices that are perturbed.
+       molecule : Sire.Mol.Molecule
+           The molecule that the property will be added to.
+
+       perm : [int]
+           The position in the property's values of the value for each atom
+           in 'molecule', in cut-group order.
 
        Returns
        -------
 
-       has_pert_atom : bool
-           Whether the potential includes a perturbed atom.
+       propty : Sire.Mol.AtomProp
+           The permuted property.
     """
 
-    for idx in idxs:
-        if idx in pert_idxs:
-            return True
+    values = propty.toVector()
 
-    return False
+    new_propty = type(propty)(molecule.info())
+    new_propty.copyFrom([values[x] for x in perm])
 
-def _has_dummy(mol, idxs, is_lambda1=False):
-    """Internal function to check whether any atom is a dummy.
+    return new_propty
+
+def _cut_group_atoms(molecule):
+    """Internal function to return the indices of the atoms in each cut group
+       of a molecule. Sire stores coordinates by cut group, which needn't
+       follow the order of the atoms.
 
        Parameters
        ----------
 
-       mol : Sire.Mol.Molecule
+       molecule : Sire.Mol.Molecule
            The molecule.
 
-       idxs : [AtomIdx]
-           A list of atom indices.
+       Returns
+       -------
 
-       is_lambda1 : bool
-           Whether to check the lambda = 1 state.
+       indices : [[int]]
+           The atom indices for each cut group.
+    """
+    info = molecule.info()
+    return [[idx.value() for idx in info.getAtomsIn(_SireMol.CGIdx(x))]
+            for x in range(0, info.nCutGroups())]
+
+def _get_coordinates(molecule, prop):
+    """Internal function to extract a coordinates property from a molecule.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       prop : str
+           The name of the coordinates property.
 
        Returns
        -------
 
-       has_dummy : bool
-           Whether a dummy atom is present.
+       coordinates : numpy.ndarray
+           An array of shape (nAtoms, 3) containing the coordinates of each
+           atom, in atom index order.
     """
 
-    # Set the element property associated with the end state.
-    if is_lambda1:
-        prop = "element1"
-    else:
-        prop = "element0"
-
-    dummy = _SireMol.Element(0)
+    # Sire flattens the coordinates in cut group order. Sire doesn't expose
+    # the underlying buffer, so the components are copied straight into a
+    # flat array, without creating an intermediate list for each atom.
+    vectors = molecule.property(prop).toVector()
+    coordinates = _np.fromiter(_itertools.chain.from_iterable((v.x(), v.y(), v.z()) for v in vectors),
+                               dtype=_np.float64, count=3*len(vectors))
+    coordinates = coordinates.reshape(-1, 3)
 
-    # Check whether an of the atoms is a dummy.
-    for idx in idxs:
-        if mol.atom(idx).property(prop) == dummy:
-            return True
+    # Re-order by atom index, if needed.
+    order = [idx for group in _cut_group_atoms(molecule) for idx in group]
+    if order != list(range(0, len(order))):
+        reordered = _np.empty_like(coordinates)
+        reordered[order] = coordinates
+        coordinates = reordered
 
-    return False
+    return coordinates
 
-def _is_dummy(mol, idxs, is_lambda1=False):
-    """Internal function to return whether each atom is a dummy.
+def _set_coordinates(molecule, prop, coordinates):
+    """Internal function to set a coordinates property of a molecule.
 
        Parameters
        ----------
 
-       mol : Sire.Mol.Molecule
+       molecule : Sire.Mol.Molecule
            The molecule.
 
-       idxs : [AtomIdx]
-           A list of atom indices.
+       prop : str
+           The name of the coordinates property.
 
-       is_lambda1 : bool
-           Whether to check the lambda = 1 state.
+       coordinates : numpy.ndarray
+           An array of shape (nAtoms, 3) containing the coordinates of each
+           atom, in atom index order.
 
        Returns
        -------
 
-       is_dummy : [bool]
-           Whether each atom is a dummy.
+       molecule : Sire.Mol.Molecule
+           The updated molecule.
+    """
+
+    # Create the coordinates for each cut group. Sire can only be passed a
+    # Vector object for each atom.
+    coordinates = coordinates.tolist()
+    groups = [_SireVol.CoordGroup([_SireMaths.Vector(coordinates[idx]) for idx in group])
+              for group in _cut_group_atoms(molecule)]
+
+    coords = _SireMol.AtomCoords(_SireVol.CoordGroupArray(groups))
+
+    return molecule.edit().setProperty(prop, coords).molecule().commit()
+
+def _validate_coordinates(coordinates, num_atoms):
+    """Internal function to validate an array of coordinates.
+
+       Parameters
+       ----------
+
+       coordinates : numpy.ndarray, [[float]]
+           The coordinates.
+
+       num_atoms : int
+           The expected number of atoms.
+
+       Returns
+       -------
+
+       coordinates : numpy.ndarray
+           A contiguous array of shape (num_atoms, 3).
+    """
+
+    if not isinstance(coordinates, (_np.ndarray, list, tuple)):
+        raise TypeError("'coordinates' must be of type 'numpy.ndarray'")
+
+    coordinates = _np.ascontiguousarray(coordinates, dtype=_np.float64)
+
+    if coordinates.shape != (num_atoms, 3):
+        raise ValueError("'coordinates' must have shape (%d, 3), found %s"
+            % (num_atoms, coordinates.shape))
+
+    return coordinates
+
+def _aabox(coordinates):
+    """Internal function to return the axis-aligned bounding box for a set of
+       coordinates.
+
+       Parameters
+       ----------
+
+       coordinates : numpy.ndarray
+           An array of shape (N, 3) containing the coordinates.
+
+       Returns
+       -------
+
+       aabox : Sire.Vol.AABox
+           The axis-aligned bounding box.
+    """
+
+    if len(coordinates) == 0:
+        return _SireVol.AABox()
+
+    minimum = coordinates.min(axis=0)
+    maximum = coordinates.max(axis=0)
+
+    return _SireVol.AABox(_SireMaths.Vector((0.5*(minimum + maximum)).tolist()),
+                          _SireMaths.Vector((0.5*(maximum - minimum)).tolist()))
+
+def _dihedral_key(idxs):
+    """Internal function to return a canonical key for a dihedral. A dihedral
+       and its mirror image have the same key.
+
+       Parameters
+       ----------
+
+       idxs : (int, int, int, int)
+           The indices of the atoms in the dihedral.
+
+       Returns
+       -------
+
+       key : (int, int, int, int)
+           The canonical key.
+    """
+    return min(idxs, idxs[::-1])
+
+def _improper_key(idxs):
+    """Internal function to return a canonical key for an improper. Any
+       permutation of the atoms in an improper has the same key.
+
+       Parameters
+       ----------
+
+       idxs : (int, int, int, int)
+           The indices of the atoms in the improper.
+
+       Returns
+       -------
+
+       key : (int, int, int, int)
+           The canonical key.
+    """
+    return tuple(sorted(idxs))
+
+def _bonded_term_keys(info, potentials, key):
+    """Internal function to group the four-atom bonded terms in a list of
+       potentials by their canonical key.
+
+       Parameters
+       ----------
+
+       info : Sire.Mol.MoleculeInfo
+           The molecule info object.
+
+       potentials : [Sire.MM.FourAtomFunction]
+           The potentials.
+
+       key : function
+           The function used to create the canonical key from a tuple of
+           atom indices.
+
+       Returns
+       -------
+
+       keys : dict
+           A dictionary mapping canonical keys to a list of (idxs, index)
+           tuples, holding the atom indices and the index in 'potentials' of
+           each term with that key. Several terms can share a key, e.g.
+           impropers over the same atoms with a different central atom.
+    """
+
+    keys = {}
+
+    for idx, potential in enumerate(potentials):
+        idxs = (info.atomIdx(potential.atom0()).value(),
+                info.atomIdx(potential.atom1()).value(),
+                info.atomIdx(potential.atom2()).value(),
+                info.atomIdx(potential.atom3()).value())
+
+        keys.setdefault(key(idxs), []).append((idxs, idx))
+
+    return keys
+
+def _match_bonded_terms(keys0, keys1):
+    """Internal function to find the bonded terms that are unique to each end
+       state of a merged molecule, and those that are shared. Terms with the
+       same canonical key are paired one-to-one, with terms whose atoms are
+       listed in the same order paired first.
+
+       Parameters
+       ----------
+
+       keys0 : dict
+           A dictionary mapping canonical keys to lists of (idxs, index)
+           tuples for the potentials at lambda = 0.
+
+       keys1 : dict
+           A dictionary mapping canonical keys to lists of (idxs, index)
+           tuples for the potentials at lambda = 1.
+
+       Returns
+       -------
+
+       (unique0, unique1, shared) : ([int], [int], [(int, int)])
+           The indices of the potentials unique to lambda = 0, unique to
+           lambda = 1, and tuples of indices of the potentials that are
+           shared.
+    """
+
+    unique0 = []
+    unique1 = []
+    shared = []
+
+    for key, terms0 in keys0.items():
+        terms0 = list(terms0)
+        terms1 = list(keys1.get(key, []))
+
+        # Pair the terms whose atoms are listed in the same order.
+        for term0 in list(terms0):
+            for term1 in terms1:
+                if term0[0] == term1[0]:
+                    shared.append((term0[1], term1[1]))
+                    terms0.remove(term0)
+                    terms1.remove(term1)
+                    break
+
+        # Pair the remaining terms in order.
+        for (_, idx0), (_, idx1) in zip(terms0, terms1):
+            shared.append((idx0, idx1))
+
+        unique0.extend(idx for _, idx in terms0[len(terms1):])
+        unique1.extend(idx for _, idx in terms1[len(terms0):])
+
+    for key, terms1 in keys1.items():
+        if key not in keys0:
+            unique1.extend(idx for _, idx in terms1)
+
+    return unique0, unique1, shared
+
+def _has_pert_atom(idxs, pert_idxs):
+    """Internal function to check whether a potential contains perturbed atoms.
+
+       Parameters
+       ----------
+
+       idxs : [AtomIdx]
+           A list of atom indices involved in the potential.
+
+       pert_idxs : [AtomIdx]
+           A list of atom indices that are perturbed.
+
+       Returns
+       -------
+
+       has_pert_atom : bool
+           Whether the potential includes a perturbed atom.
+    """
+
+    for idx in idxs:
+        if idx in pert_idxs:
+            return True
+
+    return False
+
+def _has_dummy(mol, idxs, is_lambda1=False):
+    """Internal function to check whether any atom is a dummy.
+
+       Parameters
+       ----------
+
+       mol : Sire.Mol.Molecule
+           The molecule.
+
+       idxs : [AtomIdx]
+           A list of atom indices.
+
+       is_lambda1 : bool
+           Whether to check the lambda = 1 state.
+
+       Returns
+       -------
+
+       has_dummy : bool
+           Whether a dummy atom is present.
+    """
+
+    # Set the element property associated with the end state.
+    if is_lambda1:
+        prop = "element1"
+    else:
+        prop = "element0"
+
+    dummy = _SireMol.Element(0)
+
+    # Check whether an of the atoms is a dummy.
+    for idx in idxs:
+        if mol.atom(idx).property(prop) == dummy:
+            return True
+
+    return False
+
+def _is_dummy(mol, idxs, is_lambda1=False):
+    """Internal function to return whether each atom is a dummy.
+
+       Parameters
+       ----------
+
+       mol : Sire.Mol.Molecule
+           The molecule.
+
+       idxs : [AtomIdx]
+           A list of atom indices.
+
+       is_lambda1 : bool
+           Whether to check the lambda = 1 state.
+
+       Returns
+       -------
+
+       is_dummy : [bool]
+           Whether each atom is a dummy.
     """
 
     # Set the element property associated with the end state.
@@ -2746,35 +3002,824 @@ def _random_suffix(basename, size=4, chars=_string.ascii_uppercase + _string.dig
                        + "AMBER atom names can only be 4 characters wide.")
     return "".join(_random.choice(chars) for _ in range(size-basename_size))
 
-def _is_ring_broken(conn0, conn1, idx0, idy0, idx1, idy1):
-    """Internal function to test whether a perturbation changes the connectivity
-       around two atoms such that a ring is broken.
+def _molecule_type(molecule):
+    """Internal function to classify a small molecule as a water or an ion.
+       The result is cached for each molecule number and version, which
+       changes whenever the molecule is edited.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       Returns
+       -------
+
+       type : str
+           "water", "ion", or None if the molecule is neither.
+    """
+
+    num_atoms = molecule.nAtoms()
+
+    # Water models have 5 or less atoms.
+    if num_atoms > 5:
+        return None
+
+    key = (molecule.number().value(), molecule.version())
+
+    with _molecule_types_lock:
+        try:
+            _molecule_types.move_to_end(key)
+            return _molecule_types[key]
+        except KeyError:
+            pass
+
+    # Get the elements, inferring them from the atom names if needed.
+    try:
+        elements = [x.symbol() for x in molecule.property("element").toVector()]
+    except:
+        elements = []
+        for atom in molecule.atoms():
+            # Strip all digits and whitespace from the name.
+            name = "".join([x for x in atom.name().value() if not x.isdigit()]).replace(" ", "")
+            elements.append(_SireMol.Element.biologicalElement(name).symbol())
+
+    # A single atom is an ion.
+    if num_atoms == 1:
+        mol_type = "ion"
+
+    # A water molecule has two Hydrogens and one Oxygen.
+    elif elements.count("H") == 2 and elements.count("O") == 1:
+        mol_type = "water"
+
+    else:
+        mol_type = None
+
+    with _molecule_types_lock:
+        _molecule_types[key] = mol_type
+        while len(_molecule_types) > _max_molecule_types:
+            _molecule_types.popitem(last=False)
+
+    return mol_type
+
+def _merge_region(molecule0, molecule1, mapping, roi):
+    """Internal function to work out the atoms that are perturbed in a
+       residue-local merge.
+
+       Parameters
+       ----------
+
+       molecule0 : Sire.Mol.Molecule
+           The first molecule.
+
+       molecule1 : Sire.Mol.Molecule
+           The second molecule.
+
+       mapping : dict
+           The mapping between matching atom indices in the two molecules.
+
+       roi : [int], str
+           The indices of the perturbed residues in molecule0, or "auto" to
+           detect them from the mapping.
+
+       Returns
+       -------
+
+       (region0, region1, residues1) : (set, set, dict)
+           The indices of the perturbed atoms in each molecule, along with a
+           dictionary mapping the index of each atom that is unique to
+           molecule1 to the index of the residue in molecule0 that will
+           contain it.
+    """
+
+    # Integer versions of the mapping.
+    forward = { k.value() : v.value() for k, v in mapping.items() }
+    backward = { v : k for k, v in forward.items() }
+
+    # The residue index of each atom in the two molecules.
+    res0 = _atom_residues(molecule0)
+    res1 = _atom_residues(molecule1)
+
+    # The atoms that are unique to each molecule.
+    unique0 = [x for x in range(0, len(res0)) if x not in forward]
+    unique1 = [x for x in range(0, len(res1)) if x not in backward]
+
+    # Residues in molecule1 that contain unique atoms.
+    residues_unique1 = { res1[x] for x in unique1 }
+
+    if roi == "auto":
+        names0 = [res.name().value() for res in molecule0.residues()]
+        names1 = [res.name().value() for res in molecule1.residues()]
+
+        roi = { res0[x] for x in unique0 }
+        for x, y in forward.items():
+            if res1[y] in residues_unique1 or names0[res0[x]] != names1[res1[y]]:
+                roi.add(res0[x])
+    else:
+        roi = set(roi)
+
+    # All atoms that are unique to molecule0 must be in the region of interest.
+    for x in unique0:
+        if res0[x] not in roi:
+            raise _IncompatibleError("Atom %d of 'molecule0' is unique but its residue (%d) "
+                                     "is not in the region of interest!" % (x, res0[x]))
+
+    # Place each atom that is unique to molecule1 in the molecule0 residue that
+    # matches its own residue in molecule1.
+    matched = {}
+    for x, y in forward.items():
+        matched.setdefault(res1[y], res0[x])
+
+    residues1 = {}
+    for x in unique1:
+        if res1[x] not in matched or matched[res1[x]] not in roi:
+            raise _IncompatibleError("Atom %d of 'molecule1' is unique but doesn't belong to "
+                                     "a residue in the region of interest!" % x)
+        residues1[x] = matched[res1[x]]
+
+    region0 = { x for x in range(0, len(res0)) if res0[x] in roi }
+    region1 = { forward[x] for x in region0 if x in forward }
+    region1.update(unique1)
+
+    return region0, region1, residues1
+
+def _merge_local(molecule0, molecule1, mapping, roi, shared_props,
+        inv_property_map0={}, inv_property_map1={}, allow_ring_breaking=False):
+    """Internal function to perform a residue-local merge. The residues of
+       molecule0 are preserved, with the atoms that are unique to molecule1
+       added to the end of the residue that will contain them, so that the
+       atoms in each residue are contiguous. Atom properties are set in bulk,
+       and bonded terms outside of the region of interest are taken from
+       molecule0 once and shared by both end states.
+
+       Parameters
+       ----------
+
+       molecule0 : Sire.Mol.Molecule
+           The first molecule.
+
+       molecule1 : Sire.Mol.Molecule
+           The second molecule.
+
+       mapping : dict
+           The mapping between matching atom indices in the two molecules.
+
+       roi : [int], str
+           The indices of the perturbed residues in molecule0, or "auto" to
+           detect them from the mapping.
+
+       shared_props : [str]
+           The properties that are shared by the two molecules.
+
+       inv_property_map0 : dict
+           The inverse of the user property map for molecule0.
+
+       inv_property_map1 : dict
+           The inverse of the user property map for molecule1.
+
+       allow_ring_breaking : bool
+           Whether to allow the opening/closing of rings during a merge.
+
+       Returns
+       -------
+
+       merged : Sire.Mol.Molecule
+           The merged molecule.
+    """
+
+    # Work out the region of interest.
+    region0, region1, residues1 = _merge_region(molecule0, molecule1, mapping, roi)
+
+    # The atoms that are unique to molecule1 in each residue of the merged
+    # molecule.
+    unique1 = {}
+    for x in sorted(residues1):
+        unique1.setdefault(residues1[x], []).append(x)
+
+    # The index in the merged molecule of each atom in the two molecules.
+    to_merged0 = [None] * molecule0.nAtoms()
+    to_merged1 = [None] * molecule1.nAtoms()
+
+    # Get the atom names, which are only needed in the region of interest for
+    # molecule1.
+    names0 = [atom.name() for atom in molecule0.atoms()]
+    names1 = [molecule1.atom(_SireMol.AtomIdx(x)).name() if x in region1 else None
+              for x in range(0, molecule1.nAtoms())]
+
+    # Create the merged molecule, with a residue and cut-group for each
+    # residue of molecule0. Each residue holds its atoms from molecule0,
+    # followed by the atoms that are unique to molecule1.
+    editor = _SireMol.Molecule("Merged_Molecule").edit()
+    num = 0
+    for res_idx, atoms in enumerate(_residue_atoms(molecule0)):
+        res = molecule0.residue(_SireMol.ResIdx(res_idx))
+        added = editor.add(res.number())
+        added.rename(res.name())
+        cg = added.molecule().add(_SireMol.CGName(str(res_idx + 1)))
+
+        for names, to_merged, idxs in [(names0, to_merged0, atoms),
+                                       (names1, to_merged1, unique1.get(res_idx, []))]:
+            for x in idxs:
+                added = cg.add(names[x])
+                added.renumber(_SireMol.AtomNum(num + 1))
+                added.reparent(_SireMol.ResIdx(res_idx))
+                to_merged[x] = num
+                num += 1
+
+        editor = cg.molecule()
+
+    # Atoms that are mapped from molecule0.
+    for idx0, idx1 in mapping.items():
+        to_merged1[idx1.value()] = to_merged0[idx0.value()]
+
+    edit_mol = editor.commit().edit()
+
+    # The atoms from each molecule for each atom in the merged molecule. Atoms
+    # outside of the region of interest are only taken from molecule0.
+    from0 = [None] * num
+    from1 = [None] * num
+    for x, idx in enumerate(to_merged0):
+        from0[idx] = x
+    for x, idx in enumerate(to_merged1):
+        from1[idx] = x
+
+    # Properties of the dummy atoms at each end state.
+    dummies = { "charge"    : 0*_SireUnits.e_charge,
+                "LJ"        : _SireMM.LJParameter(),
+                "ambertype" : "du",
+                "element"   : _SireMol.Element(0) }
+
+    # The values of an atom property at each end state. At lambda = 0, atoms
+    # that are unique to molecule1 are dummies, and vice versa at lambda = 1.
+    def end_states(values0, values1, name):
+        state0 = []
+        state1 = []
+        for x, y in zip(from0, from1):
+            if x is None:
+                state0.append(dummies.get(name, values1[y]))
+            else:
+                state0.append(values0[x])
+
+            if y is None:
+                state1.append(dummies.get(name, values0[x]))
+            elif x is None or x in region0:
+                state1.append(values1[y])
+            else:
+                state1.append(values0[x])
+
+        return state0, state1
+
+    # Set the atom names.
+    names0 = [name.value() for name in names0]
+    names1 = [None if name is None else name.value() for name in names1]
+    for suffix, values in zip(["0", "1"], end_states(names0, names1, "name")):
+        edit_mol = _set_atom_property(edit_mol, "name" + suffix, values, _SireMol.AtomStringProperty)
+
+    # Get the atom properties of each molecule, using the user names.
+    props0 = { inv_property_map0.get(prop, prop) : prop for prop in molecule0.propertyKeys()
+               if isinstance(molecule0.property(prop), _SireMol.AtomProp) }
+    props1 = { inv_property_map1.get(prop, prop) : prop for prop in molecule1.propertyKeys()
+               if isinstance(molecule1.property(prop), _SireMol.AtomProp) }
+
+    for name in set(props0).union(props1):
+        if name in props0:
+            propty = molecule0.property(props0[name])
+            values0 = _atom_property_values(molecule0, props0[name])
+        if name in props1:
+            propty1 = molecule1.property(props1[name])
+            values1 = _atom_property_values(molecule1, props1[name])
+
+        # This is a perturbable property. Rename to "property0" and
+        # "property1", e.g. "charge0" and "charge1".
+        if name in shared_props and name in props0 and name in props1:
+            for suffix, values in zip(["0", "1"], end_states(values0, values1, name)):
+                edit_mol = _set_atom_property(edit_mol, name + suffix, values, type(propty))
+
+        # Properties that are only in molecule0 are set for its atoms.
+        elif name in props0:
+            edit_mol = _set_atom_property(edit_mol, name,
+                [None if x is None else values0[x] for x in from0], type(propty))
+
+        # Properties that are only in molecule1 are set for its atoms in the
+        # region of interest.
+        else:
+            values = [None if y is None or (x is not None and x not in region0) else values1[y]
+                      for x, y in zip(from0, from1)]
+            edit_mol = _set_atom_property(edit_mol, name, values, type(propty1))
+
+    # Now merge the "bond", "angle", "dihedral", and "improper" parameters.
+    # Terms from molecule0 are present at lambda = 0, and at lambda = 1 if they
+    # are outside of the region of interest or contain an atom that is unique
+    # to molecule0. Terms from molecule1 are only taken from the region of
+    # interest: they are present at lambda = 1, and at lambda = 0 if they
+    # contain an atom that is unique to molecule1.
+    info0 = molecule0.info()
+    info1 = molecule1.info()
+    unique0 = { x for x in range(0, len(to_merged0)) if from1[to_merged0[x]] is None }
+    selection1 = _atom_selection(molecule1, region1)
+
+    for name, functions in [("bond", _SireMM.TwoAtomFunctions),
+                            ("angle", _SireMM.ThreeAtomFunctions),
+                            ("dihedral", _SireMM.FourAtomFunctions),
+                            ("improper", _SireMM.FourAtomFunctions)]:
+        if name not in shared_props:
+            continue
+
+        # Get the user defined property names.
+        prop0 = inv_property_map0.get(name, name)
+        prop1 = inv_property_map1.get(name, name)
+
+        # Create the new sets of terms.
+        terms0 = functions(edit_mol.info())
+        terms1 = functions(edit_mol.info())
+
+        for potential in molecule0.property(prop0).potentials():
+            atoms = _potential_atoms(info0, potential)
+            merged = [_SireMol.AtomIdx(to_merged0[x]) for x in atoms]
+            terms0.set(*merged, potential.function())
+            if region0.isdisjoint(atoms) or not unique0.isdisjoint(atoms):
+                terms1.set(*merged, potential.function())
+
+        for potential in molecule1.property(prop1).includeOnly(selection1, False).potentials():
+            atoms = _potential_atoms(info1, potential)
+            merged = [_SireMol.AtomIdx(to_merged1[x]) for x in atoms]
+            terms1.set(*merged, potential.function())
+            if any(from0[to_merged1[x]] is None for x in atoms):
+                terms0.set(*merged, potential.function())
+
+        edit_mol.setProperty(name + "0", terms0)
+        edit_mol.setProperty(name + "1", terms1)
+
+    # The number of potentials should be consistent for the "bond0"
+    # and "bond1" properties.
+    if edit_mol.property("bond0").nFunctions() != edit_mol.property("bond1").nFunctions():
+        raise _IncompatibleError("Inconsistent number of bonds in merged molecule!")
+
+    # Create the connectivity object. Connectivity is the same at lambda = 0
+    # and lambda = 1.
+    conn = _SireMol.Connectivity(edit_mol.info()).edit()
+    for bond in edit_mol.property("bond0").potentials():
+        conn.connect(bond.atom0(), bond.atom1())
+    conn = conn.commit()
+
+    # Check that the merge hasn't modified the connectivity of either molecule.
+    c0 = molecule0.property("connectivity")
+    c1 = molecule1.property("connectivity")
+    _validate_connectivity(c0, conn, [_SireMol.AtomIdx(x) for x in to_merged0], allow_ring_breaking)
+    _validate_connectivity(c1, conn, [_SireMol.AtomIdx(x) for x in to_merged1], allow_ring_breaking)
+
+    # Set the "connectivity" property.
+    edit_mol.setProperty("connectivity", conn)
+
+    # Get the user defined "forcefield" and "intrascale" property names.
+    ff0 = inv_property_map0.get("forcefield", "forcefield")
+    ff1 = inv_property_map1.get("forcefield", "forcefield")
+    intra0 = inv_property_map0.get("intrascale", "intrascale")
+    intra1 = inv_property_map1.get("intrascale", "intrascale")
+
+    # Create the intrascale matrices.
+    clj_nb_pairs0, clj_nb_pairs1 = _local_intrascale(edit_mol.info(), conn, c0, c1,
+        to_merged0, to_merged1, molecule0.property(intra0), molecule1.property(intra1),
+        molecule0.property(ff0))
+
+    # Store the two molecular components.
+    edit_mol.setProperty("molecule0", molecule0)
+    edit_mol.setProperty("molecule1", molecule1)
+
+    # Set the "intrascale" properties.
+    edit_mol.setProperty("intrascale0", clj_nb_pairs0)
+    edit_mol.setProperty("intrascale1", clj_nb_pairs1)
+
+    # Set the "forcefield" properties.
+    edit_mol.setProperty("forcefield0", molecule0.property(ff0))
+    edit_mol.setProperty("forcefield1", molecule1.property(ff1))
+
+    # Flag that this molecule is perturbable.
+    edit_mol.setProperty("is_perturbable", _SireBase.wrap(True))
+
+    return edit_mol.commit()
+
+def _residue_atoms(molecule):
+    """Internal function to return the indices of the atoms in each residue
+       of a molecule.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       Returns
+       -------
+
+       indices : [[int]]
+           The atom indices for each residue.
+    """
+    info = molecule.info()
+    return [[idx.value() for idx in info.getAtomsIn(_SireMol.ResIdx(x))]
+            for x in range(0, info.nResidues())]
+
+def _atom_residues(molecule):
+    """Internal function to return the index of the residue that contains
+       each atom of a molecule.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       Returns
+       -------
+
+       indices : [int]
+           The residue index for each atom.
+    """
+    residues = [None] * molecule.nAtoms()
+    for x, atoms in enumerate(_residue_atoms(molecule)):
+        for idx in atoms:
+            residues[idx] = x
+    return residues
+
+def _atom_selection(molecule, atoms):
+    """Internal function to select a set of atoms in a molecule.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       atoms : [int]
+           The indices of the atoms.
+
+       Returns
+       -------
+
+       selection : Sire.Mol.AtomSelection
+           The selected atoms.
+    """
+    selection = _SireMol.AtomSelection(molecule)
+    selection = selection.selectNone()
+    for x in sorted(atoms):
+        selection = selection.select(_SireMol.AtomIdx(x))
+    return selection
+
+def _atom_property_values(molecule, prop):
+    """Internal function to get the values of an atom property of a molecule,
+       in atom index order.
+
+       Parameters
+       ----------
+
+       molecule : Sire.Mol.Molecule
+           The molecule.
+
+       prop : str
+           The name of the property.
+
+       Returns
+       -------
+
+       values : list
+           The value of the property for each atom.
+    """
+
+    # Atom properties are stored in cut-group order.
+    try:
+        values = molecule.property(prop).toVector()
+        order = [idx for group in _cut_group_atoms(molecule) for idx in group]
+    except:
+        return [molecule.atom(_SireMol.AtomIdx(x)).property(prop) for x in range(0, molecule.nAtoms())]
+
+    sorted_values = [None] * len(order)
+    for value, idx in zip(values, order):
+        sorted_values[idx] = value
+
+    return sorted_values
+
+def _set_atom_property(edit_mol, name, values, propty_type):
+    """Internal function to set an atom property of a molecule in one go.
+       The property is set atom by atom if this isn't possible.
+
+       Parameters
+       ----------
+
+       edit_mol : Sire.Mol.MolEditor
+           The molecule.
+
+       name : str
+           The name of the property.
+
+       values : list
+           The value of the property for each atom, in atom index order, or
+           None to use the default value.
+
+       propty_type : type
+           The type of the property, e.g. Sire.Mol.AtomCharges.
+
+       Returns
+       -------
+
+       edit_mol : Sire.Mol.MolEditor
+           The updated molecule.
+    """
+
+    try:
+        propty = propty_type(edit_mol.info())
+        defaults = propty.toVector()
+        order = [idx for group in _cut_group_atoms(edit_mol) for idx in group]
+        propty.copyFrom([defaults[x] if values[idx] is None else values[idx]
+                         for x, idx in enumerate(order)])
+        return edit_mol.setProperty(name, propty)
+    except:
+        pass
+
+    # Fall back to setting the property atom by atom.
+    for x, value in enumerate(values):
+        if value is not None:
+            edit_mol = edit_mol.atom(_SireMol.AtomIdx(x)).setProperty(name, value).molecule()
+
+    return edit_mol
+
+def _potential_atoms(info, potential):
+    """Internal function to get the indices of the atoms in a bonded
+       potential.
+
+       Parameters
+       ----------
+
+       info : Sire.Mol.MoleculeInfo
+           The info object for the molecule.
+
+       potential : Sire.MM.TwoAtomFunction, Sire.MM.ThreeAtomFunction, \
+                   Sire.MM.FourAtomFunction
+           The potential.
+
+       Returns
+       -------
+
+       atoms : [int]
+           The atom indices, in the order of the potential.
+    """
+
+    atoms = [potential.atom0(), potential.atom1()]
+
+    if hasattr(potential, "atom2"):
+        atoms.append(potential.atom2())
+    if hasattr(potential, "atom3"):
+        atoms.append(potential.atom3())
+
+    return [info.atomIdx(x).value() for x in atoms]
+
+def _local_intrascale(info, conn, conn0, conn1, to_merged0, to_merged1,
+        intrascale0, intrascale1, ff):
+    """Internal function to create the intrascale matrices for a residue-local
+       merge. The rules used for a whole molecule merge are applied, but only
+       to the pairs of atoms that are within three bonds of each other in
+       either end state, or in the merged molecule. All other pairs are
+       assumed to be fully non-bonded, i.e. to have a scale factor of one.
+
+       Parameters
+       ----------
+
+       info : Sire.Mol.MoleculeInfo
+           The info object for the merged molecule.
+
+       conn : Sire.Mol.Connectivity
+           The connectivity of the merged molecule.
+
+       conn0 : Sire.Mol.Connectivity
+           The connectivity of molecule0.
+
+       conn1 : Sire.Mol.Connectivity
+           The connectivity of molecule1.
+
+       to_merged0 : [int]
+           The index in the merged molecule of each atom in molecule0.
+
+       to_merged1 : [int]
+           The index in the merged molecule of each atom in molecule1.
+
+       intrascale0 : Sire.MM.CLJNBPairs
+           The intrascale matrix of molecule0.
+
+       intrascale1 : Sire.MM.CLJNBPairs
+           The intrascale matrix of molecule1.
+
+       ff : Sire.MM.MMDetail
+           The force field of molecule0.
+
+       Returns
+       -------
+
+       (clj_nb_pairs0, clj_nb_pairs1) : (Sire.MM.CLJNBPairs, Sire.MM.CLJNBPairs)
+           The intrascale matrices at lambda = 0 and lambda = 1.
+    """
+
+    clj_nb_pairs0 = _SireMM.CLJNBPairs(info, _SireMM.CLJScaleFactor(1, 1))
+    clj_nb_pairs1 = _SireMM.CLJNBPairs(info, _SireMM.CLJScaleFactor(1, 1))
+
+    # Map from merged atom indices back to each molecule.
+    from_merged0 = { idx : x for x, idx in enumerate(to_merged0) }
+    from_merged1 = { idx : x for x, idx in enumerate(to_merged1) }
+
+    # The atoms that are unique to each molecule, using merged atom indices.
+    unique0 = { idx for idx in to_merged0 if idx not in from_merged1 }
+    unique1 = { idx for idx in to_merged1 if idx not in from_merged0 }
+
+    # Collect the candidate pairs, using merged atom indices.
+    pairs = set()
+    for to_merged, conn_mol in [(to_merged0, conn0), (to_merged1, conn1)]:
+        for x, near in _neighbourhoods(conn_mol, range(0, len(to_merged))).items():
+            x = to_merged[x]
+            pairs.update((min(x, to_merged[y]), max(x, to_merged[y])) for y in near)
+    for x, near in _neighbourhoods(conn, range(0, info.nAtoms())).items():
+        pairs.update((min(x, y), max(x, y)) for y in near)
+
+    scale14 = _SireMM.CLJScaleFactor(ff.electrostatic14ScaleFactor(), ff.vdw14ScaleFactor())
+
+    for x, y in pairs:
+        idx = _SireMol.AtomIdx(x)
+        idy = _SireMol.AtomIdx(y)
+
+        # The default value, which is only non-zero for pairs of atoms that
+        # are unique to different molecules.
+        value = _SireMM.CLJScaleFactor(0, 0)
+        if (x in unique0 and y in unique1) or (x in unique1 and y in unique0):
+            conn_type = conn.connectionType(idx, idy)
+            if conn_type == 0:
+                value = _SireMM.CLJScaleFactor(1, 1)
+            elif conn_type == 4:
+                value = scale14
+
+        # Get the intrascale values for each end state.
+        is_mol0 = x in from_merged0 and y in from_merged0
+        is_mol1 = x in from_merged1 and y in from_merged1
+        if is_mol0:
+            intra0 = intrascale0.get(_SireMol.AtomIdx(from_merged0[x]),
+                                     _SireMol.AtomIdx(from_merged0[y]))
+        if is_mol1:
+            intra1 = intrascale1.get(_SireMol.AtomIdx(from_merged1[x]),
+                                     _SireMol.AtomIdx(from_merged1[y]))
+
+        # lambda = 0: molecule0 takes precedence.
+        value0 = value
+        if is_mol1 and not intra1.coulomb() == 0:
+            value0 = intra1
+        if is_mol0:
+            value0 = intra0
+        clj_nb_pairs0.set(idx, idy, value0)
+
+        # lambda = 1: molecule1 takes precedence.
+        value1 = value
+        if is_mol0 and not intra0.coulomb() == 0:
+            value1 = intra0
+        if is_mol1:
+            value1 = intra1
+        clj_nb_pairs1.set(idx, idy, value1)
+
+    return clj_nb_pairs0, clj_nb_pairs1
+
+def _validate_connectivity(conn0, conn1, mapping, allow_ring_breaking=False):
+    """Internal function to check that a merge hasn't modified the connectivity
+       of one of the end states. This is equivalent to comparing the connection
+       type and ring membership of every pair of atoms, but only pairs of atoms
+       that are within three bonds of each other in either state can differ in
+       connection type, so the cost scales with the number of atoms and bonds.
 
        Parameters
        ----------
 
        conn0 : Sire.Mol.Connectivity
-           The connectivity object for the first end state.
+           The connectivity of the end state.
 
        conn1 : Sire.Mol.Connectivity
-           The connectivity object for the second end state.
+           The connectivity of the merged molecule.
+
+       mapping : [Sire.Mol.AtomIdx]
+           The index in the merged molecule of each atom in the end state.
+
+       allow_ring_breaking : bool
+           Whether to allow the opening/closing of rings.
+    """
+
+    num_atoms = len(mapping)
 
-       idx0 : Sire.Mol.AtomIdx
-           The index of the first atom in the first state.
+    # Map indices in the merged molecule back to the end state.
+    inv_mapping = { idx.value() : x for x, idx in enumerate(mapping) }
 
-       idy0 : Sire.Mol.AtomIdx
-           The index of the second atom in the first state.
+    # Find the atoms that are within three bonds of each atom in each state.
+    # Paths in the merged molecule can pass through atoms that aren't part of
+    # the end state.
+    near0 = _neighbourhoods(conn0, range(0, num_atoms))
+    near1 = _neighbourhoods(conn1, [idx.value() for idx in mapping])
 
-       idx1 : Sire.Mol.AtomIdx
-           The index of the first atom in the second state.
+    # Find the pairs of atoms whose connection type has changed.
+    changed = set()
+    for x in range(0, num_atoms):
+        idx = _SireMol.AtomIdx(x)
+        for y in near0[x] | { inv_mapping[z] for z in near1[mapping[x].value()] if z in inv_mapping }:
+            if y > x:
+                idy = _SireMol.AtomIdx(y)
+                if conn0.connectionType(idx, idy) != conn1.connectionType(mapping[x], mapping[y]):
+                    changed.add((x, y))
+
+    # Work out which atoms are in a ring in each state.
+    rings0 = [conn0.inRing(_SireMol.AtomIdx(x)) for x in range(0, num_atoms)]
+    rings1 = [conn1.inRing(mapping[x]) for x in range(0, num_atoms)]
+
+    # Have we opened/closed a ring? This means that both atoms are part of a
+    # ring in one end state, whereas at least one isn't in the other end state.
+    def is_ring_broken(x, y):
+        return (rings0[x] & rings0[y]) ^ (rings1[x] & rings1[y])
+
+    # Ring opening/closing is allowed, so connection types can only change
+    # if a ring is broken.
+    if allow_ring_breaking:
+        for x, y in sorted(changed):
+            if not is_ring_broken(x, y):
+                raise _IncompatibleError("The merge has changed the molecular connectivity! "
+                                         "Check your atom mapping.")
+        return
+
+    # Otherwise, report the first pair of atoms for which the connection type
+    # has changed, or a ring has been opened/closed.
+
+    # Group the atoms by their ring membership in each state.
+    groups = {}
+    for x in range(0, num_atoms):
+        groups.setdefault((rings0[x], rings1[x]), []).append(x)
+
+    # Find the first pair of atoms with an unchanged connection type that
+    # opens/closes a ring.
+    broken = None
+    for x in range(0, num_atoms):
+        for (ring0, ring1), atoms in groups.items():
+            if (rings0[x] & ring0) ^ (rings1[x] & ring1):
+                # Find the first atom in the group after x.
+                idx = _bisect.bisect_right(atoms, x)
+                while idx < len(atoms) and (x, atoms[idx]) in changed:
+                    idx += 1
+                if idx < len(atoms) and (broken is None or atoms[idx] < broken[1]):
+                    broken = (x, atoms[idx])
+        if broken is not None:
+            break
+
+    if len(changed) > 0 and (broken is None or min(changed) < broken):
+        raise _IncompatibleError("The merge has changed the molecular connectivity! "
+                                 "If you want to open/close a ring, then set the "
+                                 "'allow_ring_breaking' option to 'True'.")
+
+    if broken is not None:
+        raise _IncompatibleError("The merge has changed opened/closed a ring! "
+                                "If you want to allow this perturbation, then set the "
+                                "'allow_ring_breaking' option to 'True'.")
+
+def _neighbourhoods(conn, atoms, depth=3):
+    """Internal function to find the atoms that are within a given number of
+       bonds of each atom in a list.
+
+       Parameters
+       ----------
+
+       conn : Sire.Mol.Connectivity
+           The connectivity of the molecule.
+
+       atoms : [int]
+           The indices of the atoms.
+
+       depth : int
+           The maximum number of bonds.
+
+       Returns
+       -------
 
-       idy1 : Sire.Mol.AtomIdx
-           The index of the second atom in the second state.
+       neighbourhoods : dict
+           A dictionary mapping the index of each atom to the set of indices
+           of atoms within 'depth' bonds, excluding the atom itself.
     """
 
-    # Have we opened/closed a ring? This means that both atoms are part of a ring in
-    # one end state, whereas at least one isn't in the other end state.
-    return (conn0.inRing(idx0) & conn0.inRing(idy0)) ^ (conn1.inRing(idx1) & conn1.inRing(idy1))
+    # The bonded neighbours of each atom, evaluated as needed.
+    bonded = {}
+    def neighbours(x):
+        if x not in bonded:
+            bonded[x] = [idx.value() for idx in conn.connectionsTo(_SireMol.AtomIdx(x))]
+        return bonded[x]
+
+    neighbourhoods = {}
+
+    for x in atoms:
+        visited = {x}
+        frontier = {x}
+        for _ in range(0, depth):
+            frontier = {z for y in frontier for z in neighbours(y) if z not in visited}
+            visited.update(frontier)
+        visited.discard(x)
+        neighbourhoods[x] = visited
+
+    return neighbourhoods
 
 # Import at bottom of module to avoid circular dependency.
 from ._system import System as _System
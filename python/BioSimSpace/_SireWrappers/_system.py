@@ -24,6 +24,8 @@ A thin wrapper around Sire.System. This is an internal package and should
 not be directly exposed to the user.
 """
 
+import numpy as _np
+
 import Sire.Maths as _SireMaths
 import Sire.Mol as _SireMol
 import Sire.System as _SireSystem
@@ -39,6 +41,15 @@ __email_ = "lester.hedges@gmail.com"
 
 __all__ = ["System"]
 
+# Residue names used to identify protein molecules. This includes the
+# alternative protonation states and capping groups used by the AMBER
+# and CHARMM force fields.
+_amino_acids = { "ALA", "ARG", "ASH", "ASN", "ASP", "CYM", "CYS", "CYX",
+                 "GLH", "GLN", "GLU", "GLY", "HID", "HIE", "HIP", "HIS",
+                 "HSD", "HSE", "HSP", "ILE", "LEU", "LYN", "LYS", "MET",
+                 "PHE", "PRO", "SER", "THR", "TRP", "TYR", "VAL", "ACE",
+                 "NME", "NHE" }
+
 class _MolWithResName(_SireMol.MolWithResID):
     def __init__(self, resname):
         super().__init__(_SireMol.ResName(resname))
@@ -59,6 +70,19 @@ class System():
                or a list of BioSimSpace molecule objects.
         """
 
+        # Whether the underlying Sire system may be shared with another object.
+        # Wrappers share the Sire system until one of them is modified, at
+        # which point a copy is made. (Copy-on-write.)
+        self._is_shared = False
+
+        # An index of molecule numbers for each category of molecule. This is
+        # created when first needed and cleared whenever the system changes.
+        # The version of the Sire system that it was created from is also
+        # stored, since the Sire system can be modified directly by objects
+        # that hold a reference to it.
+        self._molecule_index = None
+        self._molecule_index_version = None
+
         # Check that the system is valid.
 
         # Convert tuple to a list.
@@ -67,11 +91,16 @@ class System():
 
         # A Sire System object.
         if type(system) is _SireSystem.System:
-            self._sire_system = system.__deepcopy__()
+            self._sire_system = system
+            self._is_shared = True
 
         # Another BioSimSpace System object.
         elif type(system) is System:
-            self._sire_system = system._sire_system.__deepcopy__()
+            self._sire_system = system._sire_system
+            self._molecule_index = system._molecule_index
+            self._molecule_index_version = system._molecule_index_version
+            self._is_shared = True
+            system._is_shared = True
 
         # A Sire Molecule object.
         elif type(system) is _SireMol.Molecule:
@@ -108,23 +137,18 @@ class System():
     def __add__(self, other):
         """Addition operator."""
 
-        # Create a copy of the current system.
-        system = System(self._sire_system.__deepcopy__())
-
-        # Add the new molecules.
-        if type(other) is System:
-            system.addMolecules(other.getMolecules())
-        else:
-            system.addMolecules(other)
+        # Assemble the combined system in a single pass.
+        builder = _SystemBuilder(self)
+        builder.add(other)
 
         # Return the combined system.
-        return system
+        return builder.commit()
 
     def __sub__(self, other):
         """Subtraction operator."""
 
         # Create a copy of the current system.
-        system = System(self._sire_system.__deepcopy__())
+        system = System(self)
 
         # Remove the molecules from the other system.
         if type(other) is System:
@@ -312,9 +336,12 @@ class System():
         # The system is empty: create a new Sire system from the molecules.
         if self._sire_system.nMolecules() == 0:
             self._sire_system = self._createSireSystem(molecules)
+            self._is_shared = False
+            self._molecule_index = None
 
         # Otherwise, add the molecules to the existing "all" group.
         else:
+            self._detach()
             for mol in molecules:
                 self._sire_system.add(mol._sire_molecule, _SireMol.MGName("all"))
 
@@ -346,6 +373,9 @@ class System():
             raise TypeError("'molecules' must be of type 'BioSimSpace._SireWrappers.Molecule' "
                             "or a list of 'BioSimSpace._SireWrappers.Molecule' types.")
 
+        # Make sure that the Sire system isn't shared.
+        self._detach()
+
         # Remove the molecules in the system.
         for mol in molecules:
             self._sire_system.remove(mol._sire_molecule.number())
@@ -353,12 +383,15 @@ class System():
     def removeWaterMolecules(self):
         """Remove all of the water molecules from the system."""
 
-        # Get the list of water molecules.
-        waters = self.getWaterMolecules()
+        # Get the numbers of the water molecules.
+        waters = self._getMoleculeIndex()["water"]
+
+        # Make sure that the Sire system isn't shared.
+        self._detach()
 
         # Remove the molecules in the system.
-        for mol in waters:
-            self._sire_system.remove(mol._sire_molecule.number())
+        for num in waters:
+            self._sire_system.remove(num)
 
     def updateMolecules(self, molecules):
         """Update a molecule, or list of molecules in the system.
@@ -392,6 +425,7 @@ class System():
         # TODO: Currently the Sire.System.update method doesn't work correctly
         # for certain changes to the Molecule molInfo object. As such, we remove
         # the old molecule from the system, then add the new one in.
+        self._detach()
         for mol in molecules:
             try:
                 self._sire_system.update(mol._sire_molecule)
@@ -449,13 +483,7 @@ class System():
            molecules : [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
                A list of water molecule objects.
         """
-
-        waters = []
-
-        for mol in self._sire_system.search("water"):
-            waters.append(_Molecule(mol))
-
-        return waters
+        return self._getIndexedMolecules("water")
 
     def nWaterMolecules(self):
         """Return the number of water molecules in the system.
@@ -466,7 +494,7 @@ class System():
            num_waters : int
                The number of water molecules in the system.
         """
-        return len(self.getWaterMolecules())
+        return len(self._getMoleculeIndex()["water"])
 
     def getPerturbableMolecules(self):
         """Return a list containing all of the perturbable molecules in the system.
@@ -477,13 +505,7 @@ class System():
            molecules : [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
                A list of perturbable molecules.
         """
-
-        molecules = []
-
-        for mol in self._sire_system.search("perturbable"):
-            molecules.append(_Molecule(mol))
-
-        return molecules
+        return self._getIndexedMolecules("perturbable")
 
     def nPerturbableMolecules(self):
         """Return the number of perturbable molecules in the system.
@@ -494,7 +516,53 @@ class System():
            num_perturbable : int
                The number of perturbable molecules in the system.
         """
-        return len(self.getPerturbableMolecules())
+        return len(self._getMoleculeIndex()["perturbable"])
+
+    def getIonMolecules(self):
+        """Return a list containing all of the ions in the system, i.e.
+           molecules containing a single atom.
+
+           Returns
+           -------
+
+           molecules : [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
+               A list of ions.
+        """
+        return self._getIndexedMolecules("ion")
+
+    def nIonMolecules(self):
+        """Return the number of ions in the system.
+
+           Returns
+           -------
+
+           num_ions : int
+               The number of ions in the system.
+        """
+        return len(self._getMoleculeIndex()["ion"])
+
+    def getProteinMolecules(self):
+        """Return a list containing all of the protein molecules in the system,
+           i.e. molecules containing amino acid residues.
+
+           Returns
+           -------
+
+           molecules : [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
+               A list of protein molecules.
+        """
+        return self._getIndexedMolecules("protein")
+
+    def nProteinMolecules(self):
+        """Return the number of protein molecules in the system.
+
+           Returns
+           -------
+
+           num_proteins : int
+               The number of protein molecules in the system.
+        """
+        return len(self._getMoleculeIndex()["protein"])
 
     def getMolWithResName(self, resname):
         """Return the molecule containing the given residue.
@@ -550,6 +618,7 @@ class System():
         box = _SireVol.PeriodicBox(_SireMaths.Vector(vec))
 
         # Set the "space" property.
+        self._detach()
         self._sire_system.setProperty(property_map.get("space", "space"), box)
 
     def getBox(self, property_map={}):
@@ -618,17 +687,108 @@ class System():
         if type(property_map) is not dict:
             raise TypeError("'property_map' must be of type 'dict'")
 
-        # Translate each of the molecules in the system.
-        for n in self._sire_system.molNums():
-            # Copy the property map.
+        # Translate each molecule using Sire, then update the system in a
+        # single pass. The coordinates at lambda = 0 are used for perturbable
+        # molecules.
+        molecules = _SireMol.Molecules()
+        for num in self._sire_system.molNums():
+            mol = self._sire_system.molecule(num)
             _property_map = property_map.copy()
+            _property_map["coordinates"] = _coordinates_property(mol, property_map)
+            molecules.add(mol.move().translate(_SireMaths.Vector(vec), _property_map).commit())
+
+        self._detach()
+        self._sire_system.update(molecules)
+
+    def getCoordinates(self, property_map={}, is_lambda1=False):
+        """Return the coordinates of all of the atoms in the system. Atoms are
+           ordered by molecule, in the order that molecules appear in the
+           system.
+
+           Parameters
+           ----------
+
+           property_map : dict
+               A dictionary that maps system "properties" to their user defined
+               values. This allows the user to refer to properties with their
+               own naming scheme, e.g. { "charge" : "my-charge" }
+
+           is_lambda1 : bool
+              Whether to use the coordinates at lambda = 1 for merged
+              molecules.
+
+           Returns
+           -------
+
+           coordinates : numpy.ndarray
+               An array of shape (nAtoms, 3) containing the coordinates of
+               each atom, in Angstrom.
+        """
+
+        if type(property_map) is not dict:
+            raise TypeError("'property_map' must be of type 'dict'")
+
+        if type(is_lambda1) is not bool:
+            raise TypeError("'is_lambda1' must be of type 'bool'")
+
+        coordinates = []
+
+        for idx, num in enumerate(self._sire_system.molNums()):
+            mol = self._sire_system.molecule(num)
+            prop = _coordinates_property(mol, property_map, is_lambda1)
+            try:
+                coordinates.append(_get_coordinates(mol, prop))
+            except UserWarning:
+                raise UserWarning("Molecule %d has no '%s' property." % (idx, prop)) from None
+
+        if len(coordinates) == 0:
+            return _np.empty((0, 3))
+
+        return _np.concatenate(coordinates)
+
+    def setCoordinates(self, coordinates, property_map={}, is_lambda1=False):
+        """Set the coordinates of all of the atoms in the system. Atoms are
+           ordered by molecule, in the order that molecules appear in the
+           system.
+
+           Parameters
+           ----------
 
-            # If this is a perturbable molecule, use the coordinates at lambda = 0.
-            if self._sire_system.molecule(n).hasProperty("is_perturbable"):
-                _property_map["coordinates"] = "coordinates0"
+           coordinates : numpy.ndarray
+               An array of shape (nAtoms, 3) containing the coordinates of
+               each atom, in Angstrom.
 
-            mol = self._sire_system[n].move().translate(_SireMaths.Vector(vec), _property_map).commit()
-            self._sire_system.update(mol)
+           property_map : dict
+               A dictionary that maps system "properties" to their user defined
+               values. This allows the user to refer to properties with their
+               own naming scheme, e.g. { "charge" : "my-charge" }
+
+           is_lambda1 : bool
+              Whether to set the coordinates at lambda = 1 for merged
+              molecules.
+        """
+
+        if type(property_map) is not dict:
+            raise TypeError("'property_map' must be of type 'dict'")
+
+        if type(is_lambda1) is not bool:
+            raise TypeError("'is_lambda1' must be of type 'bool'")
+
+        coordinates = _validate_coordinates(coordinates, self.nAtoms())
+
+        # Create the updated molecules.
+        molecules = _SireMol.Molecules()
+        start = 0
+        for num in self._sire_system.molNums():
+            mol = self._sire_system.molecule(num)
+            end = start + mol.nAtoms()
+            prop = _coordinates_property(mol, property_map, is_lambda1)
+            molecules.add(_set_coordinates(mol, prop, coordinates[start:end]))
+            start = end
+
+        # Update all of the molecules at once.
+        self._detach()
+        self._sire_system.update(molecules)
 
     def _getSireSystem(self):
         """Return the full Sire System object.
@@ -639,8 +799,91 @@ class System():
            system : Sire.System.System
                The underlying Sire system object.
         """
+
+        # The caller now holds a reference to the Sire system, so it must be
+        # copied before this wrapper is modified.
+        self._is_shared = True
+
         return self._sire_system
 
+    def _detach(self):
+        """Make sure that this object holds its own copy of the underlying
+           Sire system and clear any data derived from it. This must be
+           called before the Sire system is modified in place.
+        """
+        if self._is_shared:
+            self._sire_system = self._sire_system.__deepcopy__()
+            self._is_shared = False
+
+        self._molecule_index = None
+
+    def _getMoleculeIndex(self):
+        """Return the index of molecule numbers for each category of molecule.
+           Each molecule is placed in a single category, in order of priority:
+           "perturbable", "water", "ion", "protein", and "other".
+
+           Returns
+           -------
+
+           index : dict
+               A dictionary mapping each category to a list of Sire.Mol.MolNum
+               objects.
+        """
+
+        # Make sure the index is still valid, i.e. that the Sire system hasn't
+        # been modified since it was created.
+        version = self._sire_system.version()
+        version = (version.majorVersion(), version.minorVersion())
+
+        if self._molecule_index is not None and self._molecule_index_version == version:
+            return self._molecule_index
+
+        index = { "perturbable" : [],
+                  "water" : [],
+                  "ion" : [],
+                  "protein" : [],
+                  "other" : [] }
+
+        # Perturbable and water molecules can be found with a single search.
+        perturbable = { mol.number() for mol in self._sire_system.search("perturbable") }
+        waters = { mol.number() for mol in self._sire_system.search("water") }
+
+        for num in self._sire_system.molNums():
+            if num in perturbable:
+                index["perturbable"].append(num)
+            elif num in waters:
+                index["water"].append(num)
+            else:
+                mol = self._sire_system.molecule(num)
+                if mol.nAtoms() == 1:
+                    index["ion"].append(num)
+                elif any(res.name().value().upper() in _amino_acids for res in mol.residues()):
+                    index["protein"].append(num)
+                else:
+                    index["other"].append(num)
+
+        self._molecule_index = index
+        self._molecule_index_version = version
+
+        return index
+
+    def _getIndexedMolecules(self, category):
+        """Return the molecules in a category of the molecule index.
+
+           Parameters
+           ----------
+
+           category : str
+               The category of molecule.
+
+           Returns
+           -------
+
+           molecules : [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
+               The molecules in the category.
+        """
+        return [_Molecule(self._sire_system.molecule(num)) for num in self._getMoleculeIndex()[category]]
+
     def _getAABox(self, property_map={}):
         """Get the axis-aligned bounding box for the molecular system.
 
@@ -659,31 +902,8 @@ class System():
                The axis-aligned bounding box for the molecule.
         """
 
-        # Initialise the coordinates vector.
-        coord = []
-
-        # Get all of the molecules in the system.
-        mols = self.getMolecules()
-
-        # Loop over all of the molecules.
-        for idx, mol in enumerate(mols):
-
-            # Extract the atomic coordinates and append them to the vector.
-            try:
-                if "coordinates" in property_map:
-                    prop = property_map["coordinates"]
-                else:
-                    if mol.isMerged():
-                        prop = "coordinates0"
-                    else:
-                        prop = "coordinates"
-                coord.extend(mol._sire_molecule.property(prop).toVector())
-
-            except UserWarning:
-                raise UserWarning("Molecule %d has no 'coordinates' property." % idx) from None
-
         # Return the AABox for the coordinates.
-        return _SireVol.AABox(coord)
+        return _aabox(self.getCoordinates(property_map))
 
     def _renumberMolecules(self, molecules, is_rebuild=False):
         """Helper function to renumber the molecules to be consistent with the
@@ -792,45 +1012,35 @@ class System():
         if self.nMolecules() != system.nMolecules():
             raise _IncompatibleError("The passed 'system' contains a different number of "
                                      "molecules. Expected '%d', found '%d'"
-                                     % (self.nMolecules, system.nMolecules()))
+                                     % (self.nMolecules(), system.nMolecules()))
 
         # Check that each molecule in the system contains the same number of atoms.
-        for idx in range(0, self.nMolecules()):
+        for idx, (num0, num1) in enumerate(zip(self._sire_system.molNums(),
+                                               system._sire_system.molNums())):
             # Extract the number of atoms in the molecules.
-            num_atoms0 = self._sire_system.molecule(_SireMol.MolIdx(idx)).nAtoms()
-            num_atoms1 = self._sire_system.molecule(_SireMol.MolIdx(idx)).nAtoms()
+            num_atoms0 = self._sire_system.molecule(num0).nAtoms()
+            num_atoms1 = system._sire_system.molecule(num1).nAtoms()
 
             if num_atoms0 != num_atoms1:
                 raise _IncompatibleError("Mismatch in atom count for molecule '%d': "
-                                         "Expected '%d', found '%d'" % (num_atoms0, num_atoms1))
+                                         "Expected '%d', found '%d'" % (idx, num_atoms0, num_atoms1))
 
         # Work out the name of the "coordinates" property.
         prop0 = property_map0.get("coordinates0", "coordinates")
         prop1 = property_map1.get("coordinates1", "coordinates")
 
-        # Loop over all molecules and update the coordinates.
-        for idx in range(0, self.nMolecules()):
-            # Extract the molecules from each system.
-            mol0 = self._sire_system.molecule(_SireMol.MolIdx(idx))
-            mol1 = system._sire_system.molecule(_SireMol.MolIdx(idx))
-
-            # Check whether the molecule is perturbable.
-            if mol0.hasProperty("is_perturbable"):
-                if is_lambda1:
-                    prop = "coordinates1"
-                else:
-                    prop = "coordinates0"
-            else:
-                prop = prop0
-
-            # Try to update the coordinates property.
-            try:
-                mol0 = mol0.edit().setProperty(prop, mol1.property(prop1)).molecule().commit()
-            except:
-                raise _IncompatibleError("Unable to update 'coordinates' for molecule index '%d'" % idx)
+        # Extract the coordinates from the passed system.
+        try:
+            coordinates = system.getCoordinates({ "coordinates" : prop1 })
+        except UserWarning as e:
+            raise _IncompatibleError("Unable to extract coordinates from the passed 'system': %s" % e) from None
 
-            # Update the molecule in the original system.
-            self._sire_system.update(mol0)
+        # Update the coordinates of all molecules at once. The coordinates at
+        # the chosen end state are updated for perturbable molecules.
+        try:
+            self.setCoordinates(coordinates, { "coordinates" : prop0 }, is_lambda1)
+        except:
+            raise _IncompatibleError("Unable to update 'coordinates' for the system.") from None
 
     @staticmethod
     def _createSireSystem(molecules):
@@ -865,3 +1075,9 @@ class System():
 
 # Import at bottom of module to avoid circular dependency.
 from ._molecule import Molecule as _Molecule
+from ._molecule import _aabox
+from ._molecule import _coordinates_property
+from ._molecule import _get_coordinates
+from ._molecule import _set_coordinates
+from ._molecule import _validate_coordinates
+from ._system_builder import SystemBuilder as _SystemBuilder
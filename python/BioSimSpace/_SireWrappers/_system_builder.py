@@ -0,0 +1,227 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+A helper class for assembling large molecular systems. This is an internal
+package and should not be directly exposed to the user.
+"""
+
+import Sire.Mol as _SireMol
+import Sire.System as _SireSystem
+
+from ._molecule import Molecule as _Molecule
+from ._system import System as _System
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["SystemBuilder"]
+
+class SystemBuilder():
+    """A class for assembling a system from many molecules. Molecules are
+       collected as they are added and a single Sire system is created when
+       the builder is committed, which avoids the cost of updating a system
+       each time that a molecule is added.
+    """
+
+    def __init__(self, system=None):
+        """Constructor.
+
+           Parameters
+           ----------
+
+           system : :class:`System <BioSimSpace._SireWrappers.System>`, \
+                    :class:`Molecule <BioSimSpace._SireWrappers.Molecule>`, \
+                    [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`]
+               An optional system, molecule, or list of molecules to start
+               from. The properties of a system, e.g. its periodic box, are
+               copied to the committed system.
+        """
+
+        # The Sire molecules, in the order that they were added.
+        self._molecules = []
+
+        # The numbers of the molecules that have been added.
+        self._mol_nums = set()
+
+        # System properties to copy to the committed system.
+        self._properties = {}
+
+        if system is not None:
+            self.add(system)
+
+            if type(system) is _System:
+                for prop in system._sire_system.propertyKeys():
+                    self._properties[prop] = system._sire_system.property(prop)
+
+    def __str__(self):
+        """Return a human readable string representation of the object."""
+        return "<BioSimSpace.SystemBuilder: nMolecules=%d>" % self.nMolecules()
+
+    def __repr__(self):
+        """Return a string showing how to instantiate the object."""
+        return "<BioSimSpace.SystemBuilder: nMolecules=%d>" % self.nMolecules()
+
+    def add(self, molecules):
+        """Add a molecule, a list of molecules, or all of the molecules in
+           a system.
+
+           Parameters
+           ----------
+
+           molecules : :class:`Molecule <BioSimSpace._SireWrappers.Molecule>`, \
+                       [:class:`Molecule <BioSimSpace._SireWrappers.Molecule>`], \
+                       :class:`System <BioSimSpace._SireWrappers.System>`
+              The molecules to add.
+        """
+
+        # Convert tuple to a list.
+        if type(molecules) is tuple:
+            molecules = list(molecules)
+
+        # A Molecule object.
+        if type(molecules) is _Molecule:
+            molecules = [molecules._sire_molecule]
+
+        # A System object.
+        elif type(molecules) is _System:
+            sire_system = molecules._sire_system
+            molecules = [sire_system.molecule(num) for num in sire_system.molNums()]
+
+        # A list of Molecule objects.
+        elif type(molecules) is list and all(isinstance(x, _Molecule) for x in molecules):
+            molecules = [mol._sire_molecule for mol in molecules]
+
+        # Invalid argument.
+        else:
+            raise TypeError("'molecules' must be of type 'BioSimSpace._SireWrappers.Molecule', "
+                            "'BioSimSpace._SireWrappers.System', or a list of "
+                            "'BioSimSpace._SireWrappers.Molecule' types.")
+
+        for mol in molecules:
+            # Sire systems can't contain two molecules with the same number,
+            # so give any duplicate a new, unique number.
+            if mol.number() in self._mol_nums:
+                mol = mol.edit().renumber().commit()
+
+            self._mol_nums.add(mol.number())
+            self._molecules.append(mol)
+
+    def nMolecules(self):
+        """Return the number of molecules that have been added.
+
+           Returns
+           -------
+
+           num_molecules : int
+               The number of molecules.
+        """
+        return len(self._molecules)
+
+    def commit(self, renumber=False):
+        """Create a system containing all of the molecules that have been
+           added.
+
+           Parameters
+           ----------
+
+           renumber : bool
+               Whether to renumber the residues and atoms in the system
+               consecutively, in the order that molecules were added.
+
+           Returns
+           -------
+
+           system : :class:`System <BioSimSpace._SireWrappers.System>`
+               The system.
+        """
+
+        if type(renumber) is not bool:
+            raise TypeError("'renumber' must be of type 'bool'")
+
+        if renumber:
+            molecules = _renumber(self._molecules)
+        else:
+            molecules = self._molecules
+
+        # Create a single "all" molecule group containing every molecule.
+        molgrp = _SireMol.MoleculeGroup("all")
+        for mol in molecules:
+            molgrp.add(mol)
+
+        # Create the Sire system.
+        sire_system = _SireSystem.System("BioSimSpace System")
+        sire_system.add(molgrp)
+
+        # Copy across any system properties.
+        for prop, value in self._properties.items():
+            sire_system.setProperty(prop, value)
+
+        system = _System(sire_system)
+
+        # Nothing else holds a reference to the Sire system, so there's no
+        # need to copy it when the system is modified.
+        system._is_shared = False
+
+        return system
+
+def _renumber(molecules):
+    """Internal function to renumber the residues and atoms in a list of
+       molecules consecutively, in a single pass.
+
+       Parameters
+       ----------
+
+       molecules : [Sire.Mol.Molecule]
+           The molecules.
+
+       Returns
+       -------
+
+       molecules : [Sire.Mol.Molecule]
+           The renumbered molecules.
+    """
+
+    num_residues = 0
+    num_atoms = 0
+
+    new_molecules = []
+
+    for mol in molecules:
+        edit_mol = mol.edit()
+
+        # Renumber the residues.
+        num_hash = {}
+        for res in edit_mol.residues():
+            num_residues += 1
+            num_hash[res.number()] = _SireMol.ResNum(num_residues)
+        edit_mol = edit_mol.renumber(num_hash).molecule()
+
+        # Renumber the atoms.
+        num_hash = {}
+        for atom in edit_mol.atoms():
+            num_atoms += 1
+            num_hash[atom.number()] = _SireMol.AtomNum(num_atoms)
+        edit_mol = edit_mol.renumber(num_hash).molecule()
+
+        new_molecules.append(edit_mol.commit())
+
+    return new_molecules
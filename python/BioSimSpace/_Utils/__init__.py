@@ -22,6 +22,14 @@
 """
 .. currentmodule:: BioSimSpace._Utils
 
+Functions
+=========
+
+.. autosummary::
+    :toctree: generated/
+
+    archive
+
 Context managers
 ================
 
@@ -29,6 +37,8 @@ Context managers
     :toctree: generated/
 
     cd
+    environ
 """
 
+from ._archive import *
 from ._contextmanagers import *
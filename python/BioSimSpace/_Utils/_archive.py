@@ -0,0 +1,428 @@
+######################################################################
+# BioSimSpace: Making biomolecular simulation a breeze!
+#
+# Copyright: 2017-2019
+#
+# Authors: Lester Hedges <lester.hedges@gmail.com>
+#
+# BioSimSpace is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# BioSimSpace is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BioSimSpace. If not, see <http://www.gnu.org/licenses/>.
+#####################################################################
+
+"""
+Utilities for archiving the contents of working directories.
+"""
+
+import concurrent.futures as _futures
+import fnmatch as _fnmatch
+import os as _os
+import struct as _struct
+import tempfile as _tempfile
+import threading as _threading
+import uuid as _uuid
+import zipfile as _zipfile
+
+__author__ = "Lester Hedges"
+__email_ = "lester.hedges@gmail.com"
+
+__all__ = ["archive"]
+
+# The supported compression codecs.
+_codecs = { "STORED" : _zipfile.ZIP_STORED,
+            "DEFLATED" : _zipfile.ZIP_DEFLATED,
+            "BZIP2" : _zipfile.ZIP_BZIP2,
+            "LZMA" : _zipfile.ZIP_LZMA }
+
+# The range of compression levels supported by each codec. The zipfile module
+# doesn't support setting the level for the other codecs.
+_levels = { _zipfile.ZIP_DEFLATED : range(0, 10),
+            _zipfile.ZIP_BZIP2 : range(1, 10) }
+
+# The size of the fixed part of a local file header, and the maximum size or
+# offset that can be stored without the Zip64 extensions.
+_local_size = 30
+_max_size = 0xFFFFFFFF
+
+# The files in each archive written by this module, along with their size and
+# modification time when they were archived. These are used to work out which
+# files have changed when an archive is updated.
+_manifests = {}
+_manifests_lock = _threading.Lock()
+
+def archive(directory, zipname, include=None, exclude=None, compression="stored",
+        level=None, workers=None, incremental=True):
+    """Archive the files in a directory to a zip file.
+
+       Parameters
+       ----------
+
+       directory : str
+           The directory containing the files to archive. Only files at the
+           top level of the directory are included.
+
+       zipname : str
+           The name of the zip file.
+
+       include : [str]
+           A list of glob patterns. Only files whose names match one of the
+           patterns are archived. By default, all files are archived.
+
+       exclude : [str]
+           A list of glob patterns for files to exclude, e.g. ["*.nc", "*.dcd"]
+           to skip trajectories.
+
+       compression : str
+           The compression codec: "stored", "deflated", "bzip2", or "lzma".
+
+       level : int
+           The compression level. Use None for the codec's default. Levels
+           are only supported by the "deflated" (0 to 9) and "bzip2" (1 to 9)
+           codecs.
+
+       workers : int
+           The number of threads used to compress files in parallel. By
+           default, one thread is used per CPU.
+
+       incremental : bool
+           Whether to update an archive previously written to the same path,
+           so that only files that have changed since it was written are
+           compressed. Unchanged files are copied from the existing archive
+           without being recompressed, and new files are appended in place
+           when nothing else has changed.
+
+       Returns
+       -------
+
+       zipname : str
+           The name of the zip file.
+    """
+
+    if type(directory) is not str:
+        raise TypeError("'directory' must be of type 'str'")
+
+    if not _os.path.isdir(directory):
+        raise IOError("Directory doesn't exist: '%s'" % directory)
+
+    if type(zipname) is not str:
+        raise TypeError("'zipname' must be of type 'str'")
+
+    include = _validate_patterns(include, "include")
+    exclude = _validate_patterns(exclude, "exclude")
+
+    if type(compression) is not str:
+        raise TypeError("'compression' must be of type 'str'")
+
+    try:
+        compress_type = _codecs[compression.upper().replace(" ", "")]
+    except KeyError:
+        raise ValueError("Unsupported compression codec '%s'. Options are: %s"
+            % (compression, ", ".join(codec.lower() for codec in _codecs))) from None
+
+    if level is not None:
+        if type(level) is not int:
+            raise TypeError("'level' must be of type 'int'")
+        if compress_type not in _levels:
+            raise ValueError("The '%s' codec doesn't support a compression level." % compression.lower())
+        if level not in _levels[compress_type]:
+            raise ValueError("The compression level for the '%s' codec must be between %d and %d."
+                % (compression.lower(), _levels[compress_type][0], _levels[compress_type][-1]))
+
+    if workers is None:
+        workers = _os.cpu_count() or 1
+    elif type(workers) is not int:
+        raise TypeError("'workers' must be of type 'int'")
+    elif workers < 1:
+        raise ValueError("'workers' must be greater than zero!")
+
+    if type(incremental) is not bool:
+        raise TypeError("'incremental' must be of type 'bool'")
+
+    # Find the files to archive, along with their current size and
+    # modification time. Never include the archive itself.
+    zippath = _os.path.abspath(zipname)
+    files = {}
+    for name in sorted(_os.listdir(directory)):
+        path = _os.path.join(directory, name)
+        if _os.path.abspath(path) == zippath or not _os.path.isfile(path):
+            continue
+        if any(_fnmatch.fnmatch(name, pattern) for pattern in include) and \
+            not any(_fnmatch.fnmatch(name, pattern) for pattern in exclude):
+            stat = _os.stat(path)
+            files[name] = (path, (stat.st_size, stat.st_mtime_ns))
+
+    # Work out which members of an existing archive can be reused. The archive
+    # itself must not have been modified by anything else, and must have been
+    # written with the same settings.
+    members = {}
+    if incremental:
+        with _manifests_lock:
+            entry = _manifests.get(zippath)
+        if entry is not None and _os.path.isfile(zippath):
+            stat = _os.stat(zippath)
+            zip_key, manifest, settings = entry
+            if zip_key == (stat.st_size, stat.st_mtime_ns) and \
+                settings == (compress_type, level):
+                members = manifest
+
+    # The members that are unchanged, and the files that need to be compressed.
+    unchanged = [name for name, key in members.items() if name in files and files[name][1] == key]
+    changed = [name for name in files if name not in unchanged]
+
+    # Nothing has changed.
+    if len(unchanged) == len(members) and len(changed) == 0:
+        return zipname
+
+    # The only changes are new files, so append them to the archive.
+    if len(members) > 0 and len(unchanged) == len(members):
+        with _zipfile.ZipFile(zipname, "a", compression=compress_type, compresslevel=level) as zip_file:
+            for name in changed:
+                zip_file.write(files[name][0], arcname=name)
+
+    # Otherwise, write a new archive, copying the compressed data for the
+    # unchanged members from the existing archive. The new archive replaces
+    # the existing one once it is complete.
+    else:
+        tmpname = "%s.%s.tmp" % (zippath, _uuid.uuid4().hex)
+
+        try:
+            # Compress the changed files in parallel, each to its own
+            # temporary archive, then merge these with the unchanged members.
+            if workers > 1 and len(changed) > 1:
+                with _tempfile.TemporaryDirectory(dir=_os.path.dirname(zippath)) as tmp_dir:
+                    def compress(index):
+                        name = changed[index]
+                        single = _os.path.join(tmp_dir, "%d.zip" % index)
+                        with _zipfile.ZipFile(single, "w", compression=compress_type, compresslevel=level) as zip_file:
+                            zip_file.write(files[name][0], arcname=name)
+                        return single
+
+                    with _futures.ThreadPoolExecutor(max_workers=min(workers, len(changed))) as pool:
+                        singles = list(pool.map(compress, range(0, len(changed))))
+
+                    _merge([(zippath, unchanged)] + [(single, [name]) for single, name in zip(singles, changed)],
+                        tmpname)
+
+            # Otherwise, copy the unchanged members and append the changed
+            # files directly.
+            else:
+                if len(unchanged) > 0:
+                    _merge([(zippath, unchanged)], tmpname)
+                    mode = "a"
+                else:
+                    mode = "w"
+
+                with _zipfile.ZipFile(tmpname, mode, compression=compress_type, compresslevel=level) as zip_file:
+                    for name in changed:
+                        zip_file.write(files[name][0], arcname=name)
+
+            _os.replace(tmpname, zippath)
+
+        except:
+            if _os.path.isfile(tmpname):
+                _os.remove(tmpname)
+            raise
+
+    # Record the state of the archive.
+    stat = _os.stat(zippath)
+    with _manifests_lock:
+        _manifests[zippath] = ((stat.st_size, stat.st_mtime_ns),
+            { name : files[name][1] for name in unchanged + changed }, (compress_type, level))
+
+    return zipname
+
+def _merge(sources, zipname):
+    """Internal function to write a zip file containing members of other zip
+       files. The compressed data for each member is copied byte for byte,
+       so nothing is recompressed. The records are written following the
+       zip file format specification, using the member information exposed
+       by zipfile.ZipInfo.
+
+       Parameters
+       ----------
+
+       sources : [(str, [str])]
+           The name of each source zip file, along with the names of the
+           members to copy from it.
+
+       zipname : str
+           The name of the zip file to write.
+    """
+
+    records = []
+
+    with open(zipname, "wb") as output:
+        for source, names in sources:
+            if len(names) == 0:
+                continue
+
+            with _zipfile.ZipFile(source) as zip_file, open(source, "rb") as input:
+                for name in names:
+                    info = zip_file.getinfo(name)
+
+                    # Work out the size of the local header, the compressed
+                    # data, and any data descriptor that follows it.
+                    input.seek(info.header_offset)
+                    header = input.read(_local_size)
+                    if len(header) != _local_size or header[:4] != b"PK\x03\x04":
+                        raise _zipfile.BadZipFile("Invalid local header for member '%s'" % name)
+                    name_size, extra_size = _struct.unpack("<2H", header[26:30])
+                    size = _local_size + name_size + extra_size + info.compress_size
+
+                    if info.flag_bits & 0x08:
+                        input.seek(info.header_offset + size)
+                        is_zip64 = info.file_size > _max_size or info.compress_size > _max_size
+                        size += (4 if input.read(4) == b"PK\x07\x08" else 0) + (20 if is_zip64 else 12)
+
+                    # Copy the record.
+                    offset = output.tell()
+                    input.seek(info.header_offset)
+                    _copy(input, output, size)
+
+                    records.append(_central_record(info, offset))
+
+        # Write the central directory.
+        start = output.tell()
+        for record in records:
+            output.write(record)
+        size = output.tell() - start
+
+        num = len(records)
+        if num >= 0xFFFF or start > _max_size or size > _max_size:
+            # Zip64 end of central directory record and locator.
+            end = output.tell()
+            output.write(_struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0,
+                num, num, size, start))
+            output.write(_struct.pack("<4sLQL", b"PK\x06\x07", 0, end, 1))
+            num = min(num, 0xFFFF)
+            size = min(size, _max_size)
+            start = min(start, _max_size)
+
+        output.write(_struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, num, num, size, start, 0))
+
+def _central_record(info, offset):
+    """Internal function to create the central directory record for a member.
+
+       Parameters
+       ----------
+
+       info : zipfile.ZipInfo
+           The member information.
+
+       offset : int
+           The offset of the local header of the member.
+
+       Returns
+       -------
+
+       record : bytes
+           The central directory record.
+    """
+
+    # Remove any existing Zip64 extra field, since the offset has changed.
+    extra = b""
+    data = info.extra
+    while len(data) >= 4:
+        tag, size = _struct.unpack("<2H", data[:4])
+        if tag != 0x0001:
+            extra += data[:4+size]
+        data = data[4+size:]
+
+    file_size = info.file_size
+    compress_size = info.compress_size
+
+    # Values that are too large are stored in a Zip64 extra field.
+    zip64 = []
+    if file_size > _max_size:
+        zip64.append(file_size)
+        file_size = _max_size
+    if compress_size > _max_size:
+        zip64.append(compress_size)
+        compress_size = _max_size
+    if offset > _max_size:
+        zip64.append(offset)
+        offset = _max_size
+
+    extract_version = info.extract_version
+    if len(zip64) > 0:
+        extra = _struct.pack("<2H%dQ" % len(zip64), 0x0001, 8*len(zip64), *zip64) + extra
+        extract_version = max(extract_version, 45)
+    create_version = max(info.create_version, extract_version)
+
+    if info.flag_bits & 0x800:
+        filename = info.filename.encode("utf-8")
+    else:
+        filename = info.filename.encode("cp437")
+
+    year, month, day, hour, minute, second = info.date_time
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+
+    return _struct.pack("<4s4B4HL2L5H2L", b"PK\x01\x02", create_version, info.create_system,
+        extract_version, 0, info.flag_bits, info.compress_type, dos_time, dos_date, info.CRC,
+        compress_size, file_size, len(filename), len(extra), len(info.comment), 0,
+        info.internal_attr, info.external_attr, offset) + filename + extra + info.comment
+
+def _copy(input, output, size, chunk_size=1 << 20):
+    """Internal function to copy a number of bytes between files.
+
+       Parameters
+       ----------
+
+       input : file
+           The file to read from.
+
+       output : file
+           The file to write to.
+
+       size : int
+           The number of bytes to copy.
+
+       chunk_size : int
+           The maximum number of bytes to copy at once.
+    """
+    while size > 0:
+        data = input.read(min(size, chunk_size))
+        if len(data) == 0:
+            raise _zipfile.BadZipFile("Unexpected end of file.")
+        output.write(data)
+        size -= len(data)
+
+def _validate_patterns(patterns, name):
+    """Internal helper function to validate a list of glob patterns.
+
+       Parameters
+       ----------
+
+       patterns : str, [str]
+           The patterns.
+
+       name : str
+           The name of the argument.
+
+       Returns
+       -------
+
+       patterns : [str]
+           The list of patterns.
+    """
+
+    if patterns is None:
+        return ["*"] if name == "include" else []
+
+    if type(patterns) is str:
+        patterns = [patterns]
+
+    if type(patterns) is not list or not all(type(x) is str for x in patterns):
+        raise TypeError("'%s' must be of type 'str', or a list of 'str' types." % name)
+
+    return patterns
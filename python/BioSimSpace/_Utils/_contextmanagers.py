@@ -26,16 +26,24 @@ Custom context managers.
 from contextlib import contextmanager as _contextmanager
 
 import os as _os
+import threading as _threading
 
 __author__ = "Lester Hedges"
 __email_ = "lester.hedges@gmail.com"
 
-__all__ = ["cd"]
+__all__ = ["cd", "environ"]
+
+# The working directory and environment are shared by all threads in the
+# process, so changes to them are serialised.
+_lock = _threading.RLock()
 
 # Adapted from: http://ralsina.me/weblog/posts/BB963.html
 @_contextmanager
 def cd(work_dir):
-    """Execute the context in the directory "work_dir"
+    """Execute the context in the directory "work_dir". The working directory
+       is shared by all threads, so only one thread can be inside this context
+       at a time. Code running in other threads at the same time should use
+       absolute paths.
 
        Parameters
        ----------
@@ -43,20 +51,53 @@ def cd(work_dir):
        work_dir : str
            The working directory for the context.
     """
-    # Store the current directory.
-    old_dir = _os.getcwd()
+    with _lock:
+        # Store the current directory.
+        old_dir = _os.getcwd()
+
+        # Create the working directory if it doesn't exist.
+        if not _os.path.isdir(work_dir):
+            _os.makedirs(work_dir)
+
+        # Change to the new directory.
+        _os.chdir(work_dir)
 
-    # Create the working directory if it doesn't exist.
-    if not _os.path.isdir(work_dir):
-        _os.makedirs(work_dir)
+        # Execute the context.
+        try:
+            yield
+
+        # Return to original directory.
+        finally:
+            _os.chdir(old_dir)
+
+@_contextmanager
+def environ(variables):
+    """Execute the context with additional environment variables set. Any
+       existing values are restored on exit. As for "cd", only one thread can
+       be inside this context at a time.
+
+       Parameters
+       ----------
+
+       variables : dict
+           A dictionary mapping environment variable names to their values.
+    """
+    with _lock:
+        # Store the current values.
+        old_values = { name : _os.environ.get(name) for name in variables }
 
-    # Change to the new directory.
-    _os.chdir(work_dir)
+        # Set the new values.
+        for name, value in variables.items():
+            _os.environ[name] = str(value)
 
-    # Execute the context.
-    try:
-        yield
+        # Execute the context.
+        try:
+            yield
 
-    # Return to original directory.
-    finally:
-        _os.chdir(old_dir)
+        # Restore the original values.
+        finally:
+            for name, value in old_values.items():
+                if value is None:
+                    _os.environ.pop(name, None)
+                else:
+                    _os.environ[name] = value
@@ -1,9 +1,14 @@
 from Sire.MM import InternalFF, IntraCLJFF, IntraFF
-from Sire.Mol import AtomIdx, PartialMolecule
+from Sire.Mol import AtomIdx, PartialMolecule, ResIdx
 
 import BioSimSpace as BSS
 
+from BioSimSpace._SireWrappers._molecule import _bonded_term_keys, _improper_key, _match_bonded_terms, \
+                                                 _merge_region, _validate_connectivity
+
+import numpy as np
 import pytest
+import random
 
 # Parameterise the function with a set of valid atom pre-matches.
 @pytest.mark.parametrize("prematch", [{AtomIdx(3) : AtomIdx(1)},
@@ -156,6 +161,34 @@ def test_merge():
 
     assert internalff1.energy().value() == pytest.approx(internalff2.energy().value())
 
+def test_merged_coordinates():
+    # Load the ligands.
+    s0 = BSS.IO.readMolecules(BSS.IO.glob("test/io/ligands/ligand01*"))
+    s1 = BSS.IO.readMolecules(BSS.IO.glob("test/io/ligands/ligand02*"))
+
+    # Extract the molecules.
+    m0 = s0.getMolecules()[0]
+    m1 = s1.getMolecules()[0]
+
+    # Create the merged molecule.
+    mapping = BSS.Align.matchAtoms(m0, m1, timeout=BSS.Units.Time.second)
+    m0 = BSS.Align.rmsdAlign(m0, m1, mapping)
+    m2 = BSS.Align.merge(m0, m1, mapping)
+
+    # The coordinates at lambda = 0 are used by default.
+    coordinates0 = m2.getCoordinates()
+    coordinates1 = m2.getCoordinates(is_lambda1=True)
+    assert coordinates0.shape == coordinates1.shape == (m2.nAtoms(), 3)
+
+    # The property map is used to choose the end state properties.
+    assert np.array_equal(m2.getCoordinates({ "coordinates0" : "coordinates1" }), coordinates1)
+
+    # Translating a system moves the coordinates at lambda = 0.
+    system = m2.toSystem()
+    system.translate([1, 2, 3])
+    assert np.allclose(system.getCoordinates(), coordinates0 + [1, 2, 3])
+    assert np.allclose(system.getCoordinates(is_lambda1=True), coordinates1)
+
 def test_ring_breaking_five_membered():
     # Load the ligands.
     s0 = BSS.IO.readMolecules(BSS.IO.glob("test/io/ligands/ligand31*"))
@@ -200,6 +233,239 @@ def test_ring_breaking_six_membered():
     # Now check that we can merge if we allow ring breaking.
     m2 = BSS.Align.merge(m0, m1, mapping, allow_ring_breaking=True)
 
+@pytest.mark.parametrize("allow_ring_breaking", [False, True])
+def test_validate_connectivity(allow_ring_breaking):
+    # Compare the connectivity validation used by merge against a check of
+    # every pair of atoms on randomly perturbed bond graphs. The perturbations
+    # add and remove bonds, so they open and close rings as well as changing
+    # the connectivity elsewhere.
+    rng = random.Random(42)
+
+    errors = set()
+    for _ in range(0, 500):
+        # Create a random end state, which is a tree with some extra bonds to
+        # form rings.
+        num_atoms = rng.randint(4, 12)
+        bonds = {(rng.randrange(0, x), x) for x in range(1, num_atoms)}
+        for _ in range(0, rng.randint(0, 3)):
+            x, y = sorted(rng.sample(range(0, num_atoms), 2))
+            bonds.add((x, y))
+        conn0 = _Connectivity(num_atoms, bonds)
+
+        # Place the end state in a merged molecule with some extra atoms.
+        num_merged = num_atoms + rng.randint(0, 3)
+        mapping = rng.sample(range(0, num_merged), num_atoms)
+        merged_bonds = {tuple(sorted((mapping[x], mapping[y]))) for x, y in bonds}
+
+        # Bond each extra atom to an existing atom.
+        for x in range(0, num_merged):
+            if x not in mapping:
+                merged_bonds.add(tuple(sorted((x, rng.choice(mapping)))))
+
+        # Perturb the bonds of the merged molecule.
+        for _ in range(0, rng.randint(0, 2)):
+            if len(merged_bonds) > 0 and rng.random() < 0.5:
+                merged_bonds.discard(rng.choice(sorted(merged_bonds)))
+            else:
+                x, y = sorted(rng.sample(range(0, num_merged), 2))
+                merged_bonds.add((x, y))
+        conn1 = _Connectivity(num_merged, merged_bonds)
+
+        mapping = [AtomIdx(x) for x in mapping]
+
+        expected = _validate_all_pairs(conn0, conn1, mapping, allow_ring_breaking)
+        try:
+            _validate_connectivity(conn0, conn1, mapping, allow_ring_breaking)
+            error = None
+        except BSS._Exceptions.IncompatibleError as e:
+            error = str(e)
+
+        assert error == expected
+        errors.add(error)
+
+    # Make sure that the valid and every invalid outcome were tested.
+    if allow_ring_breaking:
+        assert len(errors) == 2
+    else:
+        assert len(errors) == 3
+
+def test_match_impropers():
+    # Two impropers over the same atoms, but with a different central atom,
+    # share a canonical key. Neither should be lost when matching the terms
+    # at each end state.
+    info = _MoleculeInfo()
+    impropers0 = [_Potential(0, 1, 2, 3), _Potential(1, 0, 2, 3), _Potential(4, 5, 6, 7)]
+    impropers1 = [_Potential(3, 2, 1, 0), _Potential(1, 0, 2, 3)]
+
+    keys0 = _bonded_term_keys(info, impropers0, _improper_key)
+    keys1 = _bonded_term_keys(info, impropers1, _improper_key)
+    assert keys0[(0, 1, 2, 3)] == [((0, 1, 2, 3), 0), ((1, 0, 2, 3), 1)]
+
+    unique0, unique1, shared = _match_bonded_terms(keys0, keys1)
+
+    # Terms with the same atom ordering are paired first.
+    assert sorted(shared) == [(0, 0), (1, 1)]
+    assert unique0 == [2]
+    assert unique1 == []
+
+    # An extra term with a shared key is unique to its end state.
+    impropers1.append(_Potential(2, 1, 0, 3))
+    keys1 = _bonded_term_keys(info, impropers1, _improper_key)
+    unique0, unique1, shared = _match_bonded_terms(keys0, keys1)
+    assert sorted(shared) == [(0, 0), (1, 1)]
+    assert unique0 == [2]
+    assert unique1 == [2]
+
+def test_merge_roi():
+    # Load the ligands.
+    s0 = BSS.IO.readMolecules(BSS.IO.glob("test/io/ligands/ligand01*"))
+    s1 = BSS.IO.readMolecules(BSS.IO.glob("test/io/ligands/ligand02*"))
+
+    # Extract the molecules.
+    m0 = s0.getMolecules()[0]
+    m1 = s1.getMolecules()[0]
+
+    # Get the best mapping between the molecules.
+    mapping = BSS.Align.matchAtoms(m0, m1, timeout=BSS.Units.Time.second)
+
+    # Align m0 to m1 based on the mapping.
+    m0 = BSS.Align.rmsdAlign(m0, m1, mapping)
+
+    # Create the merged molecule for the whole ligand.
+    m2 = BSS.Align.merge(m0, m1, mapping)
+
+    # The ligand is a single residue, so a residue-local merge of that residue
+    # should match the whole molecule merge.
+    m3 = BSS.Align.merge(m0, m1, mapping, roi="auto")
+
+    # The residue of molecule0 is preserved.
+    assert m3._sire_molecule.residue().name() == m0._sire_molecule.residue().name()
+
+    for prop in ["charge0", "charge1", "LJ0", "LJ1"]:
+        assert m2._sire_molecule.property(prop) == m3._sire_molecule.property(prop)
+
+    # Check that the intrascale matrices match.
+    num_atoms = m2._sire_molecule.nAtoms()
+    for prop in ["intrascale0", "intrascale1"]:
+        intra2 = m2._sire_molecule.property(prop)
+        intra3 = m3._sire_molecule.property(prop)
+        for x in range(0, num_atoms):
+            for y in range(x+1, num_atoms):
+                assert intra2.get(AtomIdx(x), AtomIdx(y)) == intra3.get(AtomIdx(x), AtomIdx(y))
+
+    for prop in ["bond", "angle", "dihedral", "improper"]:
+        for end_state in ["0", "1"]:
+            assert m2._sire_molecule.property(prop + end_state).nFunctions() == \
+                   m3._sire_molecule.property(prop + end_state).nFunctions()
+
+    # The ligand only has a single residue, so this index is out of range.
+    with pytest.raises(ValueError):
+        BSS.Align.merge(m0, m1, mapping, roi=[1])
+
+    # A region of interest that doesn't contain the perturbed atoms is invalid.
+    with pytest.raises(BSS._Exceptions.IncompatibleError):
+        BSS.Align.merge(m0, m1, mapping, roi=[])
+
+def test_merge_roi_mutation(tmpdir):
+    # Load the alanine dipeptide, which has ACE, ALA, and NME residues.
+    s0 = BSS.IO.readMolecules(["test/io/amber/ala/ala.top", "test/io/amber/ala/ala.crd"])
+
+    # Use the same molecule for both end states. Leaving the side chain of the
+    # ALA residue out of the mapping creates a point mutation, where the atoms
+    # in the side chain are unique to each end state.
+    m0 = s0.getMolecules()[0]
+    m1 = s0.getMolecules()[0]
+
+    side_chain = ["CB", "HB1", "HB2", "HB3"]
+    mapping = {}
+    for atom in m0._sire_molecule.atoms():
+        if atom.residue().name().value() != "ALA" or atom.name().value() not in side_chain:
+            mapping[atom.index()] = atom.index()
+    num_unique = m0.nAtoms() - len(mapping)
+    assert num_unique == len(side_chain)
+
+    # The ALA residue is detected as the region of interest.
+    region0, region1, residues1 = _merge_region(m0._sire_molecule, m1._sire_molecule, mapping, "auto")
+    ala = m0._sire_molecule.residue(ResIdx(1))
+    assert ala.name().value() == "ALA"
+    assert region0 == { atom.index().value() for atom in ala.atoms() }
+    assert region1 == region0
+    assert set(residues1.values()) == {1}
+
+    # Create the merged molecule for the whole molecule, and residue-local
+    # merges with the detected and explicit regions of interest.
+    m2 = BSS.Align.merge(m0, m1, mapping)
+    m3 = BSS.Align.merge(m0, m1, mapping, roi="auto")
+    m4 = BSS.Align.merge(m0, m1, mapping, roi=[1])
+
+    # The residues of molecule0 are created.
+    residues = m3._sire_molecule.residues()
+    assert [res.name().value() for res in residues] == ["ACE", "ALA", "NME"]
+    assert [res.name().value() for res in m4._sire_molecule.residues()] == ["ACE", "ALA", "NME"]
+
+    # The atoms that are unique to molecule1 are added to the end of the ALA
+    # residue, so the atoms in each residue are contiguous.
+    assert m3.nAtoms() == m0.nAtoms() + num_unique
+    assert residues[1].nAtoms() == ala.nAtoms() + num_unique
+    start = 0
+    for res in residues:
+        assert sorted(atom.index().value() for atom in res.atoms()) == \
+               list(range(start, start + res.nAtoms()))
+        start += res.nAtoms()
+    end = max(atom.index().value() for atom in ala.atoms()) + 1
+    for x in range(end, end + num_unique):
+        atom = m3._sire_molecule.atom(AtomIdx(x))
+        assert atom.residue().index() == ResIdx(1)
+        assert atom.name().value() in side_chain
+
+    # The whole molecule merge adds the unique atoms after the NME residue.
+    # Work out the index in that merge of each atom in the residue-local merge.
+    perm = list(range(0, end)) + list(range(m0.nAtoms(), m3.nAtoms())) + list(range(end, m0.nAtoms()))
+
+    # The perturbed properties match the whole molecule merge.
+    for prop in ["name0", "name1", "charge0", "charge1", "LJ0", "LJ1", "ambertype0", "ambertype1"]:
+        assert [m2._sire_molecule.atom(AtomIdx(x)).property(prop) for x in perm] == \
+               [m3._sire_molecule.atom(AtomIdx(x)).property(prop) for x in range(0, m3.nAtoms())]
+        assert m3._sire_molecule.property(prop) == m4._sire_molecule.property(prop)
+
+    # So do the numbers of bonded terms.
+    for prop in ["bond", "angle", "dihedral", "improper"]:
+        for suffix in ["0", "1"]:
+            assert m2._sire_molecule.property(prop + suffix).nFunctions() == \
+                   m3._sire_molecule.property(prop + suffix).nFunctions()
+
+    # The residue of a unique atom in molecule0 must be in the region of interest.
+    with pytest.raises(BSS._Exceptions.IncompatibleError):
+        BSS.Align.merge(m0, m1, mapping, roi=[0])
+
+    # Write the perturbation files for the whole molecule and residue-local
+    # merges, along with the molecule at lambda = 0.
+    pert2 = str(tmpdir.join("whole.pert"))
+    pert3 = str(tmpdir.join("roi.pert"))
+    m2._toPertFile(pert2)
+    mol = m3._toPertFile(pert3)
+    files = BSS.IO.saveMolecules(str(tmpdir.join("roi")), mol.toSystem(),
+                                 ["gro87", "grotop", "prm7", "rst7"])
+    assert len(files) == 4
+
+    # The residues are preserved in the molecule at lambda = 0.
+    assert [res.name().value() for res in mol._sire_molecule.residues()] == ["ACE", "ALA", "NME"]
+
+    # The residues are contiguous, so the AMBER topology can be read back.
+    s = BSS.IO.readMolecules([str(tmpdir.join("roi.prm7")), str(tmpdir.join("roi.rst7"))])
+    residues = s.getMolecules()[0]._sire_molecule.residues()
+    assert [res.name().value() for res in residues] == ["ACE", "ALA", "NME"]
+    assert s.nAtoms() == m3.nAtoms()
+
+    # Duplicate atom names in a perturbation file are given a random suffix,
+    # so compare the records without the atom names.
+    def records(file_name):
+        with open(file_name, "r") as file:
+            return sorted(line.strip() for line in file if len(line.split()) > 0 and
+                          line.split()[0] not in ["name", "atom0", "atom1", "atom2", "atom3"])
+
+    assert records(pert2) == records(pert3)
+
 def _load_mapping(file_name):
     """Internal function to load a mapping from file."""
 
@@ -210,3 +476,99 @@ def _load_mapping(file_name):
             mapping[AtomIdx(int(indices[0]))] = AtomIdx(int(indices[1]))
 
     return mapping
+
+class _Connectivity():
+    """A minimal stand-in for Sire.Mol.Connectivity, built from a list of
+       bonds.
+    """
+
+    def __init__(self, num_atoms, bonds):
+        self._bonded = {x : set() for x in range(0, num_atoms)}
+        for x, y in bonds:
+            self._bonded[x].add(y)
+            self._bonded[y].add(x)
+
+    def connectionsTo(self, idx):
+        return [AtomIdx(y) for y in sorted(self._bonded[idx.value()])]
+
+    def connectionType(self, idx, idy):
+        # The number of bonds between the atoms, or zero if they are more than
+        # three bonds apart.
+        x, y = idx.value(), idy.value()
+        visited = {x}
+        frontier = {x}
+        for num_bonds in range(1, 4):
+            frontier = {z for w in frontier for z in self._bonded[w] if z not in visited}
+            if y in frontier:
+                return num_bonds
+            visited.update(frontier)
+        return 0
+
+    def inRing(self, idx):
+        # An atom is in a ring if it is still connected to one of its bonded
+        # neighbours once the bond between them is removed.
+        x = idx.value()
+        for y in self._bonded[x]:
+            visited = {x}
+            frontier = [z for z in self._bonded[x] if z != y]
+            while len(frontier) > 0:
+                z = frontier.pop()
+                if z == y:
+                    return True
+                if z not in visited:
+                    visited.add(z)
+                    frontier.extend(self._bonded[z])
+        return False
+
+def _validate_all_pairs(conn0, conn1, mapping, allow_ring_breaking):
+    """Internal function to validate a merge by checking every pair of atoms.
+       This returns the error message, or None if the merge is valid.
+    """
+
+    def is_ring_broken(idx0, idy0, idx1, idy1):
+        return (conn0.inRing(idx0) & conn0.inRing(idy0)) ^ (conn1.inRing(idx1) & conn1.inRing(idy1))
+
+    for x in range(0, len(mapping)):
+        idx = AtomIdx(x)
+        for y in range(x+1, len(mapping)):
+            idy = AtomIdx(y)
+            if conn0.connectionType(idx, idy) != conn1.connectionType(mapping[x], mapping[y]):
+                if allow_ring_breaking:
+                    if not is_ring_broken(idx, idy, mapping[x], mapping[y]):
+                        return ("The merge has changed the molecular connectivity! "
+                                "Check your atom mapping.")
+                else:
+                    return ("The merge has changed the molecular connectivity! "
+                            "If you want to open/close a ring, then set the "
+                            "'allow_ring_breaking' option to 'True'.")
+            elif not allow_ring_breaking:
+                if is_ring_broken(idx, idy, mapping[x], mapping[y]):
+                    return ("The merge has changed opened/closed a ring! "
+                            "If you want to allow this perturbation, then set the "
+                            "'allow_ring_breaking' option to 'True'.")
+
+    return None
+
+class _MoleculeInfo():
+    """A minimal stand-in for Sire.Mol.MoleculeInfo."""
+
+    def atomIdx(self, idx):
+        return idx
+
+class _Potential():
+    """A minimal stand-in for Sire.MM.FourAtomFunction."""
+
+    def __init__(self, idx0, idx1, idx2, idx3):
+        self._idxs = [AtomIdx(idx0), AtomIdx(idx1), AtomIdx(idx2), AtomIdx(idx3)]
+
+    def atom0(self):
+        return self._idxs[0]
+
+    def atom1(self):
+        return self._idxs[1]
+
+    def atom2(self):
+        return self._idxs[2]
+
+    def atom3(self):
+        return self._idxs[3]
@@ -4,6 +4,7 @@ from collections import OrderedDict
 
 import os
 import pytest
+import timeit
 
 # Make sure AMBER is installed.
 if BSS._amber_home is not None:
@@ -176,6 +177,103 @@ def test_args():
     assert len(arg_string_list) == 17
     assert arg_string == "-x X -a A -b B -y -e -f 6 -g -h H -k K -z Z"
 
+def test_nrg_parser(tmpdir):
+    """Test incremental parsing of the energy info file."""
+
+    from BioSimSpace.Process._amber import _NrgParser
+
+    nrg_file = str(tmpdir.join("test.nrg"))
+
+    # Create an empty energy info file.
+    open(nrg_file, "w").close()
+
+    # Create the parser.
+    parser = _NrgParser(nrg_file)
+
+    # There are no records.
+    assert parser.update() == []
+
+    # Write a complete record followed by a partial record.
+    with open(nrg_file, "w") as file:
+        file.write(nrg_record(1) + nrg_record(2)[:50])
+
+    # Only the complete record should be parsed.
+    records = parser.update()
+    assert len(records) == 1
+    assert records[0][0] == ("NSTEP", "1")
+    assert ("EPTOT", "-13580.2467") in records[0]
+
+    # Nothing has changed.
+    assert parser.update() == []
+
+    # Complete the partial record.
+    with open(nrg_file, "a") as file:
+        file.write(nrg_record(2)[50:])
+
+    records = parser.update()
+    assert len(records) == 1
+    assert records[0][0] == ("NSTEP", "2")
+
+    # Rewrite the file with an unterminated record.
+    with open(nrg_file, "w") as file:
+        file.write(nrg_record(3, separator=False))
+
+    # The record should only be returned when flushed.
+    assert parser.update() == []
+    records = parser.update(flush=True)
+    assert len(records) == 1
+    assert records[0][0] == ("NSTEP", "3")
+
+    # Rewrite the file with a truncated record. This should be discarded.
+    with open(nrg_file, "w") as file:
+        file.write(nrg_record(4)[:100])
+
+    assert parser.update(flush=True) == []
+
+@pytest.mark.skipif("BSS_BENCHMARK" not in os.environ, reason="Set BSS_BENCHMARK to run benchmarks.")
+def test_nrg_parser_benchmark(tmpdir):
+    """Benchmark incremental parsing of a large energy info file."""
+
+    from BioSimSpace.Process._amber import _NrgParser
+
+    nrg_file = str(tmpdir.join("test.nrg"))
+
+    # Write a synthetic file containing one million records.
+    num_records = 1000000
+    with open(nrg_file, "w") as file:
+        for x in range(1, num_records + 1):
+            file.write(nrg_record(x))
+
+    parser = _NrgParser(nrg_file)
+
+    # Time the parse of the entire file.
+    start = timeit.default_timer()
+    assert len(parser.update()) == num_records
+    full = timeit.default_timer() - start
+
+    # Append a single record and time the incremental update.
+    with open(nrg_file, "a") as file:
+        file.write(nrg_record(num_records + 1))
+
+    start = timeit.default_timer()
+    assert len(parser.update()) == 1
+    incremental = timeit.default_timer() - start
+
+    # The cost of an update should be independent of the file size.
+    assert incremental < 1e-3 * full
+
+def nrg_record(step, separator=True):
+    """Helper function to create a synthetic energy info record."""
+
+    record = (" NSTEP = %8d   TIME(PS) = %11.3f  TEMP(K) =   301.23  PRESS =     0.0\n"
+              " Etot   =    -12345.6789  EKtot   =      1234.5678  EPtot      =    -13580.2467\n"
+              " BOND   =        12.3456  ANGLE   =        34.5678  DIHED      =        56.7890\n") % (step, 0.002*step)
+
+    if separator:
+        record += " " + 78*"-" + "\n"
+
+    return record
+
 def create_process(protocol):
     """Create an Amber process for a given prototol."""
 
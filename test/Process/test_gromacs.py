@@ -59,7 +59,106 @@ def test_production():
     # Run the process and check that it finishes without error.
     assert run_process(protocol)
 
-def create_process(protocol):
+@pytest.mark.skipif(has_gromacs is False, reason="Requires GROMACS to be installed.")
+def test_edr():
+    """Test reading records from the binary energy file."""
+
+    # Create a short production protocol.
+    protocol = BSS.Protocol.Production(runtime=BSS.Types.Time(0.001, "nanoseconds"))
+
+    # Initialise a process that reads records from the energy file.
+    process = create_process(protocol, use_edr=True)
+
+    # Run the process.
+    process.start()
+    process.wait()
+
+    assert not process.isError()
+
+    # There should be a record for each energy output step.
+    steps = process.getStep(time_series=True)
+    times = process.getTime(time_series=True)
+    energies = process.getPotentialEnergy(time_series=True)
+    assert len(steps) > 0
+    assert len(steps) == len(times) == len(energies)
+
+@pytest.mark.skipif(has_gromacs is False, reason="Requires GROMACS to be installed.")
+def test_edr_fallback():
+    """Test falling back to the log file for an unsupported energy file."""
+
+    import struct
+
+    # Create a short production protocol.
+    protocol = BSS.Protocol.Production(runtime=BSS.Types.Time(0.001, "nanoseconds"))
+
+    # Initialise a process that reads records from the energy file.
+    process = create_process(protocol, use_edr=True)
+    process._edr_reader = BSS.Process._gromacs._EdrReader(process._edr_file)
+
+    # Write an energy file with an invalid header.
+    with open(process._edr_file, "wb") as file:
+        file.write(struct.pack(">ii", 12345, 0))
+
+    # Updating the records should warn and switch to the log file.
+    with pytest.warns(UserWarning, match="Falling back to parsing the log file"):
+        process._update_stdout_dict()
+    assert process._edr_reader is None
+
+    # Subsequent updates no longer touch the energy file.
+    process._update_stdout_dict()
+
+@pytest.mark.skipif(has_gromacs is False, reason="Requires GROMACS to be installed.")
+def test_resources(monkeypatch):
+    """Test restricting the hardware resources used by the process."""
+
+    from BioSimSpace.Process import _gromacs
+
+    # Create a short production protocol.
+    protocol = BSS.Protocol.Production(runtime=BSS.Types.Time(0.001, "nanoseconds"))
+
+    # Initialise the process.
+    process = create_process(protocol)
+
+    # Assign two threads and a GPU to a thread-MPI build.
+    monkeypatch.setitem(_gromacs._thread_mpi, process._exe, True)
+    process._setResources(2, ["1"])
+
+    # Check the command-line and environment.
+    assert "-nt 2" in process.getArgString()
+    assert "-ntomp 2" in process.getArgString()
+    assert process._getEnvironment() == { "OMP_NUM_THREADS" : "2", "CUDA_VISIBLE_DEVICES" : "1" }
+
+    # Builds that use an external MPI library don't accept -nt.
+    monkeypatch.setitem(_gromacs._thread_mpi, process._exe, False)
+    process._setResources(2, ["1"])
+    assert "-nt" not in process.getArgStringList()
+    assert "-ntomp 2" in process.getArgString()
+
+    # Remove the restrictions.
+    process._setResources()
+    assert "-nt" not in process.getArgStringList()
+    assert process._getEnvironment() == {}
+
+def test_thread_mpi(tmpdir, monkeypatch):
+    """Test detecting whether GROMACS was built with thread-MPI."""
+
+    from BioSimSpace.Process import _gromacs
+
+    # Use an empty cache for this test.
+    monkeypatch.setattr(_gromacs, "_thread_mpi", {})
+
+    # Create stand-in executables that report their MPI library.
+    for name, library, is_thread_mpi in [("gmx", "thread_mpi", True), ("gmx_mpi", "MPI", False)]:
+        exe = tmpdir.join(name)
+        exe.write("#!/bin/sh\necho 'MPI library:        %s'\n" % library)
+        exe.chmod(0o755)
+        assert _gromacs._is_thread_mpi(str(exe)) is is_thread_mpi
+
+    # Fall back to the name of the executable if it can't be run.
+    assert _gromacs._is_thread_mpi(str(tmpdir.join("gmx_mpi_d"))) is False
+    assert _gromacs._is_thread_mpi(str(tmpdir.join("gmx_d"))) is True
+
+def create_process(protocol, use_edr=False):
     """Create an Amber process for a given prototol."""
 
     # Glob the input files.
@@ -69,7 +168,7 @@ def create_process(protocol):
     system = BSS.IO.readMolecules(files)
 
     # Initialise the GROMACS process.
-    return BSS.Process.Gromacs(system, protocol, name="test")
+    return BSS.Process.Gromacs(system, protocol, name="test", use_edr=use_edr)
 
 def run_process(protocol):
     """Helper function to run various simulation protocols."""
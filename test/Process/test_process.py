@@ -0,0 +1,771 @@
+from BioSimSpace.Process._cluster import _FileTracker, _apply_changes, _run_worker
+from BioSimSpace.Process._convergence import ConvergencePolicy
+from BioSimSpace.Process._monitor import _Monitor
+from BioSimSpace.Process._process import _RecordStore, _reverse_lines, _tail
+from BioSimSpace.Process._process_runner import _allocate, _schedule
+from BioSimSpace.Process._statistics import _OnlineStatistics
+from BioSimSpace.Process._task import Task
+
+import BioSimSpace as BSS
+
+import asyncio
+import multiprocessing
+import numpy as np
+import os
+import pytest
+import threading
+import time
+import zipfile
+
+def test_record_store():
+    """Test the columnar record store."""
+
+    store = _RecordStore(int_keys=["STEP"])
+
+    # The store is empty.
+    assert len(store) == 0
+
+    # Add enough records to force the columns to grow.
+    for x in range(100):
+        store["STEP"] = str(x)
+        store["ENERGY"] = "%.4f" % (0.5 * x)
+
+    # Make sure the columns have the correct size and type.
+    assert len(store) == 2
+    assert len(store["STEP"]) == 100
+    assert store["STEP"].dtype.kind == "i"
+    assert store["ENERGY"].dtype.kind == "f"
+
+    # Check the most recent values.
+    assert store.last("STEP") == 99
+    assert store.last("ENERGY") == pytest.approx(49.5)
+
+    # Time series are read-only views.
+    time_series = store.timeSeries("ENERGY")
+    assert time_series[10] == pytest.approx(5.0)
+    with pytest.raises(ValueError):
+        time_series[0] = 1.0
+
+    # Typed time series share a single unit.
+    time_series = store.timeSeries("ENERGY", BSS.Units.Energy.kcal_per_mol)
+    assert len(time_series) == 100
+    assert time_series[-1] == 49.5 * BSS.Units.Energy.kcal_per_mol
+    assert time_series.magnitudes()[-1] == pytest.approx(49.5)
+
+    # Copies are independent of the store.
+    records = store.copy()
+    store["ENERGY"] = "1.0"
+    assert len(records["ENERGY"]) == 100
+
+    # Missing records raise a KeyError.
+    with pytest.raises(KeyError):
+        store.last("VOLUME")
+
+    # Arrays of values can be appended in one go.
+    store.extend("GRADIENT", np.arange(1000))
+    store.extend("GRADIENT", np.arange(10))
+    assert len(store["GRADIENT"]) == 1010
+    assert store.last("GRADIENT") == pytest.approx(9.0)
+
+def test_record_store_truncate():
+    """Test discarding records written after a checkpoint."""
+
+    store = _RecordStore(int_keys=["STEP"])
+    for x in range(10):
+        store["STEP"] = str(100*x)
+        store["ENERGY"] = str(x)
+
+    # Keep the records up to, and including, the checkpoint step.
+    store.truncate("STEP", 450)
+    assert list(store["STEP"]) == [0, 100, 200, 300, 400]
+    assert len(store["ENERGY"]) == 5
+
+    # New records continue from the checkpoint.
+    store["STEP"] = "500"
+    store["ENERGY"] = "5"
+    assert store.last("STEP") == 500
+    assert store.last("ENERGY") == pytest.approx(5.0)
+
+    # Truncating beyond the final record does nothing.
+    store.truncate("STEP", 1000)
+    assert len(store["STEP"]) == 6
+
+def test_record_store_malformed():
+    """Test that malformed values are stored as missing."""
+
+    store = _RecordStore(int_keys=["STEP"])
+
+    # Malformed values are handled the same way for both column types.
+    store["STEP"] = "1"
+    store["ENERGY"] = "*******"
+    store["STEP"] = "*******"
+    store["ENERGY"] = "2.0"
+
+    assert len(store["STEP"]) == 2
+    assert len(store["ENERGY"]) == 2
+    assert np.isnan(store["ENERGY"][0])
+    assert store["STEP"][1] is np.ma.masked
+    assert store["STEP"].count() == 1
+    assert store.last("STEP") is None
+    assert store.record(1) == {"STEP": None, "ENERGY": 2.0}
+
+    # The same applies to arrays of values.
+    store.extend("STEP", ["3", "NaN", "4"])
+    assert store["STEP"][2] == 3
+    assert store["STEP"][3] is np.ma.masked
+    assert list(store["STEP"].compressed()) == [1, 3, 4]
+    assert store.last("STEP") == 4
+
+def test_record_store_partial():
+    """Test that partially written records aren't counted."""
+
+    store = _RecordStore(int_keys=["STEP"])
+    for x in range(2):
+        store["STEP"] = str(x)
+        store["ENERGY"] = str(x)
+
+    # Start writing the next record.
+    store["STEP"] = "2"
+    assert store.nRecords() == 2
+    assert store.record(1) == {"STEP": 1, "ENERGY": 1.0}
+
+    # Complete the record.
+    store["ENERGY"] = "2"
+    assert store.nRecords() == 3
+
+def test_online_statistics():
+    """Test running statistics for correlated time series."""
+
+    # Generate a correlated AR(1) time series with a large mean.
+    rng = np.random.default_rng(42)
+    phi = 0.8
+    noise = rng.normal(size=20000)
+    series = np.empty(len(noise))
+    series[0] = noise[0]
+    for x in range(1, len(noise)):
+        series[x] = phi*series[x-1] + noise[x]
+    series += 1000
+
+    # Add the samples in chunks of varying size.
+    stats = _OnlineStatistics()
+    for chunk in np.array_split(series, 123):
+        stats.update(chunk)
+
+    assert stats.nSamples() == len(series)
+    assert stats.mean() == pytest.approx(series.mean())
+    assert stats.variance() == pytest.approx(series.var(ddof=1))
+
+    # Compute the statistical inefficiency directly.
+    mean = series.mean()
+    variance = series.var()
+    g = 1
+    for lag in range(1, 201):
+        correlation = np.sum((series[lag:] - mean) * (series[:-lag] - mean)) / (len(series) - lag) / variance
+        if correlation <= 0:
+            break
+        g += 2 * correlation * (1 - lag/len(series))
+
+    assert stats.statisticalInefficiency() == pytest.approx(g)
+
+    # The exact value for an AR(1) process is (1 + phi) / (1 - phi). The
+    # estimate is noisy, so only check that it is roughly correct.
+    assert stats.statisticalInefficiency() == pytest.approx((1 + phi) / (1 - phi), rel=0.5)
+
+    # The blocking estimate should agree with the correlated standard error.
+    assert stats.blockStandardError() == pytest.approx(stats.standardError(), rel=0.3)
+
+    # The statistics don't depend on how the samples were chunked.
+    single = _OnlineStatistics()
+    single.update(series)
+    for key, value in stats.summary().items():
+        assert single.summary()[key] == pytest.approx(value)
+
+class _DensityProcess():
+    """A mock process that generates density records."""
+
+    def __init__(self, density):
+        self._density = density
+
+    def getCurrentDensity(self, time_series=False):
+        return self._density
+
+def test_convergence_policy():
+    """Test the convergence-based stopping policy."""
+
+    rng = np.random.default_rng(7)
+    steps = np.arange(2000)
+
+    # The density relaxes to a stationary value.
+    equilibrating = 1.0 - 0.2*np.exp(-steps / 50) + 0.01*rng.normal(size=len(steps))
+
+    # The density is still drifting.
+    drifting = 0.8 + 1e-4*steps + 0.01*rng.normal(size=len(steps))
+
+    policy = ConvergencePolicy({"Density" : 0.002})
+
+    # The policy can only be used with processes that generate the records.
+    policy.validate(_DensityProcess(equilibrating))
+    with pytest.raises(ValueError):
+        ConvergencePolicy({"Volume" : None}).validate(_DensityProcess(equilibrating))
+
+    # The equilibration region is discarded and the mean has converged.
+    status = policy.getStatus(_DensityProcess(equilibrating))["Density"]
+    assert status["start"] > 0
+    assert status["mean"] == pytest.approx(1.0, abs=0.005)
+    assert policy.isConverged(_DensityProcess(equilibrating))
+
+    # A drifting record isn't stationary.
+    assert not policy.isConverged(_DensityProcess(drifting))
+
+    # The tolerance hasn't been met.
+    assert not ConvergencePolicy({"Density" : 1e-5}).isConverged(_DensityProcess(equilibrating))
+
+    # Too few samples.
+    assert not policy.isConverged(_DensityProcess(equilibrating[:20]))
+
+def test_tail(tmpdir):
+    """Test reading lines backwards from the end of a file."""
+
+    file = str(tmpdir.join("stdout.txt"))
+
+    # Write enough lines to span several blocks.
+    lines = ["line %d" % x for x in range(5000)]
+    with open(file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    assert _tail(file, 0) == []
+    assert _tail(file, 3) == lines[-3:]
+    assert _tail(file, 1000) == lines[-1000:]
+    assert _tail(file, 10000) == lines
+
+    # Small blocks split lines across block boundaries.
+    assert list(_reverse_lines(file, block_size=7)) == lines[::-1]
+
+    # A final line without a newline is still returned.
+    with open(file, "a") as f:
+        f.write("partial")
+    assert _tail(file, 2) == [lines[-1], "partial"]
+
+    # Empty and missing files have no lines.
+    open(file, "w").close()
+    assert _tail(file, 10) == []
+    assert _tail(str(tmpdir.join("missing.txt")), 10) == []
+
+def test_archive(tmpdir, monkeypatch):
+    """Test incremental, filtered archiving of a working directory."""
+
+    work_dir = tmpdir.mkdir("work")
+    zipname = str(tmpdir.join("output.zip"))
+
+    # Create some output files.
+    for x in range(4):
+        work_dir.join("output%d.log" % x).write("line %d\n" % x * 1000)
+    work_dir.join("traj.nc").write_binary(os.urandom(10000))
+
+    def members():
+        with zipfile.ZipFile(zipname) as zip_file:
+            assert zip_file.testzip() is None
+            return sorted(zip_file.namelist())
+
+    # Trajectories can be excluded.
+    for codec in ["stored", "deflated", "bzip2", "lzma"]:
+        BSS._Utils.archive(str(work_dir), zipname, exclude=["*.nc"], compression=codec)
+        assert members() == ["output%d.log" % x for x in range(4)]
+
+    # Only matching files are included.
+    BSS._Utils.archive(str(work_dir), zipname, include=["*.nc"], compression="deflated", level=9)
+    assert members() == ["traj.nc"]
+
+    # The archive isn't rewritten if nothing has changed.
+    BSS._Utils.archive(str(work_dir), zipname, compression="deflated")
+    mtime = os.stat(zipname).st_mtime_ns
+    BSS._Utils.archive(str(work_dir), zipname, compression="deflated")
+    assert os.stat(zipname).st_mtime_ns == mtime
+
+    # New files are appended to the existing archive, rather than replacing it.
+    inode = os.stat(zipname).st_ino
+    work_dir.join("appended.log").write("appended")
+    BSS._Utils.archive(str(work_dir), zipname, compression="deflated")
+    assert os.stat(zipname).st_ino == inode
+    assert "appended.log" in members()
+    work_dir.join("appended.log").remove()
+
+    # Track the files that are compressed.
+    written = []
+    write = zipfile.ZipFile.write
+    def track(self, filename, arcname=None, *args, **kwargs):
+        written.append(arcname)
+        return write(self, filename, arcname, *args, **kwargs)
+    monkeypatch.setattr(zipfile.ZipFile, "write", track)
+
+    # New, modified, and deleted files are all reflected in the archive. Only
+    # new and modified files are compressed, both serially and in parallel.
+    for workers in [1, 2]:
+        written.clear()
+        work_dir.join("new%d.log" % workers).write("new")
+        work_dir.join("output0.log").write("modified %d" % workers)
+        work_dir.join("output%d.log" % workers).remove()
+        BSS._Utils.archive(str(work_dir), zipname, compression="deflated", workers=workers)
+        assert sorted(written) == ["new%d.log" % workers, "output0.log"]
+
+    assert members() == ["new1.log", "new2.log", "output0.log", "output3.log", "traj.nc"]
+    with zipfile.ZipFile(zipname) as zip_file:
+        assert zip_file.read("output0.log") == b"modified 2"
+        assert zip_file.read("output3.log") == work_dir.join("output3.log").read_binary()
+        assert zip_file.read("traj.nc") == work_dir.join("traj.nc").read_binary()
+
+    # Members with non-ASCII names are copied correctly.
+    work_dir.join("\u00fc.log").write("unicode")
+    BSS._Utils.archive(str(work_dir), zipname, compression="deflated", workers=2)
+    work_dir.join("output0.log").write("modified again")
+    BSS._Utils.archive(str(work_dir), zipname, compression="deflated", workers=2)
+    with zipfile.ZipFile(zipname) as zip_file:
+        assert zip_file.read("\u00fc.log") == b"unicode"
+        assert zip_file.read("output0.log") == b"modified again"
+
+    # Invalid numbers of workers are rejected.
+    with pytest.raises(ValueError):
+        BSS._Utils.archive(str(work_dir), zipname, workers=0)
+
+    # Invalid codecs are rejected.
+    with pytest.raises(ValueError):
+        BSS._Utils.archive(str(work_dir), zipname, compression="zstd")
+
+    # Compression levels are only supported by some codecs.
+    for codec in ["stored", "lzma"]:
+        with pytest.raises(ValueError):
+            BSS._Utils.archive(str(work_dir), zipname, compression=codec, level=5)
+    with pytest.raises(ValueError):
+        BSS._Utils.archive(str(work_dir), zipname, compression="bzip2", level=0)
+
+class _Timer():
+    """A simple stand-in for a process that runs for a fixed time."""
+    def __init__(self, duration):
+        self._end = time.time() + duration
+
+    def isRunning(self):
+        return time.time() < self._end
+
+def test_monitor(tmpdir):
+    """Test the shared file and process monitor."""
+
+    monitor = _Monitor(interval=0.1)
+
+    # Record the files that are modified.
+    modified = []
+    handle = monitor.watchFile(str(tmpdir), "*.nrg", lambda file: modified.append(file))
+
+    # Watch a process, recording when it has finished.
+    finished = threading.Event()
+    process = _Timer(1)
+    monitor.watchProcess(process, finished.set)
+
+    # Modify a matching, and non-matching file.
+    for file in ["test.nrg", "test.out"]:
+        with open(str(tmpdir.join(file)), "w") as f:
+            f.write("test\n")
+
+    # Wait for the process to finish.
+    assert monitor.wait(process)
+    assert not process.isRunning()
+    assert finished.wait(1)
+
+    # Only the matching file should have triggered the callback.
+    assert len(modified) > 0
+    assert all(os.path.basename(file) == "test.nrg" for file in modified)
+
+    # Waiting for a process that doesn't finish in time should fail.
+    assert not monitor.wait(_Timer(10), timeout=0.2)
+
+    monitor.unwatch(handle)
+
+    # When polling, the modification times of files are only kept while
+    # they are being watched.
+    monitor = _Monitor(interval=0.1)
+    monitor._inotify = None
+    polled = threading.Event()
+    handle = monitor.watchFile(str(tmpdir), "*.nrg", lambda file: polled.set())
+    assert polled.wait(1)
+    assert list(monitor._stat) == [str(tmpdir.join("test.nrg"))]
+    monitor.unwatch(handle)
+    assert len(monitor._stat) == 0
+
+class _SleepTask(Task):
+    """A simple task that sleeps, then returns a value."""
+    def __init__(self, value):
+        self._value = value
+        super().__init__(autostart=True)
+
+    def _run(self):
+        time.sleep(0.2)
+        return self._value
+
+def test_async():
+    """Test awaiting many tasks and processes concurrently."""
+
+    monitor = _Monitor(interval=0.1)
+
+    async def run():
+        # Await the results of many tasks at once.
+        tasks = [_SleepTask(x) for x in range(20)]
+        results = await asyncio.gather(*[task.result() for task in tasks])
+        assert results == list(range(20))
+
+        # Await many processes at once.
+        processes = [_Timer(0.5) for x in range(100)]
+        finished = await asyncio.gather(*[monitor.waitAsync(p) for p in processes])
+        assert all(finished)
+
+        # Awaiting a process that doesn't finish in time should fail.
+        assert not await monitor.waitAsync(_Timer(10), timeout=0.2)
+
+    asyncio.run(run())
+
+class _FailingTimer():
+    """A stand-in for a process that fails a number of times before it
+       succeeds."""
+    def __init__(self, num_failures):
+        self._num_failures = num_failures
+        self._num_starts = 0
+        self._num_resumes = 0
+        self._end = 0
+        self._resources = []
+
+    def _resume(self):
+        self._num_resumes += 1
+        return False
+
+    def _setResources(self, num_threads=None, gpu_devices=None):
+        self._resources.append((num_threads, gpu_devices))
+
+    def start(self):
+        self._num_starts += 1
+        self._end = time.time() + 0.2
+
+    def isRunning(self):
+        return time.time() < self._end
+
+    def isError(self):
+        return self._num_starts <= self._num_failures
+
+def test_schedule():
+    """Test running processes concurrently, with retries."""
+
+    processes = [_FailingTimer(0), _FailingTimer(2), _FailingTimer(10), _FailingTimer(0)]
+    finished = []
+
+    # Track the maximum number of processes running at once.
+    max_running = 0
+    def count():
+        nonlocal max_running
+        while len(finished) < len(processes):
+            max_running = max(max_running, sum(p.isRunning() for p in processes))
+            time.sleep(0.01)
+    thread = threading.Thread(target=count)
+    thread.start()
+
+    slots = [(3, None), (2, None)]
+    _schedule(processes, slots, 5, finished, threading.Event())
+    thread.join()
+
+    # All processes finished, with no more than two running at once.
+    assert len(finished) == len(processes)
+    assert max_running == 2
+
+    # Failed processes are retried up to the maximum number of attempts.
+    assert [p._num_starts for p in processes] == [1, 3, 5, 1]
+
+    # Each retry tries to resume from a checkpoint.
+    assert all(p._num_resumes == p._num_starts - 1 for p in processes)
+
+    # Each process was assigned a slot when it was started.
+    assert all(len(p._resources) == p._num_starts for p in processes)
+    assert all(r in slots for p in processes for r in p._resources)
+
+class _StartFailure(_FailingTimer):
+    """A stand-in for a process that can't be started."""
+    _is_local = True
+
+    def getExecutor(self):
+        return self
+
+    def start(self):
+        raise RuntimeError("Unable to start the process!")
+
+def test_runner_error():
+    """Test that an error starting a process in the background is raised."""
+
+    runner = BSS.Process.ProcessRunner([])
+    runner._processes = [_StartFailure(0)]
+
+    runner.startAll(block=False)
+    with pytest.raises(RuntimeError, match="Unable to start the process!"):
+        runner.wait()
+
+    # The error is only raised once.
+    runner.wait()
+
+def test_allocate():
+    """Test dividing hardware resources between processes."""
+
+    # One process per core, with the cores shared evenly.
+    assert _allocate(40, None, 64, []) == [(2, None)]*24 + [(1, None)]*16
+
+    # No more processes than cores.
+    assert _allocate(40, 8, 4, []) == [(1, None)]*4
+
+    # A single process uses all of the cores.
+    assert _allocate(40, 1, 8, []) == [(8, None)]
+
+    # One process per GPU.
+    assert _allocate(40, None, 8, ["0", "1"]) == [(4, ["0"]), (4, ["1"])]
+
+    # GPUs are shared between processes.
+    assert _allocate(40, 4, 8, ["0", "1"]) == [(2, ["0"]), (2, ["1"]), (2, ["0"]), (2, ["1"])]
+
+def _wait_for(jobs):
+    """Wait for a list of executor jobs to finish."""
+    while any(job.isRunning() for job in jobs):
+        time.sleep(0.05)
+
+def test_pool_executor(tmpdir):
+    """Test running jobs on a local pool of workers."""
+
+    executor = BSS.Process.PoolExecutor(max_workers=2)
+
+    # Submit more jobs than there are workers.
+    jobs = [executor.submit("sh", ["-c", "sleep 0.5; echo $VALUE; exit %d" % (x % 2)],
+        "job%d.out" % x, "job%d.out" % x, str(tmpdir), {"VALUE" : x}) for x in range(4)]
+
+    # Only two jobs can run at once.
+    time.sleep(0.1)
+    assert [job.isQueued() for job in jobs] == [False, False, True, True]
+
+    # Cancel a queued job.
+    jobs[3].kill()
+
+    _wait_for(jobs)
+
+    assert [job.isError() for job in jobs] == [False, True, False, True]
+
+    # The environment is passed to the job.
+    with open(str(tmpdir.join("job2.out")), "r") as file:
+        assert file.read().strip() == "2"
+
+    # Terminating a job gives it the chance to write its output and exit.
+    job = executor.submit("sh", ["-c", "trap 'echo stopped; exit 0' TERM; "
+        "while true; do sleep 0.05; done"], "term.out", "term.out", str(tmpdir), {})
+    while job.isQueued():
+        time.sleep(0.05)
+    time.sleep(0.1)
+    job.terminate()
+    _wait_for([job])
+
+    assert not job.isError()
+    with open(str(tmpdir.join("term.out")), "r") as file:
+        assert file.read().strip() == "stopped"
+
+    # A job that can't be launched fails, rather than staying queued.
+    job = executor.submit("bss-missing-executable", [], "missing.out", "missing.out", str(tmpdir), {})
+    _wait_for([job])
+
+    assert not job.isQueued()
+    assert job.isError()
+
+def _run_jobs(executor, tmpdir, start_workers):
+    """Run jobs on an executor whose workers haven't been started yet,
+       cancelling a queued and a running job.
+    """
+
+    # Create a working directory containing an input file for each job.
+    work_dirs = []
+    for x in range(6):
+        work_dir = str(tmpdir.mkdir("job%d" % x))
+        with open("%s/input.txt" % work_dir, "w") as file:
+            file.write("input %d\n" % x)
+        work_dirs.append(work_dir)
+
+    # Submit jobs before any workers are running.
+    jobs = [executor.submit("sh", ["-c", "cat input.txt > output.txt; echo $VALUE; "
+        "sleep 0.2; echo done >> output.txt; exit %d" % (x % 2)],
+        "job.out", "job.err", work_dirs[x], {"VALUE" : x}) for x in range(6)]
+    assert executor.nQueued() == 6
+    assert all(job.isQueued() and job.isRunning() for job in jobs)
+
+    # Cancel a queued job.
+    jobs[5].kill()
+    assert not jobs[5].isRunning()
+
+    # Start some workers to process the queue.
+    start_workers()
+
+    # Cancel a long running job.
+    job = executor.submit("sleep", ["30"], "sleep.out", "sleep.out", work_dirs[0], {})
+    while job.isQueued():
+        time.sleep(0.05)
+    job.kill()
+
+    _wait_for(jobs + [job])
+
+    assert [job.isError() for job in jobs] == [False, True, False, True, False, True]
+    assert job.isError()
+    assert executor.nQueued() == 0
+
+    # The outputs are in the working directories.
+    for x in range(5):
+        with open("%s/output.txt" % work_dirs[x], "r") as file:
+            assert file.read() == "input %d\ndone\n" % x
+        with open("%s/job.out" % work_dirs[x], "r") as file:
+            assert file.read().strip() == str(x)
+
+def test_queue_executor(tmpdir):
+    """Test running jobs via the file-based batch queue."""
+
+    executor = BSS.Process.QueueExecutor(str(tmpdir.join("spool")), interval=0.1)
+
+    _run_jobs(executor, tmpdir, lambda: executor.startWorkers(3))
+    assert executor.nRunning() == 0
+
+    # Wait for the workers to remove a set of files from the spool.
+    cancel_dir = tmpdir.join("spool", "cancel")
+    def wait_for_removal(files):
+        for _ in range(100):
+            if not any(file.exists() for file in files):
+                break
+            time.sleep(0.05)
+        assert not any(file.exists() for file in files)
+
+    # No requests to cancel jobs are left behind.
+    wait_for_removal(cancel_dir.listdir())
+
+    # Killing a finished job doesn't leave a request behind.
+    job = executor.submit("true", [], "true.out", "true.out", str(tmpdir), {})
+    _wait_for([job])
+    job.kill()
+    assert not cancel_dir.join("%s.json" % job.jobId()).exists()
+
+    # Idle workers remove requests to cancel jobs that have already finished.
+    stale = cancel_dir.join("%s.json" % job.jobId())
+    stale.write("")
+    wait_for_removal([stale])
+
+    # Stop the workers.
+    executor.stopWorkers(timeout=5)
+    assert executor.nWorkers() == 0
+
+def test_cluster_executor(tmpdir):
+    """Test running jobs on several workers connected to a coordinator."""
+
+    executor = BSS.Process.ClusterExecutor(interval=0.1)
+
+    # The outputs are copied back from the workers.
+    _run_jobs(executor, tmpdir, lambda: executor.startWorkers(3, scratch_dir=str(tmpdir)))
+
+    # Output is streamed back while the job is running, with later
+    # additions appended to the existing file.
+    work_dir = str(tmpdir.mkdir("stream"))
+    job = executor.submit("sh", ["-c", "echo first > log.txt; sleep 1; echo second >> log.txt"],
+        "job.out", "job.err", work_dir, {})
+
+    is_streamed = False
+    while job.isRunning():
+        if os.path.isfile("%s/log.txt" % work_dir):
+            with open("%s/log.txt" % work_dir, "r") as file:
+                if file.read() == "first\n":
+                    is_streamed = True
+        time.sleep(0.05)
+
+    assert is_streamed
+    assert not job.isError()
+    with open("%s/log.txt" % work_dir, "r") as file:
+        assert file.read() == "first\nsecond\n"
+
+    # Stop the workers.
+    executor.shutdown(timeout=5)
+    assert executor.nWorkers() == 0
+
+def test_cluster_executor_worker_lost(tmpdir):
+    """Test that a job fails if its worker disconnects."""
+
+    executor = BSS.Process.ClusterExecutor(interval=0.1)
+    executor.startWorkers(1, scratch_dir=str(tmpdir))
+
+    job = executor.submit("sleep", ["2"], "sleep.out", "sleep.out", str(tmpdir), {})
+    while job.isQueued():
+        time.sleep(0.05)
+
+    # Kill the worker while the job is running.
+    executor._workers[0].kill()
+    _wait_for([job])
+
+    assert job.isError()
+
+    executor.shutdown(timeout=5)
+    assert executor.nWorkers() == 0
+
+def test_cluster_executor_token(tmpdir):
+    """Test that workers must present the shared token."""
+
+    # A token is needed to accept workers from other hosts.
+    with pytest.raises(ValueError):
+        BSS.Process.ClusterExecutor(host="0.0.0.0")
+
+    executor = BSS.Process.ClusterExecutor(interval=0.1, token="secret")
+
+    # A worker with the wrong token is disconnected.
+    worker = multiprocessing.Process(target=_run_worker,
+        args=(*executor.address(), str(tmpdir), 0.1, "wrong"), daemon=True)
+    worker.start()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert executor.nWorkers() == 0
+
+    # Workers started by the executor share its token.
+    executor.startWorkers(1, scratch_dir=str(tmpdir))
+    job = executor.submit("true", [], "job.out", "job.err", str(tmpdir), {})
+    _wait_for([job])
+    assert not job.isError()
+
+    executor.shutdown(timeout=5)
+    assert executor.nWorkers() == 0
+
+def test_file_tracker(tmpdir):
+    """Test syncing the files in a directory that are appended to or rewritten."""
+
+    source = str(tmpdir.mkdir("source"))
+    target = str(tmpdir.mkdir("target"))
+    tracker = _FileTracker(source)
+
+    def write(name, data, mode="w"):
+        with open(os.path.join(source, name), mode) as file:
+            file.write(data)
+
+    def sync():
+        files = tracker.changes()
+        _apply_changes(target, files)
+        for name in os.listdir(source):
+            with open(os.path.join(source, name), "rb") as file0, \
+                 open(os.path.join(target, name), "rb") as file1:
+                assert file0.read() == file1.read()
+        return files
+
+    write("log.txt", "step 1\n")
+    write("restart.txt", "time 1\n")
+    sync()
+
+    # Only the new data in a file that has been appended to is sent.
+    write("log.txt", "step 2\n", "a")
+    files = sync()
+    assert files["log.txt"][0] == len("step 1\n")
+
+    # A file that is rewritten with longer content is sent in full.
+    write("restart.txt", "time 10.0\n")
+    files = sync()
+    assert files["restart.txt"][0] == 0
+
+    # The same applies to large files, which are only partly checked.
+    write("restart.txt", "x" * 200000)
+    sync()
+    write("restart.txt", "y" + "x" * 200000)
+    files = sync()
+    assert files["restart.txt"][0] == 0
@@ -0,0 +1,89 @@
+import BioSimSpace as BSS
+
+import mdtraj
+import numpy as np
+import pytest
+
+from mdtraj.formats import DCDTrajectoryFile, NetCDFTrajectoryFile, TRRTrajectoryFile, XTCTrajectoryFile
+
+# The number of frames and atoms in the test trajectories.
+num_frames = 25
+num_atoms = 200
+
+def write_trajectory(file):
+    """Write a random trajectory to file."""
+
+    xyz = np.random.rand(num_frames, num_atoms, 3).astype(np.float32)
+
+    if file.endswith(".dcd"):
+        with DCDTrajectoryFile(file, "w") as f:
+            f.write(10*xyz, cell_lengths=np.full((num_frames, 3), 30, np.float32),
+                    cell_angles=np.full((num_frames, 3), 90, np.float32))
+    elif file.endswith(".nc"):
+        with NetCDFTrajectoryFile(file, "w") as f:
+            f.write(10*xyz)
+    elif file.endswith(".xtc"):
+        with XTCTrajectoryFile(file, "w") as f:
+            f.write(xyz)
+    elif file.endswith(".trr"):
+        with TRRTrajectoryFile(file, "w") as f:
+            f.write(xyz)
+
+@pytest.mark.parametrize("extension", ["dcd", "nc", "xtc", "trr"])
+def test_count_frames(tmpdir, extension):
+    """Test counting trajectory frames without loading the coordinates."""
+
+    file = str(tmpdir.join("traj.%s" % extension))
+    write_trajectory(file)
+
+    # Make sure the count matches MDTraj.
+    with mdtraj.open(file) as f:
+        assert len(f) == num_frames
+    assert BSS.Trajectory.countFrames(file) == num_frames
+
+@pytest.mark.parametrize("extension", ["dcd", "xtc", "trr"])
+def test_count_frames_partial(tmpdir, extension):
+    """Test that incomplete frames at the end of a file aren't counted."""
+
+    file = str(tmpdir.join("traj.%s" % extension))
+    write_trajectory(file)
+
+    with open(file, "rb") as f:
+        data = f.read()
+
+    # Simulate a running process by writing the file a chunk at a time.
+    partial = str(tmpdir.join("partial.%s" % extension))
+    counts = []
+    for size in range(0, len(data), len(data) // 37):
+        with open(partial, "wb") as f:
+            f.write(data[:size])
+        counts.append(BSS.Trajectory.countFrames(partial))
+
+    # The count never decreases and never includes the incomplete frame.
+    assert counts == sorted(counts)
+    assert counts[-1] < num_frames
+
+    # Complete the file.
+    with open(partial, "wb") as f:
+        f.write(data)
+    assert BSS.Trajectory.countFrames(partial) == num_frames
+
+def test_stitch(tmpdir):
+    """Test joining the trajectory segment written by a resumed process."""
+
+    from BioSimSpace.Trajectory._trajectory import _stitch
+
+    file = str(tmpdir.join("traj.dcd"))
+    segment = str(tmpdir.join("segment.dcd"))
+    write_trajectory(file)
+    write_trajectory(segment)
+
+    # Keep the frames up to the checkpoint and append the segment.
+    _stitch(file, segment, num_frames=10)
+    assert BSS.Trajectory.countFrames(file) == 10 + num_frames
+
+    # Make sure that MDTraj can read the joined trajectory.
+    with mdtraj.open(file) as f:
+        xyz = f.read()[0]
+    with mdtraj.open(segment) as f:
+        assert np.allclose(xyz[10:], f.read()[0])
@@ -0,0 +1,160 @@
+import BioSimSpace as BSS
+
+import numpy as np
+
+import collections
+import pytest
+
+@pytest.fixture(scope="module")
+def system():
+    """A solvated alanine dipeptide system."""
+    return BSS.IO.readMolecules(BSS.IO.glob("test/io/amber/ala/*"))
+
+def test_copy_on_write(system):
+    # Work on a copy, so that the shared fixture isn't modified.
+    system = system.copy()
+
+    # Copy the system. The underlying Sire system is shared.
+    copy = system.copy()
+    assert copy._sire_system is system._sire_system
+
+    # Modifying the copy shouldn't change the original.
+    num_waters = system.nWaterMolecules()
+    copy.removeWaterMolecules()
+    assert copy._sire_system is not system._sire_system
+    assert copy.nWaterMolecules() == 0
+    assert system.nWaterMolecules() == num_waters
+
+    # Neither should modifying the original change the copy.
+    box = system.getBox()
+    copy.setBox(3*[10*BSS.Units.Length.angstrom])
+    system.translate([1, 1, 1])
+    assert system.getBox() == box
+    assert copy.getBox() == 3*[10*BSS.Units.Length.angstrom]
+
+def test_process_system():
+    # Load a fresh copy of the system.
+    system = BSS.IO.readMolecules(BSS.IO.glob("test/io/amber/ala/*"))
+
+    # Processes hold a reference to the Sire system of the passed system.
+    process = BSS.Process.Amber(system, BSS.Protocol.Minimisation(), name="test")
+
+    # Modifying the system after creating the process shouldn't change the
+    # system used by the process.
+    num_molecules = system.nMolecules()
+    system.removeWaterMolecules()
+    assert system.nMolecules() < num_molecules
+    assert process._system.nMolecules() == num_molecules
+
+def test_molecule_index():
+    # Load a fresh copy of the system.
+    system = BSS.IO.readMolecules(BSS.IO.glob("test/io/amber/ala/*"))
+
+    # The system contains a single alanine dipeptide and water.
+    assert system.nProteinMolecules() == 1
+    assert system.nWaterMolecules() == system.nMolecules() - 1
+    assert system.nPerturbableMolecules() == 0
+    assert system.nIonMolecules() == 0
+    assert all(mol.isWater() for mol in system.getWaterMolecules())
+
+    # Copies share the index.
+    copy = system.copy()
+    assert copy._molecule_index is system._molecule_index
+
+    # The index is updated when the system is modified.
+    copy.removeWaterMolecules()
+    assert copy.nWaterMolecules() == 0
+    assert copy.nMolecules() == 1
+    assert system.nWaterMolecules() == system.nMolecules() - 1
+
+    copy.addMolecules(system.getWaterMolecules()[0])
+    assert copy.nWaterMolecules() == 1
+
+    # The index is also updated if the Sire system is modified directly.
+    water = copy.getWaterMolecules()[0]
+    copy._getSireSystem().remove(water._sire_molecule.number())
+    assert copy.nWaterMolecules() == 0
+
+def test_water_detection(system, monkeypatch):
+    from BioSimSpace._SireWrappers import _molecule
+
+    # Use an empty cache of molecule types for this test.
+    molecule_types = collections.OrderedDict()
+    monkeypatch.setattr(_molecule, "_molecule_types", molecule_types)
+
+    # Classify all of the molecules.
+    molecules = system.getMolecules()
+    is_water = [mol.isWater() for mol in molecules]
+
+    # Only the alanine dipeptide isn't a water molecule.
+    assert is_water.count(False) == 1
+    assert system.nWaterMolecules() == is_water.count(True)
+
+    # Each water molecule is cached, so repeated calls don't classify it
+    # again.
+    assert list(molecule_types.values()).count("water") == is_water.count(True)
+    assert [mol.isWater() for mol in molecules] == is_water
+
+    # The cache is bounded.
+    molecule_types.clear()
+    monkeypatch.setattr(_molecule, "_max_molecule_types", 10)
+    assert [mol.isWater() for mol in molecules] == is_water
+    assert len(molecule_types) == 10
+
+def test_coordinates():
+    # Load a fresh copy of the system.
+    system = BSS.IO.readMolecules(BSS.IO.glob("test/io/amber/ala/*"))
+
+    # Extract the coordinates.
+    coordinates = system.getCoordinates()
+    assert coordinates.shape == (system.nAtoms(), 3)
+
+    # The coordinates match those of the individual molecules.
+    mol_coordinates = np.concatenate([mol.getCoordinates() for mol in system.getMolecules()])
+    assert np.array_equal(coordinates, mol_coordinates)
+
+    # Translate the system and check that all atoms have moved.
+    system.translate([1, 2, 3])
+    assert np.allclose(system.getCoordinates(), coordinates + [1, 2, 3])
+
+    # Set the coordinates back to their original values.
+    system.setCoordinates(coordinates)
+    assert np.allclose(system.getCoordinates(), coordinates)
+
+    # Check the bounding box.
+    box = system._getAABox()
+    assert np.allclose([box.minCoords().x(), box.minCoords().y(), box.minCoords().z()],
+                       coordinates.min(axis=0))
+    assert np.allclose([box.maxCoords().x(), box.maxCoords().y(), box.maxCoords().z()],
+                       coordinates.max(axis=0))
+
+    # The array must contain coordinates for every atom.
+    with pytest.raises(ValueError):
+        system.setCoordinates(coordinates[1:])
+
+def test_system_builder(system):
+    # Start from the existing system.
+    builder = BSS._SireWrappers.SystemBuilder(system)
+    assert builder.nMolecules() == system.nMolecules()
+
+    # Add a second copy of the water molecules. These are given new numbers.
+    waters = system.getWaterMolecules()
+    builder.add(waters)
+    assert builder.nMolecules() == system.nMolecules() + len(waters)
+
+    # Create the system, renumbering the residues and atoms.
+    new_system = builder.commit(renumber=True)
+    assert new_system.nMolecules() == system.nMolecules() + len(waters)
+    assert new_system.nWaterMolecules() == 2*len(waters)
+    assert new_system.nAtoms() == system.nAtoms() + sum(wat.nAtoms() for wat in waters)
+
+    # System properties are preserved.
+    assert new_system.getBox() == system.getBox()
+
+    # Atoms are numbered consecutively.
+    nums = [atom.number().value() for mol in new_system.getMolecules()
+                                  for atom in mol._getSireMolecule().atoms()]
+    assert sorted(nums) == list(range(1, new_system.nAtoms() + 1))
+
+    # Combining systems gives the same result.
+    assert (system + waters).nMolecules() == new_system.nMolecules()